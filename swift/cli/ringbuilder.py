@@ -15,6 +15,7 @@
 # limitations under the License.
 
 from __future__ import print_function
+from array import array
 import logging
 
 from errno import EEXIST
@@ -25,6 +26,7 @@ from os.path import basename, abspath, dirname, exists, join as pathjoin
 from sys import argv as sys_argv, exit, stderr, stdout
 from textwrap import wrap
 from time import time
+import json
 import optparse
 import math
 
@@ -32,14 +34,14 @@ from six.moves import zip as izip
 from six.moves import input
 
 from swift.common import exceptions
-from swift.common.ring import RingBuilder, Ring
+from swift.common.ring import RingBuilder, Ring, RingData
 from swift.common.ring.builder import MAX_BALANCE
 from swift.common.ring.utils import validate_args, \
     validate_and_normalize_ip, build_dev_from_opts, \
     parse_builder_ring_filename_args, parse_search_value, \
     parse_search_values_from_opts, parse_change_values_from_opts, \
-    dispersion_report, parse_add_value
-from swift.common.utils import lock_parent_directory
+    dispersion_report, parse_add_value, ring_diff_report
+from swift.common.utils import lock_parent_directory, human_readable
 
 MAJOR_VERSION = 1
 MINOR_VERSION = 3
@@ -953,6 +955,110 @@ swift-ring-builder <builder_file> dispersion <search_filter> [options]
                 print(template % args)
         exit(status)
 
+    def diff():
+        """
+swift-ring-builder <builder_file> diff <old_ring_file> [options]
+
+    Output report on the data movement caused by replacing <old_ring_file>
+    with the ring from the builder file, i.e. by pushing out the ring that
+    write_ring would write.
+
+    For every region and zone (and with --verbose every server and device)
+    the report shows how many partition replicas it would receive (Parts In)
+    and send (Parts Out). The device that loses a partition is counted as
+    its sender.
+
+    --part-sizes <file>   JSON object mapping partition numbers to the bytes
+                          one replica of that partition holds, e.g. from a
+                          sample of partition directories; partitions not in
+                          the sample are assumed to be of average size
+    --bytes-per-part <n>  bytes assumed for one replica of any partition not
+                          in --part-sizes
+    --bandwidth <MB/s>    replication bandwidth of a single device, used to
+                          estimate how long the busiest device would need
+        """
+        if not builder._replica2part2dev:
+            print('Specified builder file \"%s\" is not rebalanced yet. '
+                  'Please rebalance first.' % builder_file)
+            exit(EXIT_ERROR)
+        usage = Commands.diff.__doc__.strip()
+        parser = optparse.OptionParser(usage)
+        parser.add_option('-v', '--verbose', action='store_true',
+                          help='Display servers and devices too')
+        parser.add_option('--part-sizes', metavar='FILE',
+                          help='JSON file of bytes per partition replica')
+        parser.add_option('--bytes-per-part', type='float',
+                          help='Bytes per partition replica')
+        parser.add_option('--bandwidth', type='float',
+                          help='Replication bandwidth per device in MB/s')
+        options, args = parser.parse_args(argv)
+        if len(args) < 4:
+            print(Commands.diff.__doc__.strip())
+            exit(EXIT_ERROR)
+        old_ring_file = args[3]
+        part_sizes = None
+        try:
+            old_ring = RingData.load(old_ring_file)
+            if options.part_sizes:
+                with open(options.part_sizes) as f:
+                    part_sizes = dict((int(part), float(size))
+                                      for part, size in json.load(f).items())
+        except (IOError, ValueError) as e:
+            print(e)
+            exit(EXIT_ERROR)
+        try:
+            report = ring_diff_report(
+                old_ring, builder.get_ring(), part_sizes=part_sizes,
+                default_part_size=options.bytes_per_part)
+        except ValueError as e:
+            print(e)
+            exit(EXIT_ERROR)
+
+        print('Comparing %s to the ring of %s' % (old_ring_file,
+                                                  builder_file))
+        print('%d of %d partitions (%.2f%%) move, %d replicas in total' % (
+            report['parts_moved'], report['parts'],
+            100.0 * report['parts_moved'] / report['parts'],
+            report['replicas_moved']))
+        with_bytes = report['bytes_moved'] is not None
+        if with_bytes:
+            print('Estimated data movement: %sB' %
+                  human_readable(report['bytes_moved']))
+            if options.bandwidth:
+                busiest = max([0] + [
+                    max(tier_report['bytes_in'], tier_report['bytes_out'])
+                    for tier_name, tier_report in report['graph']
+                    if '/' in tier_name])
+                seconds = busiest / (options.bandwidth * 1024 * 1024)
+                print('Estimated replication time: %.1f hours at %s MB/s '
+                      'per device' % (seconds / 3600, options.bandwidth))
+        if not report['graph']:
+            exit(EXIT_SUCCESS)
+
+        graph = [(tier_name, tier_report)
+                 for tier_name, tier_report in report['graph']
+                 if options.verbose or '-' not in tier_name]
+        tier_width = max(max(len(tier_name) for tier_name, _junk in graph),
+                         30)
+        template = '%-' + str(tier_width) + 's %10s %10s'
+        if with_bytes:
+            template += ' %10s %10s'
+        header_line = template % ((
+            'Tier', 'Parts In', 'Parts Out', 'Bytes In', 'Bytes Out'
+        )[:5 if with_bytes else 3])
+        underline = '-' * len(header_line)
+        print(underline)
+        print(header_line)
+        print(underline)
+        for tier_name, tier_report in graph:
+            row = [tier_name, tier_report['parts_in'],
+                   tier_report['parts_out']]
+            if with_bytes:
+                row += [human_readable(tier_report['bytes_in']),
+                        human_readable(tier_report['bytes_out'])]
+            print(template % tuple(row))
+        exit(EXIT_SUCCESS)
+
     def validate():
         """
 swift-ring-builder <builder_file> validate
@@ -963,12 +1069,24 @@ swift-ring-builder <builder_file> validate
 
     def write_ring():
         """
-swift-ring-builder <builder_file> write_ring
+swift-ring-builder <builder_file> write_ring [--format-version <1|2>]
     Just rewrites the distributable ring file. This is done automatically after
     a successful rebalance, so really this is only useful after one or more
     'set_info' calls when no rebalance is needed but you want to send out the
     new device information.
+
+    --format-version 2 writes an uncompressed ring that servers memory-map,
+    so all worker processes on a node share a single copy of the partition
+    tables and reloading a changed ring is cheap. Rebalance always writes
+    the default format 1; run write_ring again afterwards to switch.
         """
+        usage = Commands.write_ring.__doc__.strip()
+        parser = optparse.OptionParser(usage)
+        parser.add_option('--format-version', type='choice',
+                          choices=['1', '2'], default='1',
+                          help='Ring file format version to write')
+        options, args = parser.parse_args(argv)
+        format_version = int(options.format_version)
         ring_data = builder.get_ring()
         if not ring_data._replica2part2dev_id:
             if ring_data.devs:
@@ -978,8 +1096,9 @@ swift-ring-builder <builder_file> write_ring
             else:
                 print('Warning: Writing an empty ring')
         ring_data.save(
-            pathjoin(backup_dir, '%d.' % time() + basename(ring_file)))
-        ring_data.save(ring_file)
+            pathjoin(backup_dir, '%d.' % time() + basename(ring_file)),
+            format_version=format_version)
+        ring_data.save(ring_file, format_version=format_version)
         exit(EXIT_SUCCESS)
 
     def write_builder():
@@ -1016,7 +1135,8 @@ swift-ring-builder <ring_file> write_builder [min_part_hours]
             'devs': ring.devs,
             'devs_changed': False,
             'version': 0,
-            '_replica2part2dev': ring._replica2part2dev_id,
+            '_replica2part2dev': [array('H', p2d) for p2d in
+                                  ring._replica2part2dev_id],
             '_last_part_moves_epoch': None,
             '_last_part_moves': None,
             '_last_part_gather_start': 0,
@@ -28,6 +28,7 @@ BufferedHTTPResponse.
 
 from swift import gettext_ as _
 from swift.common import constraints
+import errno
 import logging
 import time
 import socket
@@ -70,6 +71,11 @@ class BufferedHTTPResponse(HTTPResponse):
         self.will_close = _UNKNOWN      # conn will close at end of response
         self._readline_buffer = ''
 
+        # set by BufferedHTTPConnection.getresponse() when the connection
+        # may go back to its pool once this response is over
+        self.pooled_conn = None
+        self._reading = False
+
     def expect_response(self):
         if self.fp:
             self.fp.close()
@@ -86,16 +92,25 @@ class BufferedHTTPResponse(HTTPResponse):
             self.msg = HTTPMessage(self.fp, 0)
             self.msg.fp = None
 
+    def _read(self, amt=None):
+        # HTTPResponse.read() closes the response once all of the body has
+        # been read; close() needs to tell that apart from being closed early.
+        self._reading = True
+        try:
+            return HTTPResponse.read(self, amt)
+        finally:
+            self._reading = False
+
     def read(self, amt=None):
         if not self._readline_buffer:
-            return HTTPResponse.read(self, amt)
+            return self._read(amt)
 
         if amt is None:
             # Unbounded read: send anything we have buffered plus whatever
             # is left.
             buffered = self._readline_buffer
             self._readline_buffer = ''
-            return buffered + HTTPResponse.read(self, amt)
+            return buffered + self._read(amt)
         elif amt <= len(self._readline_buffer):
             # Bounded read that we can satisfy entirely from our buffer
             res = self._readline_buffer[:amt]
@@ -106,7 +121,7 @@ class BufferedHTTPResponse(HTTPResponse):
             smaller_amt = amt - len(self._readline_buffer)
             buf = self._readline_buffer
             self._readline_buffer = ''
-            return buf + HTTPResponse.read(self, smaller_amt)
+            return buf + self._read(smaller_amt)
 
     def readline(self, size=1024):
         # You'd think Python's httplib would provide this, but it doesn't.
@@ -119,7 +134,7 @@ class BufferedHTTPResponse(HTTPResponse):
         while ('\n' not in self._readline_buffer
                and len(self._readline_buffer) < size):
             read_size = size - len(self._readline_buffer)
-            chunk = HTTPResponse.read(self, read_size)
+            chunk = self._read(read_size)
             if not chunk:
                 break
             self._readline_buffer += chunk
@@ -144,17 +159,112 @@ class BufferedHTTPResponse(HTTPResponse):
         self.close()
 
     def close(self):
+        conn, self.pooled_conn = self.pooled_conn, None
+        # The connection can only carry another request once all of this
+        # response has been read off it.
+        reusable = self._real_socket is not None and (
+            self._reading or (not self.chunked and self.length == 0))
         HTTPResponse.close(self)
         self.sock = None
         self._real_socket = None
+        if conn is not None:
+            conn.release(reusable)
+
+
+def _is_idle(sock):
+    """
+    Check that nothing has happened on an idle connection's socket, which
+    would mean that the server closed it or sent something unexpected.
+    """
+    try:
+        sock.fd.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+    except socket.error as err:
+        return err.errno in (errno.EAGAIN, errno.EWOULDBLOCK)
+    return False
+
+
+class ConnectionPool(object):
+    """
+    Pool of idle persistent connections to backend servers, keyed by
+    (ip, port). Only one greenthread uses a connection at a time: it is taken
+    out of the pool for a request and put back once the response has been
+    read in full.
+
+    :param max_idle: most idle connections kept to any one (ip, port)
+    :param idle_timeout: seconds after which an idle connection is closed
+    """
+
+    def __init__(self, max_idle=8, idle_timeout=15):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        # (ip, port) -> list of (time released, socket), oldest first
+        self._idle = {}
+        self._next_reap = 0
+
+    def _reap(self, now):
+        if now < self._next_reap:
+            return
+        self._next_reap = now + min(self.idle_timeout, 1)
+        expired = now - self.idle_timeout
+        for key, idle in list(self._idle.items()):
+            while idle and idle[0][0] <= expired:
+                idle.pop(0)[1].close()
+            if not idle:
+                del self._idle[key]
+
+    def get(self, ip, port):
+        """
+        Take an idle connection to ip:port out of the pool.
+
+        :returns: a connected socket, or None if there is no usable one
+        """
+        self._reap(time.time())
+        idle = self._idle.get((ip, int(port)))
+        while idle:
+            # the most recently used connection is the least likely to have
+            # been closed by the server
+            sock = idle.pop()[1]
+            if _is_idle(sock):
+                return sock
+            sock.close()
+        return None
+
+    def put(self, ip, port, sock):
+        """
+        Return the socket of a connection to ip:port to the pool, or close it
+        if the pool already holds max_idle of them.
+        """
+        now = time.time()
+        self._reap(now)
+        idle = self._idle.setdefault((ip, int(port)), [])
+        if len(idle) >= self.max_idle:
+            sock.close()
+        else:
+            idle.append((now, sock))
+
+    def evict(self, ip, port):
+        """
+        Close all idle connections to ip:port, e.g. because it has been
+        erroring.
+        """
+        for _junk, sock in self._idle.pop((ip, int(port)), []):
+            sock.close()
 
 
 class BufferedHTTPConnection(HTTPConnection):
     """HTTPConnection class that uses BufferedHTTPResponse"""
     response_class = BufferedHTTPResponse
+    #: :class:`ConnectionPool` that connections reuse sockets from and
+    #: return them to; None makes every connection use a new socket. This is
+    #: a class setting, so a process only has one pool.
+    pool = None
 
     def connect(self):
         self._connected_time = time.time()
+        if self.pool is not None:
+            self.sock = self.pool.get(self.host, self.port)
+            if self.sock is not None:
+                return
         ret = HTTPConnection.connect(self)
         self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         return ret
@@ -173,6 +283,8 @@ class BufferedHTTPConnection(HTTPConnection):
 
     def getresponse(self):
         response = HTTPConnection.getresponse(self)
+        if self.pool is not None and not response.will_close:
+            response.pooled_conn = self
         logging.debug("HTTP PERF: %(time).5f seconds to %(method)s "
                       "%(host)s:%(port)s %(path)s)",
                       {'time': time.time() - self._connected_time,
@@ -180,6 +292,20 @@ class BufferedHTTPConnection(HTTPConnection):
                        'port': self.port, 'path': self._path})
         return response
 
+    def release(self, reusable):
+        """
+        Hand this connection's socket back to the pool, or close it.
+
+        :param reusable: whether the socket can carry another request
+        """
+        sock, self.sock = self.sock, None
+        if sock is None:
+            return
+        if reusable and self.pool is not None:
+            self.pool.put(self.host, self.port, sock)
+        else:
+            sock.close()
+
 
 def http_connect(ipaddr, port, device, partition, method, path,
                  headers=None, query_string=None, ssl=False):
@@ -52,9 +52,9 @@ from bisect import bisect
 from swift import gettext_ as _
 from hashlib import md5
 
-from eventlet.green import socket
+from eventlet.green import socket, threading
 from eventlet.pools import Pool
-from eventlet import Timeout
+from eventlet import GreenPile, Timeout
 from six.moves import range
 
 
@@ -75,11 +75,28 @@ ERROR_LIMIT_COUNT = 10
 ERROR_LIMIT_TIME = 60
 ERROR_LIMIT_DURATION = 60
 
+# round trips to memcache made by each greenthread, for per-request metrics;
+# the green threading.local, as this may be imported before the proxy
+# monkey-patches threading
+_round_trips = threading.local()
+
 
 def md5hash(key):
     return md5(key).hexdigest()
 
 
+def round_trip_count():
+    """
+    :returns: the number of round trips to memcache the current greenthread
+              has waited for
+    """
+    return getattr(_round_trips, 'count', 0)
+
+
+def _count_round_trip():
+    _round_trips.count = round_trip_count() + 1
+
+
 def sanitize_timeout(timeout):
     """
     Sanitize a timeout value to use an absolute expiration time if the delta
@@ -207,6 +224,7 @@ class MemcacheRing(object):
             try:
                 with MemcachePoolTimeout(self._pool_timeout):
                     fp, sock = self._client_cache[server].get()
+                _count_round_trip()
                 yield server, fp, sock
             except MemcachePoolTimeout as e:
                 self._exception_occurred(
@@ -223,6 +241,37 @@ class MemcacheRing(object):
         """Returns a server connection to the pool."""
         self._client_cache[server].put((fp, sock))
 
+    def _get_server(self, key):
+        """
+        Chooses the server "key" is on, when all are up, as _get_conns does.
+        """
+        pos = (bisect(self._sorted, key) + 1) % len(self._sorted)
+        return self._ring[self._sorted[pos]]
+
+    def _read_values(self, fp):
+        """
+        Reads the values sent in answer to a get of one or more keys.
+
+        :returns: dict of the values found, by (hashed) key
+        """
+        responses = {}
+        line = fp.readline().strip().split()
+        while line[0].upper() != 'END':
+            if line[0].upper() == 'VALUE':
+                size = int(line[3])
+                value = fp.read(size)
+                if int(line[2]) & PICKLE_FLAG:
+                    if self._allow_unpickle:
+                        value = pickle.loads(value)
+                    else:
+                        value = None
+                elif int(line[2]) & JSON_FLAG:
+                    value = json.loads(value)
+                responses[line[1]] = value
+                fp.readline()
+            line = fp.readline().strip().split()
+        return responses
+
     def set(self, key, value, serialize=True, timeout=0, time=0,
             min_compress_len=0):
         """
@@ -465,22 +514,7 @@ class MemcacheRing(object):
             try:
                 with Timeout(self._io_timeout):
                     sock.sendall('get %s\r\n' % ' '.join(keys))
-                    line = fp.readline().strip().split()
-                    responses = {}
-                    while line[0].upper() != 'END':
-                        if line[0].upper() == 'VALUE':
-                            size = int(line[3])
-                            value = fp.read(size)
-                            if int(line[2]) & PICKLE_FLAG:
-                                if self._allow_unpickle:
-                                    value = pickle.loads(value)
-                                else:
-                                    value = None
-                            elif int(line[2]) & JSON_FLAG:
-                                value = json.loads(value)
-                            responses[line[1]] = value
-                            fp.readline()
-                        line = fp.readline().strip().split()
+                    responses = self._read_values(fp)
                     values = []
                     for key in keys:
                         if key in responses:
@@ -491,3 +525,62 @@ class MemcacheRing(object):
                     return values
             except (Exception, Timeout) as e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
+
+    def _get_many_from_server(self, server, items):
+        """
+        Gets the values of keys that are all on one server. If that server
+        can't be used, the keys are looked up one by one instead, since
+        their next servers may differ.
+
+        :param server: the server the keys are on
+        :param items: list of (key, hashed key)
+        :returns: list of values
+        """
+        hashed_keys = [hashed_key for key, hashed_key in items]
+        for (conn_server, fp, sock) in self._get_conns(hashed_keys[0]):
+            if conn_server != server:
+                self._return_conn(conn_server, fp, sock)
+                break
+            try:
+                with Timeout(self._io_timeout):
+                    sock.sendall('get %s\r\n' % ' '.join(hashed_keys))
+                    responses = self._read_values(fp)
+                    self._return_conn(server, fp, sock)
+                    return [responses.get(key) for key in hashed_keys]
+            except (Exception, Timeout) as e:
+                self._exception_occurred(server, e, sock=sock, fp=fp)
+        return [self.get(key) for key, hashed_key in items]
+
+    def get_many(self, keys):
+        """
+        Gets the values of any keys. Unlike get_multi, the keys don't have
+        to be on one server: those on each server are asked for at once, and
+        the servers are asked concurrently, so this takes about as long as
+        one get.
+
+        :param keys: keys for values to be retrieved from memcache
+        :returns: list of values, None for the keys that weren't found
+        """
+        if not keys or not self._sorted:
+            return [None] * len(keys)
+        hashed = [(key, md5hash(key)) for key in keys]
+        by_server = {}
+        for key, hashed_key in hashed:
+            by_server.setdefault(self._get_server(hashed_key), []).append(
+                (key, hashed_key))
+        groups = list(by_server.items())
+        if len(groups) == 1:
+            results = [self._get_many_from_server(*groups[0])]
+        else:
+            round_trips = round_trip_count()
+            pile = GreenPile(len(groups))
+            for server, items in groups:
+                pile.spawn(self._get_many_from_server, server, items)
+            results = list(pile)
+            # the round trips overlap, so they only count as one
+            _round_trips.count = round_trips + 1
+        responses = {}
+        for (server, items), values in zip(groups, results):
+            for (key, hashed_key), value in zip(items, values):
+                responses[hashed_key] = value
+        return [responses[hashed_key] for key, hashed_key in hashed]
@@ -13,7 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import deque, OrderedDict
+import functools
+import itertools
 import json
+from six import BytesIO
 from six.moves.urllib.parse import quote, unquote
 import tarfile
 from xml.sax import saxutils
@@ -24,7 +28,8 @@ from swift.common.swob import Request, HTTPBadGateway, \
     HTTPCreated, HTTPBadRequest, HTTPNotFound, HTTPUnauthorized, HTTPOk, \
     HTTPPreconditionFailed, HTTPRequestEntityTooLarge, HTTPNotAcceptable, \
     HTTPLengthRequired, HTTPException, HTTPServerError, wsgify
-from swift.common.utils import get_logger, register_swift_info
+from swift.common.utils import get_logger, register_swift_info, \
+    ContextPool
 from swift.common import constraints
 from swift.common.http import HTTP_UNAUTHORIZED, HTTP_NOT_FOUND, HTTP_CONFLICT
 
@@ -39,6 +44,10 @@ class CreateContainerError(Exception):
 ACCEPTABLE_FORMATS = ['text/plain', 'application/json', 'application/xml',
                       'text/xml']
 
+# Files in an archive up to this size are read into memory, so that they can
+# be uploaded while the rest of the archive is read.
+MAX_BUFFERED_FILE_SIZE = 1024 * 1024
+
 
 def get_response_body(data_format, data_dict, error_list):
     """
@@ -232,6 +241,12 @@ class Bulk(object):
 
     /container_name
 
+    Deletes are made one at a time, in the order given, unless the
+    delete_concurrency option is set higher. The objects are then grouped by
+    container and the containers are deleted after all the objects, so a
+    container can be deleted along with the objects in it; the errors in the
+    response are listed in that order too.
+
     The response is similar to extract archive as in every response will be a
     200 OK and you must parse the response body for actual results. An example
     response is:
@@ -262,7 +277,8 @@ class Bulk(object):
     def __init__(self, app, conf, max_containers_per_extraction=10000,
                  max_failed_extractions=1000, max_deletes_per_request=10000,
                  max_failed_deletes=1000, yield_frequency=10, retry_count=0,
-                 retry_interval=1.5, logger=None):
+                 retry_interval=1.5, delete_concurrency=1,
+                 extract_concurrency=1, logger=None):
         self.app = app
         self.logger = logger or get_logger(conf, log_route='bulk')
         self.max_containers = max_containers_per_extraction
@@ -272,6 +288,8 @@ class Bulk(object):
         self.yield_frequency = yield_frequency
         self.retry_count = retry_count
         self.retry_interval = retry_interval
+        self.delete_concurrency = max(1, delete_concurrency)
+        self.extract_concurrency = max(1, extract_concurrency)
         self.max_path_length = constraints.MAX_OBJECT_NAME_LENGTH \
             + constraints.MAX_CONTAINER_NAME_LENGTH + 2
 
@@ -382,42 +400,74 @@ class Bulk(object):
 
             if objs_to_delete is None:
                 objs_to_delete = self.get_objs_to_delete(req)
+                if self.delete_concurrency > 1:
+                    objs_to_delete = self._group_by_container(
+                        objs_to_delete)
             failed_file_response = {'type': HTTPBadRequest}
             req.environ['eventlet.minimum_write_chunk_size'] = 0
-            for obj_to_delete in objs_to_delete:
-                if last_yield + self.yield_frequency < time():
-                    separator = '\r\n\r\n'
-                    last_yield = time()
-                    yield ' '
-                obj_name = obj_to_delete['name']
-                if not obj_name:
-                    continue
-                if len(failed_files) >= self.max_failed_deletes:
-                    raise HTTPBadRequest('Max delete failures exceeded')
-                if obj_to_delete.get('error'):
-                    if obj_to_delete['error']['code'] == HTTP_NOT_FOUND:
-                        resp_dict['Number Not Found'] += 1
-                    else:
-                        failed_files.append([quote(obj_name),
-                                            obj_to_delete['error']['message']])
-                    continue
-                delete_path = '/'.join(['', vrs, account,
-                                        obj_name.lstrip('/')])
-                if not constraints.check_utf8(delete_path):
-                    failed_files.append([quote(obj_name),
-                                         HTTPPreconditionFailed().status])
-                    continue
-                new_env = req.environ.copy()
-                new_env['PATH_INFO'] = delete_path
-                del(new_env['wsgi.input'])
-                new_env['CONTENT_LENGTH'] = 0
-                new_env['REQUEST_METHOD'] = 'DELETE'
-                new_env['HTTP_USER_AGENT'] = \
-                    '%s %s' % (req.environ.get('HTTP_USER_AGENT'), user_agent)
-                new_env['swift.source'] = swift_source
-                self._process_delete(delete_path, obj_name, new_env, resp_dict,
+            # functions that count the results of the deletes, oldest
+            # first: the failures are listed in the order the deletes were
+            # started, whichever delete finishes first
+            pending = deque()
+
+            def count_delete(obj_name, delete):
+                self._process_delete(obj_name, delete.wait(), resp_dict,
                                      failed_files, failed_file_response)
 
+            def count_error(obj_name, error):
+                if error['code'] == HTTP_NOT_FOUND:
+                    resp_dict['Number Not Found'] += 1
+                else:
+                    failed_files.append([quote(obj_name), error['message']])
+
+            if self.delete_concurrency > 1:
+                batches = self._objects_then_containers(objs_to_delete)
+            else:
+                batches = [objs_to_delete]
+            with ContextPool(self.delete_concurrency) as pool:
+                for objs in batches:
+                    for obj_to_delete in objs:
+                        if last_yield + self.yield_frequency < time():
+                            separator = '\r\n\r\n'
+                            last_yield = time()
+                            yield ' '
+                        obj_name = obj_to_delete['name']
+                        if not obj_name:
+                            continue
+                        if len(failed_files) >= self.max_failed_deletes:
+                            raise HTTPBadRequest(
+                                'Max delete failures exceeded')
+                        delete_path = '/'.join(['', vrs, account,
+                                                obj_name.lstrip('/')])
+                        if obj_to_delete.get('error'):
+                            pending.append(functools.partial(
+                                count_error, obj_name,
+                                obj_to_delete['error']))
+                        elif not constraints.check_utf8(delete_path):
+                            pending.append(functools.partial(
+                                failed_files.append,
+                                [quote(obj_name),
+                                 HTTPPreconditionFailed().status]))
+                        else:
+                            new_env = req.environ.copy()
+                            new_env['PATH_INFO'] = delete_path
+                            del(new_env['wsgi.input'])
+                            new_env['CONTENT_LENGTH'] = 0
+                            new_env['REQUEST_METHOD'] = 'DELETE'
+                            new_env['HTTP_USER_AGENT'] = '%s %s' % (
+                                req.environ.get('HTTP_USER_AGENT'),
+                                user_agent)
+                            new_env['swift.source'] = swift_source
+                            pending.append(functools.partial(
+                                count_delete, obj_name, pool.spawn(
+                                    self._delete, delete_path, new_env)))
+                        while len(pending) >= self.delete_concurrency:
+                            pending.popleft()()
+                    # with concurrency, containers are only deleted once the
+                    # objects are gone
+                    while pending:
+                        pending.popleft()()
+
             if failed_files:
                 resp_dict['Response Status'] = \
                     failed_file_response['type']().status
@@ -474,19 +524,50 @@ class Bulk(object):
             extract_base = extract_base.rstrip('/')
             tar = tarfile.open(mode='r|' + compress_type,
                                fileobj=req.body_file)
-            failed_response_type = HTTPBadRequest
+            failed_file_response = {'type': HTTPBadRequest}
             req.environ['eventlet.minimum_write_chunk_size'] = 0
             containers_created = 0
-            while True:
-                if last_yield + self.yield_frequency < time():
-                    separator = '\r\n\r\n'
-                    last_yield = time()
-                    yield ' '
-                tar_info = next(tar)
-                if tar_info is None or \
-                        len(failed_files) >= self.max_failed_extractions:
-                    break
-                if tar_info.isfile():
+            # functions that count the results of the uploads, oldest first
+            pending = deque()
+
+            def count_upload(obj_path, container_failure, upload):
+                resp = upload.wait()
+                if resp.is_success:
+                    resp_dict['Number Files Created'] += 1
+                else:
+                    if container_failure:
+                        failed_files.append(container_failure)
+                    if resp.status_int == HTTP_UNAUTHORIZED:
+                        failed_files.append([
+                            quote(obj_path[:self.max_path_length]),
+                            HTTPUnauthorized().status])
+                        raise HTTPUnauthorized(request=req)
+                    if resp.status_int // 100 == 5:
+                        failed_file_response['type'] = HTTPBadGateway
+                    failed_files.append([
+                        quote(obj_path[:self.max_path_length]),
+                        resp.status])
+
+            def count_failure(obj_path, status):
+                failed_files.append([
+                    quote(obj_path[:self.max_path_length]), status])
+
+            def count_pending(limit):
+                while len(pending) > limit:
+                    pending.popleft()()
+
+            with ContextPool(self.extract_concurrency) as pool:
+                while True:
+                    if last_yield + self.yield_frequency < time():
+                        separator = '\r\n\r\n'
+                        last_yield = time()
+                        yield ' '
+                    tar_info = next(tar)
+                    if tar_info is None or \
+                            len(failed_files) >= self.max_failed_extractions:
+                        break
+                    if not tar_info.isfile():
+                        continue
                     obj_path = tar_info.name
                     if obj_path.startswith('./'):
                         obj_path = obj_path[2:]
@@ -500,14 +581,16 @@ class Bulk(object):
                         ['', vrs, account, obj_path])
                     container = obj_path.split('/', 1)[0]
                     if not constraints.check_utf8(destination):
-                        failed_files.append(
-                            [quote(obj_path[:self.max_path_length]),
-                             HTTPPreconditionFailed().status])
+                        pending.append(functools.partial(
+                            count_failure, obj_path,
+                            HTTPPreconditionFailed().status))
+                        count_pending(self.extract_concurrency - 1)
                         continue
                     if tar_info.size > constraints.MAX_FILE_SIZE:
-                        failed_files.append([
-                            quote(obj_path[:self.max_path_length]),
-                            HTTPRequestEntityTooLarge().status])
+                        pending.append(functools.partial(
+                            count_failure, obj_path,
+                            HTTPRequestEntityTooLarge().status))
+                        count_pending(self.extract_concurrency - 1)
                         continue
                     container_failure = None
                     if container not in containers_accessed:
@@ -516,6 +599,7 @@ class Bulk(object):
                             if self.create_container(req, cont_path):
                                 containers_created += 1
                                 if containers_created > self.max_containers:
+                                    count_pending(0)
                                     raise HTTPBadRequest(
                                         'More than %d containers to create '
                                         'from tar.' % self.max_containers)
@@ -526,14 +610,23 @@ class Bulk(object):
                                 quote(cont_path[:self.max_path_length]),
                                 err.status]
                             if err.status_int == HTTP_UNAUTHORIZED:
+                                count_pending(0)
                                 raise HTTPUnauthorized(request=req)
                         except ValueError:
-                            failed_files.append([
-                                quote(obj_path[:self.max_path_length]),
-                                HTTPBadRequest().status])
+                            pending.append(functools.partial(
+                                count_failure, obj_path,
+                                HTTPBadRequest().status))
+                            count_pending(self.extract_concurrency - 1)
                             continue
+                        containers_accessed.add(container)
 
                     tar_file = tar.extractfile(tar_info)
+                    # small files are read now, so the next one can be read
+                    # while they're uploaded
+                    buffered = self.extract_concurrency > 1 and \
+                        tar_info.size <= MAX_BUFFERED_FILE_SIZE
+                    if buffered:
+                        tar_file = BytesIO(tar_file.read())
                     new_env = req.environ.copy()
                     new_env['REQUEST_METHOD'] = 'PUT'
                     new_env['wsgi.input'] = tar_file
@@ -553,26 +646,19 @@ class Bulk(object):
                             create_obj_req.headers[header_name] = \
                                 pax_value.encode("utf-8")
 
-                    resp = create_obj_req.get_response(self.app)
-                    containers_accessed.add(container)
-                    if resp.is_success:
-                        resp_dict['Number Files Created'] += 1
+                    pending.append(functools.partial(
+                        count_upload, obj_path, container_failure,
+                        pool.spawn(create_obj_req.get_response, self.app)))
+                    if buffered:
+                        count_pending(self.extract_concurrency - 1)
                     else:
-                        if container_failure:
-                            failed_files.append(container_failure)
-                        if resp.status_int == HTTP_UNAUTHORIZED:
-                            failed_files.append([
-                                quote(obj_path[:self.max_path_length]),
-                                HTTPUnauthorized().status])
-                            raise HTTPUnauthorized(request=req)
-                        if resp.status_int // 100 == 5:
-                            failed_response_type = HTTPBadGateway
-                        failed_files.append([
-                            quote(obj_path[:self.max_path_length]),
-                            resp.status])
+                        # it's read from the archive as it's uploaded
+                        count_pending(0)
+                count_pending(0)
 
             if failed_files:
-                resp_dict['Response Status'] = failed_response_type().status
+                resp_dict['Response Status'] = \
+                    failed_file_response['type']().status
             elif not resp_dict['Number Files Created']:
                 resp_dict['Response Status'] = HTTPBadRequest().status
                 resp_dict['Response Body'] = 'Invalid Tar File: No Valid Files'
@@ -590,10 +676,61 @@ class Bulk(object):
         yield separator + get_response_body(
             out_content_type, resp_dict, failed_files)
 
-    def _process_delete(self, delete_path, obj_name, env, resp_dict,
-                        failed_files, failed_file_response, retry=0):
-        delete_obj_req = Request.blank(delete_path, env)
-        resp = delete_obj_req.get_response(self.app)
+    @staticmethod
+    def _group_by_container(objs_to_delete):
+        """
+        :params objs_to_delete: a list of dictionaries as given to
+            handle_delete_iter
+        :returns: the list reordered so that the objects in a container are
+            together, in the order their containers first appear in
+        """
+        by_container = OrderedDict()
+        for obj_to_delete in objs_to_delete:
+            container = obj_to_delete['name'].lstrip('/').split('/', 1)[0]
+            by_container.setdefault(container, []).append(obj_to_delete)
+        return list(itertools.chain.from_iterable(by_container.values()))
+
+    @staticmethod
+    def _objects_then_containers(objs_to_delete):
+        """
+        Splits the objects and containers to delete, so that the containers
+        are deleted once all the objects are gone.
+
+        :params objs_to_delete: an iterable of dictionaries as given to
+            handle_delete_iter
+        :returns: an iterator of the objects' dictionaries, in the order
+            given, and then a list of the containers' dictionaries
+        """
+        containers = []
+
+        def objects():
+            for obj_to_delete in objs_to_delete:
+                if '/' in (obj_to_delete['name'] or '').strip('/'):
+                    yield obj_to_delete
+                else:
+                    containers.append(obj_to_delete)
+
+        yield objects()
+        yield containers
+
+    def _delete(self, delete_path, env):
+        """
+        Deletes an object or container, retrying a container that's not
+        empty yet up to retry_count times.
+
+        :returns: the response to the last DELETE
+        """
+        retry = 0
+        while True:
+            delete_obj_req = Request.blank(delete_path, env)
+            resp = delete_obj_req.get_response(self.app)
+            if resp.status_int != HTTP_CONFLICT or retry >= self.retry_count:
+                return resp
+            retry += 1
+            sleep(self.retry_interval ** retry)
+
+    def _process_delete(self, obj_name, resp, resp_dict, failed_files,
+                        failed_file_response):
         if resp.status_int // 100 == 2:
             resp_dict['Number Deleted'] += 1
         elif resp.status_int == HTTP_NOT_FOUND:
@@ -601,13 +738,6 @@ class Bulk(object):
         elif resp.status_int == HTTP_UNAUTHORIZED:
             failed_files.append([quote(obj_name),
                                  HTTPUnauthorized().status])
-        elif resp.status_int == HTTP_CONFLICT and \
-                self.retry_count > 0 and self.retry_count > retry:
-            retry += 1
-            sleep(self.retry_interval ** retry)
-            self._process_delete(delete_path, obj_name, env, resp_dict,
-                                 failed_files, failed_file_response,
-                                 retry)
         else:
             if resp.status_int // 100 == 5:
                 failed_file_response['type'] = HTTPBadGateway
@@ -653,6 +783,8 @@ def filter_factory(global_conf, **local_conf):
     yield_frequency = int(conf.get('yield_frequency', 10))
     retry_count = int(conf.get('delete_container_retry_count', 0))
     retry_interval = 1.5
+    delete_concurrency = int(conf.get('delete_concurrency', 1))
+    extract_concurrency = int(conf.get('extract_concurrency', 1))
 
     register_swift_info(
         'bulk_upload',
@@ -672,5 +804,7 @@ def filter_factory(global_conf, **local_conf):
             max_failed_deletes=max_failed_deletes,
             yield_frequency=yield_frequency,
             retry_count=retry_count,
-            retry_interval=retry_interval)
+            retry_interval=retry_interval,
+            delete_concurrency=delete_concurrency,
+            extract_concurrency=extract_concurrency)
     return bulk_filter
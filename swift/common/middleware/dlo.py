@@ -316,7 +316,8 @@ class GetContext(WSGIContext):
                 req, self.dlo.app, listing_iter, ua_suffix="DLO MultipartGET",
                 swift_source="DLO", name=req.path, logger=self.logger,
                 max_get_time=self.dlo.max_get_time,
-                response_body_length=actual_content_length)
+                response_body_length=actual_content_length,
+                prefetch_segments=self.dlo.prefetch_segments)
 
             try:
                 app_iter.validate_first_segment()
@@ -367,6 +368,7 @@ class DynamicLargeObject(object):
             'rate_limit_after_segment', '10'))
         self.rate_limit_segments_per_sec = int(conf.get(
             'rate_limit_segments_per_sec', '1'))
+        self.prefetch_segments = int(conf.get('prefetch_segments', '0'))
 
     def _populate_config_from_old_location(self, conf):
         if ('rate_limit_after_segment' in conf or
@@ -24,7 +24,7 @@ The logging format implemented below is as follows:
 client_ip remote_addr datetime request_method request_path protocol
     status_int referer user_agent auth_token bytes_recvd bytes_sent
     client_etag transaction_id headers request_time source log_info
-    request_start_time request_end_time
+    request_start_time request_end_time policy_index [phase_times]
 
 These values are space-separated, and each is url-encoded, so that they can
 be separated with a simple .split()
@@ -46,6 +46,12 @@ be separated with a simple .split()
   ``env.setdefault('swift.log_info', []).append(your_info)`` so as to
   not disturb others' log information.
 
+* phase_times is only logged if access_log_phase_times is set. It lists how
+  long handling the request spent in each of its phases, as
+  ``phase:seconds`` pairs, comma separated. The phases are timed by the proxy
+  server and its middleware through the dict in swift.phase_times in the
+  WSGI environment, using ``swift.common.request_helpers.timed_phase``.
+
 * Values that are missing (e.g. due to a header not being present) or zero
   are generally represented by a single hyphen ('-').
 
@@ -81,6 +87,7 @@ from swift.common.utils import (get_logger, get_remote_client,
                                 get_valid_utf8_str, config_true_value,
                                 InputProxy, list_from_csv, get_policy_index)
 
+from swift.common.memcached import round_trip_count
 from swift.common.storage_policy import POLICIES
 
 QUOTE_SAFE = '/:'
@@ -99,6 +106,8 @@ class ProxyLoggingMiddleware(object):
         log_hdrs_only = list_from_csv(conf.get(
             'access_log_headers_only', ''))
         self.log_hdrs_only = [x.title() for x in log_hdrs_only]
+        self.log_phase_times = config_true_value(conf.get(
+            'access_log_phase_times', 'no'))
 
         # The leading access_* check is in case someone assumes that
         # log_statsd_valid_http_methods behaves like the other log_statsd_*
@@ -139,7 +148,8 @@ class ProxyLoggingMiddleware(object):
         return value
 
     def log_request(self, req, status_int, bytes_received, bytes_sent,
-                    start_time, end_time, resp_headers=None):
+                    start_time, end_time, resp_headers=None,
+                    memcache_round_trips=0):
         """
         Log a request.
 
@@ -150,6 +160,8 @@ class ProxyLoggingMiddleware(object):
         :param start_time: timestamp request started
         :param end_time: timestamp request completed
         :param resp_headers: dict of the response headers
+        :param memcache_round_trips: how many times the request waited for
+                                     memcache
         """
         resp_headers = resp_headers or {}
         req_path = get_valid_utf8_str(req.path)
@@ -173,6 +185,12 @@ class ProxyLoggingMiddleware(object):
         start_time_str = "%.9f" % start_time
         end_time_str = "%.9f" % end_time
         policy_index = get_policy_index(req.headers, resp_headers)
+        phase_times = req.environ.get('swift.phase_times')
+        optional_fields = ()
+        if self.log_phase_times:
+            optional_fields = (','.join(
+                '%s:%.4f' % (phase, phase_times[phase])
+                for phase in sorted(phase_times or ())),)
         self.access_logger.info(' '.join(
             quote(str(x) if x else '-', QUOTE_SAFE)
             for x in (
@@ -197,7 +215,7 @@ class ProxyLoggingMiddleware(object):
                 start_time_str,
                 end_time_str,
                 policy_index
-            )))
+            ) + optional_fields))
 
         # Log timing and bytes-transferred data to StatsD
         metric_name = self.statsd_metric_name(req, status_int, method)
@@ -212,6 +230,14 @@ class ProxyLoggingMiddleware(object):
                                       (end_time - start_time) * 1000)
             self.access_logger.update_stats(metric_name + '.xfer',
                                             bytes_received + bytes_sent)
+            if memcache_round_trips:
+                self.access_logger.update_stats(
+                    metric_name + '.memcache_trips',
+                    memcache_round_trips)
+            if self.log_phase_times and phase_times:
+                for phase, phase_time in phase_times.items():
+                    self.access_logger.timing(
+                        metric_name + '.phase.' + phase, phase_time * 1000)
         if metric_name_policy:
             self.access_logger.timing(metric_name_policy + '.timing',
                                       (end_time - start_time) * 1000)
@@ -259,11 +285,16 @@ class ProxyLoggingMiddleware(object):
             return self.app(env, start_response)
 
         self.mark_req_logged(env)
+        if self.log_phase_times:
+            env.setdefault('swift.phase_times', {})
 
         start_response_args = [None]
         input_proxy = InputProxy(env['wsgi.input'])
         env['wsgi.input'] = input_proxy
         start_time = time.time()
+        # memcache round trips are counted by greenthread, and this one
+        # handles the request
+        memcache_round_trips = round_trip_count()
 
         def my_start_response(status, headers, exc_info=None):
             start_response_args[0] = (status, list(headers), exc_info)
@@ -329,7 +360,9 @@ class ProxyLoggingMiddleware(object):
                 status_int = status_int_for_logging(client_disconnect)
                 self.log_request(
                     req, status_int, input_proxy.bytes_received, bytes_sent,
-                    start_time, time.time(), resp_headers=resp_headers)
+                    start_time, time.time(), resp_headers=resp_headers,
+                    memcache_round_trips=(
+                        round_trip_count() - memcache_round_trips))
                 close_method = getattr(iterable, 'close', None)
                 if callable(close_method):
                     close_method()
@@ -342,7 +375,8 @@ class ProxyLoggingMiddleware(object):
             status_int = status_int_for_logging(start_status=500)
             self.log_request(
                 req, status_int, input_proxy.bytes_received, 0, start_time,
-                time.time())
+                time.time(), memcache_round_trips=(
+                    round_trip_count() - memcache_round_trips))
             six.reraise(exc_type, exc_value, exc_traceback)
         else:
             return iter_response(iterable)
@@ -17,8 +17,10 @@ from swift import gettext_ as _
 
 import eventlet
 
-from swift.common.utils import cache_from_env, get_logger, register_swift_info
-from swift.proxy.controllers.base import get_account_info, get_container_info
+from swift.common.utils import cache_from_env, get_logger, \
+    register_swift_info, LRUCache
+from swift.proxy.controllers.base import get_account_info, \
+    get_container_info, prefetch_info
 from swift.common.memcached import MemcacheConnectionError
 from swift.common.swob import Request, Response
 
@@ -90,9 +92,19 @@ class RateLimitMiddleware(object):
 
     Rate limits requests on both an Account and Container level.  Limits are
     configurable.
+
+    The requests of all the proxies are counted against each limit in
+    memcache. With sync_interval set, each worker counts its requests
+    locally instead, and only adds them to the count in memcache, getting
+    the other workers' requests back, every sync_interval seconds or once
+    they'd take sync_budget_seconds at the limit's rate.
     """
 
     BLACK_LIST_SLEEP = 1
+    # most limits a worker counts the requests of locally
+    MAX_LOCAL_BUCKETS = 10000
+    # fields of a local bucket
+    RUNNING_TIME, UNSYNCED, SYNCED_AT = 0, 1, 2
 
     def __init__(self, app, conf, logger=None):
 
@@ -116,6 +128,11 @@ class RateLimitMiddleware(object):
             conf, 'container_ratelimit_')
         self.container_listing_ratelimits = interpret_conf_limits(
             conf, 'container_listing_ratelimit_')
+        self.sync_interval = float(conf.get('sync_interval', 0))
+        self.sync_budget_seconds = \
+            float(conf.get('sync_budget_seconds', 1))
+        self.local_buckets = LRUCache(maxsize=self.MAX_LOCAL_BUCKETS,
+                                      maxtime=float('inf'))
 
     def get_container_size(self, env):
         rv = 0
@@ -194,14 +211,21 @@ class RateLimitMiddleware(object):
         try:
             now_m = int(round(time.time() * self.clock_accuracy))
             time_per_request_m = int(round(self.clock_accuracy / max_rate))
-            running_time_m = self.memcache_client.incr(
-                key, delta=time_per_request_m)
+            if self.sync_interval > 0:
+                running_time_m, bucket = self._incr_local(
+                    key, now_m, time_per_request_m)
+            else:
+                bucket = None
+                running_time_m = self.memcache_client.incr(
+                    key, delta=time_per_request_m)
             need_to_sleep_m = 0
             if (now_m - running_time_m >
                     self.rate_buffer_seconds * self.clock_accuracy):
                 next_avail_time = int(now_m + time_per_request_m)
                 self.memcache_client.set(key, str(next_avail_time),
                                          serialize=False)
+                if bucket is not None:
+                    bucket[:] = [next_avail_time, 0, now_m]
             else:
                 need_to_sleep_m = \
                     max(running_time_m - now_m - time_per_request_m, 0)
@@ -209,7 +233,14 @@ class RateLimitMiddleware(object):
             max_sleep_m = self.max_sleep_time_seconds * self.clock_accuracy
             if max_sleep_m - need_to_sleep_m <= self.clock_accuracy * 0.01:
                 # treat as no-op decrement time
-                self.memcache_client.decr(key, delta=time_per_request_m)
+                if bucket is not None:
+                    bucket[self.RUNNING_TIME] -= time_per_request_m
+                if bucket is not None and \
+                        bucket[self.UNSYNCED] >= time_per_request_m:
+                    # it's not been added to memcache yet
+                    bucket[self.UNSYNCED] -= time_per_request_m
+                else:
+                    self.memcache_client.decr(key, delta=time_per_request_m)
                 raise MaxSleepTimeHitError(
                     "Max Sleep Time Exceeded: %.2f" %
                     (float(need_to_sleep_m) / self.clock_accuracy))
@@ -218,6 +249,56 @@ class RateLimitMiddleware(object):
         except MemcacheConnectionError:
             return 0
 
+    def _incr_local(self, key, now_m, time_per_request_m):
+        """
+        Counts a request against the worker's local bucket for a limit,
+        adding the requests counted locally to memcache if it's time to.
+
+        :param key: a memcache key
+        :param now_m: the time now, in clock_accuracy units
+        :param time_per_request_m: time per request at the limit's rate, in
+                                   clock_accuracy units
+        :returns: a tuple of the limit's running time with the request
+                  counted, and the bucket, a list of the running time, the
+                  time of the requests not yet added to memcache, and when it
+                  was last synced with memcache, all in clock_accuracy units
+        :raises MemcacheConnectionError: if memcache is not available
+        """
+        bucket = self.local_buckets.get(key)
+        if bucket is None:
+            # there's nothing to go by locally yet, so count the request in
+            # memcache (as do other greenthreads that get here meanwhile)
+            running_time_m = self.memcache_client.incr(
+                key, delta=time_per_request_m)
+            bucket = self.local_buckets.get(key)
+            if bucket is None:
+                bucket = self.local_buckets.set(
+                    key, [running_time_m, 0, now_m])
+            return running_time_m, bucket
+
+        bucket[self.RUNNING_TIME] += time_per_request_m
+        bucket[self.UNSYNCED] += time_per_request_m
+        if now_m - bucket[self.SYNCED_AT] < \
+                self.sync_interval * self.clock_accuracy and \
+                bucket[self.UNSYNCED] < \
+                self.sync_budget_seconds * self.clock_accuracy:
+            return bucket[self.RUNNING_TIME], bucket
+
+        # Other greenthreads keep counting against the bucket while we wait
+        # for memcache, so take what we add to memcache out of it first;
+        # otherwise they'd find it still due a sync and add it again.
+        unsynced_m = bucket[self.UNSYNCED]
+        bucket[self.UNSYNCED] = 0
+        bucket[self.SYNCED_AT] = now_m
+        try:
+            running_time_m = self.memcache_client.incr(key, delta=unsynced_m)
+        except MemcacheConnectionError:
+            bucket[self.UNSYNCED] += unsynced_m
+            raise
+        # plus the requests counted locally meanwhile
+        bucket[self.RUNNING_TIME] = running_time_m + bucket[self.UNSYNCED]
+        return running_time_m, bucket
+
     def handle_ratelimit(self, req, account_name, container_name, obj_name):
         '''
         Performs rate limiting and account white/black listing.  Sleeps
@@ -231,6 +312,10 @@ class RateLimitMiddleware(object):
         if not self.memcache_client:
             return None
 
+        if account_name:
+            # the container info is wanted here or later on, so look it up
+            # along with the account info
+            prefetch_info(req.environ, self.app, account_name, container_name)
         try:
             account_info = get_account_info(req.environ, self.app,
                                             swift_source='RL')
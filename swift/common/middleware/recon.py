@@ -25,6 +25,7 @@ from swift.common.swob import Request, Response
 from swift.common.utils import get_logger, config_true_value, \
     SWIFT_CONF_FILE
 from swift.common.constraints import check_mount
+from swift.common.shared_table import SharedTable
 from resource import getpagesize
 from hashlib import md5
 
@@ -58,6 +59,8 @@ class ReconMiddleware(object):
                                                 'account.recon')
         self.drive_recon_cache = os.path.join(self.recon_cache_path,
                                               'drive.recon')
+        self.node_timing_table = os.path.join(self.recon_cache_path,
+                                              'proxy-node-timing.table')
         self.account_ring_path = os.path.join(swift_dir, 'account.ring.gz')
         self.container_ring_path = os.path.join(swift_dir, 'container.ring.gz')
 
@@ -89,6 +92,30 @@ class ReconMiddleware(object):
             self.logger.exception(_('Error retrieving recon data'))
         return dict((key, None) for key in cache_keys)
 
+    def _from_shared_table(self, table_file):
+        """retrieve the rows of a table shared by the workers of a server
+
+        :params table_file: file the table is in
+        :return: dict of each row's key to its values and when it was
+                 updated; None if the table couldn't be read
+        """
+        try:
+            table = SharedTable(path=table_file, readonly=True)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return {}
+            self.logger.exception(_('Error reading shared table'))
+            return None
+        except Exception:
+            self.logger.exception(_('Error retrieving shared table data'))
+            return None
+        return dict((key, dict(values, updated=updated))
+                    for key, updated, values in table.items())
+
+    def get_node_timing(self):
+        """get the proxy's connect and first byte times for each device"""
+        return self._from_shared_table(self.node_timing_table)
+
     def get_version(self):
         """get swift version"""
         verinfo = {'version': swiftver}
@@ -380,6 +407,8 @@ class ReconMiddleware(object):
             content = self.get_driveaudit_error()
         elif rcheck == "time":
             content = self.get_time()
+        elif rcheck == "nodetiming":
+            content = self.get_node_timing()
         else:
             content = "Invalid path: %s" % req.path
             return Response(request=req, status="404 Not Found",
@@ -196,6 +196,7 @@ metadata which can be used for stats purposes.
 
 from six.moves import range
 
+from collections import OrderedDict
 from datetime import datetime
 import json
 import mimetypes
@@ -212,7 +213,7 @@ from swift.common.swob import Request, HTTPBadRequest, HTTPServerError, \
 from swift.common.utils import get_logger, config_true_value, \
     get_valid_utf8_str, override_bytes_from_content_type, split_path, \
     register_swift_info, RateLimitedIterator, quote, close_if_possible, \
-    closing_if_possible
+    closing_if_possible, ContextPool
 from swift.common.request_helpers import SegmentedIterable
 from swift.common.constraints import check_utf8, MAX_BUFFERED_SLO_SEGMENTS
 from swift.common.http import HTTP_NOT_FOUND, HTTP_UNAUTHORIZED, is_success
@@ -682,7 +683,9 @@ class SloGetContext(WSGIContext):
             name=req.path, logger=self.slo.logger,
             ua_suffix="SLO MultipartGET",
             swift_source="SLO",
-            max_get_time=self.slo.max_get_time)
+            max_get_time=self.slo.max_get_time,
+            prefetch_segments=self.slo.prefetch_segments,
+            max_prefetch_bytes=self.slo.max_prefetch_bytes)
 
         try:
             segmented_iter.validate_first_segment()
@@ -730,7 +733,13 @@ class StaticLargeObject(object):
             'rate_limit_after_segment', '10'))
         self.rate_limit_segments_per_sec = int(self.conf.get(
             'rate_limit_segments_per_sec', '0'))
-        self.bulk_deleter = Bulk(app, {}, logger=self.logger)
+        self.prefetch_segments = int(self.conf.get('prefetch_segments', 0))
+        self.max_prefetch_bytes = int(self.conf.get(
+            'max_prefetch_bytes', 33554432))
+        self.concurrency = max(1, int(self.conf.get('concurrency', 8)))
+        # the manifests are only deleted once their segments are gone
+        self.bulk_deleter = Bulk(app, {}, delete_concurrency=1,
+                                 logger=self.logger)
 
     def handle_multipart_get_or_head(self, req, start_response):
         """
@@ -796,13 +805,8 @@ class StaticLargeObject(object):
             out_content_type = 'text/plain'
         data_for_storage = []
         slo_etag = md5()
-        last_obj_path = None
-        for index, seg_dict in enumerate(parsed_data):
-            obj_name = seg_dict['path']
-            if isinstance(obj_name, six.text_type):
-                obj_name = obj_name.encode('utf-8')
-            obj_path = '/'.join(['', vrs, account, obj_name.lstrip('/')])
 
+        def do_head(obj_path):
             new_env = req.environ.copy()
             new_env['PATH_INFO'] = obj_path
             new_env['REQUEST_METHOD'] = 'HEAD'
@@ -812,10 +816,27 @@ class StaticLargeObject(object):
             new_env['CONTENT_LENGTH'] = 0
             new_env['HTTP_USER_AGENT'] = \
                 '%s MultipartPUT' % req.environ.get('HTTP_USER_AGENT')
-            if obj_path != last_obj_path:
-                last_obj_path = obj_path
-                head_seg_resp = \
-                    Request.blank(obj_path, new_env).get_response(self)
+            return Request.blank(obj_path, new_env).get_response(self)
+
+        segments = []
+        for seg_dict in parsed_data:
+            obj_name = seg_dict['path']
+            if isinstance(obj_name, six.text_type):
+                obj_name = obj_name.encode('utf-8')
+            obj_path = '/'.join(['', vrs, account, obj_name.lstrip('/')])
+            segments.append((seg_dict, obj_name, obj_path))
+        # Each segment (or sub-SLO, whose HEAD gives the totals of its
+        # manifest) is only HEADed once, however often it's listed. The
+        # HEADs are done concurrently, but their results are checked in
+        # the order of the manifest so the errors come out the same.
+        unique_paths = list(OrderedDict.fromkeys(
+            obj_path for _seg, _name, obj_path in segments))
+        with ContextPool(min(self.concurrency, len(unique_paths))) as pool:
+            head_resps = dict(zip(unique_paths,
+                                  pool.imap(do_head, unique_paths)))
+
+        for index, (seg_dict, obj_name, obj_path) in enumerate(segments):
+            head_seg_resp = head_resps[obj_path]
 
             if head_seg_resp.is_success:
                 segment_length = head_seg_resp.content_length
@@ -35,7 +35,7 @@ from swift.common.middleware.acl import (
 from swift.common.utils import cache_from_env, get_logger, \
     split_path, config_true_value, register_swift_info
 from swift.common.utils import config_read_reseller_options
-from swift.proxy.controllers.base import get_account_info
+from swift.proxy.controllers.base import get_account_info, prefetch_info
 
 
 class TempAuth(object):
@@ -385,7 +385,21 @@ class TempAuth(object):
         if not memcache_client:
             raise Exception('Memcache required')
         memcache_token_key = '%s/token/%s' % (self.reseller_prefix, token)
-        cached_auth_data = memcache_client.get(memcache_token_key)
+        account = container = None
+        if not env.get('HTTP_AUTHORIZATION'):
+            # (with S3, the path holds a user name until checked below)
+            try:
+                version, account, container, _junk = split_path(
+                    env['PATH_INFO'], 2, 4, True)
+            except ValueError:
+                pass
+        if account:
+            # the info of the account, and of the container, are usually
+            # wanted later on, so look them up along with the token
+            cached_auth_data, = prefetch_info(
+                env, self.app, account, container, [memcache_token_key])
+        else:
+            cached_auth_data = memcache_client.get(memcache_token_key)
         if cached_auth_data:
             expires, groups = cached_auth_data
             if expires < time():
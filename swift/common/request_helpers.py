@@ -20,11 +20,15 @@ Why not swift.common.utils, you ask? Because this way we can import things
 from swob in here without creating circular imports.
 """
 
+import collections
+from contextlib import contextmanager
 import hashlib
 import itertools
 import sys
 import time
 
+from eventlet import greenthread
+from greenlet import GreenletExit
 import six
 from six.moves.urllib.parse import unquote
 
@@ -254,6 +258,40 @@ def copy_header_subset(from_r, to_r, condition):
             to_r.headers[k] = v
 
 
+def add_phase_time(env, phase, duration):
+    """
+    Add to the time spent in a phase of handling a request, if something
+    (e.g. proxy_logging) asked for the request's phase times by putting a
+    dict in env['swift.phase_times'].
+
+    :param env: WSGI environment of the request
+    :param phase: name of the phase, e.g. 'auth'
+    :param duration: seconds spent in the phase
+    """
+    phase_times = env.get('swift.phase_times')
+    if phase_times is not None:
+        phase_times[phase] = phase_times.get(phase, 0) + duration
+
+
+@contextmanager
+def timed_phase(env, phase):
+    """
+    Context manager that adds the time spent in its block to a phase of
+    handling a request; see add_phase_time.
+
+    :param env: WSGI environment of the request
+    :param phase: name of the phase
+    """
+    if env.get('swift.phase_times') is None:
+        yield
+        return
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        add_phase_time(env, phase, time.time() - start_time)
+
+
 class SegmentedIterable(object):
     """
     Iterable that returns the object contents for a large object.
@@ -272,11 +310,17 @@ class SegmentedIterable(object):
     :param name: name of manifest (used in logging only)
     :param response_body_length: optional response body length for
                                  the response being sent to the client.
+    :param prefetch_segments: number of the following segments to request
+                              while a segment is sent to the client
+    :param max_prefetch_bytes: the segments requested ahead are limited to
+                               this many bytes in all; segments whose size
+                               isn't listed count as 0
     """
 
     def __init__(self, req, app, listing_iter, max_get_time,
                  logger, ua_suffix, swift_source,
-                 name='<not specified>', response_body_length=None):
+                 name='<not specified>', response_body_length=None,
+                 prefetch_segments=0, max_prefetch_bytes=0):
         self.req = req
         self.app = app
         self.listing_iter = listing_iter
@@ -286,6 +330,8 @@ class SegmentedIterable(object):
         self.swift_source = swift_source
         self.name = name
         self.response_body_length = response_body_length
+        self.prefetch_segments = prefetch_segments
+        self.max_prefetch_bytes = max_prefetch_bytes
         self.peeked_chunk = None
         self.app_iter = self._internal_iter()
         self.validated_first_segment = False
@@ -376,40 +422,105 @@ class SegmentedIterable(object):
         if pending_req:
             yield pending_req, pending_etag, pending_size
 
+    def _get_segment(self, seg_req, seg_etag, seg_size):
+        seg_resp = seg_req.get_response(self.app)
+        if not is_success(seg_resp.status_int):
+            close_if_possible(seg_resp.app_iter)
+            raise SegmentError(
+                'ERROR: While processing manifest %s, '
+                'got %d while retrieving %s' %
+                (self.name, seg_resp.status_int, seg_req.path))
+
+        elif ((seg_etag and (seg_resp.etag != seg_etag)) or
+                (seg_size and (seg_resp.content_length != seg_size) and
+                 not seg_req.range)):
+            # The content-length check is for security reasons. Seems
+            # possible that an attacker could upload a >1mb object and
+            # then replace it with a much smaller object with same
+            # etag. Then create a big nested SLO that calls that
+            # object many times which would hammer our obj servers. If
+            # this is a range request, don't check content-length
+            # because it won't match.
+            close_if_possible(seg_resp.app_iter)
+            raise SegmentError(
+                'Object segment no longer valid: '
+                '%(path)s etag: %(r_etag)s != %(s_etag)s or '
+                '%(r_size)s != %(s_size)s.' %
+                {'path': seg_req.path, 'r_etag': seg_resp.etag,
+                 'r_size': seg_resp.content_length,
+                 's_etag': seg_etag,
+                 's_size': seg_size})
+        return seg_resp
+
+    def _segment_length(self, seg_req, seg_size):
+        if not seg_req.range:
+            return seg_size or 0
+        ranges = seg_req.range.ranges_for_length(seg_size)
+        return sum(end - start for start, end in ranges or [])
+
+    def _segment_responses(self):
+        """
+        Yields (request, response) for each segment, in order.
+
+        While a segment is sent to the client, the requests for up to
+        prefetch_segments of the following segments are made, so that their
+        first bytes are there when they're wanted. Those are only requested
+        while they add up to no more than max_prefetch_bytes.
+        """
+        if self.prefetch_segments <= 0:
+            for seg_req, seg_etag, seg_size in self._coalesce_requests():
+                yield seg_req, self._get_segment(seg_req, seg_etag, seg_size)
+            return
+
+        seg_reqs = self._coalesce_requests()
+        # (request, greenthread getting the response, length) of each
+        # segment requested but not yet yielded, oldest first
+        fetching = collections.deque()
+        fetching_bytes = 0
+        listing_error = None
+        try:
+            while True:
+                try:
+                    seg_req, seg_etag, seg_size = next(seg_reqs)
+                except StopIteration:
+                    break
+                except (ListingIterError, SegmentError):
+                    # the segments listed before the error still get sent
+                    listing_error = sys.exc_info()
+                    break
+                seg_length = self._segment_length(seg_req, seg_size)
+                while fetching and (
+                        len(fetching) > self.prefetch_segments or
+                        fetching_bytes + seg_length >
+                        self.max_prefetch_bytes):
+                    fetch_req, fetch, fetch_length = fetching.popleft()
+                    fetching_bytes -= fetch_length
+                    yield fetch_req, fetch.wait()
+                fetching.append((seg_req, greenthread.spawn(
+                    self._get_segment, seg_req, seg_etag, seg_size),
+                    seg_length))
+                fetching_bytes += seg_length
+
+            while fetching:
+                fetch_req, fetch, fetch_length = fetching.popleft()
+                yield fetch_req, fetch.wait()
+            if listing_error:
+                six.reraise(*listing_error)
+        finally:
+            # the client went away, or a segment was bad
+            for fetch_req, fetch, fetch_length in fetching:
+                fetch.kill()
+                try:
+                    close_if_possible(fetch.wait().app_iter)
+                except (Exception, GreenletExit):
+                    pass
+
     def _internal_iter(self):
         bytes_left = self.response_body_length
 
         try:
-            for seg_req, seg_etag, seg_size in self._coalesce_requests():
-                seg_resp = seg_req.get_response(self.app)
-                if not is_success(seg_resp.status_int):
-                    close_if_possible(seg_resp.app_iter)
-                    raise SegmentError(
-                        'ERROR: While processing manifest %s, '
-                        'got %d while retrieving %s' %
-                        (self.name, seg_resp.status_int, seg_req.path))
-
-                elif ((seg_etag and (seg_resp.etag != seg_etag)) or
-                        (seg_size and (seg_resp.content_length != seg_size) and
-                         not seg_req.range)):
-                    # The content-length check is for security reasons. Seems
-                    # possible that an attacker could upload a >1mb object and
-                    # then replace it with a much smaller object with same
-                    # etag. Then create a big nested SLO that calls that
-                    # object many times which would hammer our obj servers. If
-                    # this is a range request, don't check content-length
-                    # because it won't match.
-                    close_if_possible(seg_resp.app_iter)
-                    raise SegmentError(
-                        'Object segment no longer valid: '
-                        '%(path)s etag: %(r_etag)s != %(s_etag)s or '
-                        '%(r_size)s != %(s_size)s.' %
-                        {'path': seg_req.path, 'r_etag': seg_resp.etag,
-                         'r_size': seg_resp.content_length,
-                         's_etag': seg_etag,
-                         's_size': seg_size})
-                else:
-                    self.current_resp = seg_resp
+            for seg_req, seg_resp in self._segment_responses():
+                self.current_resp = seg_resp
 
                 seg_hash = None
                 if seg_resp.etag and not seg_req.headers.get('Range'):
@@ -498,3 +609,5 @@ class SegmentedIterable(object):
         """
         if self.current_resp:
             close_if_possible(self.current_resp.app_iter)
+        # and those of the segments requested ahead
+        close_if_possible(self.app_iter)
@@ -518,17 +518,19 @@ class RingBuilder(object):
         max_allowed_replicas = self._build_max_replicas_by_tier()
         parts_at_risk = 0
 
-        dispersion_graph = {}
+        index2tier, dev_tier_indexes = self._build_tier_indexes()
+        tier_max = [max_allowed_replicas[tier] for tier in index2tier]
+
+        graph = [None] * len(index2tier)
         # go over all the devices holding each replica part by part
         for part_id, dev_ids in enumerate(
                 six.moves.zip(*self._replica2part2dev)):
             # count the number of replicas of this part for each tier of each
             # device, some devices may have overlapping tiers!
             replicas_at_tier = defaultdict(int)
-            for rep_id, dev in enumerate(iter(
-                    self.devs[dev_id] for dev_id in dev_ids)):
-                for tier in (dev.get('tiers') or tiers_for_dev(dev)):
-                    replicas_at_tier[tier] += 1
+            for rep_id, dev_id in enumerate(dev_ids):
+                for index in dev_tier_indexes[dev_id]:
+                    replicas_at_tier[index] += 1
                 # IndexErrors will be raised if the replicas are increased or
                 # decreased, and that actually means the partition has changed
                 try:
@@ -537,23 +539,25 @@ class RingBuilder(object):
                     changed_parts += 1
                     continue
 
-                if old_device != dev['id']:
+                if old_device != dev_id:
                     changed_parts += 1
             part_at_risk = False
             # update running totals for each tiers' number of parts with a
             # given replica count
-            for tier, replicas in replicas_at_tier.items():
-                if tier not in dispersion_graph:
-                    dispersion_graph[tier] = [self.parts] + [0] * int_replicas
-                dispersion_graph[tier][0] -= 1
-                dispersion_graph[tier][replicas] += 1
-                if replicas > max_allowed_replicas[tier]:
+            for index, replicas in replicas_at_tier.items():
+                if graph[index] is None:
+                    graph[index] = [self.parts] + [0] * int_replicas
+                graph[index][0] -= 1
+                graph[index][replicas] += 1
+                if replicas > tier_max[index]:
                     part_at_risk = True
             # this part may be at risk in multiple tiers, but we only count it
             # as at_risk once
             if part_at_risk:
                 parts_at_risk += 1
-        self._dispersion_graph = dispersion_graph
+        self._dispersion_graph = dict(
+            (index2tier[index], replicas) for index, replicas in
+            enumerate(graph) if replicas is not None)
         self.dispersion = 100.0 * parts_at_risk / self.parts
         return changed_parts
 
@@ -947,6 +951,8 @@ class RingBuilder(object):
         Update the map of partition => [replicas] to be reassigned from
         insufficiently-far-apart replicas.
         """
+        index2tier, dev_tier_indexes = self._build_tier_indexes()
+        tier_max = [replica_plan[tier]['max'] for tier in index2tier]
         # Now we gather partitions that are "at risk" because they aren't
         # currently sufficient spread out across the cluster.
         for part in range(self.parts):
@@ -956,8 +962,8 @@ class RingBuilder(object):
             # partition.
             replicas_at_tier = defaultdict(int)
             for dev in self._devs_for_part(part):
-                for tier in dev['tiers']:
-                    replicas_at_tier[tier] += 1
+                for index in dev_tier_indexes[dev['id']]:
+                    replicas_at_tier[index] += 1
 
             # Now, look for partitions not yet spread out enough.
             undispersed_dev_replicas = []
@@ -969,12 +975,12 @@ class RingBuilder(object):
                 # the min part hour check is ignored iff a device has more
                 # than one replica of a part assigned to it - which would have
                 # only been possible on rings built with older version of code
+                tier_indexes = dev_tier_indexes[dev_id]
                 if (self._last_part_moves[part] < self.min_part_hours and
-                        not replicas_at_tier[dev['tiers'][-1]] > 1):
+                        not replicas_at_tier[tier_indexes[-1]] > 1):
                     break
-                if all(replicas_at_tier[tier] <=
-                       replica_plan[tier]['max']
-                       for tier in dev['tiers']):
+                if all(replicas_at_tier[index] <= tier_max[index]
+                       for index in tier_indexes):
                     continue
                 undispersed_dev_replicas.append((dev, replica))
 
@@ -993,8 +999,8 @@ class RingBuilder(object):
                     "Gathered %d/%d from dev %d [dispersion]",
                     part, replica, dev['id'])
                 self._replica2part2dev[replica][part] = NONE_DEV
-                for tier in dev['tiers']:
-                    replicas_at_tier[tier] -= 1
+                for index in dev_tier_indexes[dev['id']]:
+                    replicas_at_tier[index] -= 1
                 self._last_part_moves[part] = 0
 
     def _gather_parts_for_balance_can_disperse(self, assign_parts, start,
@@ -1015,23 +1021,27 @@ class RingBuilder(object):
             if self._last_part_moves[part] < self.min_part_hours:
                 continue
             # For each part we'll look at the devices holding those parts and
-            # see if any are overweight, keeping track of replicas_at_tier as
-            # we go
+            # see if any are overweight; most parts have none, so only then
+            # do we count up replicas_at_tier
             overweight_dev_replica = []
-            replicas_at_tier = defaultdict(int)
+            part_devs = []
             for replica in self._replicas_for_part(part):
                 dev_id = self._replica2part2dev[replica][part]
                 if dev_id == NONE_DEV:
                     continue
                 dev = self.devs[dev_id]
-                for tier in dev['tiers']:
-                    replicas_at_tier[tier] += 1
+                part_devs.append(dev)
                 if dev['parts_wanted'] < 0:
                     overweight_dev_replica.append((dev, replica))
 
             if not overweight_dev_replica:
                 continue
 
+            replicas_at_tier = defaultdict(int)
+            for dev in part_devs:
+                for tier in dev['tiers']:
+                    replicas_at_tier[tier] += 1
+
             overweight_dev_replica.sort(
                 key=lambda dr: dr[0]['parts_wanted'])
             for dev, replica in overweight_dev_replica:
@@ -1170,84 +1180,133 @@ class RingBuilder(object):
             sorted((d for d in self._iter_devs() if d['weight']),
                    key=lambda x: x['sort_key'])
 
-        tier2devs = defaultdict(list)
+        tier2dev = {}
         tier2sort_key = defaultdict(tuple)
-        tier2dev_sort_key = defaultdict(list)
         max_tier_depth = 0
         for dev in available_devs:
             for tier in dev['tiers']:
-                tier2devs[tier].append(dev)  # <-- starts out sorted!
-                tier2dev_sort_key[tier].append(dev['sort_key'])
                 tier2sort_key[tier] = dev['sort_key']
                 if len(tier) > max_tier_depth:
                     max_tier_depth = len(tier)
+            tier2dev[dev['tiers'][-1]] = dev
 
+        # Number the tiers breadth first, children in sort key order, and
+        # keep everything the placement loop below needs in flat lists
+        # indexed by those numbers; at large part powers hashing tier tuples
+        # in that loop was most of the cost of a rebalance.
         tier2children_sets = build_tier_tree(available_devs)
-        tier2children = defaultdict(list)
-        tier2children_sort_key = {}
-        tiers_list = [()]
-        depth = 1
-        while depth <= max_tier_depth:
-            new_tiers_list = []
-            for tier in tiers_list:
-                child_tiers = list(tier2children_sets[tier])
-                child_tiers.sort(key=tier2sort_key.__getitem__)
-                tier2children[tier] = child_tiers
-                tier2children_sort_key[tier] = map(
-                    tier2sort_key.__getitem__, child_tiers)
-                new_tiers_list.extend(child_tiers)
-            tiers_list = new_tiers_list
+        index2tier = [()]
+        tier2index = {(): 0}
+        children = []
+        depth_start = 0
+        depth = 0
+        while depth < max_tier_depth:
+            depth_end = len(index2tier)
+            for index in range(depth_start, depth_end):
+                child_tiers = sorted(tier2children_sets[index2tier[index]],
+                                     key=tier2sort_key.__getitem__)
+                child_indexes = []
+                for child_tier in child_tiers:
+                    tier2index[child_tier] = len(index2tier)
+                    child_indexes.append(len(index2tier))
+                    index2tier.append(child_tier)
+                children.append(child_indexes)
+            depth_start = depth_end
             depth += 1
-
+        children.extend([] for _junk in range(len(index2tier) -
+                                              len(children)))
+        tier_max = [replica_plan[tier]['max'] for tier in index2tier]
+        available = [parts_available_in_tier[tier] for tier in index2tier]
+        index2dev = dict((tier2index[tier], dev)
+                         for tier, dev in tier2dev.items())
+        # zero weight devices still hold replicas, but only the tiers they
+        # share with weighted devices can ever be candidates
+        dev_tier_indexes = dict(
+            (dev['id'], [tier2index[tier] for tier in dev['tiers']
+                         if tier in tier2index])
+            for dev in self._iter_devs())
+
+        replicas_at_tier = [0] * len(index2tier)
         for part, replace_replicas in reassign_parts:
             # always update part_moves for min_part_hours
             self._last_part_moves[part] = 0
             # count up where these replicas be
-            replicas_at_tier = defaultdict(int)
+            touched = []
             for dev in self._devs_for_part(part):
-                for tier in dev['tiers']:
-                    replicas_at_tier[tier] += 1
+                for index in dev_tier_indexes[dev['id']]:
+                    replicas_at_tier[index] += 1
+                    touched.append(index)
 
             for replica in replace_replicas:
                 # Find a new home for this replica
-                tier = ()
+                index = 0
                 # This used to be a cute, recursive function, but it's been
                 # unrolled for performance.
                 depth = 1
                 while depth <= max_tier_depth:
                     # Choose the roomiest tier among those that don't
                     # already have their max replicas assigned according
-                    # to the replica_plan.
-                    candidates = [t for t in tier2children[tier] if
-                                  replicas_at_tier[t] <
-                                  replica_plan[t]['max']]
-
-                    if not candidates:
+                    # to the replica_plan; ties go to the first candidate.
+                    best = None
+                    for child in children[index]:
+                        if replicas_at_tier[child] < tier_max[child] and (
+                                best is None or
+                                available[child] > available[best]):
+                            best = child
+
+                    if best is None:
                         raise Exception('no home for %s/%s %s' % (
-                            part, replica, {t: (
-                                replicas_at_tier[t],
-                                replica_plan[t]['max'],
-                            ) for t in tier2children[tier]}))
-                    tier = max(candidates, key=lambda t:
-                               parts_available_in_tier[t])
+                            part, replica, {index2tier[c]: (
+                                replicas_at_tier[c],
+                                tier_max[c],
+                            ) for c in children[index]}))
+                    index = best
 
                     depth += 1
 
-                dev = tier2devs[tier][-1]
+                dev = index2dev[index]
                 dev['parts_wanted'] -= 1
                 dev['parts'] += 1
-                for tier in dev['tiers']:
-                    parts_available_in_tier[tier] -= 1
-                    replicas_at_tier[tier] += 1
+                for index in dev_tier_indexes[dev['id']]:
+                    available[index] -= 1
+                    replicas_at_tier[index] += 1
+                    touched.append(index)
 
                 self._replica2part2dev[replica][part] = dev['id']
                 self.logger.debug(
                     "Placed %d/%d onto dev %d", part, replica, dev['id'])
 
+            for index in touched:
+                replicas_at_tier[index] = 0
+
         # Just to save memory and keep from accidental reuse.
         for dev in self._iter_devs():
             del dev['sort_key']
 
+    def _build_tier_indexes(self):
+        """
+        Number every tier of every device, so that per-partition replica
+        counts can be kept keyed by small ints rather than by tier tuples,
+        which is much cheaper when walking millions of partitions.
+
+        :returns: a tuple of (index2tier, dev_tier_indexes) where index2tier
+                  is the list of tiers in number order and dev_tier_indexes
+                  maps each device id to the numbers of its tiers, in the
+                  order of :func:`tiers_for_dev`
+        """
+        index2tier = []
+        tier2index = {}
+        dev_tier_indexes = {}
+        for dev in self._iter_devs():
+            indexes = []
+            for tier in (dev.get('tiers') or tiers_for_dev(dev)):
+                if tier not in tier2index:
+                    tier2index[tier] = len(index2tier)
+                    index2tier.append(tier)
+                indexes.append(tier2index[tier])
+            dev_tier_indexes[dev['id']] = indexes
+        return index2tier, dev_tier_indexes
+
     @staticmethod
     def _sort_key_for(dev):
         return (dev['parts_wanted'], random.randint(0, 0xFFFF), dev['id'])
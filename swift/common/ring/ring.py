@@ -14,9 +14,12 @@
 # limitations under the License.
 
 import array
+import ctypes
 import six.moves.cPickle as pickle
 import inspect
 import json
+import mmap
+import sys
 from collections import defaultdict
 from gzip import GzipFile
 from os.path import getmtime
@@ -28,11 +31,24 @@ from hashlib import md5
 from itertools import chain
 from tempfile import NamedTemporaryFile
 
+from eventlet import spawn_n
 from six.moves import range
 
-from swift.common.utils import hash_path, validate_configuration
+from swift import gettext_ as _
+from swift.common.utils import hash_path, hash_paths, \
+    validate_configuration, LRUCache, tpool_reraise
 from swift.common.ring.utils import tiers_for_dev
 
+#: Alignment of each replica2part2dev_id table within a v2 ring file. Tables
+#: start on a page boundary so that every worker mapping the file shares the
+#: same page cache pages.
+V2_TABLE_ALIGNMENT = 4096
+
+_PART_STRUCT = struct.Struct('>I')
+
+#: Default number of partitions whose handoff order :class:`Ring` remembers.
+DEFAULT_HANDOFF_CACHE_SIZE = 1024
+
 
 class RingData(object):
     """Partitioned consistent hashing ring data (used for serialization)."""
@@ -76,6 +92,47 @@ class RingData(object):
                 array.array('H', gz_file.read(2 * partition_count)))
         return ring_dict
 
+    @classmethod
+    def deserialize_v2(cls, filename, metadata_only=False):
+        """
+        Deserialize a v2 (uncompressed, memory-mappable) ring file into a
+        dictionary with `devs`, `part_shift`, and `replica2part2dev_id` keys.
+
+        The `replica2part2dev_id` tables are not copied into process memory;
+        each one is a read-only view of a private mapping of the file, so all
+        processes that load the same ring file share one copy of the tables
+        in the page cache.
+
+        :param filename: Path to a file serialized by :meth:`serialize_v2`.
+        :param bool metadata_only: If True, only load `devs` and `part_shift`
+        :returns: A dict containing `devs`, `part_shift`, and
+                  `replica2part2dev_id`
+        """
+        with open(filename, 'rb') as fp:
+            magic, format_version, json_len = struct.unpack(
+                '!4sHI', fp.read(10))
+            ring_dict = json.loads(fp.read(json_len))
+            ring_dict['replica2part2dev_id'] = []
+            if metadata_only:
+                return ring_dict
+            # Pages are only ever read; ACCESS_COPY lets ctypes reference the
+            # mapping while guaranteeing nothing is written back to the file.
+            ring_map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        offset = 10 + json_len
+        for part_count in ring_dict['replica_lengths']:
+            offset += -offset % V2_TABLE_ALIGNMENT
+            part2dev_id = (ctypes.c_uint16 * part_count).from_buffer(
+                ring_map, offset)
+            if ring_dict['byteorder'] != sys.byteorder:
+                # Written on a host of the other endianness; we have no
+                # choice but to take a private, byte-swapped copy.
+                part2dev_id = array.array('H', part2dev_id)
+                part2dev_id.byteswap()
+            ring_dict['replica2part2dev_id'].append(part2dev_id)
+            offset += 2 * part_count
+        return ring_dict
+
     @classmethod
     def load(cls, filename, metadata_only=False):
         """
@@ -85,6 +142,20 @@ class RingData(object):
         :param bool metadata_only: If True, only load `devs` and `part_shift`.
         :returns: A RingData instance containing the loaded data.
         """
+        # v2 rings are not compressed, so they are recognized by their magic
+        # before we try to gunzip anything.
+        with open(filename, 'rb') as fp:
+            header = fp.read(6)
+        if len(header) == 6 and header[:4] == 'R1NG':
+            format_version, = struct.unpack('!H', header[4:])
+            if format_version == 2:
+                ring_data = cls.deserialize_v2(
+                    filename, metadata_only=metadata_only)
+                return RingData(ring_data['replica2part2dev_id'],
+                                ring_data['devs'], ring_data['part_shift'])
+            raise Exception('Unknown ring format version %d' %
+                            format_version)
+
         gz_file = GzipFile(filename, 'rb')
         # Python 2.6 GzipFile doesn't support BufferedIO
         if hasattr(gz_file, '_checkReadable'):
@@ -122,16 +193,53 @@ class RingData(object):
         file_obj.write(struct.pack('!I', json_len))
         file_obj.write(json_text)
         for part2dev_id in ring['replica2part2dev_id']:
-            file_obj.write(part2dev_id.tostring())
+            file_obj.write(array.array('H', part2dev_id).tostring())
+
+    def serialize_v2(self, file_obj):
+        """
+        Write out the uncompressed, memory-mappable v2 serialization.
+
+        The layout is the v1 magic, version and JSON header followed by one
+        native-endian array of unsigned shorts per replica, each starting on a
+        :data:`V2_TABLE_ALIGNMENT` boundary.
+
+        :param file_obj: A file-like object opened for binary writing,
+                         positioned at its start.
+        """
+        file_obj.write(struct.pack('!4sH', 'R1NG', 2))
+        ring = self.to_dict()
+        json_encoder = json.JSONEncoder(sort_keys=True)
+        json_text = json_encoder.encode(
+            {'devs': ring['devs'], 'part_shift': ring['part_shift'],
+             'replica_count': len(ring['replica2part2dev_id']),
+             'replica_lengths': [len(part2dev_id) for part2dev_id in
+                                 ring['replica2part2dev_id']],
+             'byteorder': sys.byteorder})
+        json_len = len(json_text)
+        file_obj.write(struct.pack('!I', json_len))
+        file_obj.write(json_text)
+        offset = 10 + json_len
+        for part2dev_id in ring['replica2part2dev_id']:
+            padding = -offset % V2_TABLE_ALIGNMENT
+            file_obj.write('\x00' * padding)
+            table = array.array('H', part2dev_id).tostring()
+            file_obj.write(table)
+            offset += padding + len(table)
 
-    def save(self, filename, mtime=1300507380.0):
+    def save(self, filename, mtime=1300507380.0, format_version=1):
         """
         Serialize this RingData instance to disk.
 
         :param filename: File into which this instance should be serialized.
         :param mtime: time used to override mtime for gzip, default or None
                       if the caller wants to include time
+        :param format_version: 1 for the gzipped format, 2 for the
+                               uncompressed format that :class:`Ring`
+                               memory-maps
         """
+        if format_version not in (1, 2):
+            raise ValueError('Unknown ring format version %r' %
+                             (format_version,))
         # Override the timestamp so that the same ring data creates
         # the same bytes on disk. This makes a checksum comparison a
         # good way to see if two rings are identical.
@@ -139,13 +247,16 @@ class RingData(object):
         # This only works on Python 2.7; on 2.6, we always get the
         # current time in the gzip output.
         tempf = NamedTemporaryFile(dir=".", prefix=filename, delete=False)
-        if 'mtime' in inspect.getargspec(GzipFile.__init__).args:
+        if format_version == 2:
+            self.serialize_v2(tempf)
+        elif 'mtime' in inspect.getargspec(GzipFile.__init__).args:
             gz_file = GzipFile(filename, mode='wb', fileobj=tempf,
                                mtime=mtime)
         else:
             gz_file = GzipFile(filename, mode='wb', fileobj=tempf)
-        self.serialize_v1(gz_file)
-        gz_file.close()
+        if format_version == 1:
+            self.serialize_v1(gz_file)
+            gz_file.close()
         tempf.flush()
         os.fsync(tempf.fileno())
         tempf.close()
@@ -164,9 +275,20 @@ class Ring(object):
 
     :param serialized_path: path to serialized RingData instance
     :param reload_time: time interval in seconds to check for a ring change
+    :param handoff_cache_size: number of partitions whose handoff order is
+                               remembered by :meth:`get_more_nodes`; 0
+                               disables the cache
+    :param logger: optional logger; ring reloads are logged and counted in
+                   statsd through it
+    :param background_reload: if True, a changed ring is loaded in a native
+                              thread while requests keep using the current
+                              one, instead of by the request that noticed
+                              the change
     """
 
-    def __init__(self, serialized_path, reload_time=15, ring_name=None):
+    def __init__(self, serialized_path, reload_time=15, ring_name=None,
+                 handoff_cache_size=DEFAULT_HANDOFF_CACHE_SIZE, logger=None,
+                 background_reload=False):
         # can't use the ring unless HASH_PATH_SUFFIX is set
         validate_configuration()
         if ring_name:
@@ -175,63 +297,134 @@ class Ring(object):
         else:
             self.serialized_path = os.path.join(serialized_path)
         self.reload_time = reload_time
+        self.logger = logger
+        self.background_reload = background_reload
+        self._reloading = False
+        self._handoff_cache = LRUCache(maxsize=handoff_cache_size)
         self._reload(force=True)
 
     def _reload(self, force=False):
         self._rtime = time() + self.reload_time
-        if force or self.has_changed():
-            ring_data = RingData.load(self.serialized_path)
-            self._mtime = getmtime(self.serialized_path)
-            self._devs = ring_data.devs
-            # NOTE(akscram): Replication parameters like replication_ip
-            #                and replication_port are required for
-            #                replication process. An old replication
-            #                ring doesn't contain this parameters into
-            #                device. Old-style pickled rings won't have
-            #                region information.
-            for dev in self._devs:
-                if dev:
-                    dev.setdefault('region', 1)
-                    if 'ip' in dev:
-                        dev.setdefault('replication_ip', dev['ip'])
-                    if 'port' in dev:
-                        dev.setdefault('replication_port', dev['port'])
-
-            self._replica2part2dev_id = ring_data._replica2part2dev_id
-            self._part_shift = ring_data._part_shift
-            self._rebuild_tier_data()
-
-            # Do this now, when we know the data has changed, rather than
-            # doing it on every call to get_more_nodes().
-            regions = set()
-            zones = set()
-            ips = set()
-            self._num_devs = 0
-            for dev in self._devs:
-                if dev:
-                    regions.add(dev['region'])
-                    zones.add((dev['region'], dev['zone']))
-                    ips.add((dev['region'], dev['zone'], dev['ip']))
-                    self._num_devs += 1
-            self._num_regions = len(regions)
-            self._num_zones = len(zones)
-            self._num_ips = len(ips)
+        if not force and not self.has_changed():
+            return
+        if force or not self.background_reload:
+            start = time()
+            self._apply_ring_state(self._load_ring_state())
+            self._log_reload(start)
+        elif not self._reloading:
+            # Keep serving requests from the current ring while the new one
+            # is loaded; see _background_reload.
+            self._reloading = True
+            spawn_n(self._background_reload)
+
+    def _background_reload(self):
+        """
+        Load the changed ring in a native thread, so that neither the request
+        that noticed the change nor any other greenthread in this process has
+        to wait for it, then swap the new ring data in.
+        """
+        start = time()
+        try:
+            state = tpool_reraise(self._load_ring_state)
+        except Exception:
+            if self.logger:
+                self.logger.exception(
+                    _('Error reloading ring %s'), self.serialized_path)
+                self.logger.increment('ring_reload_errors')
+        else:
+            # No greenthread switch can happen while the attributes are
+            # assigned, so requests see either the old ring or the new one.
+            self._apply_ring_state(state)
+            self._log_reload(start)
+        finally:
+            self._reloading = False
+
+    def _log_reload(self, start):
+        if not self.logger:
+            return
+        self.logger.info(_('Loaded ring %(path)s in %(time).3fs'), {
+            'path': self.serialized_path, 'time': time() - start})
+        self.logger.increment('ring_reloads')
+        self.logger.timing_since('ring_reload.timing', start)
+
+    def _load_ring_state(self):
+        """
+        Load the ring from disk and compute everything derived from it,
+        without touching the ring data currently in use.
 
-    def _rebuild_tier_data(self):
-        self.tier2devs = defaultdict(list)
-        for dev in self._devs:
+        :returns: a dict of attribute names to values, to be passed to
+                  :meth:`_apply_ring_state`
+        """
+        ring_data = RingData.load(self.serialized_path)
+        mtime = getmtime(self.serialized_path)
+        devs = ring_data.devs
+        # NOTE(akscram): Replication parameters like replication_ip
+        #                and replication_port are required for
+        #                replication process. An old replication
+        #                ring doesn't contain this parameters into
+        #                device. Old-style pickled rings won't have
+        #                region information.
+        for dev in devs:
+            if dev:
+                dev.setdefault('region', 1)
+                if 'ip' in dev:
+                    dev.setdefault('replication_ip', dev['ip'])
+                if 'port' in dev:
+                    dev.setdefault('replication_port', dev['port'])
+
+        tier2devs, tiers_by_length = self._build_tier_data(devs)
+
+        # Do this now, when we know the data has changed, rather than
+        # doing it on every call to get_more_nodes().
+        regions = set()
+        zones = set()
+        ips = set()
+        num_devs = 0
+        for dev in devs:
+            if dev:
+                regions.add(dev['region'])
+                zones.add((dev['region'], dev['zone']))
+                ips.add((dev['region'], dev['zone'], dev['ip']))
+                num_devs += 1
+        return {
+            '_mtime': mtime,
+            '_devs': devs,
+            '_replica2part2dev_id': ring_data._replica2part2dev_id,
+            '_part_shift': ring_data._part_shift,
+            'tier2devs': tier2devs,
+            'tiers_by_length': tiers_by_length,
+            '_num_devs': num_devs,
+            '_num_regions': len(regions),
+            '_num_zones': len(zones),
+            '_num_ips': len(ips),
+        }
+
+    def _apply_ring_state(self, state):
+        for attr, value in state.items():
+            setattr(self, attr, value)
+        self._handoff_cache.reset()
+
+    @staticmethod
+    def _build_tier_data(devs):
+        tier2devs = defaultdict(list)
+        for dev in devs:
             if not dev:
                 continue
             for tier in tiers_for_dev(dev):
-                self.tier2devs[tier].append(dev)
+                tier2devs[tier].append(dev)
 
         tiers_by_length = defaultdict(list)
-        for tier in self.tier2devs:
+        for tier in tier2devs:
             tiers_by_length[len(tier)].append(tier)
-        self.tiers_by_length = sorted(tiers_by_length.values(),
-                                      key=lambda x: len(x[0]))
-        for tiers in self.tiers_by_length:
+        tiers_by_length = sorted(tiers_by_length.values(),
+                                 key=lambda x: len(x[0]))
+        for tiers in tiers_by_length:
             tiers.sort()
+        return tier2devs, tiers_by_length
+
+    def _rebuild_tier_data(self):
+        self.tier2devs, self.tiers_by_length = \
+            self._build_tier_data(self._devs)
 
     @property
     def replica_count(self):
@@ -266,7 +459,7 @@ class Ring(object):
             if part < len(r2p2d):
                 dev_id = r2p2d[part]
                 if dev_id not in seen_ids:
-                    part_nodes.append(self.devs[dev_id])
+                    part_nodes.append(self._devs[dev_id])
                     seen_ids.add(dev_id)
         return [dict(node, index=i) for i, node in enumerate(part_nodes)]
 
@@ -285,6 +478,48 @@ class Ring(object):
         part = struct.unpack_from('>I', key)[0] >> self._part_shift
         return part
 
+    def get_parts(self, names):
+        """
+        Get the partitions for many accounts/containers/objects at once.
+
+        This is equivalent to calling :meth:`get_part` for each name, but is
+        considerably cheaper for bulk callers that look up thousands of names.
+
+        :param names: iterable of (account, container, object) tuples;
+                      container and object may be None
+        :returns: list of partition numbers, in the order of ``names``
+        """
+        if time() > self._rtime:
+            self._reload()
+        part_shift = self._part_shift
+        unpack = _PART_STRUCT.unpack_from
+        return [unpack(key)[0] >> part_shift
+                for key in hash_paths(names, raw_digest=True)]
+
+    def get_nodes_for_names(self, names):
+        """
+        Get the partitions and primary nodes for many
+        accounts/containers/objects at once.
+
+        Names that share a partition share the same list of node dicts, so
+        callers can cheaply group their work per partition or per node.
+
+        :param names: iterable of (account, container, object) tuples;
+                      container and object may be None
+        :returns: list of (partition, list of node dicts) tuples, in the order
+                  of ``names``
+
+        See :func:`get_nodes` for a description of the node dicts.
+        """
+        part_nodes = {}
+        result = []
+        for part in self.get_parts(names):
+            nodes = part_nodes.get(part)
+            if nodes is None:
+                nodes = part_nodes[part] = self._get_part_nodes(part)
+            result.append((part, nodes))
+        return result
+
     def get_part_nodes(self, part):
         """
         Get the nodes that are responsible for the partition. If one
@@ -342,6 +577,10 @@ class Ring(object):
         will usually keep the same sequences of handoffs even with
         ring changes.
 
+        The ids of the handoffs found for recently used partitions are
+        remembered until the ring is reloaded, so the first few handoffs of
+        a hot partition are yielded without walking the partition table.
+
         :param part: partition to get handoff nodes for
         :returns: generator of node dicts
 
@@ -349,6 +588,37 @@ class Ring(object):
         """
         if time() > self._rtime:
             self._reload()
+        if not self._handoff_cache.maxsize:
+            for dev in self._get_more_nodes(part):
+                yield dev
+            return
+
+        devs = self._devs
+        handoffs = self._handoff_cache.get(part)
+        if handoffs is None:
+            # [dev ids found so far, True once every handoff is known]
+            handoffs = self._handoff_cache.set(part, [[], False])
+        handoff_ids = handoffs[0]
+
+        index = 0
+        while index < len(handoff_ids):
+            yield devs[handoff_ids[index]]
+            index += 1
+        if handoffs[1]:
+            return
+        # Beyond what's known; the search is deterministic, so resume it from
+        # the start and skip what was already yielded. Other generators for
+        # the same partition may be extending handoff_ids concurrently.
+        for i, dev in enumerate(self._get_more_nodes(part)):
+            if i < index:
+                continue
+            if i == len(handoff_ids):
+                handoff_ids.append(dev['id'])
+            index += 1
+            yield dev
+        handoffs[1] = True
+
+    def _get_more_nodes(self, part):
         primary_nodes = self._get_part_nodes(part)
 
         used = set(d['id'] for d in primary_nodes)
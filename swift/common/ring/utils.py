@@ -17,6 +17,9 @@ import optparse
 import re
 import socket
 
+from six.moves import zip as izip
+from six.moves import zip_longest
+
 from swift.common.utils import expand_ipv6
 
 
@@ -669,6 +672,109 @@ def dispersion_report(builder, search_filter=None, verbose=False):
     }
 
 
+def ring_diff_report(old_ring, new_ring, part_sizes=None,
+                     default_part_size=None):
+    """
+    Compare the partition assignments of two rings and report how much data
+    every tier would send and receive if ``new_ring`` replaced ``old_ring``.
+
+    A partition replica moves when a device is assigned the partition in one
+    ring but not in the other; replicas that only swap replica index do not
+    move any data. The device that loses the assignment is counted as the
+    sender.
+
+    :param old_ring: the :class:`~swift.common.ring.RingData` in use
+    :param new_ring: the :class:`~swift.common.ring.RingData` to be deployed
+    :param part_sizes: optional dict mapping partition number to the bytes
+                       one replica of it holds, e.g. from a sample of
+                       partition directories
+    :param default_part_size: bytes assumed for one replica of partitions
+                              missing from ``part_sizes``; defaults to the
+                              mean of ``part_sizes``
+    :returns: a dict with the number of partitions, moved partitions, moved
+              replicas and moved bytes, and a ``graph`` list of
+              (tier_name, tier_report) sorted by tier. Each tier report has
+              parts_in, parts_out, bytes_in and bytes_out. Bytes are None
+              if neither ``part_sizes`` nor ``default_part_size`` is given.
+    :raises ValueError: if the rings have different partition powers
+    """
+    if old_ring._part_shift != new_ring._part_shift:
+        raise ValueError('Rings have different partition powers; every '
+                         'partition would move')
+    if part_sizes and default_part_size is None:
+        default_part_size = \
+            float(sum(part_sizes.values())) / len(part_sizes)
+    with_bytes = default_part_size is not None
+    part_sizes = part_sizes or {}
+
+    dev_parts_in = defaultdict(int)
+    dev_parts_out = defaultdict(int)
+    dev_bytes_in = defaultdict(float)
+    dev_bytes_out = defaultdict(float)
+    parts_moved = replicas_moved = 0
+    bytes_moved = 0.0
+    # Compare whole columns of the partition tables at once and only look
+    # closer at the partitions whose assignment differs.
+    for part, (old_ids, new_ids) in enumerate(izip(
+            zip_longest(*old_ring._replica2part2dev_id),
+            zip_longest(*new_ring._replica2part2dev_id))):
+        if old_ids == new_ids:
+            continue
+        old_ids = set(old_ids)
+        new_ids = set(new_ids)
+        old_ids.discard(None)
+        new_ids.discard(None)
+        added = new_ids - old_ids
+        removed = old_ids - new_ids
+        if not (added or removed):
+            continue
+        parts_moved += 1
+        replicas_moved += len(added)
+        if with_bytes:
+            part_size = part_sizes.get(part, default_part_size)
+            bytes_moved += part_size * len(added)
+        for dev_id in added:
+            dev_parts_in[dev_id] += 1
+            if with_bytes:
+                dev_bytes_in[dev_id] += part_size
+        for dev_id in removed:
+            dev_parts_out[dev_id] += 1
+            if with_bytes:
+                dev_bytes_out[dev_id] += part_size
+
+    tier_reports = {}
+    tier_names = {}
+    for dev_id in set(dev_parts_in) | set(dev_parts_out):
+        if dev_id < len(new_ring.devs) and new_ring.devs[dev_id]:
+            ring = new_ring
+        else:
+            ring = old_ring
+        for tier in tiers_for_dev(ring.devs[dev_id]):
+            if tier not in tier_reports:
+                tier_names[tier] = get_tier_name(tier, ring)
+                tier_reports[tier] = {
+                    'parts_in': 0,
+                    'parts_out': 0,
+                    'bytes_in': 0.0 if with_bytes else None,
+                    'bytes_out': 0.0 if with_bytes else None,
+                }
+            tier_report = tier_reports[tier]
+            tier_report['parts_in'] += dev_parts_in[dev_id]
+            tier_report['parts_out'] += dev_parts_out[dev_id]
+            if with_bytes:
+                tier_report['bytes_in'] += dev_bytes_in[dev_id]
+                tier_report['bytes_out'] += dev_bytes_out[dev_id]
+
+    return {
+        'parts': 2 ** (32 - new_ring._part_shift),
+        'parts_moved': parts_moved,
+        'replicas_moved': replicas_moved,
+        'bytes_moved': bytes_moved if with_bytes else None,
+        'graph': [(tier_names[tier], tier_reports[tier])
+                  for tier in sorted(tier_reports)],
+    }
+
+
 def get_tier_name(tier, builder):
     if len(tier) == 1:
         return "r%s" % (tier[0], )
@@ -0,0 +1,230 @@
+# Copyright (c) 2016 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A small table of numbers kept in a memory-mapped file, so that all the
+processes on a host that map the file (e.g. the workers of a proxy server)
+share it, and other processes (e.g. recon) can read it.
+"""
+
+import errno
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+import six
+
+
+MAGIC = b'SWIFTST1'
+# magic, row size, number of rows, comma separated field names
+HEADER = struct.Struct('<8sII240s')
+KEY_SIZE = 64
+# how many rows to look through for a key
+PROBES = 8
+
+
+class SharedTable(object):
+    """
+    Fixed-size hash table, shared through a memory map, whose rows hold a key,
+    the time the row was last updated, and a float for each of the fields.
+
+    Rows are found by hashing their key and probing a few slots. When all of
+    those are taken, the least recently updated row is replaced, so the table
+    holds the most recently used keys.
+
+    There is no locking between processes: of two concurrent updates of a
+    row, one may be lost, and a reader may see a row half-updated. That is
+    fine for the statistics this is meant for, which are only used as hints.
+
+    :param fields: names of the values in each row
+    :param path: file to map. If None, the table is private to this process
+                 and processes forked from it after it's created.
+    :param rows: number of rows in the table
+    :param readonly: map an existing file without changing it, taking the
+                     number of rows, and the fields if not given, from the
+                     file
+    :raises ValueError: if a file opened readonly doesn't hold a table, or
+                        holds one with other fields
+    """
+
+    def __init__(self, fields=None, path=None, rows=4096, readonly=False):
+        if readonly:
+            with open(path, 'rb') as fp:
+                magic, row_size, rows, file_fields = HEADER.unpack(
+                    fp.read(HEADER.size).ljust(HEADER.size, b'\0'))
+                file_fields = tuple(
+                    file_fields.rstrip(b'\0').decode('ascii').split(','))
+                if magic != MAGIC or fields not in (None, file_fields):
+                    raise ValueError('%s is not a table of %s' % (
+                        path, ', '.join(fields or ['anything'])))
+                self._set_fields(file_fields, rows)
+                self._map = mmap.mmap(fp.fileno(), self._size,
+                                      access=mmap.ACCESS_READ)
+            return
+
+        self._set_fields(tuple(fields), rows)
+        header = HEADER.pack(MAGIC, self._row.size, rows,
+                             ','.join(self.fields).encode('ascii'))
+        if path is None:
+            self._map = mmap.mmap(-1, self._size)
+            self._map[:HEADER.size] = header
+            return
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # keep other processes from replacing the file while we're
+                # still checking it
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if not self._is_current(fd, path):
+                    # another process replaced it meanwhile
+                    continue
+                if os.read(fd, HEADER.size) == header and \
+                        os.fstat(fd).st_size == self._size:
+                    self._map = mmap.mmap(fd, self._size)
+                else:
+                    self._map = self._replace(path, header)
+                break
+            finally:
+                # the map holds a duplicate of fd, which would keep the lock
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    @staticmethod
+    def _is_current(fd, path):
+        try:
+            return os.stat(path).st_ino == os.fstat(fd).st_ino
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return False
+
+    def _replace(self, path, header):
+        """
+        Start over with an empty table in a new file, renamed over path.
+        Other processes may still have the old file mapped, and would get a
+        SIGBUS if it was truncated under them; they keep the old file.
+
+        :returns: a map of the new file
+        """
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path),
+                                       prefix='.' + os.path.basename(path))
+        try:
+            os.fchmod(fd, 0o644)
+            os.ftruncate(fd, self._size)
+            os.write(fd, header)
+            os.rename(tmppath, path)
+            return mmap.mmap(fd, self._size)
+        except BaseException:
+            try:
+                os.unlink(tmppath)
+            except OSError:
+                pass
+            raise
+        finally:
+            os.close(fd)
+
+    def _set_fields(self, fields, rows):
+        self.fields = fields
+        self.rows = rows
+        self._row = struct.Struct(
+            '<%dsd%dd' % (KEY_SIZE, len(self.fields)))
+
+    @property
+    def _size(self):
+        return HEADER.size + self._row.size * self.rows
+
+    def _offset(self, slot):
+        return HEADER.size + self._row.size * slot
+
+    def _slots(self, key):
+        start = zlib.crc32(key) & 0xffffffff
+        for i in range(min(PROBES, self.rows)):
+            yield (start + i) % self.rows
+
+    def _key(self, key):
+        if isinstance(key, six.text_type):
+            key = key.encode('utf-8')
+        return key[:KEY_SIZE]
+
+    def _find(self, key):
+        """
+        :returns: (slot, row) of the key's row, or of the row to replace
+                  with it, where row is None if that isn't the key's
+        """
+        oldest = None
+        for slot in self._slots(key):
+            row = self._row.unpack_from(self._map, self._offset(slot))
+            row_key = row[0].rstrip(b'\0')
+            if row_key == key:
+                return slot, row
+            if not row_key:
+                return slot, None
+            if oldest is None or row[1] < oldest[1]:
+                oldest = slot, row[1]
+        return oldest[0], None
+
+    def get(self, key):
+        """
+        Look a key up.
+
+        :param key: key of the row
+        :returns: (time updated, dict of field values), or None if the key
+                  isn't in the table
+        """
+        key = self._key(key)
+        slot, row = self._find(key)
+        if row is None:
+            return None
+        return row[1], dict(zip(self.fields, row[2:]))
+
+    def update(self, key, values, now=None):
+        """
+        Set some of the values in a key's row, adding the row if necessary.
+        Values not given keep their value, or are 0 in a new row.
+
+        :param key: key of the row
+        :param values: dict of field values
+        :param now: time of the update; defaults to the current time
+        """
+        key = self._key(key)
+        slot, row = self._find(key)
+        if row is None:
+            old_values = [0.0] * len(self.fields)
+        else:
+            old_values = row[2:]
+        new_values = [values.get(field, old_value)
+                      for field, old_value in zip(self.fields, old_values)]
+        if now is None:
+            now = time.time()
+        self._row.pack_into(self._map, self._offset(slot), key, now,
+                            *new_values)
+
+    def items(self):
+        """
+        :returns: list of (key, time updated, dict of field values) for all
+                  the rows in the table
+        """
+        items = []
+        for slot in range(self.rows):
+            row = self._row.unpack_from(self._map, self._offset(slot))
+            row_key = row[0].rstrip(b'\0')
+            if row_key:
+                items.append((row_key, row[1],
+                              dict(zip(self.fields, row[2:]))))
+        return items
@@ -1766,6 +1766,38 @@ def hash_path(account, container=None, object=None, raw_digest=False):
                    + HASH_PATH_SUFFIX).hexdigest()
 
 
+def hash_paths(names, raw_digest=False):
+    """
+    Get the canonical hashes for many accounts/containers/objects.
+
+    This yields the same hashes as calling :func:`hash_path` for each name,
+    but the md5 state for ``HASH_PATH_PREFIX`` is only computed once and
+    copied for every name.
+
+    :param names: iterable of (account, container, object) tuples;
+                  container and object may be None
+    :param raw_digest: If True, yield the raw versions rather than hex
+                       digests
+    :returns: generator of hash strings, in the order of ``names``
+    """
+    prefix_md5 = md5(HASH_PATH_PREFIX + '/')
+    suffix = HASH_PATH_SUFFIX
+    for account, container, object in names:
+        if object and not container:
+            raise ValueError('container is required if object is provided')
+        path = account
+        if container:
+            path += '/' + container
+            if object:
+                path += '/' + object
+        path_md5 = prefix_md5.copy()
+        path_md5.update(path + suffix)
+        if raw_digest:
+            yield path_md5.digest()
+        else:
+            yield path_md5.hexdigest()
+
+
 @contextmanager
 def lock_path(directory, timeout=10, timeout_class=None):
     """
@@ -2265,22 +2297,37 @@ class GreenAsyncPile(object):
         self._inflight += 1
         self._pool.spawn(self._run_func, func, args, kwargs)
 
-    def waitall(self, timeout):
-        """
-        Wait timeout seconds for any results to come in.
-
-        :param timeout: seconds to wait for results
-        :returns: list of results accrued in that time
-        """
+    def _wait(self, timeout, first_n=None):
         results = []
         try:
             with GreenAsyncPileWaitallTimeout(timeout):
                 while True:
                     results.append(next(self))
+                    if first_n and len(results) >= first_n:
+                        break
         except (GreenAsyncPileWaitallTimeout, StopIteration):
             pass
         return results
 
+    def waitfirst(self, timeout):
+        """
+        Wait up to timeout seconds for the first result to come in.
+
+        :param timeout: seconds to wait for results
+        :returns: list of the first result, or an empty list if there wasn't
+                  one in that time
+        """
+        return self._wait(timeout, first_n=1)
+
+    def waitall(self, timeout):
+        """
+        Wait timeout seconds for any results to come in.
+
+        :param timeout: seconds to wait for results
+        :returns: list of results accrued in that time
+        """
+        return self._wait(timeout)
+
     def __iter__(self):
         return self
 
@@ -2828,6 +2875,9 @@ class LRUCache(object):
     """
     Decorator for size/time bound memoization that evicts the least
     recently used members.
+
+    It can also be used as a cache on its own, through get(), set() and
+    delete().
     """
 
     PREV, NEXT, KEY, CACHED_AT, VALUE = 0, 1, 2, 3, 4  # link fields
@@ -2865,6 +2915,47 @@ class LRUCache(object):
         link[self.NEXT] = self.tail
         return value
 
+    def get(self, key, default=None):
+        """
+        Get the value cached for a key, marking it as the most recently used.
+
+        :param key: the key
+        :param default: what to return if the key isn't cached
+        :returns: the cached value, or default if the key isn't cached or
+                  its value has timed out
+        """
+        link = self.mapping.get((key,))
+        if link is None:
+            return default
+        try:
+            return self.get_cached(link, key)
+        except KeyError:
+            self.delete(key)
+            return default
+
+    def set(self, key, value):
+        """
+        Cache a value for a key, replacing any value cached for it before.
+
+        :param key: the key
+        :param value: the value
+        :returns: the value
+        """
+        self.delete(key)
+        return self.set_cache(value, key)
+
+    def delete(self, key):
+        """
+        Remove a key from the cache, if it's cached.
+
+        :param key: the key
+        """
+        link = self.mapping.pop((key,), None)
+        if link is not None:
+            link_prev, link_next = link[self.PREV], link[self.NEXT]
+            link_prev[self.NEXT] = link_next
+            link_next[self.PREV] = link_prev
+
     def __call__(self, f):
 
         class LRUCacheWrapped(object):
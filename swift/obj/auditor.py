@@ -28,6 +28,7 @@ from swift.common.utils import get_logger, ratelimit_sleep, dump_recon_cache, \
     list_from_csv, listdir
 from swift.common.exceptions import DiskFileQuarantined, DiskFileNotExist
 from swift.common.daemon import Daemon
+from swift.common.storage_policy import REPL_POLICY
 
 SLEEP_BETWEEN_AUDITS = 30
 
@@ -39,7 +40,8 @@ class AuditorWorker(object):
         self.conf = conf
         self.logger = logger
         self.devices = devices
-        self.diskfile_mgr = diskfile.DiskFileManager(conf, self.logger)
+        self.diskfile_mgr = diskfile.DiskFileRouter.get_manager_cls(
+            REPL_POLICY, conf.get('diskfile_backend'))(conf, self.logger)
         self.max_files_per_second = float(conf.get('files_per_second', 20))
         self.max_bytes_per_second = float(conf.get('bytes_per_second',
                                                    10000000))
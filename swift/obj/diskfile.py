@@ -34,17 +34,22 @@ import six.moves.cPickle as pickle
 import errno
 import fcntl
 import os
+import re
+import shutil
+import struct
 import time
 import uuid
 import hashlib
 import logging
 import traceback
 import xattr
+from binascii import hexlify, unhexlify
 from os.path import basename, dirname, exists, getmtime, join, splitext
 from random import shuffle
 from tempfile import mkstemp
 from contextlib import contextmanager
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from itertools import chain
 
 from eventlet import Timeout
 from eventlet.hubs import trampoline
@@ -56,12 +61,13 @@ from swift.common.utils import mkdirs, Timestamp, \
     storage_directory, hash_path, renamer, fallocate, fsync, fdatasync, \
     fsync_dir, drop_buffer_cache, ThreadPool, lock_path, write_pickle, \
     config_true_value, listdir, split_path, ismount, remove_file, \
-    get_md5_socket, F_SETPIPE_SZ
+    get_md5_socket, F_SETPIPE_SZ, lock_file, stdlib_threading
 from swift.common.splice import splice, tee
 from swift.common.exceptions import DiskFileQuarantined, DiskFileNotExist, \
     DiskFileCollision, DiskFileNoSpace, DiskFileDeviceUnavailable, \
     DiskFileDeleted, DiskFileError, DiskFileNotOpen, PathNotDir, \
-    ReplicationLockTimeout, DiskFileExpired, DiskFileXattrNotSupported
+    ReplicationLockTimeout, DiskFileExpired, DiskFileXattrNotSupported, \
+    ChunkReadError, ChunkReadTimeout
 from swift.common.swob import multi_range_iterator
 from swift.common.storage_policy import (
     get_policy_string, split_policy_string, PolicyError, POLICIES,
@@ -72,6 +78,7 @@ from functools import partial
 PICKLE_PROTOCOL = 2
 ONE_WEEK = 604800
 HASH_FILE = 'hashes.pkl'
+HASH_INVALIDATIONS_FILE = 'hashes.invalid'
 METADATA_KEY = 'user.swift.metadata'
 DROP_CACHE_WINDOW = 1024 * 1024
 # These are system-set metadata keys that cannot be changed with a POST.
@@ -102,11 +109,129 @@ def _get_filename(fd):
     return fd
 
 
-def read_metadata(fd):
+# Binary metadata format: a header holding X-Timestamp, Content-Length and
+# ETag at fixed offsets, then the number of remaining items, a table of their
+# key and value lengths and finally their keys and values.
+BINARY_METADATA_MAGIC = 'SWMD'
+BINARY_METADATA_VERSION = 1
+_BINARY_HEADER = struct.Struct('!4sBBQQ16sI')
+_BINARY_TIMESTAMP_FLAG = 1
+_BINARY_CONTENT_LENGTH_FLAG = 2
+_BINARY_ETAG_FLAG = 4
+_BINARY_FIXED_KEYS = frozenset(('X-Timestamp', 'Content-Length', 'ETag'))
+_BINARY_TIMESTAMP_RE = re.compile(r'\d{10}\.\d{5}\Z')
+_BINARY_ETAG_RE = re.compile(r'[0-9a-f]{32}\Z')
+METADATA_FORMATS = ('pickle', 'binary')
+
+
+def _encode_binary_metadata(metadata):
+    """
+    Encode metadata in the binary format, or return None if it holds
+    anything but str keys and values.
+    """
+    flags = 0
+    ticks = content_length = 0
+    etag = ''
+    lengths = []
+    items = []
+    for key, value in metadata.items():
+        if not isinstance(key, str) or not isinstance(value, str):
+            return None
+        if key == 'X-Timestamp' and _BINARY_TIMESTAMP_RE.match(value):
+            flags |= _BINARY_TIMESTAMP_FLAG
+            ticks = int(value.replace('.', ''))
+        elif key == 'Content-Length' and value.isdigit() and \
+                str(int(value)) == value and int(value) < 2 ** 64:
+            flags |= _BINARY_CONTENT_LENGTH_FLAG
+            content_length = int(value)
+        elif key == 'ETag' and _BINARY_ETAG_RE.match(value):
+            flags |= _BINARY_ETAG_FLAG
+            etag = unhexlify(value)
+        else:
+            if len(key) >= 2 ** 16:
+                return None
+            lengths.extend((len(key), len(value)))
+            items.extend((key, value))
+    count = len(items) // 2
+    return ''.join([
+        _BINARY_HEADER.pack(BINARY_METADATA_MAGIC, BINARY_METADATA_VERSION,
+                            flags, ticks, content_length, etag, count),
+        struct.pack('!' + 'HI' * count, *lengths)] + items)
+
+
+def _decode_binary_metadata(metastr, keys=None):
+    if metastr[4:5] != chr(BINARY_METADATA_VERSION):
+        raise ValueError('Unknown binary metadata version %r' % metastr[4:5])
+    magic, version, flags, ticks, content_length, etag, count = \
+        _BINARY_HEADER.unpack_from(metastr)
+    metadata = {}
+    if flags & _BINARY_TIMESTAMP_FLAG and (
+            keys is None or 'X-Timestamp' in keys):
+        metadata['X-Timestamp'] = '%010d.%05d' % divmod(ticks, 100000)
+    if flags & _BINARY_CONTENT_LENGTH_FLAG and (
+            keys is None or 'Content-Length' in keys):
+        metadata['Content-Length'] = str(content_length)
+    if flags & _BINARY_ETAG_FLAG and (keys is None or 'ETag' in keys):
+        metadata['ETag'] = hexlify(etag)
+    if keys is not None and _BINARY_FIXED_KEYS.issuperset(keys):
+        return metadata
+    lengths_format = '!' + 'HI' * count
+    lengths = struct.unpack_from(lengths_format, metastr, _BINARY_HEADER.size)
+    offset = _BINARY_HEADER.size + struct.calcsize(lengths_format)
+    for i in range(0, 2 * count, 2):
+        key_end = offset + lengths[i]
+        offset = key_end + lengths[i + 1]
+        key = metastr[key_end - lengths[i]:key_end]
+        if keys is None or key in keys:
+            metadata[key] = metastr[key_end:offset]
+    if offset != len(metastr):
+        raise ValueError('Truncated or padded binary metadata')
+    return metadata
+
+
+def encode_metadata(metadata, metadata_format='pickle'):
+    """
+    Serialize a metadata dict for storage in xattrs.
+
+    :param metadata: dictionary of metadata
+    :param metadata_format: 'pickle', or 'binary' for a compact encoding
+                            that stores X-Timestamp, Content-Length and ETag
+                            at fixed offsets; metadata the binary encoding
+                            can't represent is pickled anyway. Decoding all
+                            of the binary encoding is slower than unpickling.
+    :returns: serialized metadata string
+    """
+    if metadata_format not in METADATA_FORMATS:
+        raise ValueError('Unknown metadata format %r' % metadata_format)
+    if metadata_format == 'binary':
+        metastr = _encode_binary_metadata(metadata)
+        if metastr is not None:
+            return metastr
+    return pickle.dumps(metadata, PICKLE_PROTOCOL)
+
+
+def decode_metadata(metastr, keys=None):
+    """
+    Deserialize metadata written by :func:`encode_metadata` in any format.
+
+    :param metastr: serialized metadata string
+    :param keys: optional collection of the metadata keys the caller needs;
+                 for binary metadata only those are decoded
+    :returns: dictionary of metadata; if keys is given it may be limited to
+              those keys
+    """
+    if metastr.startswith(BINARY_METADATA_MAGIC):
+        return _decode_binary_metadata(metastr, keys)
+    return pickle.loads(metastr)
+
+
+def read_metadata(fd, keys=None):
     """
-    Helper function to read the pickled metadata from an object file.
+    Helper function to read the serialized metadata from an object file.
 
     :param fd: file descriptor or filename to load the metadata from
+    :param keys: optional collection of the metadata keys the caller needs,
+                 see :func:`decode_metadata`
 
     :returns: dictionary of metadata
     """
@@ -128,17 +253,19 @@ def read_metadata(fd):
             raise DiskFileNotExist()
         # TODO: we might want to re-raise errors that don't denote a missing
         # xattr here.  Seems to be ENODATA on linux and ENOATTR on BSD/OSX.
-    return pickle.loads(metadata)
+    return decode_metadata(metadata, keys)
 
 
-def write_metadata(fd, metadata, xattr_size=65536):
+def write_metadata(fd, metadata, xattr_size=65536, metadata_format='pickle'):
     """
-    Helper function to write pickled metadata for an object file.
+    Helper function to write serialized metadata for an object file.
 
     :param fd: file descriptor or filename to write the metadata
     :param metadata: metadata to write
+    :param metadata_format: serialization format, see
+                            :func:`encode_metadata`
     """
-    metastr = pickle.dumps(metadata, PICKLE_PROTOCOL)
+    metastr = encode_metadata(metadata, metadata_format)
     key = 0
     while metastr:
         try:
@@ -221,10 +348,69 @@ def quarantine_renamer(device_path, corrupted_file_path):
     return to_dir
 
 
+def consolidate_hashes(partition_dir):
+    """
+    Fold the suffixes journaled in a partition's hashes.invalid into its
+    hashes.pkl, then empty hashes.invalid.
+
+    :param partition_dir: absolute path to partition dir containing
+                          hashes.pkl and hashes.invalid
+    :returns: tuple of (hashes, mtime of hashes.pkl); hashes is None if
+              there is no hashes.pkl yet
+    :raises Exception: whatever unpickling a corrupt hashes.pkl raises
+    """
+    hashes_file = join(partition_dir, HASH_FILE)
+    invalidations_file = join(partition_dir, HASH_INVALIDATIONS_FILE)
+
+    with lock_path(partition_dir):
+        try:
+            with open(hashes_file, 'rb') as fp:
+                hashes = pickle.load(fp)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            hashes = None
+
+        try:
+            with open(invalidations_file, 'rb') as fp:
+                invalid_suffixes = fp.read().split()
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            invalid_suffixes = []
+
+        if invalid_suffixes:
+            if hashes is not None:
+                modified = False
+                for suffix in invalid_suffixes:
+                    if suffix not in hashes or hashes[suffix]:
+                        hashes[suffix] = None
+                        modified = True
+                if modified:
+                    write_pickle(hashes, hashes_file, partition_dir,
+                                 PICKLE_PROTOCOL)
+            # Every invalidation is now in hashes.pkl (or there is no
+            # hashes.pkl and everything will be hashed anyway).
+            with open(invalidations_file, 'wb'):
+                pass
+
+        try:
+            mtime = getmtime(hashes_file)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            mtime = -1
+        return hashes, mtime
+
+
 def invalidate_hash(suffix_dir):
     """
     Invalidates the hash for a suffix_dir in the partition's hashes file.
 
+    The suffix is only appended to the partition's hashes.invalid journal;
+    it is folded into hashes.pkl by :func:`consolidate_hashes` the next time
+    the partition's hashes are asked for.
+
     :param suffix_dir: absolute path to suffix dir whose hash needs
                        invalidating
     """
@@ -234,16 +420,12 @@ def invalidate_hash(suffix_dir):
     hashes_file = join(partition_dir, HASH_FILE)
     if not os.path.exists(hashes_file):
         return
+    invalidations_file = join(partition_dir, HASH_INVALIDATIONS_FILE)
+    # The lock keeps the append from landing between consolidate_hashes
+    # reading the journal and emptying it.
     with lock_path(partition_dir):
-        try:
-            with open(hashes_file, 'rb') as fp:
-                hashes = pickle.load(fp)
-            if suffix in hashes and not hashes[suffix]:
-                return
-        except Exception:
-            return
-        hashes[suffix] = None
-        write_pickle(hashes, hashes_file, partition_dir, PICKLE_PROTOCOL)
+        with open(invalidations_file, 'ab') as fp:
+            fp.write(suffix + '\n')
 
 
 class AuditLocation(object):
@@ -342,28 +524,60 @@ def strip_self(f):
 class DiskFileRouter(object):
 
     policy_type_to_manager_cls = {}
+    backend_to_manager_cls = {}
 
     @classmethod
-    def register(cls, policy_type):
+    def register(cls, policy_type, backend=None):
         """
         Decorator for Storage Policy implementations to register
         their DiskFile implementation.
+
+        :param policy_type: the policy type the implementation serves
+        :param backend: optional name of an alternative implementation, used
+                        instead of the default one for policy_type when the
+                        ``diskfile_backend`` option names it
         """
+        if backend is None:
+            registry, key = cls.policy_type_to_manager_cls, policy_type
+        else:
+            registry, key = cls.backend_to_manager_cls, (backend, policy_type)
+
         def register_wrapper(diskfile_cls):
-            if policy_type in cls.policy_type_to_manager_cls:
+            if key in registry:
                 raise PolicyError(
                     '%r is already registered for the policy_type %r' % (
-                        cls.policy_type_to_manager_cls[policy_type],
-                        policy_type))
-            cls.policy_type_to_manager_cls[policy_type] = diskfile_cls
+                        registry[key], policy_type))
+            registry[key] = diskfile_cls
             return diskfile_cls
         return register_wrapper
 
-    def __init__(self, *args, **kwargs):
+    @classmethod
+    def get_manager_cls(cls, policy_type, backend=None):
+        """
+        Find the DiskFile manager class to use for a policy type.
+
+        :param policy_type: the policy type
+        :param backend: optional name of an alternative implementation; policy
+                        types it has no implementation for use the default one
+        :raises ValueError: if no implementation is registered as backend
+        """
+        if backend:
+            if backend not in set(
+                    name for name, _junk in cls.backend_to_manager_cls):
+                raise ValueError('Unknown diskfile_backend %r' % backend)
+            manager_cls = cls.backend_to_manager_cls.get(
+                (backend, policy_type))
+            if manager_cls:
+                return manager_cls
+        return cls.policy_type_to_manager_cls[policy_type]
+
+    def __init__(self, conf, *args, **kwargs):
         self.policy_to_manager = {}
+        backend = conf.get('diskfile_backend')
         for policy in POLICIES:
-            manager_cls = self.policy_type_to_manager_cls[policy.policy_type]
-            self.policy_to_manager[policy] = manager_cls(*args, **kwargs)
+            manager_cls = self.get_manager_cls(policy.policy_type, backend)
+            self.policy_to_manager[policy] = manager_cls(
+                conf, *args, **kwargs)
 
     def __getitem__(self, policy):
         return self.policy_to_manager[policy]
@@ -395,6 +609,7 @@ class BaseDiskFileManager(object):
     diskfile_cls = None  # must be set by subclasses
 
     invalidate_hash = strip_self(invalidate_hash)
+    consolidate_hashes = strip_self(consolidate_hashes)
     quarantine_renamer = strip_self(quarantine_renamer)
 
     def __init__(self, conf, logger):
@@ -405,6 +620,10 @@ class BaseDiskFileManager(object):
         self.bytes_per_sync = int(conf.get('mb_per_sync', 512)) * 1024 * 1024
         self.mount_check = config_true_value(conf.get('mount_check', 'true'))
         self.reclaim_age = int(conf.get('reclaim_age', ONE_WEEK))
+        self.metadata_format = conf.get('metadata_format', 'pickle')
+        if self.metadata_format not in METADATA_FORMATS:
+            raise ValueError('metadata_format must be one of %s' %
+                             ', '.join(METADATA_FORMATS))
         self.replication_one_per_device = config_true_value(
             conf.get('replication_one_per_device', 'true'))
         self.replication_lock_timeout = int(conf.get(
@@ -414,17 +633,22 @@ class BaseDiskFileManager(object):
             lambda: ThreadPool(nthreads=threads_per_disk))
 
         self.use_splice = False
+        self.use_splice_put = False
         self.pipe_size = None
 
         conf_wants_splice = config_true_value(conf.get('splice', 'no'))
+        conf_wants_splice_put = config_true_value(
+            conf.get('splice_put', 'no'))
         # If the operator wants zero-copy with splice() but we don't have the
         # requisite kernel support, complain so they can go fix it.
-        if conf_wants_splice and not splice.available:
+        if (conf_wants_splice or conf_wants_splice_put) and \
+                not splice.available:
             self.logger.warn(
-                "Use of splice() requested (config says \"splice = %s\"), "
-                "but the system does not support it. "
-                "splice() will not be used." % conf.get('splice'))
-        elif conf_wants_splice and splice.available:
+                "Use of splice() requested (config says \"splice = %s\", "
+                "\"splice_put = %s\"), but the system does not support it. "
+                "splice() will not be used." % (
+                    conf.get('splice', 'no'), conf.get('splice_put', 'no')))
+        elif conf_wants_splice or conf_wants_splice_put:
             try:
                 sockfd = get_md5_socket()
                 os.close(sockfd)
@@ -437,7 +661,8 @@ class BaseDiskFileManager(object):
                 self.logger.warn("MD5 sockets not supported. "
                                  "splice() will not be used.")
             else:
-                self.use_splice = True
+                self.use_splice = conf_wants_splice
+                self.use_splice_put = conf_wants_splice_put
                 with open('/proc/sys/fs/pipe-max-size') as f:
                     max_pipe_size = int(f.read())
                 self.pipe_size = min(max_pipe_size, self.disk_chunk_size)
@@ -564,7 +789,7 @@ class BaseDiskFileManager(object):
             timestamp = self.parse_on_disk_filename(filename)['timestamp']
             return (time.time() - float(timestamp)) > reclaim_age
 
-        files = listdir(hsh_path)
+        files = self._list_ondisk_files(hsh_path)
         files.sort(reverse=True)
         results = self.gather_ondisk_files(files, include_obsolete=True,
                                            **kwargs)
@@ -579,11 +804,49 @@ class BaseDiskFileManager(object):
             if is_reclaimable(filename):
                 results.setdefault('obsolete', []).append(filename)
         for filename in results.get('obsolete', []):
-            remove_file(join(hsh_path, filename))
+            self._remove_ondisk_file(hsh_path, filename)
             files.remove(filename)
         results['files'] = files
         return results
 
+    def _list_ondisk_files(self, hsh_path):
+        """
+        List the names of the on-disk files of an object.
+
+        :param hsh_path: object hash path
+        :returns: list of file names, empty if hsh_path does not exist
+        :raises OSError: for non-ENOENT errors, e.g. ENOTDIR
+        """
+        return listdir(hsh_path)
+
+    def _remove_ondisk_file(self, hsh_path, filename):
+        """
+        Quietly remove one on-disk file of an object.
+
+        :param hsh_path: object hash path
+        :param filename: name of the file to remove
+        """
+        remove_file(join(hsh_path, filename))
+
+    def _read_ondisk_metadata(self, hsh_path, filename, keys=None):
+        """
+        Read the metadata of one on-disk file of an object.
+
+        :param hsh_path: object hash path
+        :param filename: name of the file to read
+        :param keys: optional collection of the metadata keys the caller needs
+        :returns: dictionary of metadata
+        """
+        return read_metadata(join(hsh_path, filename), keys=keys)
+
+    def remove_hash_dir(self, hsh_path):
+        """
+        Quietly remove all on-disk files of an object.
+
+        :param hsh_path: object hash path
+        """
+        shutil.rmtree(hsh_path, ignore_errors=True)
+
     def hash_cleanup_listdir(self, hsh_path, reclaim_age=ONE_WEEK):
         """
         List contents of a hash directory and clean up any old files.
@@ -679,10 +942,11 @@ class BaseDiskFileManager(object):
             recalculate = []
 
         try:
-            with open(hashes_file, 'rb') as fp:
-                hashes = pickle.load(fp)
-            mtime = getmtime(hashes_file)
+            hashes, mtime = consolidate_hashes(partition_path)
         except Exception:
+            hashes = None
+        if hashes is None:
+            hashes = {}
             do_listdir = True
             force_rewrite = True
         if do_listdir:
@@ -714,6 +978,17 @@ class BaseDiskFileManager(object):
         else:
             return hashed, hashes
 
+    def compact_partition(self, partition_path):
+        """
+        Reclaim the space of overwritten and deleted objects in a partition.
+        Only called by the object-replicator's pass over its local
+        partitions, never while serving a request.
+
+        :param partition_path: absolute path of the partition directory
+        :returns: the number of bytes reclaimed
+        """
+        return 0
+
     def construct_dev_path(self, device):
         """
         Construct the path to a device without checking if it is mounted.
@@ -831,7 +1106,8 @@ class BaseDiskFileManager(object):
         if not filenames:
             raise DiskFileNotExist()
         try:
-            metadata = read_metadata(os.path.join(object_path, filenames[-1]))
+            metadata = self._read_ondisk_metadata(object_path, filenames[-1],
+                                                  keys=('name',))
         except EOFError:
             raise DiskFileNotExist()
         try:
@@ -946,6 +1222,47 @@ class BaseDiskFileManager(object):
                             object_path, err))
 
 
+def _tee_to_md5_socket(client_rpipe, hash_wpipe, hash_rpipe, md5_sockfd,
+                       bytes_in_pipe):
+    """
+    Feed the data sitting in a pipe into an MD5 socket, leaving it in the
+    pipe.
+
+    :param client_rpipe: read end of the pipe holding the data
+    :param hash_wpipe: write end of an empty pipe as big as client_rpipe's
+    :param hash_rpipe: read end of that pipe
+    :param md5_sockfd: MD5 socket from get_md5_socket()
+    :param bytes_in_pipe: number of bytes in client_rpipe
+    """
+    # "Copy" data from pipe A to pipe B (really just some pointer
+    # manipulation in the kernel, not actual copying).
+    bytes_copied = tee(client_rpipe, hash_wpipe, bytes_in_pipe, 0)
+    if bytes_copied != bytes_in_pipe:
+        # We teed data between two pipes of equal size, and the
+        # destination pipe was empty. If, somehow, the destination pipe
+        # was full before all the data was teed, we should fail here. If
+        # we don't raise an exception, then we will have the incorrect MD5
+        # hash once the object has been sent out, causing a false-positive
+        # quarantine.
+        raise Exception("tee() failed: tried to move %d bytes, but only "
+                        "moved %d" % (bytes_in_pipe, bytes_copied))
+    # Take the data and feed it into an in-kernel MD5 socket. The MD5
+    # socket hashes data that is written to it. Reading from it yields
+    # the MD5 checksum of the written data.
+    #
+    # Note that we don't have to worry about splice() returning None here
+    # (which happens on EWOULDBLOCK); we're splicing $bytes_in_pipe bytes
+    # from a pipe with exactly that many bytes in it, so read won't block,
+    # and we're splicing it into an MD5 socket, which synchronously hashes
+    # any data sent to it, so writing won't block either.
+    (hashed, _1, _2) = splice(hash_rpipe, None, md5_sockfd, None,
+                              bytes_in_pipe, splice.SPLICE_F_MORE)
+    if hashed != bytes_in_pipe:
+        raise Exception("md5 socket didn't take all the data? "
+                        "(tried to write %d, but wrote %d)" %
+                        (bytes_in_pipe, hashed))
+
+
 class BaseDiskFileWriter(object):
     """
     Encapsulation of the write context for servicing PUT REST API
@@ -1018,7 +1335,10 @@ class BaseDiskFileWriter(object):
                 chunk = chunk[written:]
 
         self._threadpool.run_in_thread(_write_entire_chunk, chunk)
+        self._sync_written()
+        return self._upload_size
 
+    def _sync_written(self):
         # For large files sync every 512MB (by default) written
         diff = self._upload_size - self._last_sync
         if diff >= self._bytes_per_sync:
@@ -1026,12 +1346,110 @@ class BaseDiskFileWriter(object):
             drop_buffer_cache(self._fd, self._last_sync, diff)
             self._last_sync = self._upload_size
 
-        return self._upload_size
+    def can_zero_copy_receive(self):
+        return self.manager.use_splice_put
+
+    def zero_copy_receive(self, rsockfd, length, prefix='', timeout=None,
+                          deadline=None):
+        """
+        Does some magic with splice() and tee() to move an object body from
+        network to disk without ever touching userspace, hashing it on the
+        way through.
+
+        :param rsockfd: file descriptor (integer) of the non-blocking socket
+                        the body is read from
+        :param length: number of bytes of the body left to read from rsockfd
+        :param prefix: start of the body, already read off the socket by the
+                       caller, which is written before the rest
+        :param timeout: seconds to wait for rsockfd to become readable
+        :param deadline: time by which the whole body must have been read,
+                         or None
+        :returns: a tuple of the total number of bytes written to the object
+                  and the hex MD5 checksum of the body
+        :raises ChunkReadTimeout: if rsockfd does not become readable in time,
+                                  or the deadline passes
+        :raises ChunkReadError: if the client goes away before sending length
+                                bytes
+        """
+        client_rpipe, client_wpipe = os.pipe()
+        hash_rpipe, hash_wpipe = os.pipe()
+        md5_sockfd = get_md5_socket()
+        bytes_hashed = [0]
+
+        # The actual amount allocated to the pipe may be rounded up to the
+        # nearest multiple of the page size; see zero_copy_send().
+        pipe_size = fcntl.fcntl(client_rpipe, F_SETPIPE_SZ,
+                                self.manager.pipe_size)
+        fcntl.fcntl(hash_rpipe, F_SETPIPE_SZ, pipe_size)
+
+        def drain_pipe(bytes_in_pipe):
+            # Same dance as zero_copy_send(), except that the data ends up in
+            # our temporary file rather than in a socket.
+            _tee_to_md5_socket(client_rpipe, hash_wpipe, hash_rpipe,
+                               md5_sockfd, bytes_in_pipe)
+            bytes_hashed[0] += bytes_in_pipe
+            while bytes_in_pipe > 0:
+                (written, _1, _2) = self._threadpool.run_in_thread(
+                    splice, client_rpipe, None, self._fd, None,
+                    bytes_in_pipe, 0)
+                self._upload_size += written
+                bytes_in_pipe -= written
+            self._sync_written()
+
+        try:
+            while prefix:
+                chunk, prefix = prefix[:pipe_size], prefix[pipe_size:]
+                # The pipe is empty and at least len(chunk) big, so this
+                # write will neither block nor come up short.
+                os.write(client_wpipe, chunk)
+                drain_pipe(len(chunk))
+
+            while length > 0:
+                try:
+                    (bytes_in_pipe, _1, _2) = splice(
+                        rsockfd, None, client_wpipe, None,
+                        min(length, pipe_size), 0)
+                except IOError as exc:
+                    if exc.errno != errno.EWOULDBLOCK:
+                        raise
+                    wait = timeout
+                    if deadline is not None:
+                        wait = max(0, deadline - time.time())
+                        if timeout is not None:
+                            wait = min(wait, timeout)
+                    trampoline(rsockfd, read=True, timeout=wait,
+                               timeout_exc=ChunkReadTimeout)
+                    continue
+                if bytes_in_pipe == 0:
+                    raise ChunkReadError(
+                        'Client disconnected with %d bytes left' % length)
+                length -= bytes_in_pipe
+                drain_pipe(bytes_in_pipe)
+                if length > 0 and deadline is not None and \
+                        time.time() >= deadline:
+                    raise ChunkReadTimeout()
+
+            # Linux MD5 sockets return '00000000000000000000000000000000' for
+            # the checksum if you didn't write any bytes to them, instead of
+            # returning the correct value.
+            if bytes_hashed[0] > 0:
+                bin_checksum = os.read(md5_sockfd, 16)
+                hex_checksum = ''.join("%02x" % ord(c) for c in bin_checksum)
+            else:
+                hex_checksum = MD5_OF_EMPTY_STRING
+        finally:
+            os.close(client_rpipe)
+            os.close(client_wpipe)
+            os.close(hash_rpipe)
+            os.close(hash_wpipe)
+            os.close(md5_sockfd)
+        return self._upload_size, hex_checksum
 
     def _finalize_put(self, metadata, target_path, cleanup):
         # Write the metadata before calling fsync() so that both data and
         # metadata are flushed to disk.
-        write_metadata(self._fd, metadata)
+        write_metadata(self._fd, metadata,
+                       metadata_format=self._diskfile.manager.metadata_format)
         # We call fsync() before calling drop_cache() to lower the amount of
         # redundant work the drop cache code will perform on the pages (now
         # that after fsync the pages will be all clean).
@@ -1138,6 +1556,8 @@ class BaseDiskFileReader(object):
         self._md5_of_sent_bytes = None
         self._suppress_file_closing = False
         self._quarantined_dir = None
+        self._zero_copy_ranges = None
+        self._zero_copy_mime = None
 
     @property
     def manager(self):
@@ -1182,17 +1602,25 @@ class BaseDiskFileReader(object):
         Does some magic with splice() and tee() to move stuff from disk to
         network without ever touching userspace.
 
+        If app_iter_range() or app_iter_ranges() was called, only the
+        requested range(s) are sent, framed the same way as the iterator they
+        returned would have framed them. As with those iterators, the data is
+        only checked against the object's ETag when a range covers the whole
+        object.
+
         :param wsockfd: file descriptor (integer) of the socket out which to
                         send data
         """
-        # Note: if we ever add support for zero-copy ranged GET responses,
-        # we'll have to make this conditional.
-        self._started_at_0 = True
+        if self._zero_copy_ranges is None:
+            ranges = [(0, self._obj_size)]
+        else:
+            ranges = [(start or 0,
+                       self._obj_size if stop is None else stop)
+                      for start, stop in self._zero_copy_ranges]
 
         rfd = self._fp.fileno()
         client_rpipe, client_wpipe = os.pipe()
         hash_rpipe, hash_wpipe = os.pipe()
-        md5_sockfd = get_md5_socket()
 
         # The actual amount allocated to the pipe may be rounded up to the
         # nearest multiple of the page size. If we have the memory allocated,
@@ -1203,85 +1631,115 @@ class BaseDiskFileReader(object):
         pipe_size = fcntl.fcntl(client_rpipe, F_SETPIPE_SZ, self._pipe_size)
         fcntl.fcntl(hash_rpipe, F_SETPIPE_SZ, pipe_size)
 
-        dropped_cache = 0
-        self._bytes_read = 0
-        try:
-            while True:
-                # Read data from disk to pipe
-                (bytes_in_pipe, _1, _2) = self._threadpool.run_in_thread(
-                    splice, rfd, None, client_wpipe, None, pipe_size, 0)
-                if bytes_in_pipe == 0:
-                    self._read_to_eof = True
-                    self._drop_cache(rfd, dropped_cache,
-                                     self._bytes_read - dropped_cache)
-                    break
-                self._bytes_read += bytes_in_pipe
-
-                # "Copy" data from pipe A to pipe B (really just some pointer
-                # manipulation in the kernel, not actual copying).
-                bytes_copied = tee(client_rpipe, hash_wpipe, bytes_in_pipe, 0)
-                if bytes_copied != bytes_in_pipe:
-                    # We teed data between two pipes of equal size, and the
-                    # destination pipe was empty. If, somehow, the destination
-                    # pipe was full before all the data was teed, we should
-                    # fail here. If we don't raise an exception, then we will
-                    # have the incorrect MD5 hash once the object has been
-                    # sent out, causing a false-positive quarantine.
-                    raise Exception("tee() failed: tried to move %d bytes, "
-                                    "but only moved %d" %
-                                    (bytes_in_pipe, bytes_copied))
-                # Take the data and feed it into an in-kernel MD5 socket. The
-                # MD5 socket hashes data that is written to it. Reading from
-                # it yields the MD5 checksum of the written data.
-                #
-                # Note that we don't have to worry about splice() returning
-                # None here (which happens on EWOULDBLOCK); we're splicing
-                # $bytes_in_pipe bytes from a pipe with exactly that many
-                # bytes in it, so read won't block, and we're splicing it into
-                # an MD5 socket, which synchronously hashes any data sent to
-                # it, so writing won't block either.
-                (hashed, _1, _2) = splice(hash_rpipe, None, md5_sockfd, None,
-                                          bytes_in_pipe, splice.SPLICE_F_MORE)
-                if hashed != bytes_in_pipe:
-                    raise Exception("md5 socket didn't take all the data? "
-                                    "(tried to write %d, but wrote %d)" %
-                                    (bytes_in_pipe, hashed))
-
-                while bytes_in_pipe > 0:
-                    try:
-                        res = splice(client_rpipe, None, wsockfd, None,
-                                     bytes_in_pipe, 0)
-                        bytes_in_pipe -= res[0]
-                    except IOError as exc:
-                        if exc.errno == errno.EWOULDBLOCK:
-                            trampoline(wsockfd, write=True)
-                        else:
-                            raise
+        def send_range(start, stop):
+            # Ranges running to the end of the object are read until EOF, as
+            # the whole object always was, so that a data file longer or
+            # shorter than its metadata says gets quarantined.
+            to_eof = stop >= self._obj_size
+            self._started_at_0 = start == 0
+            self._read_to_eof = False
+            self._bytes_read = 0
+            md5_sockfd = None
+            if start == 0 and to_eof:
+                md5_sockfd = get_md5_socket()
+            offset = dropped_cache = start
+            try:
+                while True:
+                    want = pipe_size
+                    if not to_eof:
+                        want = min(want, stop - offset)
+                        if want <= 0:
+                            break
+                    # Read data from disk to pipe
+                    (bytes_in_pipe, _1, _2) = self._threadpool.run_in_thread(
+                        splice, rfd, offset, client_wpipe, None, want, 0)
+                    if bytes_in_pipe == 0:
+                        self._read_to_eof = True
+                        break
+                    offset += bytes_in_pipe
+                    self._bytes_read += bytes_in_pipe
+
+                    if md5_sockfd is not None:
+                        _tee_to_md5_socket(client_rpipe, hash_wpipe,
+                                           hash_rpipe, md5_sockfd,
+                                           bytes_in_pipe)
+
+                    while bytes_in_pipe > 0:
+                        try:
+                            res = splice(client_rpipe, None, wsockfd, None,
+                                         bytes_in_pipe, 0)
+                            bytes_in_pipe -= res[0]
+                        except IOError as exc:
+                            if exc.errno == errno.EWOULDBLOCK:
+                                trampoline(wsockfd, write=True)
+                            else:
+                                raise
+
+                    if offset - dropped_cache > DROP_CACHE_WINDOW:
+                        self._drop_cache(rfd, dropped_cache,
+                                         offset - dropped_cache)
+                        dropped_cache = offset
+                self._drop_cache(rfd, dropped_cache, offset - dropped_cache)
+            finally:
+                if md5_sockfd is not None:
+                    # Linux MD5 sockets return
+                    # '00000000000000000000000000000000' for the checksum if
+                    # you didn't write any bytes to them, instead of
+                    # returning the correct value.
+                    if self._bytes_read > 0:
+                        bin_checksum = os.read(md5_sockfd, 16)
+                        hex_checksum = ''.join(
+                            "%02x" % ord(c) for c in bin_checksum)
+                    else:
+                        hex_checksum = MD5_OF_EMPTY_STRING
+                    self._md5_of_sent_bytes = hex_checksum
+                    os.close(md5_sockfd)
+
+        def send_part(start, stop):
+            send_range(start, stop)
+            return iter([])
 
-                if self._bytes_read - dropped_cache > DROP_CACHE_WINDOW:
-                    self._drop_cache(rfd, dropped_cache,
-                                     self._bytes_read - dropped_cache)
-                    dropped_cache = self._bytes_read
-        finally:
-            # Linux MD5 sockets return '00000000000000000000000000000000' for
-            # the checksum if you didn't write any bytes to them, instead of
-            # returning the correct value.
-            if self._bytes_read > 0:
-                bin_checksum = os.read(md5_sockfd, 16)
-                hex_checksum = ''.join("%02x" % ord(c) for c in bin_checksum)
+        try:
+            if self._zero_copy_mime is None:
+                for start, stop in ranges:
+                    send_range(start, stop)
             else:
-                hex_checksum = MD5_OF_EMPTY_STRING
-            self._md5_of_sent_bytes = hex_checksum
-
+                # Let multi_range_iterator() generate the MIME framing, and
+                # splice each part in between.
+                content_type, boundary, size = self._zero_copy_mime
+                for chunk in multi_range_iterator(ranges, content_type,
+                                                  boundary, size, send_part):
+                    self._zero_copy_write(wsockfd, chunk)
+        finally:
             os.close(client_rpipe)
             os.close(client_wpipe)
             os.close(hash_rpipe)
             os.close(hash_wpipe)
-            os.close(md5_sockfd)
             self.close()
 
+    def _zero_copy_write(self, wsockfd, data):
+        """
+        Write a string out the non-blocking socket wsockfd, waiting for it to
+        become writable as needed.
+        """
+        while data:
+            try:
+                data = data[os.write(wsockfd, data):]
+            except OSError as exc:
+                if exc.errno == errno.EWOULDBLOCK:
+                    trampoline(wsockfd, write=True)
+                else:
+                    raise
+
     def app_iter_range(self, start, stop):
         """Returns an iterator over the data file for range (start, stop)"""
+        # Remember the range in case the body gets sent by zero_copy_send()
+        # rather than by iterating.
+        self._zero_copy_ranges = [(start, stop)]
+        self._zero_copy_mime = None
+        return self._app_iter_range(start, stop)
+
+    def _app_iter_range(self, start, stop):
         if start or start == 0:
             self._fp.seek(start)
         if stop is not None:
@@ -1303,6 +1761,12 @@ class BaseDiskFileReader(object):
 
     def app_iter_ranges(self, ranges, content_type, boundary, size):
         """Returns an iterator over the data file for a set of ranges"""
+        if ranges:
+            self._zero_copy_ranges = ranges
+            self._zero_copy_mime = (content_type, boundary, size)
+        return self._app_iter_ranges(ranges, content_type, boundary, size)
+
+    def _app_iter_ranges(self, ranges, content_type, boundary, size):
         if not ranges:
             yield ''
         else:
@@ -1310,7 +1774,7 @@ class BaseDiskFileReader(object):
                 self._suppress_file_closing = True
                 for chunk in multi_range_iterator(
                         ranges, content_type, boundary, size,
-                        self.app_iter_range):
+                        self._app_iter_range):
                     yield chunk
             finally:
                 self._suppress_file_closing = False
@@ -1604,7 +2068,9 @@ class BaseDiskFile(object):
             exc = DiskFileNotExist()
         else:
             try:
-                metadata = self._failsafe_read_metadata(ts_file, ts_file)
+                # only the timestamp of a tombstone is ever used
+                metadata = self._failsafe_read_metadata(
+                    ts_file, ts_file, keys=('X-Timestamp',))
             except DiskFileQuarantined:
                 # If the tombstone's corrupted, quarantine it and pretend it
                 # wasn't there
@@ -1677,27 +2143,38 @@ class BaseDiskFile(object):
             raise self._quarantine(
                 data_file, "bad metadata content-length value %s" % (
                     self._metadata['Content-Length']))
-        fd = fp.fileno()
-        try:
-            statbuf = os.fstat(fd)
-        except OSError as err:
-            # Quarantine, we can't successfully stat the file.
-            raise self._quarantine(data_file, "not stat-able: %s" % err)
-        else:
-            obj_size = statbuf.st_size
+        obj_size = self._get_data_file_size(data_file, fp)
         if obj_size != metadata_size:
             raise self._quarantine(
                 data_file, "metadata content-length %s does"
                 " not match actual object size %s" % (
-                    metadata_size, statbuf.st_size))
+                    metadata_size, obj_size))
         self._content_length = obj_size
         return obj_size
 
-    def _failsafe_read_metadata(self, source, quarantine_filename=None):
+    def _get_data_file_size(self, data_file, fp):
+        """
+        Find the on-disk size of the object's data.
+
+        :param data_file: data file name being considered, used when
+                          quarantines occur
+        :param fp: open file pointer of the data file
+        :returns: size in bytes of the object's data
+        :raises DiskFileQuarantined: if the file can not be stat'ed
+        """
+        try:
+            statbuf = os.fstat(fp.fileno())
+        except OSError as err:
+            # Quarantine, we can't successfully stat the file.
+            raise self._quarantine(data_file, "not stat-able: %s" % err)
+        return statbuf.st_size
+
+    def _failsafe_read_metadata(self, source, quarantine_filename=None,
+                                keys=None):
         # Takes source and filename separately so we can read from an open
         # file if we have one
         try:
-            return read_metadata(source)
+            return read_metadata(source, keys=keys)
         except (DiskFileXattrNotSupported, DiskFileNotExist):
             raise
         except Exception as err:
@@ -1717,7 +2194,7 @@ class BaseDiskFile(object):
         :raises DiskFileError: various exceptions from
                     :func:`swift.obj.diskfile.DiskFile._verify_data_file`
         """
-        fp = open(data_file, 'rb')
+        fp = self._open_data_file(data_file)
         self._datafile_metadata = self._failsafe_read_metadata(fp, data_file)
         self._metadata = {}
         if meta_file:
@@ -1742,6 +2219,15 @@ class BaseDiskFile(object):
         self._verify_data_file(data_file, fp)
         return fp
 
+    def _open_data_file(self, data_file):
+        """
+        Open the `.data` file for reading.
+
+        :param data_file: on-disk `.data` file being considered
+        :returns: an opened data file pointer
+        """
+        return open(data_file, 'rb')
+
     def get_metafile_metadata(self):
         """
         Provide the metafile metadata for a previously opened object as a
@@ -2421,3 +2907,771 @@ class ECDiskFileManager(BaseDiskFileManager):
 
         hash_per_fi = self._hash_suffix_dir(path, mapper, reclaim_age)
         return dict((fi, md5.hexdigest()) for fi, md5 in hash_per_fi.items())
+
+
+# Packed layout: each record in a volume file holds one on-disk file of an
+# object, a header then the file name, the serialized metadata and the data.
+# Each index entry names an object hash, one of its file names and the
+# volume, offset and length of its record, followed by the file name.
+PACKED_INDEX_FILE = 'packed.index'
+PACKED_LOCK_FILE = 'packed.lock'
+PACKED_VOLUME_FORMAT = 'packed-%08d.volume'
+_PACKED_RECORD_MAGIC = 'SWPK'
+_PACKED_RECORD_HEADER = struct.Struct('!4s16sHII')
+_PACKED_INDEX_ENTRY = struct.Struct('!B16sHIQI')
+_PACKED_ADD = 1
+_PACKED_REMOVE = 2
+_PACKED_VOLUME = 3
+_PACKED_PARTITION_CACHE_SIZE = 1024
+
+
+def _write_all(fd, buf):
+    while buf:
+        buf = buf[os.write(fd, buf):]
+
+
+class PackedFile(object):
+    """
+    Read-only file-like view of the data of a record in a volume file.
+
+    :param path: path of the volume file
+    :param offset: offset of the record in the volume file
+    :param length: length of the record
+    :param object_hash: hash of the object the record should belong to
+    :param filename: on-disk file name the record should hold
+    :raises DiskFileError: if the record does not hold the expected file
+    """
+
+    def __init__(self, path, offset, length, object_hash, filename):
+        self._fp = open(path, 'rb')
+        try:
+            self._fp.seek(offset)
+            header = self._fp.read(_PACKED_RECORD_HEADER.size)
+            if len(header) != _PACKED_RECORD_HEADER.size:
+                raise DiskFileError('Truncated packed record')
+            magic, raw_hash, name_len, metadata_len, data_len = \
+                _PACKED_RECORD_HEADER.unpack(header)
+            name = self._fp.read(name_len)
+            if magic != _PACKED_RECORD_MAGIC or \
+                    raw_hash != unhexlify(object_hash) or name != filename:
+                raise DiskFileError('Packed record does not hold %s/%s' % (
+                    object_hash, filename))
+            if length != (_PACKED_RECORD_HEADER.size + name_len +
+                          metadata_len + data_len):
+                raise DiskFileError('Bad packed record length')
+            self._metastr = self._fp.read(metadata_len)
+        except Exception:
+            self._fp.close()
+            raise
+        self.data_offset = self._fp.tell()
+        self.size = data_len
+
+    def read_metadata(self, keys=None):
+        return decode_metadata(self._metastr, keys)
+
+    def read(self, size=-1):
+        remaining = self.size - self.tell()
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return ''
+        return self._fp.read(size)
+
+    def seek(self, offset):
+        self._fp.seek(self.data_offset + offset)
+
+    def tell(self):
+        return self._fp.tell() - self.data_offset
+
+    def fileno(self):
+        return self._fp.fileno()
+
+    def close(self):
+        self._fp.close()
+
+
+class PackedPartition(object):
+    """
+    Index of the on-disk files of objects packed into the volume files of a
+    partition.
+
+    Every change to the set of packed files is appended to the partition's
+    index file, which is read incrementally so that appends made by other
+    processes are picked up cheaply. Appends and compaction are serialized by
+    a lock file in the partition directory; compaction replaces the index
+    file, which makes every reader re-read it.
+
+    :param partition_path: absolute path of the partition directory
+    """
+
+    def __init__(self, partition_path):
+        self.partition_path = partition_path
+        self.index_file = join(partition_path, PACKED_INDEX_FILE)
+        self.lock_file = join(partition_path, PACKED_LOCK_FILE)
+        self._lock = stdlib_threading.Lock()
+        self._reset(None)
+
+    def _reset(self, ino):
+        self._ino = ino
+        self._parsed = 0
+        # object hash -> {filename: (volume, offset, length)}
+        self._files = {}
+        # suffix -> set of object hashes
+        self._suffixes = {}
+        # volume -> bytes of the records still referenced
+        self._live_bytes = defaultdict(int)
+        # volume new records are appended to
+        self._volume = 0
+
+    def _volume_path(self, volume):
+        return join(self.partition_path, PACKED_VOLUME_FORMAT % volume)
+
+    def _apply(self, buf):
+        """
+        Apply the complete index entries in buf to the in-memory index.
+
+        :returns: number of bytes of buf consumed
+        """
+        pos = 0
+        while pos + _PACKED_INDEX_ENTRY.size <= len(buf):
+            op, raw_hash, name_len, volume, offset, length = \
+                _PACKED_INDEX_ENTRY.unpack_from(buf, pos)
+            end = pos + _PACKED_INDEX_ENTRY.size + name_len
+            if end > len(buf):
+                break
+            filename = buf[pos + _PACKED_INDEX_ENTRY.size:end]
+            pos = end
+            object_hash = hexlify(raw_hash)
+            if op == _PACKED_ADD:
+                files = self._files.setdefault(object_hash, {})
+                if filename in files:
+                    old_volume, _junk, old_length = files[filename]
+                    self._live_bytes[old_volume] -= old_length
+                files[filename] = (volume, offset, length)
+                self._suffixes.setdefault(
+                    object_hash[-3:], set()).add(object_hash)
+                self._live_bytes[volume] += length
+                self._volume = max(self._volume, volume)
+            elif op == _PACKED_REMOVE:
+                files = self._files.get(object_hash, {})
+                if filename not in files:
+                    continue
+                old_volume, _junk, old_length = files.pop(filename)
+                self._live_bytes[old_volume] -= old_length
+                if not files:
+                    del self._files[object_hash]
+                    hashes = self._suffixes[object_hash[-3:]]
+                    hashes.discard(object_hash)
+                    if not hashes:
+                        del self._suffixes[object_hash[-3:]]
+            elif op == _PACKED_VOLUME:
+                self._volume = max(self._volume, volume)
+        return pos
+
+    def refresh(self):
+        """
+        Bring the in-memory index up to date with the index file.
+
+        :returns: self
+        """
+        with self._lock:
+            try:
+                fd = os.open(self.index_file, os.O_RDONLY)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                self._reset(None)
+                return self
+            try:
+                st = os.fstat(fd)
+                size = st.st_size
+                if st.st_ino != self._ino or size < self._parsed:
+                    self._reset(st.st_ino)
+                if size > self._parsed:
+                    os.lseek(fd, self._parsed, os.SEEK_SET)
+                    buf = ''
+                    while len(buf) < size - self._parsed:
+                        chunk = os.read(fd, size - self._parsed - len(buf))
+                        if not chunk:
+                            break
+                        buf += chunk
+                    self._parsed += self._apply(buf)
+            finally:
+                os.close(fd)
+        return self
+
+    def suffixes(self):
+        return set(self._suffixes)
+
+    def hashes(self, suffix):
+        return set(self._suffixes.get(suffix, ()))
+
+    def files(self, object_hash):
+        return dict(self._files.get(object_hash, {}))
+
+    @contextmanager
+    def _locked(self):
+        mkdirs(self.partition_path)
+        with lock_file(self.lock_file, unlink=False):
+            self.refresh()
+            yield
+
+    def _append_index(self, entries):
+        buf = ''.join(
+            _PACKED_INDEX_ENTRY.pack(op, unhexlify(object_hash),
+                                     len(filename), volume, offset, length) +
+            filename
+            for op, object_hash, filename, volume, offset, length in entries)
+        fd = os.open(self.index_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        try:
+            size = os.fstat(fd).st_size
+            if size > self._parsed:
+                # drop the partial entry left behind by a crash
+                os.ftruncate(fd, self._parsed)
+            _write_all(fd, buf)
+            fsync(fd)
+        finally:
+            os.close(fd)
+        if not size:
+            fsync_dir(self.partition_path)
+        self.refresh()
+
+    def add(self, object_hash, filename, metastr, data, volume_size):
+        """
+        Append an on-disk file of an object to the partition's volume.
+
+        :param object_hash: hash of the object
+        :param filename: on-disk file name, e.g. <timestamp>.data
+        :param metastr: serialized metadata of the file
+        :param data: contents of the file
+        :param volume_size: size at which a new volume file is started
+        """
+        record = _PACKED_RECORD_HEADER.pack(
+            _PACKED_RECORD_MAGIC, unhexlify(object_hash), len(filename),
+            len(metastr), len(data)) + filename + metastr + data
+        with self._locked():
+            volume = self._volume
+            try:
+                size = os.path.getsize(self._volume_path(volume))
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                size = 0
+            if size and size + len(record) > volume_size:
+                volume += 1
+            fd = os.open(self._volume_path(volume),
+                         os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+            try:
+                offset = os.fstat(fd).st_size
+                _write_all(fd, record)
+                fsync(fd)
+            finally:
+                os.close(fd)
+            if not offset:
+                fsync_dir(self.partition_path)
+            self._append_index([(_PACKED_ADD, object_hash, filename, volume,
+                                 offset, len(record))])
+
+    def remove(self, object_hash, filenames):
+        """
+        Forget on-disk files of an object; their records stay in the volume
+        files until compaction.
+
+        :param object_hash: hash of the object
+        :param filenames: on-disk file names to remove
+        """
+        with self._locked():
+            files = self._files.get(object_hash, {})
+            entries = [(_PACKED_REMOVE, object_hash, filename, 0, 0, 0)
+                       for filename in filenames if filename in files]
+            if entries:
+                self._append_index(entries)
+
+    def open_file(self, object_hash, filename):
+        """
+        Open the data of a packed on-disk file.
+
+        :returns: a :class:`PackedFile`
+        :raises DiskFileNotExist: if the file is not packed here
+        :raises DiskFileError: if its record is corrupt
+        """
+        for attempt in (1, 2):
+            try:
+                volume, offset, length = self._files[object_hash][filename]
+            except KeyError:
+                raise DiskFileNotExist()
+            try:
+                return PackedFile(self._volume_path(volume), offset, length,
+                                  object_hash, filename)
+            except IOError as err:
+                if err.errno != errno.ENOENT or attempt == 2:
+                    raise
+            # the volume was compacted away since the index was last read
+            self.refresh()
+
+    def read_record(self, object_hash, filename):
+        """
+        Read the raw volume record of a packed on-disk file.
+        """
+        volume, offset, length = self._files[object_hash][filename]
+        with open(self._volume_path(volume), 'rb') as fp:
+            fp.seek(offset)
+            return fp.read(length)
+
+    def _compaction_victims(self, ratio):
+        with self._lock:
+            live_bytes = dict(self._live_bytes)
+            live_bytes.setdefault(self._volume, 0)
+        victims = set()
+        for volume, live in live_bytes.items():
+            try:
+                size = os.path.getsize(self._volume_path(volume))
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                continue
+            if size and size - live >= ratio * size:
+                victims.add(volume)
+        return victims
+
+    def _live_records(self, volumes, others=False):
+        """
+        List the records still referenced in volumes, or in every other
+        volume if others is True.
+        """
+        # refresh() may be updating the index from another thread
+        with self._lock:
+            return sorted(
+                (volume, offset, length, object_hash, filename)
+                for object_hash, files in self._files.items()
+                for filename, (volume, offset, length) in files.items()
+                if (volume in volumes) != others)
+
+    def compact(self, ratio):
+        """
+        Copy the records still referenced from volume files having at least
+        ratio of their size unreferenced into a new volume file, then remove
+        those volume files and rewrite the index.
+
+        Most records are copied without holding the lock so that writers are
+        only held up for records added to those volume files meanwhile.
+
+        :param ratio: fraction of a volume file's size that must be
+                      unreferenced for it to be compacted
+        :returns: the number of bytes reclaimed
+        """
+        self.refresh()
+        victims = self._compaction_victims(ratio)
+        if not victims:
+            return 0
+        fd, tmppath = mkstemp(dir=self.partition_path, prefix='.packed-')
+        try:
+            copied = {}
+            fps = {}
+            try:
+                for volume, offset, length, _junk, _junk in \
+                        self._live_records(victims):
+                    if volume not in fps:
+                        fps[volume] = open(self._volume_path(volume), 'rb')
+                    fps[volume].seek(offset)
+                    copied[(volume, offset)] = os.lseek(fd, 0, os.SEEK_CUR)
+                    _write_all(fd, fps[volume].read(length))
+                with self._locked():
+                    # another process may have compacted some already
+                    victims = set(volume for volume in victims
+                                  if exists(self._volume_path(volume)))
+                    new_volume = self._volume + 1
+                    entries = [(_PACKED_VOLUME, '0' * 32, '', new_volume, 0,
+                                0)]
+                    for volume, offset, length, object_hash, filename in \
+                            self._live_records(victims):
+                        if (volume, offset) not in copied:
+                            if volume not in fps:
+                                fps[volume] = open(
+                                    self._volume_path(volume), 'rb')
+                            fps[volume].seek(offset)
+                            copied[(volume, offset)] = os.lseek(
+                                fd, 0, os.SEEK_CUR)
+                            _write_all(fd, fps[volume].read(length))
+                        entries.append((_PACKED_ADD, object_hash, filename,
+                                        new_volume, copied[(volume, offset)],
+                                        length))
+                    reclaimed = sum(
+                        os.path.getsize(self._volume_path(volume))
+                        for volume in victims) - os.lseek(fd, 0, os.SEEK_CUR)
+                    entries.extend(
+                        (_PACKED_ADD, object_hash, filename, volume, offset,
+                         length)
+                        for volume, offset, length, object_hash, filename in
+                        self._live_records(victims, others=True))
+                    if len(entries) > 1:
+                        fsync(fd)
+                        renamer(tmppath, self._volume_path(new_volume))
+                    self._write_index(entries)
+                    for volume in victims:
+                        remove_file(self._volume_path(volume))
+            finally:
+                for fp in fps.values():
+                    fp.close()
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            # another process compacted these volume files first
+            return 0
+        finally:
+            os.close(fd)
+            remove_file(tmppath)
+        return reclaimed
+
+    def _write_index(self, entries):
+        fd, tmppath = mkstemp(dir=self.partition_path, prefix='.packed-')
+        try:
+            _write_all(fd, ''.join(
+                _PACKED_INDEX_ENTRY.pack(op, unhexlify(object_hash),
+                                         len(filename), volume, offset,
+                                         length) + filename
+                for op, object_hash, filename, volume, offset, length
+                in entries))
+            fsync(fd)
+        finally:
+            os.close(fd)
+        renamer(tmppath, self.index_file)
+        self.refresh()
+
+
+class PackedDiskFileReader(DiskFileReader):
+    def can_zero_copy_send(self):
+        # splice() would carry on past the end of a packed object into the
+        # rest of its volume file
+        return self._use_splice and not isinstance(self._fp, PackedFile)
+
+    def _drop_cache(self, fd, offset, length):
+        if isinstance(self._fp, PackedFile):
+            offset += self._fp.data_offset
+        super(PackedDiskFileReader, self)._drop_cache(fd, offset, length)
+
+
+class PackedDiskFileWriter(DiskFileWriter):
+    def _finalize_put(self, metadata, target_path, cleanup):
+        if self._upload_size > self.manager.packed_object_size:
+            return super(PackedDiskFileWriter, self)._finalize_put(
+                metadata, target_path, cleanup)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        chunks = []
+        remaining = self._upload_size
+        while remaining > 0:
+            chunk = os.read(self._fd, remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        partition = self.manager.get_packed_partition(
+            dirname(dirname(self._datadir)), create=True)
+        self.manager.invalidate_hash(dirname(self._datadir))
+        partition.add(basename(self._datadir), basename(target_path),
+                      encode_metadata(metadata, self.manager.metadata_format),
+                      ''.join(chunks), self.manager.packed_volume_size)
+        # The temporary file is not renamed, so remove it here rather than
+        # leaving it to create().
+        self._put_succeeded = True
+        remove_file(self._tmppath)
+        if cleanup:
+            try:
+                self.manager.hash_cleanup_listdir(self._datadir)
+            except OSError:
+                logging.exception(_('Problem cleaning up %s'), self._datadir)
+
+
+class PackedDiskFile(DiskFile):
+    reader_cls = PackedDiskFileReader
+    writer_cls = PackedDiskFileWriter
+
+    _packed_files = {}
+
+    def _get_ondisk_file(self, files):
+        partition = self.manager.get_packed_partition(
+            dirname(dirname(self._datadir)))
+        self._packed_partition = partition
+        self._packed_files = {}
+        if partition:
+            self._packed_files = dict(
+                (filename, entry) for filename, entry in
+                partition.files(basename(self._datadir)).items()
+                if filename not in files)
+        return super(PackedDiskFile, self)._get_ondisk_file(
+            files + list(self._packed_files))
+
+    def _open_packed_file(self, path):
+        try:
+            return self._packed_partition.open_file(
+                basename(self._datadir), basename(path))
+        except DiskFileError as err:
+            if isinstance(err, DiskFileNotExist):
+                raise
+            raise self._quarantine(path, str(err))
+
+    def _open_data_file(self, data_file):
+        if basename(data_file) in self._packed_files:
+            return self._open_packed_file(data_file)
+        return super(PackedDiskFile, self)._open_data_file(data_file)
+
+    def _failsafe_read_metadata(self, source, quarantine_filename=None,
+                                keys=None):
+        if isinstance(source, PackedFile):
+            fp = source
+        elif isinstance(source, str) and \
+                basename(source) in self._packed_files:
+            fp = self._open_packed_file(source)
+        else:
+            return super(PackedDiskFile, self)._failsafe_read_metadata(
+                source, quarantine_filename, keys)
+        try:
+            return fp.read_metadata(keys)
+        except Exception as err:
+            raise self._quarantine(
+                quarantine_filename,
+                "Exception reading metadata: %s" % err)
+        finally:
+            if fp is not source:
+                fp.close()
+
+    def _get_data_file_size(self, data_file, fp):
+        if isinstance(fp, PackedFile):
+            return fp.size
+        return super(PackedDiskFile, self)._get_data_file_size(data_file, fp)
+
+
+@DiskFileRouter.register(REPL_POLICY, backend='packed')
+class PackedDiskFileManager(DiskFileManager):
+    """
+    Replication policy manager that packs small objects into per-partition
+    volume files rather than giving each of them a hash directory and a file,
+    saving inodes and the random I/O of creating them.
+
+    On-disk files (`.data`, `.meta` and `.ts`) no bigger than
+    ``packed_object_size`` are appended to the partition's volume file and
+    located through its :class:`PackedPartition` index; bigger ones are
+    stored in the usual hash directories. The names of packed files are
+    merged into listings of hash, suffix and partition directories, so
+    suffix hashes, ``yield_hashes``, ssync and the auditor work the same for
+    both and agree with nodes that do not pack. Replication of packed objects
+    requires ssync; rsync only copies directories.
+    """
+    diskfile_cls = PackedDiskFile
+
+    def __init__(self, conf, logger):
+        super(PackedDiskFileManager, self).__init__(conf, logger)
+        self.packed_object_size = int(conf.get('packed_object_size', 65536))
+        self.packed_volume_size = int(conf.get('packed_volume_size',
+                                               64 * 1024 * 1024))
+        self.packed_compact_ratio = float(conf.get('packed_compact_ratio',
+                                                   0.5))
+        self._packed_partitions = OrderedDict()
+        # get_packed_partition() is called from tpool threads too; each
+        # partition must have exactly one index, whose lock serializes its
+        # readers
+        self._packed_partitions_lock = stdlib_threading.Lock()
+
+    def get_packed_partition(self, partition_path, create=False):
+        """
+        Get the up to date index of the objects packed in a partition.
+
+        :param partition_path: absolute path of the partition directory
+        :param create: return an index even if nothing is packed yet
+        :returns: a :class:`PackedPartition`, or None if nothing has been
+                  packed in the partition and create is False
+        """
+        with self._packed_partitions_lock:
+            partition = self._packed_partitions.pop(partition_path, None)
+            if partition is None:
+                if not create and \
+                        not exists(join(partition_path, PACKED_INDEX_FILE)):
+                    return None
+                partition = PackedPartition(partition_path)
+            self._packed_partitions[partition_path] = partition
+            while len(self._packed_partitions) > \
+                    _PACKED_PARTITION_CACHE_SIZE:
+                self._packed_partitions.popitem(last=False)
+        return partition.refresh()
+
+    def _packed_files(self, hsh_path):
+        partition = self.get_packed_partition(dirname(dirname(hsh_path)))
+        if partition is None:
+            return None, {}
+        return partition, partition.files(basename(hsh_path))
+
+    def _list_ondisk_files(self, hsh_path):
+        files = super(PackedDiskFileManager, self)._list_ondisk_files(
+            hsh_path)
+        _junk, packed = self._packed_files(hsh_path)
+        return files + [filename for filename in packed
+                        if filename not in files]
+
+    def _remove_ondisk_file(self, hsh_path, filename):
+        super(PackedDiskFileManager, self)._remove_ondisk_file(
+            hsh_path, filename)
+        partition, packed = self._packed_files(hsh_path)
+        if filename in packed:
+            partition.remove(basename(hsh_path), [filename])
+
+    def _read_ondisk_metadata(self, hsh_path, filename, keys=None):
+        partition, packed = self._packed_files(hsh_path)
+        if filename not in packed or exists(join(hsh_path, filename)):
+            return super(PackedDiskFileManager, self)._read_ondisk_metadata(
+                hsh_path, filename, keys=keys)
+        try:
+            fp = partition.open_file(basename(hsh_path), filename)
+        except DiskFileError:
+            # leave corrupt records for the auditor to quarantine
+            raise DiskFileNotExist()
+        try:
+            return fp.read_metadata(keys)
+        finally:
+            fp.close()
+
+    def remove_hash_dir(self, hsh_path):
+        super(PackedDiskFileManager, self).remove_hash_dir(hsh_path)
+        partition, packed = self._packed_files(hsh_path)
+        if packed:
+            partition.remove(basename(hsh_path), packed)
+
+    def quarantine_renamer(self, device_path, corrupted_file_path):
+        """
+        Write the packed files of the object out into its hash directory as
+        raw volume records, forget them and quarantine the directory.
+        """
+        hsh_path = dirname(corrupted_file_path)
+        partition, packed = self._packed_files(hsh_path)
+        if packed:
+            mkdirs(hsh_path)
+            for filename in packed:
+                path = join(hsh_path, filename)
+                if exists(path):
+                    continue
+                try:
+                    record = partition.read_record(basename(hsh_path),
+                                                   filename)
+                except (IOError, KeyError):
+                    continue
+                with open(path, 'wb') as fp:
+                    fp.write(record)
+            partition.remove(basename(hsh_path), packed)
+        return quarantine_renamer(device_path, corrupted_file_path)
+
+    def _listdir(self, path):
+        names = super(PackedDiskFileManager, self)._listdir(path)
+        partition = self.get_packed_partition(path)
+        if partition is not None:
+            packed = partition.suffixes()
+        else:
+            partition = self.get_packed_partition(dirname(path))
+            if partition is None:
+                return names
+            packed = partition.hashes(basename(path))
+        return names + [name for name in packed if name not in names]
+
+    def _hash_suffix_dir(self, path, mapper, reclaim_age):
+        partition = self.get_packed_partition(dirname(path))
+        packed = partition.hashes(basename(path)) if partition else None
+        if not packed:
+            return super(PackedDiskFileManager, self)._hash_suffix_dir(
+                path, mapper, reclaim_age)
+        hashes = defaultdict(hashlib.md5)
+        try:
+            path_contents = set(listdir(path))
+        except OSError as err:
+            if err.errno != errno.ENOTDIR:
+                raise
+            path_contents = set()
+        for hsh in sorted(path_contents | packed):
+            hsh_path = join(path, hsh)
+            try:
+                files = self.hash_cleanup_listdir(hsh_path, reclaim_age)
+            except OSError as err:
+                if err.errno != errno.ENOTDIR:
+                    raise
+                quar_path = self.quarantine_renamer(
+                    dirname(dirname(dirname(path))), hsh_path)
+                logging.exception(
+                    _('Quarantined %(hsh_path)s to %(quar_path)s because '
+                      'it is not a directory'), {'hsh_path': hsh_path,
+                                                 'quar_path': quar_path})
+                continue
+            if not files and hsh in path_contents:
+                try:
+                    os.rmdir(hsh_path)
+                except OSError:
+                    pass
+            for filename in files:
+                key, value = mapper(filename)
+                hashes[key].update(value)
+        if not hashes:
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+            raise PathNotDir()
+        return hashes
+
+    def _get_hashes(self, partition_path, recalculate=None, do_listdir=False,
+                    reclaim_age=None):
+        hashed, hashes = super(PackedDiskFileManager, self)._get_hashes(
+            partition_path, recalculate, do_listdir, reclaim_age)
+        partition = self.get_packed_partition(partition_path)
+        if partition is None:
+            return hashed, hashes
+        # listing the partition directory does not find suffixes that only
+        # hold packed objects
+        missing = partition.suffixes().difference(hashes)
+        if missing:
+            more, hashes = super(PackedDiskFileManager, self)._get_hashes(
+                partition_path, list(missing), False, reclaim_age)
+            hashed += more
+        return hashed, hashes
+
+    def compact_partition(self, partition_path):
+        partition = self.get_packed_partition(partition_path)
+        if partition is None:
+            return 0
+        reclaimed = partition.compact(self.packed_compact_ratio)
+        if reclaimed:
+            self.logger.increment('packed_compactions')
+            self.logger.update_stats('packed_bytes_reclaimed', reclaimed)
+        return reclaimed
+
+    def object_audit_location_generator(self, device_dirs=None):
+        return chain(
+            super(PackedDiskFileManager, self).object_audit_location_generator(
+                device_dirs),
+            self._packed_audit_location_generator(device_dirs))
+
+    def _packed_audit_location_generator(self, device_dirs=None):
+        if not device_dirs:
+            device_dirs = listdir(self.devices)
+        else:
+            device_dirs = list(
+                set(listdir(self.devices)).intersection(set(device_dirs)))
+        for device in device_dirs:
+            if self.mount_check and \
+                    not ismount(os.path.join(self.devices, device)):
+                continue
+            for dir_ in listdir(os.path.join(self.devices, device)):
+                if not dir_.startswith(DATADIR_BASE):
+                    continue
+                try:
+                    base, policy = split_policy_string(dir_)
+                except PolicyError:
+                    continue
+                datadir_path = os.path.join(self.devices, device, dir_)
+                for partition in listdir(datadir_path):
+                    part_path = os.path.join(datadir_path, partition)
+                    packed = self.get_packed_partition(part_path)
+                    if packed is None:
+                        continue
+                    for suffix in packed.suffixes():
+                        for hsh in packed.hashes(suffix):
+                            hsh_path = os.path.join(part_path, suffix, hsh)
+                            # hash dirs are audited with the rest
+                            if not os.path.isdir(hsh_path):
+                                yield AuditLocation(hsh_path, device,
+                                                    partition, policy)
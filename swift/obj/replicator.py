@@ -15,7 +15,7 @@
 
 import os
 import errno
-from os.path import isdir, isfile, join, dirname
+from os.path import isfile, join, dirname
 import random
 import shutil
 import time
@@ -38,7 +38,7 @@ from swift.common.bufferedhttp import http_connect
 from swift.common.daemon import Daemon
 from swift.common.http import HTTP_OK, HTTP_INSUFFICIENT_STORAGE
 from swift.obj import ssync_sender
-from swift.obj.diskfile import DiskFileManager, get_data_dir, get_tmp_dir
+from swift.obj.diskfile import DiskFileRouter, get_data_dir, get_tmp_dir
 from swift.common.storage_policy import POLICIES, REPL_POLICY
 
 
@@ -97,7 +97,14 @@ class ObjectReplicator(Daemon):
         self.rcache = os.path.join(self.recon_cache_path, "object.recon")
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
         self.node_timeout = float(conf.get('node_timeout', 10))
-        self.sync_method = getattr(self, conf.get('sync_method') or 'rsync')
+        sync_method = conf.get('sync_method') or 'rsync'
+        if conf.get('diskfile_backend') == 'packed' and \
+                sync_method != 'ssync':
+            # rsync would only copy the files that are not packed
+            self.logger.warn('The packed diskfile_backend requires '
+                             'sync_method = ssync, using ssync')
+            sync_method = 'ssync'
+        self.sync_method = getattr(self, sync_method)
         self.network_chunk_size = int(conf.get('network_chunk_size', 65536))
         self.default_headers = {
             'Content-Length': '0',
@@ -113,7 +120,8 @@ class ObjectReplicator(Daemon):
                              'operation, please disable handoffs_first and '
                              'handoff_delete before the next '
                              'normal rebalance')
-        self._diskfile_mgr = DiskFileManager(conf, self.logger)
+        self._diskfile_mgr = DiskFileRouter.get_manager_cls(
+            REPL_POLICY, conf.get('diskfile_backend'))(conf, self.logger)
 
     def _zero_stats(self):
         """Zero out the stats."""
@@ -271,9 +279,9 @@ class ObjectReplicator(Daemon):
         :param job: a dict containing info about the partition to be replicated
         """
 
-        def tpool_get_suffixes(path):
-            return [suff for suff in os.listdir(path)
-                    if len(suff) == 3 and isdir(join(path, suff))]
+        def tpool_get_suffixes(job):
+            return [suff for _junk, suff in self._diskfile_mgr.yield_suffixes(
+                job['device'], job['partition'], job['policy'])]
         self.replication_count += 1
         self.logger.increment('partition.delete.count.%s' % (job['device'],))
         headers = dict(self.default_headers)
@@ -282,7 +290,7 @@ class ObjectReplicator(Daemon):
         begin = time.time()
         try:
             responses = []
-            suffixes = tpool.execute(tpool_get_suffixes, job['path'])
+            suffixes = tpool.execute(tpool_get_suffixes, job)
             synced_remote_regions = {}
             delete_objs = None
             if suffixes:
@@ -369,7 +377,7 @@ class ObjectReplicator(Daemon):
         for object_hash in delete_objs:
             object_path = storage_directory(job['obj_path'], job['partition'],
                                             object_hash)
-            tpool.execute(shutil.rmtree, object_path, ignore_errors=True)
+            tpool.execute(self._diskfile_mgr.remove_hash_dir, object_path)
             suffix_dir = dirname(object_path)
             try:
                 os.rmdir(suffix_dir)
@@ -402,6 +410,7 @@ class ObjectReplicator(Daemon):
                 reclaim_age=self.reclaim_age)
             self.suffix_hash += hashed
             self.logger.update_stats('suffix.hashes', hashed)
+            tpool_reraise(self._diskfile_mgr.compact_partition, job['path'])
             attempts_left = len(job['nodes'])
             synced_remote_regions = set()
             random.shuffle(job['nodes'])
@@ -397,6 +397,60 @@ class ObjectController(BaseStorageServer):
                 return file_like.read(self.network_chunk_size)
         return timeout_reader
 
+    def _can_zero_copy_receive(self, obj_input, writer):
+        # To be able to zero-copy receive the object, the body has to come
+        # straight off the socket with a known length: no chunked transfer
+        # encoding and no MIME framing. We also have to be able to tell how
+        # much of it Eventlet has already buffered, which is only possible
+        # with the socket._fileobject it reads requests through.
+        # DiskFile implementations without zero-copy support may not have
+        # can_zero_copy_receive() at all.
+        can_zero_copy_receive = getattr(
+            writer, 'can_zero_copy_receive', None)
+        return (can_zero_copy_receive is not None and
+                can_zero_copy_receive() and
+                isinstance(obj_input, wsgi.Input) and
+                not obj_input.chunked_input and
+                obj_input.content_length and
+                isinstance(getattr(obj_input, 'rfile', None),
+                           socket._fileobject))
+
+    def _zero_copy_receive(self, obj_input, writer, upload_expiration):
+        """
+        Move an object body from the client's socket to disk with splice().
+
+        :param obj_input: the eventlet.wsgi.Input of the request
+        :param writer: the DiskFileWriter to write the body with
+        :param upload_expiration: time by which the whole body must have
+                                  been received
+        :returns: a tuple of the number of bytes written and the hex MD5
+                  checksum of the body
+        """
+        # Reading what Eventlet has already buffered also sends any pending
+        # 100 Continue response, so that the client starts sending the rest.
+        buffered = len(obj_input.rfile._rbuf.getvalue())
+        with ChunkReadTimeout(self.client_timeout):
+            prefix = obj_input.read(buffered)
+        rsock = obj_input.get_socket()
+        remaining = obj_input.content_length - obj_input.position
+        try:
+            result = writer.zero_copy_receive(
+                rsock.fileno(), remaining, prefix,
+                timeout=self.client_timeout, deadline=upload_expiration)
+        except (Exception, Timeout):
+            # We no longer know where the body ends, so stop reading from the
+            # client rather than let Eventlet take the rest of the body for
+            # the next request.
+            try:
+                rsock.shutdown(socket.SHUT_RD)
+            except socket.error:
+                pass
+            raise
+        # Eventlet discards whatever it thinks is left of the body once the
+        # response is sent, so tell it that we read all of it.
+        obj_input.position = obj_input.content_length
+        return result
+
     def _read_put_commit_message(self, mime_documents_iter):
         rcvd_commit = False
         try:
@@ -575,7 +629,6 @@ class ObjectController(BaseStorageServer):
                 headers={'X-Backend-Timestamp': orig_timestamp.internal})
         orig_delete_at = int(orig_metadata.get('X-Delete-At') or 0)
         upload_expiration = time.time() + self.max_upload_time
-        etag = md5()
         elapsed_time = 0
         try:
             with disk_file.create(size=fsize) as writer:
@@ -627,14 +680,27 @@ class ObjectController(BaseStorageServer):
 
                 timeout_reader = self._make_timeout_reader(obj_input)
                 try:
-                    for chunk in iter(timeout_reader, ''):
+                    if self._can_zero_copy_receive(obj_input, writer):
                         start_time = time.time()
-                        if start_time > upload_expiration:
-                            self.logger.increment('PUT.timeouts')
-                            return HTTPRequestTimeout(request=request)
-                        etag.update(chunk)
-                        upload_size = writer.write(chunk)
-                        elapsed_time += time.time() - start_time
+                        try:
+                            upload_size, etag = self._zero_copy_receive(
+                                obj_input, writer, upload_expiration)
+                        except ChunkReadTimeout:
+                            if time.time() >= upload_expiration:
+                                self.logger.increment('PUT.timeouts')
+                            raise
+                        elapsed_time = time.time() - start_time
+                    else:
+                        etag_hasher = md5()
+                        for chunk in iter(timeout_reader, ''):
+                            start_time = time.time()
+                            if start_time > upload_expiration:
+                                self.logger.increment('PUT.timeouts')
+                                return HTTPRequestTimeout(request=request)
+                            etag_hasher.update(chunk)
+                            upload_size = writer.write(chunk)
+                            elapsed_time += time.time() - start_time
+                        etag = etag_hasher.hexdigest()
                 except ChunkReadError:
                     return HTTPClientDisconnect(request=request)
                 except ChunkReadTimeout:
@@ -653,7 +719,6 @@ class ObjectController(BaseStorageServer):
 
                 request_etag = (footer_meta.get('etag') or
                                 request.headers.get('etag', '')).lower()
-                etag = etag.hexdigest()
                 if request_etag and request_etag != etag:
                     return HTTPUnprocessableEntity(request=request)
                 metadata = {
@@ -984,9 +1049,10 @@ class ObjectController(BaseStorageServer):
         # socket file descriptor from the WSGI input object. Third, the
         # diskfile has to support zero-copy send.
         #
-        # There's a good chance that this could work for 206 responses too,
-        # but the common case is sending the whole object, so we'll start
-        # there.
+        # Range requests turn the 200 into a 206 once the response is called,
+        # which is when the reader learns which range(s) zero_copy_send()
+        # has to send; conditional requests may turn it into a 304 or 412
+        # without any body at all.
         if req.method == 'GET' and res.status_int == 200 and \
            isinstance(env['wsgi.input'], wsgi.Input):
             app_iter = getattr(res, 'app_iter', None)
@@ -1019,11 +1085,20 @@ class ObjectController(BaseStorageServer):
                     except Exception:
                         self.logger.exception("zero_copy_send() blew up")
                         raise
+                    # Uncork to flush the last partial frame now rather than
+                    # whenever the kernel gets around to it, and so that a
+                    # later response on this keep-alive connection doesn't
+                    # sit corked.
+                    if hasattr(socket, 'TCP_CORK'):
+                        wsock.setsockopt(socket.IPPROTO_TCP,
+                                         socket.TCP_CORK, 0)
                     yield ''
 
                 # Get headers ready to go out
-                res(env, start_response)
-                return zero_copy_iter()
+                body_iter = res(env, start_response)
+                if res.status_int in (200, 206):
+                    return zero_copy_iter()
+                return body_iter
             else:
                 return res(env, start_response)
         else:
@@ -32,17 +32,20 @@ import functools
 import inspect
 import itertools
 import operator
+import random
+from collections import deque
 from sys import exc_info
 from swift import gettext_ as _
 
-from eventlet import sleep
+from eventlet import sleep, spawn, greenthread
+from eventlet.event import Event
 from eventlet.timeout import Timeout
 import six
 
 from swift.common.wsgi import make_pre_authed_env
 from swift.common.utils import Timestamp, config_true_value, \
     public, split_path, list_from_csv, GreenthreadSafeIterator, \
-    GreenAsyncPile, quorum_size, parse_content_type, \
+    GreenAsyncPile, quorum_size, parse_content_type, LRUCache, \
     http_response_to_document_iters, document_iters_to_http_response_body
 from swift.common.bufferedhttp import http_connect
 from swift.common.exceptions import ChunkReadTimeout, ChunkWriteTimeout, \
@@ -55,7 +58,8 @@ from swift.common.swob import Request, Response, HeaderKeyDict, Range, \
     HTTPException, HTTPRequestedRangeNotSatisfiable, HTTPServiceUnavailable, \
     status_map
 from swift.common.request_helpers import strip_sys_meta_prefix, \
-    strip_user_meta_prefix, is_user_meta, is_sys_meta, is_sys_or_user_meta
+    strip_user_meta_prefix, is_user_meta, is_sys_meta, is_sys_or_user_meta, \
+    timed_phase
 from swift.common.storage_policy import POLICIES
 
 
@@ -367,9 +371,75 @@ def get_object_env_key(account, container, obj):
     return env_key
 
 
+# (app, cache key) -> (greenthread, event) of the account and container info
+# fetches in flight, for other requests in this worker to wait for
+_info_fetches = {}
+
+
+def _copy_info(info):
+    # the info dicts hold strings, numbers and dicts of those
+    return dict((key, dict(value) if isinstance(value, dict) else value)
+                for key, value in info.items())
+
+
+class InfoCache(LRUCache):
+    """
+    Per-worker cache of account and container info, in front of memcache,
+    so that the info of hot containers doesn't have to be fetched from
+    memcache for each request.
+
+    Info is only kept for a short time, since it isn't invalidated when
+    another worker or proxy changes the account or container. Callers get
+    copies of the cached info, which they may change.
+
+    :param maxsize: most accounts and containers to keep the info of
+    :param positive_ttl: seconds to keep the info of existing accounts and
+                         containers; 0 to not cache it
+    :param negative_ttl: seconds to keep the info of missing accounts and
+                         containers; 0 to not cache it
+    """
+
+    def __init__(self, maxsize=10000, positive_ttl=1, negative_ttl=1):
+        super(InfoCache, self).__init__(maxsize,
+                                        max(positive_ttl, negative_ttl))
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+
+    def get(self, key):
+        """
+        :returns: a copy of the cached info for key, or None
+        """
+        cached = super(InfoCache, self).get(key)
+        if cached is None:
+            return None
+        expires, info = cached
+        if expires < time.time():
+            self.delete(key)
+            return None
+        return _copy_info(info)
+
+    def set(self, key, info):
+        """
+        Cache a copy of info for key, if it's the info of an existing or
+        missing account or container, and those are cached.
+        """
+        status = info.get('status', 0)
+        if is_success(status):
+            ttl = self.positive_ttl
+        elif status == HTTP_NOT_FOUND:
+            ttl = self.negative_ttl
+        else:
+            ttl = 0
+        if ttl > 0:
+            super(InfoCache, self).set(
+                key, (time.time() + ttl, _copy_info(info)))
+        else:
+            self.delete(key)
+
+
 def _set_info_cache(app, env, account, container, resp):
     """
-    Cache info in both memcache and env.
+    Cache info in memcache, env, and the app's info cache if it has one.
 
     Caching is used to avoid unnecessary calls to account & container servers.
     This is a private function that is being called by GETorHEAD_base and
@@ -399,10 +469,13 @@ def _set_info_cache(app, env, account, container, resp):
 
     # Next actually set both memcache and the env cache
     memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
+    info_cache = getattr(app, 'info_cache', None)
     if not cache_time:
         env.pop(env_key, None)
         if memcache:
             memcache.delete(cache_key)
+        if info_cache:
+            info_cache.delete(cache_key)
         return
 
     if container:
@@ -411,6 +484,8 @@ def _set_info_cache(app, env, account, container, resp):
         info = headers_to_account_info(resp.headers, resp.status_int)
     if memcache:
         memcache.set(cache_key, info, time=cache_time)
+    if info_cache:
+        info_cache.set(cache_key, info)
     env[env_key] = info
 
 
@@ -444,7 +519,7 @@ def _set_object_info_cache(app, env, account, container, obj, resp):
 
 def clear_info_cache(app, env, account, container=None):
     """
-    Clear the cached info in both memcache and env
+    Clear the cached info in memcache, env and the app's info cache
 
     :param  app: the application object
     :param  account: the account name
@@ -453,9 +528,79 @@ def clear_info_cache(app, env, account, container=None):
     _set_info_cache(app, env, account, container, None)
 
 
+def _get_info_caches(app, env, targets, extra_keys=()):
+    """
+    Get the cached info of accounts and containers from env, the app's info
+    cache or memcache (if used) in that order. The info not found in env or
+    the info cache is looked up in memcache all at once, along with any
+    other keys.
+
+    :param  app: the application object
+    :param  env: the environment used by the current request
+    :param  targets: list of (account name, container name or None)
+    :param  extra_keys: other keys to get from memcache
+    :returns: a tuple of (list of the cached info or None for each target,
+              list of the values of extra_keys)
+    """
+    memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
+    info_cache = getattr(app, 'info_cache', None)
+    # keys not worth looking up in memcache again during this request
+    skip_keys = env.get('swift.info_cache_skip', ())
+    infos = []
+    fetches = []
+    for account, container in targets:
+        cache_key, env_key = _get_cache_key(account, container)
+        info = None
+        if env_key in env:
+            info = env[env_key]
+        elif info_cache:
+            info = info_cache.get(cache_key)
+            if info:
+                app.logger.increment('info_cache.hit')
+                env[env_key] = info
+            else:
+                app.logger.increment('info_cache.miss')
+        if info or not memcache or cache_key in skip_keys:
+            infos.append(info)
+            continue
+        if container:
+            skip_chance = getattr(app, 'container_existence_skip_cache', 0)
+        else:
+            skip_chance = getattr(app, 'account_existence_skip_cache', 0)
+        if skip_chance and random.random() < skip_chance:
+            # refresh the info in memcache ahead of its expiry, so that
+            # it's rarely missed by many requests at once
+            app.logger.increment('info_cache.refresh')
+            env.setdefault('swift.info_cache_skip', set()).add(cache_key)
+        else:
+            fetches.append((len(infos), cache_key, env_key))
+        infos.append(info)
+
+    keys = [cache_key for i, cache_key, env_key in fetches]
+    keys.extend(extra_keys)
+    if not memcache or not keys:
+        return infos, [None] * len(extra_keys)
+    if len(keys) > 1 and hasattr(memcache, 'get_many'):
+        values = memcache.get_many(keys)
+    else:
+        values = [memcache.get(key) for key in keys]
+    for (i, cache_key, env_key), info in zip(fetches, values):
+        if info:
+            for key in info:
+                if isinstance(info[key], six.text_type):
+                    info[key] = info[key].encode("utf-8")
+            if info_cache:
+                info_cache.set(cache_key, info)
+            env[env_key] = infos[i] = info
+        else:
+            env.setdefault('swift.info_cache_skip', set()).add(cache_key)
+    return infos, values[len(fetches):]
+
+
 def _get_info_cache(app, env, account, container=None):
     """
-    Get the cached info from env or memcache (if used) in that order
+    Get the cached info from env, the app's info cache or memcache (if
+    used) in that order
     Used for both account and container info
     A private function used by get_info
 
@@ -463,20 +608,43 @@ def _get_info_cache(app, env, account, container=None):
     :param  env: the environment used by the current request
     :returns the cached info or None if not cached
     """
+    targets = [(account, container)]
+    memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
+    if container and hasattr(memcache, 'get_many'):
+        # the account's info is usually wanted too, if only to check it
+        # exists, and can be looked up at the same time
+        targets.append((account, None))
+    infos, _junk = _get_info_caches(app, env, targets)
+    return infos[0]
 
-    cache_key, env_key = _get_cache_key(account, container)
-    if env_key in env:
-        return env[env_key]
+
+def prefetch_info(env, app, account, container=None, extra_keys=()):
+    """
+    Get the cached info of an account, and of one of its containers, into
+    env, looking it up in memcache in one round trip along with some other
+    keys. Later calls to get_account_info and get_container_info for the
+    request then don't have to wait for memcache.
+    This is useful to middlewares.
+
+    :param env: the environment used by the current request
+    :param app: the application object
+    :param account: the unquoted name of the account
+    :param container: the unquoted name of the container, or None
+    :param extra_keys: other keys to get from memcache
+    :returns: list of the values of extra_keys in memcache
+    """
     memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
-    if memcache:
-        info = memcache.get(cache_key)
-        if info:
-            for key in info:
-                if isinstance(info[key], six.text_type):
-                    info[key] = info[key].encode("utf-8")
-            env[env_key] = info
-        return info
-    return None
+    if not hasattr(memcache, 'get_many'):
+        # nothing to gain; the info is looked up if and when it's wanted
+        if not memcache:
+            return [None] * len(extra_keys)
+        return [memcache.get(key) for key in extra_keys]
+    targets = [(account, None)]
+    if container:
+        targets.append((account, container))
+    with timed_phase(env, 'info'):
+        infos, values = _get_info_caches(app, env, targets, extra_keys)
+    return values
 
 
 def _prepare_pre_auth_info_request(env, path, swift_source):
@@ -512,17 +680,56 @@ def get_info(app, env, account, container=None, ret_not_found=False,
     :param container: The unquoted name of the container (or None if account)
     :returns: the cached info or None if cannot be retrieved
     """
+    with timed_phase(env, 'info'):
+        info = _get_info(app, env, account, container, swift_source)
+    if info and (ret_not_found or is_success(info['status'])):
+        return info
+    return None
+
+
+def _get_info(app, env, account, container, swift_source):
+    """
+    Get the info about accounts or containers, whatever its status
+
+    :returns: the info, or None if it cannot be retrieved
+    """
     info = _get_info_cache(app, env, account, container)
-    if info:
-        if ret_not_found or is_success(info['status']):
-            return info
-        return None
-    # Not in cache, let's try the account servers
+    if not info:
+        # Not in cache, let's try the account servers, unless another
+        # request of this worker already is
+        cache_key, env_key = _get_cache_key(account, container)
+        fetch_key = (app, cache_key)
+        fetch = _info_fetches.get(fetch_key)
+        if fetch and fetch[0] is not greenthread.getcurrent():
+            info = fetch[1].wait()
+            if info:
+                info = env[env_key] = _copy_info(info)
+        else:
+            event = Event()
+            _info_fetches[fetch_key] = (greenthread.getcurrent(), event)
+            try:
+                info = _get_info_from_backend(app, env, account, container,
+                                              swift_source)
+            finally:
+                _info_fetches.pop(fetch_key, None)
+                event.send(info)
+    return info
+
+
+def _get_info_from_backend(app, env, account, container, swift_source):
+    """
+    Get the info about accounts or containers from their servers
+
+    :returns: the info, or None if it cannot be retrieved
+    """
     path = '/v1/%s' % account
     if container:
         # Stop and check if we have an account?
-        if not get_info(app, env, account) and not account.startswith(
-                getattr(app, 'auto_create_account_prefix', '.')):
+        # (without timing it again: this is within get_info already)
+        account_info = _get_info(app, env, account, None, None)
+        if not (account_info and is_success(account_info['status'])) and \
+                not account.startswith(
+                    getattr(app, 'auto_create_account_prefix', '.')):
             return None
         path += '/' + container
 
@@ -536,8 +743,7 @@ def get_info(app, env, account, container=None, ret_not_found=False,
     try:
         info = resp.environ[env_key]
         env[env_key] = info
-        if ret_not_found or is_success(info['status']):
-            return info
+        return info
     except (KeyError, AttributeError):
         pass
     return None
@@ -618,6 +824,86 @@ def bytes_to_skip(record_size, range_start):
     return (record_size - (range_start % record_size)) % record_size
 
 
+class HedgeTracker(object):
+    """
+    Keeps track of how long the object servers of one storage policy take to
+    respond to GETs, and of how many GETs were hedged, i.e. sent to a second
+    node because the first was slow to respond.
+
+    :param percentile: GETs are hedged when the first node takes longer to
+                       respond than this percentile of recent response times
+    :param min_delay: least time to wait before hedging
+    :param max_delay: most time to wait before hedging; also used until
+                      enough response times have been seen
+    :param max_ratio: most GETs hedged, as a fraction of all GETs
+    """
+    window = 1000
+    min_samples = 20
+    # how often the hedging delay is recomputed
+    update_interval = 1
+    # how often the request and hedge counts are halved, so the hedge ratio
+    # follows recent traffic
+    decay_interval = 10
+
+    def __init__(self, percentile, min_delay, max_delay, max_ratio):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_ratio = max_ratio
+        self.latencies = deque(maxlen=self.window)
+        self.requests = self.hedges = 0.0
+        self._delay = max_delay
+        self._next_update = self._next_decay = 0
+
+    def record(self, latency):
+        """
+        Record how long a node took to respond.
+        """
+        self.latencies.append(latency)
+
+    @property
+    def delay(self):
+        """
+        How long to wait on the first node before hedging.
+        """
+        now = time.time()
+        if now >= self._next_update and \
+                len(self.latencies) >= self.min_samples:
+            self._next_update = now + self.update_interval
+            latencies = sorted(self.latencies)
+            index = min(len(latencies) - 1,
+                        int(len(latencies) * self.percentile / 100.0))
+            self._delay = min(self.max_delay,
+                              max(self.min_delay, latencies[index]))
+        return self._delay
+
+    def start_request(self):
+        """
+        Count a GET, and decide whether it may be hedged.
+
+        :returns: True if hedging the GET would keep within max_ratio
+        """
+        now = time.time()
+        if now >= self._next_decay:
+            self._next_decay = now + self.decay_interval
+            self.requests /= 2
+            self.hedges /= 2
+        self.requests += 1
+        return self.hedges < self.max_ratio * self.requests
+
+    def hedged(self):
+        """
+        Count a hedged GET.
+        """
+        self.hedges += 1
+
+
+def _close_sources(pile):
+    for source, _junk in pile:
+        if source:
+            close_swift_conn(source)
+
+
 class ResumingGetter(object):
     def __init__(self, app, req, server_type, node_iter, partition, path,
                  backend_headers, client_chunk_size=None, newest=None):
@@ -631,6 +917,8 @@ class ResumingGetter(object):
         self.skip_bytes = 0
         self.used_nodes = []
         self.used_source_etag = ''
+        self.hedge_tracker = None
+        self.hedge_node = None
 
         # stuff from request
         self.req_method = req.method
@@ -968,6 +1256,75 @@ class ResumingGetter(object):
         else:
             return None
 
+    def _make_node_request(self, node, node_timeout, logger_thread_locals):
+        self.app.logger.thread_locals = logger_thread_locals
+        start_node_timing = time.time()
+        try:
+            with ConnectionTimeout(self.app.conn_timeout):
+                conn = http_connect(
+                    node['ip'], node['port'], node['device'],
+                    self.partition, self.req_method, self.path,
+                    headers=self.backend_headers,
+                    query_string=self.req_query_string)
+            connected = time.time()
+            self.app.set_node_timing(node, connected - start_node_timing)
+
+            with Timeout(node_timeout):
+                possible_source = conn.getresponse()
+                # See NOTE: swift_conn at top of file about this.
+                possible_source.swift_conn = conn
+            self.app.set_node_first_byte_timing(node, time.time() - connected)
+        except (Exception, Timeout):
+            self.app.exception_occurred(
+                node, self.server_type,
+                _('Trying to %(method)s %(path)s') %
+                {'method': self.req_method, 'path': self.req_path})
+            return None, node
+        if self.hedge_tracker:
+            self.hedge_tracker.record(time.time() - start_node_timing)
+        return possible_source, node
+
+    def _iter_sources(self, node_timeout):
+        """
+        Makes requests to nodes in turn, yielding (source, node) for each of
+        them, with a source of None if the request failed.
+
+        When hedging, if the first node hasn't responded once the hedging
+        delay is up, a request goes to the next node too, which becomes
+        self.hedge_node; the responses of both nodes are yielded in the order
+        they come in. Connections to nodes whose responses weren't waited for
+        are closed in the background.
+        """
+        self.hedge_node = None
+        thread_locals = self.app.logger.thread_locals
+        nodes = (node for node in self.node_iter
+                 if node not in self.used_nodes)
+        if self.hedge_tracker:
+            may_hedge = self.hedge_tracker.start_request()
+            node = next(nodes, None)
+            if node is None:
+                return
+            pile = GreenAsyncPile(2)
+            pile.spawn(self._make_node_request, node, node_timeout,
+                       thread_locals)
+            responses = pile.waitfirst(self.hedge_tracker.delay)
+            if not responses and may_hedge:
+                node = next(nodes, None)
+                if node is not None:
+                    self.hedge_tracker.hedged()
+                    self.app.logger.increment('hedged_gets.issued')
+                    self.hedge_node = node
+                    pile.spawn(self._make_node_request, node, node_timeout,
+                               thread_locals)
+            try:
+                for response in itertools.chain(responses, pile):
+                    yield response
+            except GeneratorExit:
+                spawn(_close_sources, pile)
+                raise
+        for node in nodes:
+            yield self._make_node_request(node, node_timeout, thread_locals)
+
     def _get_source_and_node(self):
         self.statuses = []
         self.reasons = []
@@ -978,28 +1335,8 @@ class ResumingGetter(object):
         node_timeout = self.app.node_timeout
         if self.server_type == 'Object' and not self.newest:
             node_timeout = self.app.recoverable_node_timeout
-        for node in self.node_iter:
-            if node in self.used_nodes:
-                continue
-            start_node_timing = time.time()
-            try:
-                with ConnectionTimeout(self.app.conn_timeout):
-                    conn = http_connect(
-                        node['ip'], node['port'], node['device'],
-                        self.partition, self.req_method, self.path,
-                        headers=self.backend_headers,
-                        query_string=self.req_query_string)
-                self.app.set_node_timing(node, time.time() - start_node_timing)
-
-                with Timeout(node_timeout):
-                    possible_source = conn.getresponse()
-                    # See NOTE: swift_conn at top of file about this.
-                    possible_source.swift_conn = conn
-            except (Exception, Timeout):
-                self.app.exception_occurred(
-                    node, self.server_type,
-                    _('Trying to %(method)s %(path)s') %
-                    {'method': self.req_method, 'path': self.req_path})
+        for possible_source, node in self._iter_sources(node_timeout):
+            if possible_source is None:
                 continue
             if self.is_good_source(possible_source):
                 # 404 if we know we don't have a synced copy
@@ -1052,9 +1389,11 @@ class ResumingGetter(object):
             for src, _junk in sources:
                 close_swift_conn(src)
             self.used_nodes.append(node)
+            if node is self.hedge_node:
+                self.app.logger.increment('hedged_gets.won')
             src_headers = dict(
                 (k.lower(), v) for k, v in
-                possible_source.getheaders())
+                source.getheaders())
 
             # Save off the source etag so that, if we lose the connection
             # and have to resume from a different node, we can be sure that
@@ -1070,6 +1409,16 @@ class ResumingGetter(object):
 
 
 class GetOrHeadHandler(ResumingGetter):
+    def __init__(self, app, req, server_type, node_iter, partition, path,
+                 backend_headers, **kwargs):
+        super(GetOrHeadHandler, self).__init__(
+            app, req, server_type, node_iter, partition, path,
+            backend_headers, **kwargs)
+        if server_type == 'Object' and self.req_method == 'GET' and \
+                not self.newest:
+            self.hedge_tracker = app.get_hedge_tracker(
+                backend_headers.get('X-Backend-Storage-Policy-Index'))
+
     def _make_app_iter(self, req, node, source):
         """
         Returns an iterator over the contents of the source (via its read
@@ -1169,11 +1518,24 @@ class NodeIter(object):
         self.primary_nodes = self.app.sort_nodes(
             list(itertools.islice(node_iter, num_primary_nodes)))
         self.handoff_iter = node_iter
+        if self.app.sorting_method == 'timing':
+            self.handoff_iter = self._timed_handoffs(node_iter)
 
     def __iter__(self):
         self._node_iter = self._node_gen()
         return self
 
+    def _timed_handoffs(self, handoff_iter):
+        # The handoffs we expect to use are sorted too; any one of them will
+        # do as well as another, since requests look at all of them. The rest
+        # are left in ring order.
+        if self.expected_handoffs > 0:
+            for node in self.app.sort_nodes(list(itertools.islice(
+                    handoff_iter, self.expected_handoffs))):
+                yield node
+        for node in handoff_iter:
+            yield node
+
     def log_handoffs(self, handoffs):
         """
         Log handoff requests if handoff logging is enabled and the
@@ -1436,20 +1798,21 @@ class Controller(object):
         start_nodes = ring.get_part_nodes(part)
         nodes = GreenthreadSafeIterator(self.app.iter_nodes(ring, part))
         pile = GreenAsyncPile(len(start_nodes))
-        for head in headers:
-            pile.spawn(self._make_request, nodes, part, method, path,
-                       head, query_string, self.app.logger.thread_locals)
         response = []
         statuses = []
-        for resp in pile:
-            if not resp:
-                continue
-            response.append(resp)
-            statuses.append(resp[0])
-            if self.have_quorum(statuses, len(start_nodes)):
-                break
-        # give any pending requests *some* chance to finish
-        finished_quickly = pile.waitall(self.app.post_quorum_timeout)
+        with timed_phase(req.environ, 'backend'):
+            for head in headers:
+                pile.spawn(self._make_request, nodes, part, method, path,
+                           head, query_string, self.app.logger.thread_locals)
+            for resp in pile:
+                if not resp:
+                    continue
+                response.append(resp)
+                statuses.append(resp[0])
+                if self.have_quorum(statuses, len(start_nodes)):
+                    break
+            # give any pending requests *some* chance to finish
+            finished_quickly = pile.waitall(self.app.post_quorum_timeout)
         for resp in finished_quickly:
             if not resp:
                 continue
@@ -1628,7 +1991,8 @@ class Controller(object):
         handler = GetOrHeadHandler(self.app, req, self.server_type, node_iter,
                                    partition, path, backend_headers,
                                    client_chunk_size=client_chunk_size)
-        res = handler.get_working_response(req)
+        with timed_phase(req.environ, 'backend'):
+            res = handler.get_working_response(req)
 
         if not res:
             res = self.best_response(
@@ -23,6 +23,7 @@ from swift.common import constraints
 from swift.common.http import HTTP_ACCEPTED, is_success
 from swift.proxy.controllers.base import Controller, delay_denial, \
     cors_validation, clear_info_cache
+from swift.common.request_helpers import timed_phase
 from swift.common.storage_policy import POLICIES
 from swift.common.swob import HTTPBadRequest, HTTPForbidden, \
     HTTPNotFound
@@ -87,7 +88,8 @@ class ContainerController(Controller):
         """Handler for HTTP GET/HEAD requests."""
         if not self.account_info(self.account_name, req)[1]:
             if 'swift.authorize' in req.environ:
-                aresp = req.environ['swift.authorize'](req)
+                with timed_phase(req.environ, 'auth'):
+                    aresp = req.environ['swift.authorize'](req)
                 if aresp:
                     return aresp
             return HTTPNotFound(request=req)
@@ -99,7 +101,8 @@ class ContainerController(Controller):
             req.swift_entity_path)
         if 'swift.authorize' in req.environ:
             req.acl = resp.headers.get('x-container-read')
-            aresp = req.environ['swift.authorize'](req)
+            with timed_phase(req.environ, 'auth'):
+                aresp = req.environ['swift.authorize'](req)
             if aresp:
                 return aresp
         if not req.environ.get('swift_owner', False):
@@ -28,6 +28,7 @@ import six
 from six.moves.urllib.parse import unquote, quote
 
 import collections
+import functools
 import itertools
 import json
 import mimetypes
@@ -73,7 +74,7 @@ from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPNotFound, \
     HTTPClientDisconnect, HTTPUnprocessableEntity, Response, HTTPException, \
     HTTPRequestedRangeNotSatisfiable, Range, HTTPInternalServerError
 from swift.common.request_helpers import is_sys_or_user_meta, is_sys_meta, \
-    remove_items, copy_header_subset
+    remove_items, copy_header_subset, add_phase_time, timed_phase
 
 
 def copy_headers_into(from_r, to_r):
@@ -192,7 +193,8 @@ class BaseObjectController(Controller):
         obj_ring = self.app.get_object_ring(policy_index)
         req.headers['X-Backend-Storage-Policy-Index'] = policy_index
         if 'swift.authorize' in req.environ:
-            aresp = req.environ['swift.authorize'](req)
+            with timed_phase(req.environ, 'auth'):
+                aresp = req.environ['swift.authorize'](req)
             if aresp:
                 return aresp
         partition = obj_ring.get_part(
@@ -252,7 +254,8 @@ class BaseObjectController(Controller):
             containers = container_info['nodes']
             req.acl = container_info['write_acl']
             if 'swift.authorize' in req.environ:
-                aresp = req.environ['swift.authorize'](req)
+                with timed_phase(req.environ, 'auth'):
+                    aresp = req.environ['swift.authorize'](req)
                 if aresp:
                     return aresp
             if not containers:
@@ -615,6 +618,7 @@ class BaseObjectController(Controller):
         node_iter = GreenthreadSafeIterator(
             self.iter_nodes_local_first(obj_ring, partition))
         pile = GreenPile(len(nodes))
+        start_time = time.time()
 
         for nheaders in outgoing_headers:
             if expect:
@@ -624,6 +628,12 @@ class BaseObjectController(Controller):
                        self.app.logger.thread_locals)
 
         conns = [conn for conn in pile if conn]
+        # the nodes are waited on concurrently, so count only the longest
+        # wait for 100 Continue as that phase
+        expect_duration = max([conn.expect_duration for conn in conns] or [0])
+        add_phase_time(req.environ, 'connect',
+                       time.time() - start_time - expect_duration)
+        add_phase_time(req.environ, 'expect', expect_duration)
 
         return conns
 
@@ -713,7 +723,8 @@ class BaseObjectController(Controller):
 
         # is request authorized
         if 'swift.authorize' in req.environ:
-            aresp = req.environ['swift.authorize'](req)
+            with timed_phase(req.environ, 'auth'):
+                aresp = req.environ['swift.authorize'](req)
             if aresp:
                 return aresp
 
@@ -780,7 +791,8 @@ class BaseObjectController(Controller):
         req.acl = container_info['write_acl']
         req.environ['swift_sync_key'] = container_info['sync_key']
         if 'swift.authorize' in req.environ:
-            aresp = req.environ['swift.authorize'](req)
+            with timed_phase(req.environ, 'auth'):
+                aresp = req.environ['swift.authorize'](req)
             if aresp:
                 return aresp
         if not containers:
@@ -889,8 +901,10 @@ class ReplicatedObjectController(BaseObjectController):
                         node['ip'], node['port'], node['device'], part, 'PUT',
                         path, headers)
                 self.app.set_node_timing(node, time.time() - start_time)
+                start_time = time.time()
                 with Timeout(self.app.node_timeout):
                     resp = conn.getexpect()
+                conn.expect_duration = time.time() - start_time
                 if resp.status == HTTP_CONTINUE:
                     conn.resp = None
                     conn.node = node
@@ -1038,11 +1052,13 @@ class ReplicatedObjectController(BaseObjectController):
             self._check_failure_put_connections(conns, req, nodes, min_conns)
 
             # transfer data
-            self._transfer_data(req, data_source, conns, nodes)
+            with timed_phase(req.environ, 'transfer'):
+                self._transfer_data(req, data_source, conns, nodes)
 
             # get responses
-            statuses, reasons, bodies, etags = self._get_put_responses(
-                req, conns, nodes)
+            with timed_phase(req.environ, 'quorum'):
+                statuses, reasons, bodies, etags = self._get_put_responses(
+                    req, conns, nodes)
         except HTTPException as resp:
             return resp
         finally:
@@ -1086,9 +1102,17 @@ class ECAppIter(object):
         headers in the GET response from the object server.
 
     :param logger: a logger
+
+    :param threadpool: ThreadPool to decode segments in, or None to decode
+        them in the calling greenthread.
+
+    :param pipeline_depth: how many segments may be decoded at once; the
+        segments after the one being sent to the client are decoded while
+        it's sent.
     """
     def __init__(self, path, policy, internal_parts_iters, range_specs,
-                 fa_length, obj_length, logger):
+                 fa_length, obj_length, logger, threadpool=None,
+                 pipeline_depth=1):
         self.path = path
         self.policy = policy
         self.internal_parts_iters = internal_parts_iters
@@ -1097,6 +1121,8 @@ class ECAppIter(object):
         self.obj_length = obj_length if obj_length is not None else 0
         self.boundary = ''
         self.logger = logger
+        self.threadpool = threadpool
+        self.pipeline_depth = pipeline_depth
 
         self.mime_boundary = None
         self.learned_content_type = None
@@ -1434,10 +1460,12 @@ class ECAppIter(object):
                 queue.put(None)
                 frag_iter.close()
 
-        with ContextPool(len(fragment_iters)) as pool:
+        with ContextPool(len(fragment_iters) + self.pipeline_depth) as pool:
             for frag_iter, queue in zip(fragment_iters, queues):
                 pool.spawn(put_fragments_in_queue, frag_iter, queue)
 
+            # greenthreads decoding segments, oldest first
+            decoding = collections.deque()
             while True:
                 fragments = []
                 for queue in queues:
@@ -1453,14 +1481,24 @@ class ECAppIter(object):
                 # connection.
                 if not all(fragments):
                     break
-                try:
-                    segment = self.policy.pyeclib_driver.decode(fragments)
-                except ECDriverError:
-                    self.logger.exception("Error decoding fragments for %r" %
-                                          self.path)
-                    raise
+                decoding.append(pool.spawn(self._decode_segment, fragments))
+                if len(decoding) >= self.pipeline_depth:
+                    yield decoding.popleft().wait()
+
+            # the segments before a failure are still good
+            while decoding:
+                yield decoding.popleft().wait()
 
-                yield segment
+    def _decode_segment(self, fragments):
+        try:
+            if self.threadpool:
+                return self.threadpool.run_in_thread(
+                    self.policy.pyeclib_driver.decode, fragments)
+            return self.policy.pyeclib_driver.decode(fragments)
+        except ECDriverError:
+            self.logger.exception("Error decoding fragments for %r" %
+                                  self.path)
+            raise
 
     def app_iter_range(self, start, end):
         return self
@@ -1598,7 +1636,7 @@ class ECPutter(object):
     Probably deserves more docs than this, but meh.
     """
     def __init__(self, conn, node, resp, path, connect_duration,
-                 mime_boundary):
+                 mime_boundary, expect_duration=0):
         # Note: you probably want to call Putter.connect() instead of
         # instantiating one of these directly.
         self.conn = conn
@@ -1606,6 +1644,7 @@ class ECPutter(object):
         self.resp = resp
         self.path = path
         self.connect_duration = connect_duration
+        self.expect_duration = expect_duration
         # for handoff nodes node_index is None
         self.node_index = node.get('index')
         self.mime_boundary = mime_boundary
@@ -1795,8 +1834,10 @@ class ECPutter(object):
                                 part, 'PUT', path, headers)
         connect_duration = time.time() - start_time
 
+        start_time = time.time()
         with ResponseTimeout(node_timeout):
             resp = conn.getexpect()
+        expect_duration = time.time() - start_time
 
         if resp.status == HTTP_INSUFFICIENT_STORAGE:
             raise InsufficientStorage
@@ -1825,11 +1866,22 @@ class ECPutter(object):
               resp.status == HTTP_PRECONDITION_FAILED):
             conn.resp = resp
 
-        return cls(conn, node, resp, path, connect_duration, mime_boundary)
+        return cls(conn, node, resp, path, connect_duration, mime_boundary,
+                   expect_duration)
+
 
+def _encode_segments(policy, segments):
+    return [policy.pyeclib_driver.encode(segment) for segment in segments]
 
-def chunk_transformer(policy, nstreams):
+
+def chunk_transformer(policy, nstreams, threadpool=None):
     segment_size = policy.ec_segment_size
+    encode_segments = functools.partial(_encode_segments, policy)
+    if threadpool:
+        # the greenthreads sending the previous segments to the object
+        # servers keep going while this is encoded
+        encode_segments = functools.partial(threadpool.run_in_thread,
+                                            encode_segments)
 
     buf = collections.deque()
     total_buf_len = 0
@@ -1854,10 +1906,7 @@ def chunk_transformer(policy, nstreams):
                     total_buf_len -= len(piece)
                 chunks_to_encode.append(''.join(pieces))
 
-            frags_by_byte_order = []
-            for chunk_to_encode in chunks_to_encode:
-                frags_by_byte_order.append(
-                    policy.pyeclib_driver.encode(chunk_to_encode))
+            frags_by_byte_order = encode_segments(chunks_to_encode)
             # Sequential calls to encode() have given us a list that
             # looks like this:
             #
@@ -1881,7 +1930,7 @@ def chunk_transformer(policy, nstreams):
     # Take any leftover bytes and encode them.
     last_bytes = ''.join(buf)
     if last_bytes:
-        last_frags = policy.pyeclib_driver.encode(last_bytes)
+        last_frags, = encode_segments([last_bytes])
         yield last_frags
     else:
         yield [''] * nstreams
@@ -1997,6 +2046,13 @@ class ECObjectController(BaseObjectController):
                 orig_range = req.range
                 range_specs = self._convert_range(req, policy)
 
+            if self.app.ec_prefer_data_fragments:
+                # The first ec_ndata fragments of each segment are its data
+                # as is, so when all of them are there pyeclib just joins
+                # them up instead of decoding. Ask for those first.
+                node_iter.primary_nodes.sort(
+                    key=lambda node: node['index'] >= policy.ec_ndata)
+
             safe_iter = GreenthreadSafeIterator(node_iter)
             with ContextPool(policy.ec_ndata) as pool:
                 pile = GreenAsyncPile(pool)
@@ -2041,12 +2097,21 @@ class ECObjectController(BaseObjectController):
                 # This is only true if we didn't get a 206 response, but
                 # that's the only time this is used anyway.
                 fa_length = int(resp_headers['Content-Length'])
+                frag_indexes = [
+                    HeaderKeyDict(getter.last_headers).get(
+                        'X-Object-Sysmeta-Ec-Frag-Index')
+                    for getter, iterator in etag_buckets[best_etag]]
+                if all(frag_index is not None and
+                       int(frag_index) < policy.ec_ndata
+                       for frag_index in frag_indexes):
+                    self.app.logger.increment('ec_data_only_gets')
                 app_iter = ECAppIter(
                     req.swift_entity_path,
                     policy,
                     [iterator for getter, iterator in etag_buckets[best_etag]],
                     range_specs, fa_length, obj_length,
-                    self.app.logger)
+                    self.app.logger, self.app.get_ec_threadpool(),
+                    self.app.ec_pipeline_depth)
                 resp = Response(
                     request=req,
                     headers=resp_headers,
@@ -2160,7 +2225,8 @@ class ECObjectController(BaseObjectController):
         This method was added in the PUT method extraction change
         """
         bytes_transferred = 0
-        chunk_transform = chunk_transformer(policy, len(nodes))
+        chunk_transform = chunk_transformer(policy, len(nodes),
+                                            self.app.get_ec_threadpool())
         chunk_transform.send(None)
 
         def send_chunk(chunk):
@@ -2455,8 +2521,9 @@ class ECObjectController(BaseObjectController):
             # meet all the correct conditions set in the request
             self._check_failure_put_connections(putters, req, nodes, min_conns)
 
-            self._transfer_data(req, policy, data_source, putters,
-                                nodes, min_conns, etag_hasher)
+            with timed_phase(req.environ, 'transfer'):
+                self._transfer_data(req, policy, data_source, putters,
+                                    nodes, min_conns, etag_hasher)
             final_phase = True
             need_quorum = False
             # The .durable file will propagate in a replicated fashion; if
@@ -2470,10 +2537,11 @@ class ECObjectController(BaseObjectController):
             min_conns = policy.quorum
             putters = [p for p in putters if not p.failed]
             # ignore response etags, and quorum boolean
-            statuses, reasons, bodies, _etags, _quorum = \
-                self._get_put_responses(req, putters, len(nodes),
-                                        final_phase, min_conns,
-                                        need_quorum=need_quorum)
+            with timed_phase(req.environ, 'quorum'):
+                statuses, reasons, bodies, _etags, _quorum = \
+                    self._get_put_responses(req, putters, len(nodes),
+                                            final_phase, min_conns,
+                                            need_quorum=need_quorum)
         except HTTPException as resp:
             return resp
 
@@ -29,18 +29,40 @@ from swift import __canonical_version__ as swift_version
 from swift.common import constraints
 from swift.common.storage_policy import POLICIES
 from swift.common.ring import Ring
+from swift.common.shared_table import SharedTable
+from swift.common.bufferedhttp import BufferedHTTPConnection, \
+    ConnectionPool
 from swift.common.utils import cache_from_env, get_logger, \
     get_remote_client, split_path, config_true_value, generate_trans_id, \
     affinity_key_function, affinity_locality_predicate, list_from_csv, \
-    register_swift_info
+    register_swift_info, ThreadPool
 from swift.common.constraints import check_utf8, valid_api_version
+from swift.common.request_helpers import timed_phase
 from swift.proxy.controllers import AccountController, ContainerController, \
     ObjectControllerRouter, InfoController
-from swift.proxy.controllers.base import get_container_info, NodeIter
+from swift.proxy.controllers.base import get_container_info, NodeIter, \
+    HedgeTracker, InfoCache
 from swift.common.swob import HTTPBadRequest, HTTPForbidden, \
     HTTPMethodNotAllowed, HTTPNotFound, HTTPPreconditionFailed, \
     HTTPServerError, HTTPException, Request, HTTPServiceUnavailable
 from swift.common.exceptions import APIVersionError
+from swift.common.memcached import MemcacheConnectionError
+
+
+# Timings kept per device for sorting_method = timing, in this table in
+# recon_cache_path, as moving averages where each new timing has this weight.
+NODE_TIMING_FIELDS = ('connect', 'first_byte')
+NODE_TIMING_TABLE = 'proxy-node-timing.table'
+TIMING_WEIGHT = 0.2
+
+# With error_limiting_scope = host, error counts are shared through this table
+# in recon_cache_path; with error_limiting_scope = cluster, through memcache,
+# where each worker looks a node's count up at most this often.
+ERROR_LIMITING_FIELDS = ('errors',)
+ERROR_LIMITING_TABLE = 'proxy-error-limiting.table'
+ERROR_LIMITING_MEMCACHE_KEY = 'error_limiting/%s'
+ERROR_LIMITING_MEMCACHE_INTERVAL = 1
+ERROR_LIMITING_SCOPES = ('worker', 'host', 'cluster')
 
 
 # List of entry points for mandatory middlewares.
@@ -93,6 +115,11 @@ class Application(object):
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
         self.client_timeout = int(conf.get('client_timeout', 60))
         self.put_queue_depth = int(conf.get('put_queue_depth', 10))
+        self.ec_threads = int(conf.get('ec_threads', 0))
+        self.ec_pipeline_depth = int(conf.get('ec_pipeline_depth', 2))
+        self.ec_prefer_data_fragments = config_true_value(
+            conf.get('ec_prefer_data_fragments', 'true'))
+        self._ec_threadpool = None
         self.object_chunk_size = int(conf.get('object_chunk_size', 65536))
         self.client_chunk_size = int(conf.get('client_chunk_size', 65536))
         self.trans_id_suffix = conf.get('trans_id_suffix', '')
@@ -101,21 +128,53 @@ class Application(object):
             int(conf.get('error_suppression_interval', 60))
         self.error_suppression_limit = \
             int(conf.get('error_suppression_limit', 10))
+        self.error_limiting_scope = conf.get(
+            'error_limiting_scope', 'worker').lower()
+        if self.error_limiting_scope not in ERROR_LIMITING_SCOPES:
+            raise ValueError('Invalid error_limiting_scope value: %r' %
+                             self.error_limiting_scope)
         self.recheck_container_existence = \
             int(conf.get('recheck_container_existence', 60))
         self.recheck_account_existence = \
             int(conf.get('recheck_account_existence', 60))
+        self.account_existence_skip_cache = float(
+            conf.get('account_existence_skip_cache_pct', 0)) / 100
+        self.container_existence_skip_cache = float(
+            conf.get('container_existence_skip_cache_pct', 0)) / 100
+        info_cache_positive_ttl = float(
+            conf.get('info_cache_positive_ttl', 0))
+        info_cache_negative_ttl = float(
+            conf.get('info_cache_negative_ttl', 0))
+        info_cache_size = int(conf.get('info_cache_size', 10000))
+        if info_cache_size > 0 and (
+                info_cache_positive_ttl > 0 or info_cache_negative_ttl > 0):
+            self.info_cache = InfoCache(
+                info_cache_size, info_cache_positive_ttl,
+                info_cache_negative_ttl)
+        else:
+            self.info_cache = None
         self.allow_account_management = \
             config_true_value(conf.get('allow_account_management', 'no'))
         self.object_post_as_copy = \
             config_true_value(conf.get('object_post_as_copy', 'true'))
-        self.container_ring = container_ring or Ring(swift_dir,
-                                                     ring_name='container')
-        self.account_ring = account_ring or Ring(swift_dir,
-                                                 ring_name='account')
+        if config_true_value(conf.get('backend_keepalive', 'no')):
+            self.backend_pool = ConnectionPool(
+                int(conf.get('backend_keepalive_pool_size', 8)),
+                float(conf.get('backend_keepalive_timeout', 15)))
+        else:
+            self.backend_pool = None
+        ring_kwargs = {
+            'logger': self.logger,
+            'background_reload': config_true_value(
+                conf.get('background_ring_reload', 'false')),
+        }
+        self.container_ring = container_ring or Ring(
+            swift_dir, ring_name='container', **ring_kwargs)
+        self.account_ring = account_ring or Ring(
+            swift_dir, ring_name='account', **ring_kwargs)
         # ensure rings are loaded for all configured storage policies
         for policy in POLICIES:
-            policy.load_ring(swift_dir)
+            policy.load_ring(swift_dir, **ring_kwargs)
         self.obj_controller_router = ObjectControllerRouter()
         self.memcache = memcache
         mimetypes.init(mimetypes.knownfiles +
@@ -144,9 +203,36 @@ class Application(object):
             if a.strip()]
         self.strict_cors_mode = config_true_value(
             conf.get('strict_cors_mode', 't'))
-        self.node_timings = {}
+        self.recon_cache_path = conf.get('recon_cache_path',
+                                         '/var/cache/swift')
         self.timing_expiry = int(conf.get('timing_expiry', 300))
         self.sorting_method = conf.get('sorting_method', 'shuffle').lower()
+        if self.sorting_method == 'timing':
+            self.node_timings = self._open_shared_table(
+                NODE_TIMING_FIELDS, NODE_TIMING_TABLE)
+        else:
+            self.node_timings = None
+        if self.error_limiting_scope == 'host':
+            self.shared_error_limiting = self._open_shared_table(
+                ERROR_LIMITING_FIELDS, ERROR_LIMITING_TABLE)
+        else:
+            self.shared_error_limiting = None
+        # node key -> (time looked up, error count) from memcache
+        self._cluster_errors = {}
+        self.hedged_gets = config_true_value(conf.get('hedged_gets', 'no'))
+        self.hedge_percentile = float(conf.get('hedge_percentile', 95))
+        self.hedge_min_delay = float(conf.get('hedge_min_delay', 0.01))
+        self.hedge_max_delay = float(conf.get('hedge_max_delay', 1))
+        self.hedge_max_ratio = float(conf.get('hedge_max_ratio', 0.05))
+        self.hedge_policy_max_ratios = {}
+        for item in list_from_csv(conf.get('hedge_policy_max_ratios')):
+            try:
+                policy_index, ratio = item.split(':')
+                self.hedge_policy_max_ratios[int(policy_index)] = float(ratio)
+            except ValueError:
+                raise ValueError(
+                    'Invalid hedge_policy_max_ratios value: %r' % item)
+        self.hedge_trackers = {}
         self.max_large_object_get_time = float(
             conf.get('max_large_object_get_time', '86400'))
         value = conf.get('request_node_count', '2 * replicas').lower().split()
@@ -211,6 +297,9 @@ class Application(object):
         # ** Because it affects the client as well, currently, we use the
         # client chunk size as the govenor and not the object chunk size.
         socket._fileobject.default_bufsize = self.client_chunk_size
+        # Likewise, every connection from this process to the backend servers
+        # shares the persistent connection pool, if there is one.
+        BufferedHTTPConnection.pool = self.backend_pool
         self.expose_info = config_true_value(
             conf.get('expose_info', 'yes'))
         self.disallowed_sections = list_from_csv(
@@ -243,6 +332,44 @@ class Application(object):
         """
         return POLICIES.get_object_ring(policy_idx, self.swift_dir)
 
+    def get_hedge_tracker(self, policy_idx):
+        """
+        Get the hedge tracker for object GETs in a storage policy.
+
+        :param policy_idx: policy index as defined in swift.conf
+
+        :returns: a HedgeTracker, or None if GETs in the policy aren't hedged
+        """
+        if not self.hedged_gets:
+            return None
+        policy = POLICIES.get_by_index(policy_idx)
+        if policy is None:
+            return None
+        tracker = self.hedge_trackers.get(policy.idx)
+        if tracker is None:
+            max_ratio = self.hedge_policy_max_ratios.get(
+                policy.idx, self.hedge_max_ratio)
+            if max_ratio <= 0:
+                return None
+            tracker = self.hedge_trackers[policy.idx] = HedgeTracker(
+                self.hedge_percentile, self.hedge_min_delay,
+                self.hedge_max_delay, max_ratio)
+        return tracker
+
+    def get_ec_threadpool(self):
+        """
+        Get the pool of native threads that this worker erasure codes in.
+        It's started when first needed, so that each worker has its own.
+
+        :returns: a ThreadPool, or None if erasure coding is done in the
+                  worker's main thread
+        """
+        if self.ec_threads <= 0:
+            return None
+        if self._ec_threadpool is None:
+            self._ec_threadpool = ThreadPool(nthreads=self.ec_threads)
+        return self._ec_threadpool
+
     def get_controller(self, req):
         """
         Get the controller to handle a request.
@@ -388,7 +515,8 @@ class Application(object):
                 # again. If not authorized, we return the denial unless the
                 # controller's method indicates it'd like to gather more
                 # information and try again later.
-                resp = req.environ['swift.authorize'](req)
+                with timed_phase(req.environ, 'auth'):
+                    resp = req.environ['swift.authorize'](req)
                 if not resp and not req.headers.get('X-Copy-From-Account') \
                         and not req.headers.get('Destination-Account'):
                     # No resp means authorized, no delayed recheck required.
@@ -415,6 +543,21 @@ class Application(object):
             self.logger.exception(_('ERROR Unhandled exception in request'))
             return HTTPServerError(request=req)
 
+    def _open_shared_table(self, fields, name):
+        """
+        Open a table shared with the other workers, and with recon, in the
+        recon cache directory. If that fails, the table will be private to
+        this worker.
+        """
+        path = os.path.join(self.recon_cache_path, name)
+        try:
+            return SharedTable(fields, path)
+        except (IOError, OSError) as err:
+            self.logger.warning(
+                _('Unable to open %(path)s, not sharing it with other '
+                  'workers: %(err)s'), {'path': path, 'err': err})
+            return SharedTable(fields)
+
     def sort_nodes(self, nodes):
         '''
         Sorts nodes in-place (and returns the sorted list) according to
@@ -427,22 +570,54 @@ class Application(object):
         # Python's sort is stable (http://wiki.python.org/moin/HowTo/Sorting/)
         shuffle(nodes)
         if self.sorting_method == 'timing':
-            now = time()
+            expired = time() - self.timing_expiry
 
             def key_func(node):
-                timing, expires = self.node_timings.get(node['ip'], (-1.0, 0))
-                return timing if expires > now else -1.0
+                entry = self.node_timings.get(
+                    self._error_limit_node_key(node))
+                if entry is None or entry[0] <= expired:
+                    # try nodes we know nothing about first
+                    return -1.0
+                # sort timings to the millisecond
+                return round(sum(entry[1].values()), 3)
             nodes.sort(key=key_func)
         elif self.sorting_method == 'affinity':
             nodes.sort(key=self.read_affinity_sort_key)
         return nodes
 
-    def set_node_timing(self, node, timing):
-        if self.sorting_method != 'timing':
+    def _update_node_timing(self, node, field, timing):
+        if self.node_timings is None:
             return
         now = time()
-        timing = round(timing, 3)  # sort timings to the millisecond
-        self.node_timings[node['ip']] = (timing, now + self.timing_expiry)
+        node_key = self._error_limit_node_key(node)
+        entry = self.node_timings.get(node_key)
+        if entry is None or entry[0] <= now - self.timing_expiry:
+            timings = dict.fromkeys(NODE_TIMING_FIELDS, 0.0)
+        else:
+            timings = entry[1]
+        if timings[field]:
+            timing = timings[field] + TIMING_WEIGHT * (timing - timings[field])
+        timings[field] = timing
+        self.node_timings.update(node_key, timings, now)
+
+    def set_node_timing(self, node, timing):
+        """
+        Record how long it took to connect to a node.
+
+        :param node: dictionary of the node
+        :param timing: seconds it took
+        """
+        self._update_node_timing(node, 'connect', timing)
+
+    def set_node_first_byte_timing(self, node, timing):
+        """
+        Record how long a node took to respond to a GET or HEAD, once
+        connected to.
+
+        :param node: dictionary of the node
+        :param timing: seconds it took
+        """
+        self._update_node_timing(node, 'first_byte', timing)
 
     def _error_limit_node_key(self, node):
         return "{ip}:{port}/{device}".format(**node)
@@ -458,13 +633,20 @@ class Application(object):
         node_key = self._error_limit_node_key(node)
         error_stats = self._error_limiting.get(node_key)
 
-        if error_stats is None or 'errors' not in error_stats:
-            return False
-        if 'last_error' in error_stats and error_stats['last_error'] < \
-                now - self.error_suppression_interval:
-            self._error_limiting.pop(node_key, None)
-            return False
-        limited = error_stats['errors'] > self.error_suppression_limit
+        limited = False
+        if error_stats is not None and 'errors' in error_stats:
+            if 'last_error' in error_stats and error_stats['last_error'] < \
+                    now - self.error_suppression_interval:
+                self._error_limiting.pop(node_key, None)
+            else:
+                limited = \
+                    error_stats['errors'] > self.error_suppression_limit
+        if not limited and self.error_limiting_scope != 'worker':
+            limited = self._shared_node_errors(node_key, now) > \
+                self.error_suppression_limit
+            if limited:
+                # this worker would have sent the request on its own
+                self.logger.increment('error_limit.saved')
         if limited:
             self.logger.debug(
                 _('Node error limited %(ip)s:%(port)s (%(device)s)'), node)
@@ -484,6 +666,8 @@ class Application(object):
         error_stats = self._error_limiting.setdefault(node_key, {})
         error_stats['errors'] = self.error_suppression_limit + 1
         error_stats['last_error'] = time()
+        self._share_node_errors(node_key, self.error_suppression_limit + 1)
+        self._evict_node_connections(node)
         self.logger.error(_('%(msg)s %(ip)s:%(port)s/%(device)s'),
                           {'msg': msg, 'ip': node['ip'],
                           'port': node['port'], 'device': node['device']})
@@ -493,6 +677,56 @@ class Application(object):
         error_stats = self._error_limiting.setdefault(node_key, {})
         error_stats['errors'] = error_stats.get('errors', 0) + 1
         error_stats['last_error'] = time()
+        self._share_node_errors(node_key, 1)
+        self._evict_node_connections(node)
+
+    def _shared_node_errors(self, node_key, now):
+        """
+        :returns: the number of recent errors of a node, counted by all the
+                  workers of this proxy, or by all the proxies of the
+                  cluster, according to error_limiting_scope
+        """
+        if self.error_limiting_scope == 'host':
+            entry = self.shared_error_limiting.get(node_key)
+            if entry is None or \
+                    entry[0] < now - self.error_suppression_interval:
+                return 0
+            return int(entry[1]['errors'])
+        looked_up, errors = self._cluster_errors.get(node_key, (0, 0))
+        if looked_up <= now - ERROR_LIMITING_MEMCACHE_INTERVAL and \
+                self.memcache is not None:
+            errors = int(self.memcache.get(
+                ERROR_LIMITING_MEMCACHE_KEY % node_key) or 0)
+            self._cluster_errors[node_key] = (now, errors)
+        return errors
+
+    def _share_node_errors(self, node_key, errors):
+        """
+        Add to the number of recent errors of a node that the other workers,
+        or the other proxies, see.
+        """
+        now = time()
+        if self.error_limiting_scope == 'host':
+            errors += self._shared_node_errors(node_key, now)
+            self.shared_error_limiting.update(
+                node_key, {'errors': errors}, now)
+        elif self.error_limiting_scope == 'cluster' and \
+                self.memcache is not None:
+            # the count expires error_suppression_interval after the first
+            # of the errors, since incrementing it doesn't extend its time
+            try:
+                errors = self.memcache.incr(
+                    ERROR_LIMITING_MEMCACHE_KEY % node_key, delta=errors,
+                    time=self.error_suppression_interval)
+            except MemcacheConnectionError:
+                return
+            self._cluster_errors[node_key] = (now, errors)
+
+    def _evict_node_connections(self, node):
+        # idle connections to a node that is erroring are as likely to be
+        # broken as the one that just failed
+        if self.backend_pool is not None:
+            self.backend_pool.evict(node['ip'], node['port'])
 
     def error_occurred(self, node, msg):
         """
@@ -335,8 +335,8 @@ class FakeMemcache(object):
         self.store[key] = value
         return True
 
-    def incr(self, key, time=0):
-        self.store[key] = self.store.setdefault(key, 0) + 1
+    def incr(self, key, delta=1, time=0):
+        self.store[key] = self.store.setdefault(key, 0) + delta
         return self.store[key]
 
     @contextmanager
@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import logging
 import mock
 import os
@@ -24,7 +25,7 @@ import shlex
 
 from swift.cli import ringbuilder
 from swift.common import exceptions
-from swift.common.ring import RingBuilder
+from swift.common.ring import RingBuilder, Ring
 
 
 class RunSwiftRingBuilderMixin(object):
@@ -84,6 +85,16 @@ class TestCommands(unittest.TestCase, RunSwiftRingBuilderMixin):
         except OSError:
             pass
 
+    def assertSrbError(self, *argv):
+        mock_stdout = six.StringIO()
+        mock_stderr = six.StringIO()
+        with mock.patch("sys.stdout", mock_stdout):
+            with mock.patch("sys.stderr", mock_stderr):
+                with self.assertRaises(SystemExit) as cm:
+                    ringbuilder.main(["", self.tmpfile] + list(argv))
+        self.assertEqual(2, cm.exception.code)
+        return mock_stdout.getvalue()
+
     def create_sample_ring(self, part_power=6):
         """ Create a sample ring with four devices
 
@@ -1820,6 +1831,37 @@ class TestCommands(unittest.TestCase, RunSwiftRingBuilderMixin):
         argv = ["", self.tmpfile, "write_ring"]
         self.assertRaises(SystemExit, ringbuilder.main, argv)
 
+    def test_write_ring_format_version_2(self):
+        self.create_sample_ring()
+        argv = ["", self.tmpfile, "rebalance"]
+        self.assertRaises(SystemExit, ringbuilder.main, argv)
+        v1_ring = Ring(self.tmpfile + '.ring.gz')
+
+        self.run_srb("write_ring", "--format-version", "2")
+        with open(self.tmpfile + '.ring.gz', 'rb') as f:
+            self.assertEqual('R1NG\x00\x02', f.read(6))
+        v2_ring = Ring(self.tmpfile + '.ring.gz')
+        self.assertEqual(v1_ring.devs, v2_ring.devs)
+        for part in range(v1_ring.partition_count):
+            self.assertEqual(v1_ring.get_part_nodes(part),
+                             v2_ring.get_part_nodes(part))
+
+        # the lossy builder recovery works from a v2 ring too
+        os.remove(self.tmpfile)
+        ringbuilder.main(["", self.tmpfile, "write_builder"])
+        rb = RingBuilder.load(self.tmpfile)
+        self.assertEqual(
+            [list(p2d) for p2d in v1_ring._replica2part2dev_id],
+            [list(p2d) for p2d in rb._replica2part2dev])
+
+        argv = ["", self.tmpfile, "write_ring", "--format-version", "3"]
+        err = None
+        try:
+            ringbuilder.main(argv)
+        except SystemExit as e:
+            err = e
+        self.assertEqual(err.code, 2)
+
     def test_write_builder(self):
         # Test builder file already exists
         self.create_sample_ring()
@@ -1933,6 +1975,61 @@ class TestCommands(unittest.TestCase, RunSwiftRingBuilderMixin):
         self.assertIn('dispersion', out.lower())
         self.assertFalse(err)
 
+    def test_diff_command(self):
+        self.create_sample_ring()
+        self.run_srb('rebalance')
+        old_ring_file = self.tmpfile + '.old.ring.gz'
+        self.addCleanup(os.remove, old_ring_file)
+        os.rename(self.tmpfile + '.ring.gz', old_ring_file)
+        self.run_srb('add', 'r3z3-127.0.0.4:6003/sde5_1', '100')
+        self.run_srb('pretend_min_part_hours_passed')
+        self.run_srb('rebalance')
+
+        out, err = self.run_srb('diff', old_ring_file)
+        self.assertFalse(err)
+        self.assertIn('Comparing %s to the ring of %s' % (
+            old_ring_file, self.tmpfile), out)
+        self.assertIn('of 64 partitions', out)
+        self.assertNotIn('Estimated', out)
+        self.assertIn('Parts In', out)
+        self.assertNotIn('Bytes In', out)
+        self.assertIn('\nr3z3 ', out)
+        self.assertNotIn('/sde5', out)
+
+        part_sizes_file = self.tmpfile + '.part_sizes.json'
+        self.addCleanup(os.remove, part_sizes_file)
+        with open(part_sizes_file, 'w') as f:
+            json.dump({'0': 1024 * 1024, '1': 3 * 1024 * 1024}, f)
+        out, err = self.run_srb('diff', old_ring_file, '-v',
+                                '--part-sizes', part_sizes_file,
+                                '--bandwidth', '0.01')
+        self.assertFalse(err)
+        self.assertIn('Estimated data movement: ', out)
+        self.assertIn('Estimated replication time: ', out)
+        self.assertIn('Bytes In', out)
+        self.assertIn('r3z3-127.0.0.4/sde5 ', out)
+
+    def test_diff_command_errors(self):
+        self.create_sample_ring()
+        out = self.assertSrbError('diff', self.tmpfile + '.ring.gz')
+        self.assertIn('not rebalanced yet', out)
+        self.run_srb('rebalance')
+        out = self.assertSrbError('diff')
+        self.assertIn('swift-ring-builder <builder_file> diff', out)
+        out = self.assertSrbError('diff', self.tmpfile + '.missing')
+        self.assertIn('No such file or directory', out)
+
+        # a different partition power moves everything
+        old_builder_file = self.tmpfile + '.old'
+        self.addCleanup(os.remove, old_builder_file)
+        self.addCleanup(os.remove, old_builder_file + '.ring.gz')
+        os.rename(self.tmpfile, old_builder_file)
+        os.rename(self.tmpfile + '.ring.gz', old_builder_file + '.ring.gz')
+        self.create_sample_ring(part_power=7)
+        self.run_srb('rebalance')
+        out = self.assertSrbError('diff', old_builder_file + '.ring.gz')
+        self.assertIn('different partition powers', out)
+
     def test_use_ringfile_as_builderfile(self):
         mock_stdout = six.StringIO()
         mock_stderr = six.StringIO()
@@ -469,6 +469,40 @@ class TestUntar(unittest.TestCase):
             resp_data['Errors'],
             [['cont/base_fails1/' + ('f' * 101), '400 Bad Request']])
 
+    def test_extract_tar_concurrency(self):
+        self.build_tar()
+        in_flight = []
+        most_in_flight = [0]
+
+        def slow_app(env, start_response):
+            if env['REQUEST_METHOD'] == 'PUT':
+                in_flight.append(env['PATH_INFO'])
+                most_in_flight[0] = max(most_in_flight[0], len(in_flight))
+                sleep(0)
+                in_flight.remove(env['PATH_INFO'])
+            return self.app(env, start_response)
+
+        self.bulk.app = slow_app
+        self.bulk.extract_concurrency = 3
+        # files too big to be read into memory are uploaded one at a time
+        for max_buffered, expected_in_flight in ((1024, 3), (-1, 1)):
+            most_in_flight[0] = 0
+            self.app.calls = 0
+            req = Request.blank('/tar_works/acc/cont/',
+                                headers={'Accept': 'application/json'})
+            req.environ['wsgi.input'] = open(os.path.join(self.testdir,
+                                                          'tar_fails.tar'))
+            req.headers['transfer-encoding'] = 'chunked'
+            with patch.object(bulk, 'MAX_BUFFERED_FILE_SIZE', max_buffered):
+                resp_body = self.handle_extract_and_iter(req, '')
+            self.assertEqual(most_in_flight[0], expected_in_flight)
+            self.assertEqual(self.app.calls, 6)
+            resp_data = utils.json.loads(resp_body)
+            self.assertEqual(resp_data['Number Files Created'], 4)
+            self.assertEqual(
+                resp_data['Errors'],
+                [['cont/base_fails1/' + ('f' * 101), '400 Bad Request']])
+
     def test_extract_tar_fail_compress_type(self):
         self.build_tar()
         req = Request.blank('/tar_works/acc/cont/',
@@ -856,6 +890,69 @@ class TestDelete(unittest.TestCase):
                               call(self.bulk.retry_interval ** 2)],
                              mock_sleep.call_args_list)
 
+    def test_bulk_delete_order(self):
+        self.assertEqual(self.bulk.delete_concurrency, 1)
+        started = []
+
+        def recording_app(env, start_response):
+            started.append(env['PATH_INFO'][len('/delete_works/AUTH_Acc'):])
+            return self.app(env, start_response)
+
+        self.bulk.app = recording_app
+        body = '\n'.join(['/c/f3', '/d/f2', '/c/f2badutf8', 'c', '/c/f1',
+                          '/d/f1badutf8'])
+        req = Request.blank('/delete_works/AUTH_Acc', body=body,
+                            headers={'Accept': 'application/json'})
+        req.method = 'POST'
+        resp_body = self.handle_delete_and_iter(req)
+        # one at a time, in the order given
+        self.assertEqual(started, ['/c/f3', '/d/f2', '/c/f2badutf8', '/c',
+                                   '/c/f1', '/d/f1badutf8'])
+        resp_data = utils.json.loads(resp_body)
+        self.assertEqual(resp_data['Number Deleted'], 4)
+        self.assertEqual(resp_data['Errors'],
+                         [['/c/f2badutf8', '412 Precondition Failed'],
+                          ['/d/f1badutf8', '412 Precondition Failed']])
+
+    def test_bulk_delete_concurrency(self):
+        self.bulk.delete_concurrency = 3
+        started = []
+        in_flight = []
+        most_in_flight = [0]
+
+        def slow_app(env, start_response):
+            path = env['PATH_INFO'][len('/delete_works/AUTH_Acc'):]
+            if path == '/d':
+                # the container goes after all the objects are gone
+                self.assertEqual(in_flight, [])
+            started.append(path)
+            in_flight.append(path)
+            most_in_flight[0] = max(most_in_flight[0], len(in_flight))
+            # the deletes asked for first finish last
+            for _junk in range(5 - len(started)):
+                sleep(0)
+            in_flight.remove(path)
+            return self.app(env, start_response)
+
+        self.bulk.app = slow_app
+        body = '\n'.join(['d', '/c/f3', '/d/f2', '/c/f2badutf8', '/c/f1',
+                          '/c/f\xdebadutf8'])
+        req = Request.blank('/delete_works/AUTH_Acc', body=body,
+                            headers={'Accept': 'application/json'})
+        req.method = 'POST'
+        resp_body = self.handle_delete_and_iter(req)
+        self.assertEqual(most_in_flight[0], 3)
+        # grouped by container, and then the containers
+        self.assertEqual(started,
+                         ['/d/f2', '/c/f3', '/c/f2badutf8', '/c/f1', '/d'])
+        resp_data = utils.json.loads(resp_body)
+        self.assertEqual(resp_data['Number Deleted'], 4)
+        self.assertEqual(resp_data['Errors'],
+                         [['/c/f2badutf8', '412 Precondition Failed'],
+                          [urllib.parse.quote('/c/f\xdebadutf8'),
+                           '412 Precondition Failed']])
+        self.assertEqual(resp_data['Response Status'], '400 Bad Request')
+
     def test_bulk_delete_bad_file_too_long(self):
         req = Request.blank('/delete_works/AUTH_Acc',
                             headers={'Accept': 'application/json'})
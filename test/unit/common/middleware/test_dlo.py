@@ -14,6 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import eventlet
 import hashlib
 import json
 import mock
@@ -592,6 +593,59 @@ class TestDloGetManifest(DloTestCase):
         self.assertTrue(err_lines[0].startswith(
             'ERROR: An error occurred while retrieving segments'))
 
+    def _segment_gets(self):
+        return [path.split('?')[0].rsplit('/', 1)[1]
+                for method, path in self.app.calls if '/c/seg_' in path]
+
+    def _start_prefetching_get(self, **conf):
+        conf['rate_limit_after_segment'] = '1000000'
+        dlo_app = dlo.filter_factory(conf)(self.app)
+        req = swob.Request.blank('/v1/AUTH_test/mancon/manifest',
+                                 environ={'REQUEST_METHOD': 'GET'})
+        body_iter = dlo_app(req.environ, lambda *args: None)
+        chunks = iter(body_iter)
+        self.assertEqual(next(chunks), 'aaaaa')
+        # let the segments requested ahead get their responses
+        eventlet.sleep(0)
+        return body_iter, chunks
+
+    def test_get_manifest_prefetch(self):
+        body_iter, chunks = self._start_prefetching_get(
+            prefetch_segments='2')
+        with closing_if_possible(body_iter):
+            self.assertEqual(self._segment_gets(),
+                             ['seg_01', 'seg_02', 'seg_03'])
+            self.assertEqual(''.join(chunks), 'bbbbbcccccdddddeeeee')
+        self.assertEqual(self._segment_gets(),
+                         ['seg_01', 'seg_02', 'seg_03', 'seg_04', 'seg_05'])
+
+    def test_get_manifest_prefetch_client_disconnect(self):
+        body_iter, chunks = self._start_prefetching_get(
+            prefetch_segments='2')
+        body_iter.close()
+        # the segments requested ahead are closed too; see tearDown
+        self.assertEqual(self._segment_gets(),
+                         ['seg_01', 'seg_02', 'seg_03'])
+
+    def test_error_fetching_second_segment_prefetch(self):
+        self.app.register(
+            'GET', '/v1/AUTH_test/c/seg_02',
+            swob.HTTPForbidden, {}, None)
+        dlo_app = dlo.filter_factory({
+            'rate_limit_after_segment': '1000000',
+            'prefetch_segments': '2'})(self.app)
+        dlo_app.logger = self.app.logger
+
+        req = swob.Request.blank('/v1/AUTH_test/mancon/manifest',
+                                 environ={'REQUEST_METHOD': 'GET'})
+        status, headers, body, exc = self.call_dlo(req, app=dlo_app,
+                                                   expect_exception=True)
+        self.assertTrue(isinstance(exc, exceptions.SegmentError))
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(''.join(body), "aaaaa")
+        self.assertEqual(self._segment_gets(),
+                         ['seg_01', 'seg_02', 'seg_03'])
+
     def test_error_listing_container_first_listing_request(self):
         self.app.register(
             'GET', '/v1/AUTH_test/c?format=json&prefix=seg_',
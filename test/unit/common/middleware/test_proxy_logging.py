@@ -185,6 +185,71 @@ class TestProxyLogging(unittest.TestCase):
             self.assertEqual([], app.access_logger.log_dict['timing'])
             self.assertEqual([], app.access_logger.log_dict['update_stats'])
 
+    def test_log_request_memcache_round_trips(self):
+        app = proxy_logging.ProxyLoggingMiddleware(FakeApp(), {})
+        app.access_logger = FakeLogger()
+        req = Request.blank('/v1/a/c', environ={'REQUEST_METHOD': 'GET'})
+        now = 10000.0
+        app.log_request(req, 200, 7, 13, now, now + 1,
+                        memcache_round_trips=3)
+        self.assertUpdateStats([('container.GET.200.memcache_trips', 3),
+                                ('container.GET.200.xfer', 7 + 13)], app)
+
+        app.access_logger = FakeLogger()
+        app.log_request(req, 200, 7, 13, now, now + 1)
+        self.assertUpdateStats([('container.GET.200.xfer', 7 + 13)], app)
+
+    def test_log_request_phase_times(self):
+        app = proxy_logging.ProxyLoggingMiddleware(
+            FakeApp(), {'access_log_phase_times': 'yes'})
+        app.access_logger = FakeLogger()
+        req = Request.blank('/v1/a/c/o', environ={
+            'REQUEST_METHOD': 'PUT',
+            'swift.phase_times': {'auth': 0.25, 'connect': 0.0125}})
+        now = 10000.0
+        app.log_request(req, 201, 7, 0, now, now + 1)
+        log_parts = self._log_parts(app)
+        self.assertEqual(len(log_parts), 22)
+        self.assertEqual(unquote(log_parts[21]),
+                         'auth:0.2500,connect:0.0125')
+        self.assertTiming('object.PUT.201.phase.auth', app, 250)
+        self.assertTiming('object.PUT.201.phase.connect', app, 12.5)
+
+        # nothing timed
+        app.access_logger = FakeLogger()
+        req = Request.blank('/v1/a/c/o', environ={'REQUEST_METHOD': 'PUT'})
+        app.log_request(req, 201, 7, 0, now, now + 1)
+        log_parts = self._log_parts(app)
+        self.assertEqual(len(log_parts), 22)
+        self.assertEqual(log_parts[21], '-')
+        self.assertEqual(['object.PUT.201.timing'],
+                         [call[0][0] for call in
+                          app.access_logger.log_dict['timing']])
+
+    def test_phase_times(self):
+        def phase_app(env, start_response):
+            env['swift.phase_times']['auth'] = 0.5
+            return FakeApp()(env, start_response)
+
+        app = proxy_logging.ProxyLoggingMiddleware(
+            phase_app, {'access_log_phase_times': 'yes'})
+        app.access_logger = FakeLogger()
+        req = Request.blank('/v1/a/c', environ={'REQUEST_METHOD': 'GET'})
+        resp = app(req.environ, start_response)
+        ''.join(resp)
+        log_parts = self._log_parts(app)
+        self.assertEqual(log_parts[21], 'auth:0.5000')
+        self.assertTiming('container.GET.200.phase.auth', app, 500)
+
+        # disabled by default
+        app = proxy_logging.ProxyLoggingMiddleware(FakeApp(), {})
+        app.access_logger = FakeLogger()
+        req = Request.blank('/v1/a/c', environ={'REQUEST_METHOD': 'GET'})
+        resp = app(req.environ, start_response)
+        ''.join(resp)
+        self.assertNotIn('swift.phase_times', req.environ)
+        self.assertEqual(len(self._log_parts(app)), 21)
+
     def test_log_request_stat_type_good(self):
         """
         log_request() should send timing and byte-count counters for GET
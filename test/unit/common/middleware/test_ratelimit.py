@@ -36,6 +36,7 @@ class FakeMemcache(object):
         self.store = {}
         self.error_on_incr = False
         self.init_incr_return_neg = False
+        self.incr_calls = 0
 
     def get(self, key):
         return self.store.get(key)
@@ -45,6 +46,7 @@ class FakeMemcache(object):
         return True
 
     def incr(self, key, delta=1, time=0):
+        self.incr_calls += 1
         if self.error_on_incr:
             raise MemcacheConnectionError('Memcache restarting')
         if self.init_incr_return_neg:
@@ -585,6 +587,109 @@ class TestRateLimit(unittest.TestCase):
             time_took = time.time() - begin
             self.assertEqual(round(time_took, 1), 0)  # no memcache, no limit
 
+    def test_local_buckets_memcache_ops(self):
+        current_rate = 50
+        num_calls = 100
+        req = Request.blank('/v/a/c')
+        req.method = 'PUT'
+        with mock.patch('swift.common.middleware.ratelimit.get_account_info',
+                        lambda *args, **kwargs: {}):
+            incrs = {}
+            for sync_conf in ({},
+                              {'sync_interval': '0.5'},
+                              {'sync_interval': '0.5',
+                               'sync_budget_seconds': '0.1'}):
+                conf_dict = dict(sync_conf, account_ratelimit=current_rate)
+                self.test_ratelimit = \
+                    ratelimit.filter_factory(conf_dict)(FakeApp())
+                req.environ['swift.cache'] = FakeMemcache()
+                make_app_call = lambda: self.test_ratelimit(req.environ,
+                                                            start_response)
+                # the requests are limited just the same
+                self._run(make_app_call, num_calls, current_rate)
+                self._reset_time()
+                incrs[tuple(sorted(sync_conf))] = \
+                    req.environ['swift.cache'].incr_calls
+        self.assertEqual(incrs, {
+            # one for each request
+            (): 100,
+            # one every 0.5s of the 1.98s the requests take
+            ('sync_interval',): 4,
+            # one every 5 requests, which take 0.1s at 50 requests/s
+            ('sync_budget_seconds', 'sync_interval'): 20})
+
+    def test_local_buckets(self):
+        conf_dict = {'sync_interval': 1, 'sync_budget_seconds': 0.3,
+                     'max_sleep_time_seconds': 0.35}
+        fake_memcache = FakeMemcache()
+        workers = []
+        for i in range(2):
+            workers.append(ratelimit.filter_factory(conf_dict)(FakeApp()))
+            workers[-1].memcache_client = fake_memcache
+        worker_a, worker_b = workers
+        key = 'ratelimit/a'
+        # 10 requests/s is 100ms a request; the time stays at 0
+        self.assertEqual(worker_a._get_sleep_time(key, 10), 0)
+        self.assertEqual(fake_memcache.store[key], 100)
+        self.assertEqual(worker_a._get_sleep_time(key, 10), 0.1)
+        self.assertEqual(worker_a._get_sleep_time(key, 10), 0.2)
+        self.assertEqual(fake_memcache.store[key], 100)
+        self.assertEqual(fake_memcache.incr_calls, 1)
+        # worker_b doesn't know about worker_a's last two requests yet
+        self.assertEqual(worker_b._get_sleep_time(key, 10), 0.1)
+        self.assertEqual(fake_memcache.store[key], 200)
+        # worker_a's requests add up to its budget, so it syncs, finds out
+        # about worker_b's request, and has to sleep too long
+        self.assertRaises(ratelimit.MaxSleepTimeHitError,
+                          worker_a._get_sleep_time, key, 10)
+        # (the fake memcache decrements with incr)
+        self.assertEqual(fake_memcache.incr_calls, 4)
+        self.assertEqual(fake_memcache.store[key], 400)
+        # turning down a request that's only counted locally
+        self.assertRaises(ratelimit.MaxSleepTimeHitError,
+                          worker_a._get_sleep_time, key, 10)
+        self.assertEqual(fake_memcache.incr_calls, 4)
+        self.assertEqual(fake_memcache.store[key], 400)
+        # a second later, worker_b syncs again
+        mock_sleep(1)
+        self.assertEqual(worker_b._get_sleep_time(key, 10), 0)
+        self.assertEqual(fake_memcache.store[key], 500)
+
+    def test_local_buckets_concurrent_sync(self):
+        conf_dict = {'sync_interval': 1, 'sync_budget_seconds': 10}
+        fake_memcache = FakeMemcache()
+        rl = ratelimit.filter_factory(conf_dict)(FakeApp())
+        rl.memcache_client = fake_memcache
+        key = 'ratelimit/a'
+        # 10 requests/s is 100ms a request
+        for i in range(4):
+            self.assertAlmostEqual(rl._get_sleep_time(key, 10), i * 0.1)
+        self.assertEqual(fake_memcache.store[key], 100)
+        self.assertEqual(fake_memcache.incr_calls, 1)
+
+        # the next sync takes a while, and more requests come in meanwhile
+        mock_sleep(1)
+        synced = eventlet.event.Event()
+        real_incr = fake_memcache.incr
+
+        def slow_incr(*args, **kwargs):
+            synced.wait()
+            return real_incr(*args, **kwargs)
+
+        fake_memcache.incr = slow_incr
+        threads = [eventlet.spawn(rl._get_sleep_time, key, 10)
+                   for i in range(5)]
+        eventlet.greenthread.sleep(0)
+        synced.send()
+        for thread in threads:
+            self.assertEqual(thread.wait(), 0)
+        # the requests before the sync are added to memcache once, and the
+        # ones that came in during it are left for the next sync
+        self.assertEqual(fake_memcache.incr_calls, 2)
+        self.assertEqual(fake_memcache.store[key], 500)
+        bucket = rl.local_buckets.get(key)
+        self.assertEqual(bucket, [900, 400, 1000])
+
 
 class TestSwiftInfo(unittest.TestCase):
     def setUp(self):
@@ -26,6 +26,7 @@ from swift import __version__ as swiftver
 from swift.common import ring, utils
 from swift.common.swob import Request
 from swift.common.middleware import recon
+from swift.common.shared_table import SharedTable
 from swift.common.storage_policy import StoragePolicy
 from test.unit import patch_policies
 
@@ -188,6 +189,9 @@ class FakeRecon(object):
     def fake_time(self):
         return {'timetest': "1"}
 
+    def fake_node_timing(self):
+        return {'nodetimingtest': "1"}
+
     def nocontent(self):
         return None
 
@@ -1057,6 +1061,25 @@ class TestReconSuccess(TestCase):
             rv = self.app.get_time()
             self.assertEqual(rv, now)
 
+    def test_get_node_timing(self):
+        self.app.node_timing_table = os.path.join(
+            self.tempdir, 'proxy-node-timing.table')
+        self.assertEqual(self.app.get_node_timing(), {})
+
+        table = SharedTable(('connect', 'first_byte'),
+                            self.app.node_timing_table, rows=16)
+        table.update('10.1.1.1:6000/sda1', {'connect': 0.002}, now=1000)
+        table.update('10.1.1.1:6000/sdb1', {'first_byte': 0.5}, now=1001)
+        self.assertEqual(self.app.get_node_timing(), {
+            '10.1.1.1:6000/sda1': {
+                'connect': 0.002, 'first_byte': 0.0, 'updated': 1000.0},
+            '10.1.1.1:6000/sdb1': {
+                'connect': 0.0, 'first_byte': 0.5, 'updated': 1001.0}})
+
+        with open(self.app.node_timing_table, 'w') as f:
+            f.write('junk')
+        self.assertIsNone(self.app.get_node_timing())
+
 
 class TestReconMiddleware(unittest.TestCase):
 
@@ -1089,6 +1112,7 @@ class TestReconMiddleware(unittest.TestCase):
         self.app.get_socket_info = self.frecon.fake_sockstat
         self.app.get_driveaudit_error = self.frecon.fake_driveaudit
         self.app.get_time = self.frecon.fake_time
+        self.app.get_node_timing = self.frecon.fake_node_timing
 
     def test_recon_get_mem(self):
         get_mem_resp = ['{"memtest": "1"}']
@@ -1330,6 +1354,13 @@ class TestReconMiddleware(unittest.TestCase):
         resp = self.app(req.environ, start_response)
         self.assertEqual(resp, get_time_resp)
 
+    def test_recon_get_node_timing(self):
+        get_node_timing_resp = ['{"nodetimingtest": "1"}']
+        req = Request.blank('/recon/nodetiming',
+                            environ={'REQUEST_METHOD': 'GET'})
+        resp = self.app(req.environ, start_response)
+        self.assertEqual(resp, get_node_timing_resp)
+
     def test_get_device_info_function(self):
         """Test get_device_info function call success"""
         resp = self.app.get_device_info()
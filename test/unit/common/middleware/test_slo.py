@@ -19,6 +19,7 @@ from six.moves import range
 import hashlib
 import json
 import time
+import eventlet
 import unittest
 from mock import patch
 from hashlib import md5
@@ -565,6 +566,52 @@ class TestSloPutManifest(SloTestCase):
         self.assertEqual(errors[4][0], '/checktest/slob')
         self.assertEqual(errors[4][1], 'Etag Mismatch')
 
+    def test_handle_multipart_put_concurrent_heads(self):
+        bad_data = json.dumps(
+            [{'path': '/checktest/a_1', 'etag': 'a', 'size_bytes': '2'},
+             {'path': '/checktest/badreq', 'etag': 'a', 'size_bytes': '1'},
+             {'path': '/checktest/b_2', 'etag': 'not-b', 'size_bytes': '2'},
+             {'path': '/checktest/a_1', 'etag': 'a', 'size_bytes': '2'}])
+        # the segments listed first are the slowest to answer
+        yields = {'/v1/AUTH_test/checktest/a_1': 3,
+                  '/v1/AUTH_test/checktest/badreq': 2,
+                  '/v1/AUTH_test/checktest/b_2': 1}
+        in_flight = []
+        most_in_flight = [0]
+        fake_swift = self.app
+
+        def slow_app(env, start_response):
+            if env['REQUEST_METHOD'] == 'HEAD':
+                in_flight.append(env['PATH_INFO'])
+                most_in_flight[0] = max(most_in_flight[0], len(in_flight))
+                for _junk in range(yields[env['PATH_INFO']]):
+                    eventlet.sleep(0)
+                in_flight.remove(env['PATH_INFO'])
+            return fake_swift(env, start_response)
+
+        self.slo.app = slow_app
+        for concurrency in (1, 2, 8):
+            self.slo.concurrency = concurrency
+            most_in_flight[0] = 0
+            fake_swift._calls = []
+            req = Request.blank(
+                '/v1/AUTH_test/checktest/man?multipart-manifest=put',
+                environ={'REQUEST_METHOD': 'PUT'},
+                headers={'Accept': 'application/json'},
+                body=bad_data)
+            status, headers, body = self.call_slo(req)
+            self.assertEqual(most_in_flight[0], min(concurrency, 3))
+            # a_1 is only HEADed once
+            self.assertEqual(sorted(fake_swift.calls), [
+                ('HEAD', '/v1/AUTH_test/checktest/a_1'),
+                ('HEAD', '/v1/AUTH_test/checktest/b_2'),
+                ('HEAD', '/v1/AUTH_test/checktest/badreq')])
+            self.assertEqual(json.loads(body)['Errors'], [
+                ['/checktest/a_1', 'Size Mismatch'],
+                ['/checktest/badreq', '400 Bad Request'],
+                ['/checktest/b_2', 'Etag Mismatch'],
+                ['/checktest/a_1', 'Size Mismatch']])
+
     def test_handle_multipart_put_skip_size_check(self):
         good_data = json.dumps(
             [{'path': '/checktest/a_1', 'etag': 'a', 'size_bytes': None},
@@ -1470,6 +1517,47 @@ class TestSloGetManifest(SloTestCase):
         self.assertEqual(self.app.swift_sources[1:],
                          ['SLO'] * (len(self.app.swift_sources) - 1))
 
+    def test_range_get_manifest_prefetch(self):
+        self.slo.prefetch_segments = 2
+        self.slo.max_prefetch_bytes = 20
+        req = Request.blank(
+            '/v1/AUTH_test/gettest/manifest-abcd',
+            environ={'REQUEST_METHOD': 'GET'},
+            headers={'Range': 'bytes=3-17'})
+        status, headers, body = self.call_slo(req)
+
+        self.assertEqual(status, '206 Partial Content')
+        self.assertEqual(body, 'aabbbbbbbbbbccc')
+        self.assertEqual(
+            self.app.calls[3:],
+            [('GET', '/v1/AUTH_test/gettest/a_5?multipart-manifest=get'),
+             ('GET', '/v1/AUTH_test/gettest/b_10?multipart-manifest=get'),
+             ('GET', '/v1/AUTH_test/gettest/c_15?multipart-manifest=get')])
+        ranges = [c[2].get('Range') for c in self.app.calls_with_headers]
+        self.assertEqual(ranges[3:], ['bytes=3-', None, 'bytes=0-2'])
+
+    def test_get_manifest_prefetch_max_bytes(self):
+        self.slo.prefetch_segments = 2
+        c_15_get = ('GET', '/v1/AUTH_test/gettest/c_15?multipart-manifest=get')
+
+        def c_15_gets_during_b_10(max_prefetch_bytes):
+            self.slo.max_prefetch_bytes = max_prefetch_bytes
+            req = Request.blank('/v1/AUTH_test/gettest/manifest-bc')
+            body_iter = self.slo(req.environ, lambda *args: None)
+            with closing_if_possible(body_iter):
+                chunks = iter(body_iter)
+                self.assertEqual(next(chunks), 'b' * 10)
+                eventlet.sleep(0)
+                c_15_gets = self.app.calls.count(c_15_get)
+                self.assertEqual(''.join(chunks), 'c' * 15)
+            return c_15_gets
+
+        # there's room for both segments
+        self.assertEqual(c_15_gets_during_b_10(25), 1)
+        # c_15 is only requested once b_10 is sent
+        self.assertEqual(c_15_gets_during_b_10(24), 1)
+        self.assertEqual(self.app.calls.count(c_15_get), 2)
+
     def test_range_get_includes_whole_manifest(self):
         # If the first range GET results in retrieval of the entire manifest
         # body (which we can detect by looking at Content-Range), then we
@@ -22,6 +22,7 @@ import unittest
 import six.moves.cPickle as pickle
 from array import array
 from collections import defaultdict
+from hashlib import md5
 from math import ceil
 from tempfile import mkdtemp
 from shutil import rmtree
@@ -3688,5 +3689,85 @@ class TestGetRequiredOverload(unittest.TestCase):
                                         wr.items() if len(t) == tier_len})
 
 
+class TestRebalanceRegression(unittest.TestCase):
+    """
+    The rebalance engine has been optimized several times; these scenarios
+    pin down the partition placement, balance, dispersion and number of
+    partitions moved that the original tuple-keyed implementation produced,
+    so any further optimization has to be a pure refactoring.
+    """
+
+    def _fingerprint(self, rb):
+        return md5(','.join(
+            ':'.join(str(dev_id) for dev_id in part2dev)
+            for part2dev in rb._replica2part2dev)).hexdigest()
+
+    def _add_devs(self, rb, regions, zones, servers, devices, ip_suffix=1):
+        for region in range(regions):
+            for zone in range(zones):
+                for server in range(servers):
+                    for device in range(devices):
+                        rb.add_dev({
+                            'id': len(rb.devs), 'region': region,
+                            'zone': zone, 'port': 6000,
+                            'ip': '10.%d.%d.%d' % (
+                                region, zone, server + ip_suffix),
+                            'device': 'sd%s' % chr(ord('a') + device),
+                            'weight': 100.0 + 50 * (device % 3)})
+
+    def assertRebalance(self, rb, seed, expected):
+        moved, balance, removed = rb.rebalance(seed=seed)
+        rb.validate()
+        self.assertEqual(expected, (
+            moved, round(balance, 6), round(rb.dispersion, 6), removed,
+            self._fingerprint(rb)))
+
+    def test_expand_and_shrink(self):
+        rb = ring.RingBuilder(10, 3, 1)
+        self._add_devs(rb, 2, 3, 3, 4)
+        self.assertRebalance(rb, 1, (
+            3072, 3.125, 0.0, 0,
+            '3660651709072061ad6b6d00c38e6b9e'))
+        self._add_devs(rb, 2, 3, 1, 4, ip_suffix=100)
+        rb.pretend_min_part_hours_passed()
+        self.assertRebalance(rb, 2, (
+            768, 3.125, 0.0, 0,
+            '0f9f481f485e0a6e6ee0b0217dc5ba09'))
+        rb.remove_dev(3)
+        rb.set_dev_weight(10, 0.0)
+        rb.pretend_min_part_hours_passed()
+        self.assertRebalance(rb, 3, (
+            75, 4.980469, 0.0, 1,
+            'b771fd66ab4654ac15f22828e1f05386'))
+
+    def test_unbalanceable_with_overload(self):
+        rb = ring.RingBuilder(9, 3, 1)
+        self._add_devs(rb, 1, 2, 2, 3)
+        rb.add_dev({'id': len(rb.devs), 'region': 0, 'zone': 2,
+                    'port': 6000, 'ip': '10.0.2.1', 'device': 'sda',
+                    'weight': 100.0})
+        rb.set_overload(0.1)
+        self.assertRebalance(rb, 4, (
+            1536, 10.091146, 82.617188, 0,
+            '44325ed30acf9ec9f9672356135c43ad'))
+        rb.set_overload(1.0)
+        rb.pretend_min_part_hours_passed()
+        self.assertRebalance(rb, 5, (
+            76, 100.390625, 69.53125, 0,
+            'c629e6e5459b80252dc0094609f2d7b2'))
+
+    def test_fractional_replicas(self):
+        rb = ring.RingBuilder(9, 3.25, 1)
+        self._add_devs(rb, 3, 2, 2, 2)
+        self.assertRebalance(rb, 6, (
+            512, 0.961538, 0.0, 0,
+            '5b2d714e17e0c80bd09bf728df63ce21'))
+        rb.set_replicas(2.75)
+        rb.pretend_min_part_hours_passed()
+        self.assertRebalance(rb, 7, (
+            339, 19.318182, 0.0, 0,
+            'd3a9cd6ab9bb87a79abafad206447087'))
+
+
 if __name__ == '__main__':
     unittest.main()
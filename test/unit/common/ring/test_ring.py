@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import array
+import mock
 import six.moves.cPickle as pickle
 import os
 import sys
@@ -25,9 +26,11 @@ from tempfile import mkdtemp
 from shutil import rmtree
 from time import sleep, time
 
+import eventlet
 from six.moves import range
 
 from swift.common import ring, utils
+from test.unit import debug_logger
 
 
 class TestRingBase(unittest.TestCase):
@@ -129,6 +132,71 @@ class TestRingData(unittest.TestCase):
             with open(ring_fname2) as ring2:
                 self.assertEqual(ring1.read(), ring2.read())
 
+    def test_roundtrip_serialization_v2(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        rd = ring.RingData(
+            [array.array('H', [0, 1, 0, 1]), array.array('H', [0, 1, 0, 1]),
+             array.array('H', [1, 0])],
+            [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1}], 30)
+        rd.save(ring_fname, format_version=2)
+        with open(ring_fname, 'rb') as f:
+            self.assertEqual('R1NG\x00\x02', f.read(6))
+        meta_only = ring.RingData.load(ring_fname, metadata_only=True)
+        self.assertEqual([
+            {'id': 0, 'zone': 0, 'region': 1},
+            {'id': 1, 'zone': 1, 'region': 1},
+        ], meta_only.devs)
+        self.assertEqual([], meta_only._replica2part2dev_id)
+        rd2 = ring.RingData.load(ring_fname)
+        self.assertEqual(rd.devs, rd2.devs)
+        self.assertEqual(rd._part_shift, rd2._part_shift)
+        self.assertEqual([list(p2d) for p2d in rd._replica2part2dev_id],
+                         [list(p2d) for p2d in rd2._replica2part2dev_id])
+        # the tables are views into the mapped file, not private arrays
+        for p2d in rd2._replica2part2dev_id:
+            self.assertFalse(isinstance(p2d, array.array))
+        # and they can be re-serialized as a v1 ring
+        v1_fname = os.path.join(self.testdir, 'v1.ring.gz')
+        rd2.save(v1_fname)
+        self.assert_ring_data_equal(rd, ring.RingData.load(v1_fname))
+
+    def test_v2_tables_are_page_aligned(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        rd = ring.RingData(
+            [array.array('H', [0, 1] * 3000), array.array('H', [1, 0] * 3000)],
+            [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1}], 20)
+        rd.save(ring_fname, format_version=2)
+        with open(ring_fname, 'rb') as f:
+            data = f.read()
+        align = ring.ring.V2_TABLE_ALIGNMENT
+        self.assertEqual(rd._replica2part2dev_id[0].tostring(),
+                         data[align:align + 12000])
+        self.assertEqual(rd._replica2part2dev_id[1].tostring(),
+                         data[4 * align:4 * align + 12000])
+        self.assertEqual(4 * align + 12000, len(data))
+
+    def test_v2_other_byteorder(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        rd = ring.RingData(
+            [array.array('H', [0, 1, 0, 258])],
+            [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1}], 30)
+        other = 'big' if sys.byteorder == 'little' else 'little'
+        swapped = array.array('H', [0, 1, 0, 258])
+        swapped.byteswap()
+        with mock.patch('swift.common.ring.ring.sys.byteorder', other):
+            ring.RingData(
+                [swapped], rd.devs, 30).save(ring_fname, format_version=2)
+        rd2 = ring.RingData.load(ring_fname)
+        self.assertEqual([array.array('H', [0, 1, 0, 258])],
+                         rd2._replica2part2dev_id)
+
+    def test_save_unknown_format_version(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        rd = ring.RingData(
+            [array.array('H', [0, 1, 0, 1])], [{'id': 0, 'zone': 0}], 30)
+        self.assertRaises(ValueError, rd.save, ring_fname, format_version=3)
+        self.assertFalse(os.path.exists(ring_fname))
+
     def test_permissions(self):
         ring_fname = os.path.join(self.testdir, 'stat.ring.gz')
         rd = ring.RingData(
@@ -270,6 +338,130 @@ class TestRing(TestRingBase):
         self.assertEqual(len(self.ring.devs), 9)
         self.assertNotEqual(self.ring._mtime, orig_mtime)
 
+    def test_load_v2_ring(self):
+        ring.RingData(
+            self.intended_replica2part2dev_id,
+            self.intended_devs,
+            self.intended_part_shift).save(self.testgz, format_version=2)
+        mmap_ring = ring.Ring(self.testdir, ring_name='whatever')
+        self.assertEqual(mmap_ring.devs, self.intended_devs)
+        self.assertEqual(3, mmap_ring.replica_count)
+        self.assertEqual(4, mmap_ring.partition_count)
+        for part in range(4):
+            self.assertEqual(self.ring.get_part_nodes(part),
+                             mmap_ring.get_part_nodes(part))
+            self.assertEqual(list(self.ring.get_more_nodes(part)),
+                             list(mmap_ring.get_more_nodes(part)))
+        self.assertEqual(self.ring.get_nodes('a', 'c', 'o'),
+                         mmap_ring.get_nodes('a', 'c', 'o'))
+
+    def test_reload_v2_ring(self):
+        ring.RingData(
+            self.intended_replica2part2dev_id,
+            self.intended_devs,
+            self.intended_part_shift).save(self.testgz, format_version=2)
+        os.utime(self.testgz, (time() - 300, time() - 300))
+        mmap_ring = ring.Ring(self.testdir, reload_time=0.001,
+                              ring_name='whatever')
+        self.assertEqual([0, 1, 0, 1], list(
+            mmap_ring._replica2part2dev_id[0]))
+        replica2part2dev_id = [array.array('H', [1, 0, 1, 0])] + \
+            self.intended_replica2part2dev_id[1:]
+        ring.RingData(
+            replica2part2dev_id, self.intended_devs,
+            self.intended_part_shift).save(self.testgz, format_version=2)
+        sleep(0.1)
+        self.assertEqual(1, mmap_ring.get_part_nodes(0)[0]['id'])
+        self.assertEqual([1, 0, 1, 0], list(
+            mmap_ring._replica2part2dev_id[0]))
+
+    def test_reload_logged(self):
+        os.utime(self.testgz, (time() - 300, time() - 300))
+        logger = debug_logger()
+        r = ring.Ring(self.testdir, reload_time=0.001, ring_name='whatever',
+                      logger=logger)
+        self.assertEqual({'ring_reloads': 1},
+                         logger.get_increment_counts())
+        ring.RingData(
+            self.intended_replica2part2dev_id,
+            self.intended_devs[:2], self.intended_part_shift).save(self.testgz)
+        sleep(0.1)
+        self.assertEqual(2, len(r.devs))
+        self.assertEqual({'ring_reloads': 2},
+                         logger.get_increment_counts())
+        info_lines = logger.get_lines_for_level('info')
+        self.assertEqual(2, len(info_lines))
+        self.assertTrue(info_lines[1].startswith(
+            'Loaded ring %s in ' % self.testgz), info_lines)
+        self.assertEqual(2, len([
+            call for call in logger.log_dict['timing_since']
+            if call[0][0] == 'ring_reload.timing']))
+
+    def test_background_reload(self):
+        os.utime(self.testgz, (time() - 300, time() - 300))
+        logger = debug_logger()
+        r = ring.Ring(self.testdir, reload_time=0.001, ring_name='whatever',
+                      logger=logger, background_reload=True)
+        orig_mtime = r._mtime
+        self.intended_devs.append(
+            {'id': 5, 'region': 0, 'zone': 4, 'weight': 1.0,
+             'ip': '10.5.5.5', 'port': 6000})
+        ring.RingData(
+            self.intended_replica2part2dev_id,
+            self.intended_devs, self.intended_part_shift).save(self.testgz)
+        sleep(0.1)
+        with mock.patch('swift.common.ring.ring.spawn_n') as mock_spawn:
+            # the request noticing the change still gets the old ring...
+            self.assertEqual(5, len(r.devs))
+            self.assertEqual(5, len(r.devs))
+        # ...and only one reload is started for it
+        self.assertEqual(1, len(mock_spawn.call_args_list))
+        self.assertTrue(r._reloading)
+        reload_func = mock_spawn.call_args[0][0]
+        reload_func()
+        self.assertFalse(r._reloading)
+        self.assertNotEqual(orig_mtime, r._mtime)
+        self.assertEqual(6, len(r.devs))
+        self.assertEqual({'ring_reloads': 2},
+                         logger.get_increment_counts())
+
+        # and it really happens in the background
+        ring.RingData(
+            self.intended_replica2part2dev_id,
+            self.intended_devs[:2], self.intended_part_shift).save(self.testgz)
+        sleep(0.1)
+        r.get_nodes('a')
+        for _junk in range(100):
+            if not r._reloading:
+                break
+            eventlet.sleep(0.01)
+        self.assertEqual(2, len(r.devs))
+
+    def test_background_reload_error(self):
+        os.utime(self.testgz, (time() - 300, time() - 300))
+        logger = debug_logger()
+        r = ring.Ring(self.testdir, reload_time=0.001, ring_name='whatever',
+                      logger=logger, background_reload=True)
+        with open(self.testgz, 'wb') as f:
+            f.write('not a ring')
+        sleep(0.1)
+        with mock.patch('swift.common.ring.ring.spawn_n') as mock_spawn:
+            self.assertEqual(5, len(r.devs))
+        mock_spawn.call_args[0][0]()
+        self.assertFalse(r._reloading)
+        self.assertEqual(5, len(r._devs))
+        self.assertEqual({'ring_reloads': 1, 'ring_reload_errors': 1},
+                         logger.get_increment_counts())
+        error_lines = logger.get_lines_for_level('error')
+        self.assertEqual(1, len(error_lines))
+        self.assertTrue(error_lines[0].startswith(
+            'Error reloading ring %s' % self.testgz), error_lines)
+        # the next check tries again
+        sleep(0.1)
+        with mock.patch('swift.common.ring.ring.spawn_n') as mock_spawn:
+            r.get_part_nodes(0)
+        self.assertTrue(mock_spawn.called)
+
     def test_reload_without_replication(self):
         replication_less_devs = [{'id': 0, 'region': 0, 'zone': 0,
                                   'weight': 1.0, 'ip': '10.1.1.1',
@@ -370,6 +562,35 @@ class TestRing(TestRingBase):
         self.assertEqual(part1, part2)
         self.assertEqual(nodes1, nodes2)
 
+    def test_get_parts(self):
+        names = [('a', None, None), ('a', 'c', None), ('a', 'c', 'o'),
+                 ('a', 'c', 'o2'), ('a', 'c', 'o')]
+        self.assertEqual(self.ring.get_parts(names),
+                         [self.ring.get_part(*name) for name in names])
+        self.assertEqual(self.ring.get_parts(iter(names)),
+                         [self.ring.get_part(*name) for name in names])
+        self.assertEqual(self.ring.get_parts([]), [])
+        self.assertRaises(ValueError, self.ring.get_parts,
+                          [('a', None, 'o')])
+
+    def test_get_nodes_for_names(self):
+        names = [('a', None, None), ('a', 'c', None), ('a', 'c', 'o'),
+                 ('a', 'c', 'o2'), ('a', 'c', 'o')]
+        results = self.ring.get_nodes_for_names(names)
+        self.assertEqual(results,
+                         [self.ring.get_nodes(*name) for name in names])
+        # names in the same partition share their node list
+        self.assertIs(results[2][1], results[4][1])
+        self.assertEqual(self.ring.get_nodes_for_names([]), [])
+
+    def test_get_nodes_for_names_reload(self):
+        names = [('a', None, None)]
+        self.assertEqual(2, len(self.ring.get_nodes_for_names(names)[0][1]))
+        self.ring._rtime = 0
+        with mock.patch.object(self.ring, '_reload') as mock_reload:
+            self.ring.get_nodes_for_names(names)
+        self.assertEqual([mock.call()], mock_reload.call_args_list)
+
     def test_get_part_nodes(self):
         part, nodes = self.ring.get_nodes('a')
         self.assertEqual(nodes, self.ring.get_part_nodes(part))
@@ -822,6 +1043,67 @@ class TestRing(TestRingBase):
                 'handoff differs at position %d\n%s\n%s' % (
                     index, dev_ids[index:], exp_handoffs[index:]))
 
+    def _make_handoff_test_ring(self):
+        rb = ring.RingBuilder(8, 3, 1)
+        next_dev_id = 0
+        for region in range(2):
+            for zone in range(1, 4):
+                for server in range(1, 4):
+                    for device in range(1, 3):
+                        rb.add_dev({'id': next_dev_id,
+                                    'ip': '1.%d.%d.%d' % (
+                                        region, zone, server),
+                                    'port': 1234 + device,
+                                    'zone': zone, 'region': region,
+                                    'weight': 1.0})
+                        next_dev_id += 1
+        rb.rebalance(seed=2)
+        rb.get_ring().save(self.testgz)
+
+    def test_get_more_nodes_handoff_cache_same_order(self):
+        self._make_handoff_test_ring()
+        uncached = ring.Ring(self.testdir, ring_name='whatever',
+                             handoff_cache_size=0)
+        cached = ring.Ring(self.testdir, ring_name='whatever',
+                           handoff_cache_size=64)
+        self.assertEqual(0, len(uncached._handoff_cache.mapping))
+        for part in range(uncached.partition_count):
+            expected = [d['id'] for d in uncached.get_more_nodes(part)]
+            # a partial walk, then two interleaved walks that each go past
+            # what has been cached so far
+            first = cached.get_more_nodes(part)
+            self.assertEqual(expected[:2], [next(first)['id'],
+                                            next(first)['id']])
+            gen1 = cached.get_more_nodes(part)
+            gen2 = cached.get_more_nodes(part)
+            got1, got2 = [], []
+            for i in range(len(expected)):
+                got1.append(next(gen1)['id'])
+                if i % 2:
+                    got2.append(next(gen2)['id'])
+            got2.extend(d['id'] for d in gen2)
+            self.assertRaises(StopIteration, next, gen1)
+            self.assertEqual(expected, got1)
+            self.assertEqual(expected, got2)
+            # and once complete it's served entirely from the cache
+            with mock.patch.object(cached, '_get_more_nodes') as mock_more:
+                self.assertEqual(expected, [
+                    d['id'] for d in cached.get_more_nodes(part)])
+            self.assertFalse(mock_more.called)
+        self.assertEqual(64, len(cached._handoff_cache.mapping))
+
+    def test_get_more_nodes_handoff_cache_reset_on_reload(self):
+        self._make_handoff_test_ring()
+        os.utime(self.testgz, (time() - 300, time() - 300))
+        r = ring.Ring(self.testdir, reload_time=0.001,
+                      ring_name='whatever')
+        next(r.get_more_nodes(0))
+        self.assertEqual([(0,)], list(r._handoff_cache.mapping))
+        self._make_handoff_test_ring()
+        sleep(0.1)
+        next(r.get_more_nodes(1))
+        self.assertEqual([(1,)], list(r._handoff_cache.mapping))
+
 
 if __name__ == '__main__':
     unittest.main()
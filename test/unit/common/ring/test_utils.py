@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
 import unittest
 
 from swift.common import ring
@@ -27,7 +28,7 @@ from swift.common.ring.utils import (tiers_for_dev, build_tier_tree,
                                      validate_args, parse_args,
                                      parse_builder_ring_filename_args,
                                      build_dev_from_opts, dispersion_report,
-                                     parse_address)
+                                     parse_address, ring_diff_report)
 
 
 class TestUtils(unittest.TestCase):
@@ -756,6 +757,98 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(port, 6000)
         self.assertEqual(rest, 'R127.0.0.1:6000/sda1_some meta data')
 
+    def _make_ring_data(self, replica2part2dev_id, part_shift=30):
+        devs = [
+            {'id': 0, 'region': 0, 'zone': 0, 'ip': '10.0.0.1', 'port': 6000,
+             'device': 'sda'},
+            {'id': 1, 'region': 0, 'zone': 1, 'ip': '10.0.0.2', 'port': 6000,
+             'device': 'sda'},
+            {'id': 2, 'region': 1, 'zone': 2, 'ip': '10.0.0.3', 'port': 6000,
+             'device': 'sda'},
+            {'id': 3, 'region': 1, 'zone': 2, 'ip': '10.0.0.3', 'port': 6000,
+             'device': 'sdb'},
+        ]
+        return ring.RingData([array.array('H', row)
+                              for row in replica2part2dev_id],
+                             devs, part_shift)
+
+    def test_ring_diff_report(self):
+        old = self._make_ring_data([[0, 0, 1, 1], [2, 2, 2, 2]])
+        # part 0 only swaps replicas, part 1 is unchanged, part 2 moves one
+        # replica from dev 1 to dev 3, part 3 moves both replicas
+        new = self._make_ring_data([[2, 0, 3, 3], [0, 2, 2, 0]])
+        report = ring_diff_report(old, new)
+        self.assertEqual(4, report['parts'])
+        self.assertEqual(2, report['parts_moved'])
+        self.assertEqual(3, report['replicas_moved'])
+        self.assertEqual(None, report['bytes_moved'])
+        graph = dict(report['graph'])
+        self.assertEqual([
+            'r0', 'r0z0', 'r0z0-10.0.0.1', 'r0z0-10.0.0.1/sda',
+            'r0z1', 'r0z1-10.0.0.2', 'r0z1-10.0.0.2/sda',
+            'r1', 'r1z2', 'r1z2-10.0.0.3', 'r1z2-10.0.0.3/sda',
+            'r1z2-10.0.0.3/sdb'], [name for name, _junk in report['graph']])
+        self.assertEqual({'parts_in': 1, 'parts_out': 0,
+                          'bytes_in': None, 'bytes_out': None},
+                         graph['r0z0-10.0.0.1/sda'])
+        self.assertEqual({'parts_in': 0, 'parts_out': 2,
+                          'bytes_in': None, 'bytes_out': None},
+                         graph['r0z1'])
+        self.assertEqual((1, 2), (graph['r0']['parts_in'],
+                                  graph['r0']['parts_out']))
+        self.assertEqual((0, 1), (graph['r1z2-10.0.0.3/sda']['parts_in'],
+                                  graph['r1z2-10.0.0.3/sda']['parts_out']))
+        self.assertEqual((2, 1), (graph['r1z2']['parts_in'],
+                                  graph['r1z2']['parts_out']))
+
+        # no movement at all
+        report = ring_diff_report(old, old)
+        self.assertEqual((0, 0, []), (report['parts_moved'],
+                                      report['replicas_moved'],
+                                      report['graph']))
+
+    def test_ring_diff_report_bytes(self):
+        old = self._make_ring_data([[0, 0, 1, 1], [2, 2, 2, 2]])
+        new = self._make_ring_data([[2, 0, 3, 3], [0, 2, 2, 0]])
+        report = ring_diff_report(old, new, part_sizes={2: 100, 3: 300})
+        self.assertEqual(100 + 300 * 2, report['bytes_moved'])
+        graph = dict(report['graph'])
+        self.assertEqual((400, 300), (graph['r1z2']['bytes_in'],
+                                      graph['r1z2']['bytes_out']))
+        self.assertEqual((0, 400), (graph['r0z1']['bytes_in'],
+                                    graph['r0z1']['bytes_out']))
+        self.assertEqual((300, 400), (graph['r0']['bytes_in'],
+                                      graph['r0']['bytes_out']))
+
+        # the sample mean is used for partitions missing from the sample
+        report = ring_diff_report(old, new, part_sizes={0: 10, 2: 50})
+        self.assertEqual(50 + 30 * 2, report['bytes_moved'])
+        report = ring_diff_report(old, new, part_sizes={2: 50},
+                                  default_part_size=1)
+        self.assertEqual(50 + 1 * 2, report['bytes_moved'])
+        report = ring_diff_report(old, new, default_part_size=1)
+        self.assertEqual(3, report['bytes_moved'])
+
+    def test_ring_diff_report_replica_count_change(self):
+        old = self._make_ring_data([[0, 0, 1, 1], [2, 2, 2, 2]])
+        new = self._make_ring_data([[0, 0, 1, 1], [2, 2, 2, 2], [3, 3]])
+        report = ring_diff_report(old, new)
+        self.assertEqual((2, 2), (report['parts_moved'],
+                                  report['replicas_moved']))
+        self.assertEqual([('r1z2-10.0.0.3/sdb', {
+            'parts_in': 2, 'parts_out': 0,
+            'bytes_in': None, 'bytes_out': None})],
+            [(name, tier_report) for name, tier_report in report['graph']
+             if '/' in name])
+        report = ring_diff_report(new, old)
+        self.assertEqual((2, 0), (report['parts_moved'],
+                                  report['replicas_moved']))
+
+    def test_ring_diff_report_part_power_change(self):
+        old = self._make_ring_data([[0, 0, 1, 1], [2, 2, 2, 2]])
+        new = self._make_ring_data([[0] * 8, [2] * 8], part_shift=29)
+        self.assertRaises(ValueError, ring_diff_report, old, new)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -18,8 +18,9 @@ import mock
 import unittest
 
 import socket
+import time
 
-from eventlet import spawn, Timeout, listen
+from eventlet import spawn, sleep, Timeout, listen
 
 from swift.common import bufferedhttp
 
@@ -128,5 +129,128 @@ class TestBufferedHTTP(unittest.TestCase):
                                 % (e, dev, path, header))
 
 
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = bufferedhttp.ConnectionPool(max_idle=2, idle_timeout=10)
+        bufferedhttp.BufferedHTTPConnection.pool = self.pool
+        self.bindsock = listen(('127.0.0.1', 0))
+        self.port = self.bindsock.getsockname()[1]
+        self.accepted = []
+        self.server = spawn(self._serve)
+
+    def tearDown(self):
+        bufferedhttp.BufferedHTTPConnection.pool = None
+        for ip, port in list(self.pool._idle):
+            self.pool.evict(ip, port)
+        self.server.kill()
+        self.bindsock.close()
+
+    def _serve(self):
+        while True:
+            sock, addr = self.bindsock.accept()
+            self.accepted.append(sock)
+            spawn(self._handle, sock)
+
+    def _handle(self, sock):
+        # a keep-alive server; it answers /close by closing the connection
+        # and /then-close by closing it after a keep-alive response
+        fp = sock.makefile()
+        while True:
+            line = fp.readline()
+            if not line:
+                break
+            path = line.split()[1]
+            while fp.readline() not in ('\r\n', ''):
+                pass
+            if path.endswith('/close'):
+                fp.write('HTTP/1.1 200 OK\r\nContent-Length: 0\r\n'
+                         'Connection: close\r\n\r\n')
+                break
+            fp.write('HTTP/1.1 200 OK\r\nContent-Length: 8\r\n\r\n'
+                     'RESPONSE')
+            fp.flush()
+            if path.endswith('/then-close'):
+                break
+        fp.close()
+        sock.close()
+
+    def _request(self, path='/path', read=True):
+        with Timeout(3):
+            conn = bufferedhttp.http_connect(
+                '127.0.0.1', self.port, 'dev', 1, 'GET', path)
+            resp = conn.getresponse()
+            if read:
+                self.assertEqual(resp.read(), 'RESPONSE')
+            return conn, resp
+
+    def test_reuse(self):
+        conn, resp = self._request()
+        # the response is over, so its socket is back in the pool
+        self.assertIsNone(conn.sock)
+        self._request()
+        self._request()
+        self.assertEqual(len(self.accepted), 1)
+        # closing anything afterwards doesn't affect the pooled socket
+        resp.close()
+        conn.close()
+        resp.nuke_from_orbit()
+        self._request()
+        self.assertEqual(len(self.accepted), 1)
+
+    def test_partial_read_not_reused(self):
+        conn, resp = self._request(read=False)
+        self.assertEqual(resp.read(3), 'RES')
+        resp.close()
+        self._request()
+        self.assertEqual(len(self.accepted), 2)
+
+    def test_concurrent_requests_and_max_idle(self):
+        resps = [self._request(read=False)[1] for _ in range(3)]
+        self.assertEqual(len(self.accepted), 3)
+        for resp in resps:
+            self.assertEqual(resp.read(), 'RESPONSE')
+        # only max_idle of the three connections were kept
+        self.assertEqual(len(self.pool._idle[('127.0.0.1', self.port)]), 2)
+        for _ in range(3):
+            self._request()
+        self.assertEqual(len(self.accepted), 3)
+
+    def test_server_closed(self):
+        conn, resp = self._request('/close', read=False)
+        resp.read()
+        self.assertNotIn(('127.0.0.1', self.port), self.pool._idle)
+        self._request('/then-close')
+        sock = self.pool._idle[('127.0.0.1', self.port)][-1][1]
+        with Timeout(3):
+            while bufferedhttp._is_idle(sock):
+                sleep(0.01)
+        # the pooled connection was closed by the server, so it's replaced
+        self._request()
+        self.assertEqual(len(self.accepted), 3)
+        self.assertEqual(len(self.pool._idle[('127.0.0.1', self.port)]), 1)
+
+    def test_idle_timeout(self):
+        self._request()
+        with mock.patch('swift.common.bufferedhttp.time.time',
+                        return_value=time.time() + 11):
+            self._request()
+        self.assertEqual(len(self.accepted), 2)
+
+    def test_evict(self):
+        self._request()
+        self.pool.evict('127.0.0.1', str(self.port))
+        self.assertEqual(self.pool._idle, {})
+        self._request()
+        self.assertEqual(len(self.accepted), 2)
+
+    def test_expect_response_not_pooled(self):
+        with Timeout(3):
+            conn = bufferedhttp.http_connect(
+                '127.0.0.1', self.port, 'dev', 1, 'GET', '/path')
+            resp = conn.getexpect()
+        self.assertIsNone(resp.pooled_conn)
+
+
 if __name__ == '__main__':
     unittest.main()
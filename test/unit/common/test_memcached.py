@@ -17,6 +17,7 @@
 """Tests for swift.common.utils"""
 
 from collections import defaultdict
+import itertools
 import logging
 import socket
 import time
@@ -337,6 +338,101 @@ class TestMemcached(unittest.TestCase):
             ('some_key2', 'some_key1', 'not_exists'), 'multi_key'),
             [[4, 5, 6], [1, 2, 3], None])
 
+    def _keys_by_server(self, memcache_client, count):
+        keys = {}
+        for i in itertools.count():
+            key = 'key%d' % i
+            server = memcache_client._get_server(memcached.md5hash(key))
+            if len(keys.setdefault(server, [])) < count:
+                keys[server].append(key)
+            if sum(len(v) for v in keys.values()) == count * 2:
+                return keys
+
+    def test_get_many(self):
+        memcache_client = memcached.MemcacheRing(
+            ['1.2.3.4:11211', '1.2.3.5:11211'])
+        mocks = {}
+        for server in ('1.2.3.4:11211', '1.2.3.5:11211'):
+            mock = mocks[server] = MockMemcached()
+            memcache_client._client_cache[server] = MockedMemcachePool(
+                [(mock, mock)] * 2)
+        keys = self._keys_by_server(memcache_client, 2)
+        key1, key2 = keys['1.2.3.4:11211']
+        key3, key4 = keys['1.2.3.5:11211']
+        memcache_client.set(key1, [1])
+        memcache_client.set(key2, {'two': 2})
+        memcache_client.set(key4, '4')
+
+        self.assertEqual(memcache_client.get_many([]), [])
+        sent = []
+
+        def recording_sendall(orig_sendall):
+            def sendall(string):
+                sent.append(string)
+                return orig_sendall(string)
+            return sendall
+
+        for mock in mocks.values():
+            mock.sendall = recording_sendall(mock.sendall)
+        round_trips = memcached.round_trip_count()
+        self.assertEqual(
+            memcache_client.get_many([key4, key1, key3, key2, key1]),
+            ['4', [1], None, {'two': 2}, [1]])
+        # one get per server
+        self.assertEqual(sorted(sent), sorted([
+            'get %s %s\r\n' % tuple(
+                memcached.md5hash(key) for key in (key4, key3)),
+            'get %s %s %s\r\n' % tuple(
+                memcached.md5hash(key) for key in (key1, key2, key1))]))
+        self.assertEqual(round_trips + 1, memcached.round_trip_count())
+
+        # keys on one server
+        del sent[:]
+        self.assertEqual(memcache_client.get_many([key2, key1]),
+                         [{'two': 2}, [1]])
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(round_trips + 2, memcached.round_trip_count())
+
+    def test_round_trips_per_greenthread(self):
+        memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'])
+        mock = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock, mock)] * 2)
+
+        def do_gets(count):
+            round_trips = memcached.round_trip_count()
+            for i in range(count):
+                memcache_client.get('some_key')
+                # let the other greenthread have a go
+                sleep(0)
+            return memcached.round_trip_count() - round_trips
+
+        pool = GreenPool()
+        threads = [pool.spawn(do_gets, 3), pool.spawn(do_gets, 5)]
+        self.assertEqual([3, 5], [thread.wait() for thread in threads])
+
+    def test_get_many_server_down(self):
+        logging.getLogger().addHandler(NullLoggingHandler())
+        memcache_client = memcached.MemcacheRing(
+            ['1.2.3.4:11211', '1.2.3.5:11211'])
+        keys = self._keys_by_server(memcache_client, 2)
+        mock = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock, mock)] * 2)
+        exploding = ExplodingMockMemcached()
+        memcache_client._client_cache['1.2.3.5:11211'] = MockedMemcachePool(
+            [(exploding, exploding)] + [(mock, mock)] * 4)
+        key1, key2 = keys['1.2.3.4:11211']
+        key3, key4 = keys['1.2.3.5:11211']
+        for key in (key1, key2, key3, key4):
+            mock.cache[memcached.md5hash(key)] = ('0', '0', key)
+        # the keys of the server that failed are looked up one by one, each
+        # with its own retries
+        self.assertEqual(
+            memcache_client.get_many([key1, key2, key3, key4]),
+            [key1, key2, key3, key4])
+        self.assertTrue(exploding.exploded)
+
     def test_serialization(self):
         memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'],
                                                  allow_pickle=True)
@@ -16,11 +16,15 @@
 """Tests for swift.common.request_helpers"""
 
 import unittest
+
+import mock
+
 from swift.common.swob import Request, HTTPException
 from swift.common.storage_policy import POLICIES, EC_POLICY, REPL_POLICY
 from swift.common.request_helpers import is_sys_meta, is_user_meta, \
     is_sys_or_user_meta, strip_sys_meta_prefix, strip_user_meta_prefix, \
-    remove_items, copy_header_subset, get_name_and_placement
+    remove_items, copy_header_subset, get_name_and_placement, \
+    add_phase_time, timed_phase
 
 from test.unit import patch_policies
 
@@ -85,6 +89,34 @@ class TestRequestHelpers(unittest.TestCase):
         self.assertFalse('c' in to_req.headers)
         self.assertFalse('C' in to_req.headers)
 
+    def test_add_phase_time(self):
+        env = {}
+        add_phase_time(env, 'auth', 1.5)
+        self.assertEqual(env, {})
+        env['swift.phase_times'] = {}
+        add_phase_time(env, 'auth', 1.5)
+        add_phase_time(env, 'auth', 0.25)
+        add_phase_time(env, 'info', 1)
+        self.assertEqual(env['swift.phase_times'], {'auth': 1.75, 'info': 1})
+
+    def test_timed_phase(self):
+        env = {}
+        with mock.patch('swift.common.request_helpers.time.time') as t:
+            with timed_phase(env, 'auth'):
+                pass
+        self.assertEqual(env, {})
+        self.assertFalse(t.called)
+
+        env['swift.phase_times'] = {}
+        with mock.patch('swift.common.request_helpers.time.time',
+                        side_effect=[10, 12, 20, 21]):
+            with timed_phase(env, 'auth'):
+                pass
+            with self.assertRaises(ValueError):
+                with timed_phase(env, 'auth'):
+                    raise ValueError()
+        self.assertEqual(env['swift.phase_times'], {'auth': 3})
+
     @patch_policies(with_ec_default=True)
     def test_get_name_and_placement_object_req(self):
         path = '/device/part/account/container/object'
@@ -0,0 +1,147 @@
+# Copyright (c) 2016 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from swift.common import shared_table
+from swift.common.shared_table import SharedTable
+
+
+class TestSharedTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'test.table')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_get_and_update(self):
+        table = SharedTable(('a', 'b'), self.path, rows=16)
+        self.assertIsNone(table.get('key'))
+        table.update('key', {'a': 1.5}, now=1000)
+        self.assertEqual(table.get('key'), (1000, {'a': 1.5, 'b': 0.0}))
+        table.update(u'key', {'b': 2}, now=1001)
+        self.assertEqual(table.get('key'), (1001, {'a': 1.5, 'b': 2.0}))
+        with mock.patch('swift.common.shared_table.time.time',
+                        return_value=1002):
+            table.update('other', {'a': 3})
+        self.assertEqual(sorted(table.items()), [
+            ('key', 1001, {'a': 1.5, 'b': 2.0}),
+            ('other', 1002, {'a': 3.0, 'b': 0.0})])
+
+    def test_long_keys(self):
+        table = SharedTable(('a',), self.path, rows=16)
+        key = 'k' * (shared_table.KEY_SIZE + 10)
+        table.update(key, {'a': 1})
+        self.assertEqual(table.get(key)[1], {'a': 1})
+        self.assertEqual([item[0] for item in table.items()],
+                         [key[:shared_table.KEY_SIZE]])
+
+    def test_full(self):
+        table = SharedTable(('a',), self.path, rows=16)
+        for i in range(100):
+            table.update('key%d' % i, {'a': i}, now=i)
+        items = table.items()
+        self.assertEqual(len(items), 16)
+        # the most recently updated keys are kept
+        for key, updated, values in items:
+            self.assertEqual(key, 'key%d' % values['a'])
+        self.assertEqual(table.get('key99'), (99, {'a': 99}))
+        self.assertIsNone(table.get('key0'))
+
+    def test_shared(self):
+        table = SharedTable(('a', 'b'), self.path, rows=16)
+        other = SharedTable(('a', 'b'), self.path, rows=16)
+        table.update('key', {'a': 1}, now=1000)
+        self.assertEqual(other.get('key'), (1000, {'a': 1, 'b': 0}))
+        other.update('key', {'b': 2}, now=1001)
+        self.assertEqual(table.get('key'), (1001, {'a': 1, 'b': 2}))
+
+        reader = SharedTable(path=self.path, readonly=True)
+        self.assertEqual(reader.fields, ('a', 'b'))
+        self.assertEqual(reader.rows, 16)
+        self.assertEqual(reader.items(), table.items())
+        reader = SharedTable(('a', 'b'), self.path, readonly=True)
+        self.assertEqual(reader.items(), table.items())
+
+    def test_shared_between_processes(self):
+        table = SharedTable(('a',))
+        pid = os.fork()
+        if pid == 0:
+            table.update('key', {'a': 1}, now=1000)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(table.get('key'), (1000, {'a': 1}))
+
+    def test_reset_on_mismatch(self):
+        old_table = SharedTable(('a', 'b'), self.path, rows=16)
+        old_table.update('key', {'a': 1}, now=1000)
+        old_ino = os.stat(self.path).st_ino
+        # other fields
+        table = SharedTable(('a',), self.path, rows=16)
+        self.assertEqual(table.items(), [])
+        table.update('key', {'a': 1})
+        # the file was replaced rather than truncated, so processes that
+        # still map the old one can keep using it
+        self.assertNotEqual(os.stat(self.path).st_ino, old_ino)
+        self.assertEqual(old_table.get('key'), (1000, {'a': 1, 'b': 0}))
+        old_table.update('key', {'b': 2})
+        self.assertEqual(table.get('key')[1], {'a': 1})
+        # other number of rows
+        table = SharedTable(('a',), self.path, rows=32)
+        self.assertEqual(table.items(), [])
+        self.assertEqual(os.path.getsize(self.path), table._size)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)),
+                         [os.path.basename(self.path)])
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+
+    def test_replaced_while_waiting_for_lock(self):
+        SharedTable(('a',), self.path, rows=16)
+        orig_flock = shared_table.fcntl.flock
+        calls = []
+
+        def flock(fd, operation):
+            if operation == shared_table.fcntl.LOCK_EX and not calls:
+                # another process replaces the file before we get the lock
+                calls.append(fd)
+                SharedTable(('a', 'b'), self.path, rows=16).update(
+                    'key', {'b': 1}, now=1000)
+            return orig_flock(fd, operation)
+
+        with mock.patch.object(shared_table.fcntl, 'flock', flock):
+            table = SharedTable(('a', 'b'), self.path, rows=16)
+        # the file it replaced was used, not replaced again
+        self.assertEqual(table.get('key'), (1000, {'a': 0, 'b': 1}))
+
+    def test_readonly_errors(self):
+        self.assertRaises(IOError, SharedTable, path=self.path,
+                          readonly=True)
+        with open(self.path, 'w') as fp:
+            fp.write('junk')
+        self.assertRaises(ValueError, SharedTable, path=self.path,
+                          readonly=True)
+        SharedTable(('a', 'b'), self.path, rows=16)
+        self.assertRaises(ValueError, SharedTable, ('a',), self.path,
+                          readonly=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1591,6 +1591,24 @@ class TestUtils(unittest.TestCase):
             self.assertEqual(utils.hash_path('a', 'c', 'o', raw_digest=False),
                              '363f9b535bfb7d17a43a46a358afca0e')
 
+    def test_hash_paths(self):
+        names = [('a', None, None), ('a', 'c', None), ('a', 'c', 'o'),
+                 ('a', '', ''), ('\xc3\xa9', 'c', 'o')]
+        for prefix in ('', 'abcdef'):
+            with mock.patch('swift.common.utils.HASH_PATH_PREFIX', prefix):
+                self.assertEqual(list(utils.hash_paths(names)),
+                                 [utils.hash_path(*name) for name in names])
+                self.assertEqual(
+                    list(utils.hash_paths(names, raw_digest=True)),
+                    [utils.hash_path(*name, raw_digest=True)
+                     for name in names])
+        with mock.patch('swift.common.utils.HASH_PATH_PREFIX', ''):
+            self.assertEqual(list(utils.hash_paths([('a', 'c', 'o')])),
+                             ['06fbf0b514e5199dfc4e00f42eb5ea83'])
+        self.assertEqual([], list(utils.hash_paths([])))
+        self.assertRaises(ValueError, list,
+                          utils.hash_paths([('a', None, 'o')]))
+
     def test_validate_hash_conf(self):
         # no section causes InvalidHashPathConfigError
         self._test_validate_hash_conf([], [], True)
@@ -4671,6 +4689,32 @@ class TestGreenAsyncPile(unittest.TestCase):
         self.assertEqual(pile.waitall(0.5), [0.1, 0.1])
         self.assertEqual(completed[0], 2)
 
+    def test_waitfirst_only_returns_first(self):
+        def run_test(name):
+            eventlet.sleep(0)
+            completed.append(name)
+            return name
+
+        completed = []
+        pile = utils.GreenAsyncPile(3)
+        pile.spawn(run_test, 'first')
+        pile.spawn(run_test, 'second')
+        pile.spawn(run_test, 'third')
+        self.assertEqual(pile.waitfirst(0.5), [completed[0]])
+        # the others are still there to be had
+        self.assertEqual(sorted(list(pile) + completed[:1]),
+                         ['first', 'second', 'third'])
+
+    def test_waitfirst_timeout_timesout(self):
+        def run_test(sleep_duration):
+            eventlet.sleep(sleep_duration)
+            return sleep_duration
+
+        pile = utils.GreenAsyncPile(3)
+        pile.spawn(run_test, 1.0)
+        self.assertEqual(pile.waitfirst(0.1), [])
+        self.assertEqual(next(pile), 1.0)
+
     def test_pending(self):
         pile = utils.GreenAsyncPile(3)
         self.assertEqual(0, pile._pending)
@@ -4782,6 +4826,32 @@ class TestLRUCache(unittest.TestCase):
             f(i)
         self.assertEqual(f.size(), 4)
 
+    def test_get_set_delete(self):
+        cache = utils.LRUCache(maxsize=2, maxtime=30)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual('x', cache.get('a', 'x'))
+        self.assertEqual(1, cache.set('a', 1))
+        cache.set('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        # replacing a value doesn't take more room
+        cache.set('b', 3)
+        self.assertEqual(2, len(cache.mapping))
+        self.assertEqual(3, cache.get('b'))
+        # a was used less recently than b
+        cache.set('c', 4)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(3, cache.get('b'))
+        self.assertEqual(4, cache.get('c'))
+        cache.delete('b')
+        cache.delete('b')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(['c'], [key for key, in cache.mapping])
+        # timed out values are dropped
+        with patch('swift.common.utils.time.time',
+                   return_value=time.time() + 31):
+            self.assertIsNone(cache.get('c'))
+        self.assertEqual({}, cache.mapping)
+
 
 class TestParseContentRange(unittest.TestCase):
     def test_good(self):
@@ -27,6 +27,10 @@ import tempfile
 import uuid
 import xattr
 import re
+import socket
+import struct
+import threading as stdlib_threading
+import time as stdlib_time
 from collections import defaultdict
 from random import shuffle, randint
 from shutil import rmtree
@@ -50,10 +54,11 @@ from swift.common.splice import splice
 from swift.common.exceptions import DiskFileNotExist, DiskFileQuarantined, \
     DiskFileDeviceUnavailable, DiskFileDeleted, DiskFileNotOpen, \
     DiskFileError, ReplicationLockTimeout, DiskFileCollision, \
-    DiskFileExpired, SwiftException, DiskFileNoSpace, DiskFileXattrNotSupported
+    DiskFileExpired, SwiftException, DiskFileNoSpace, \
+    DiskFileXattrNotSupported, ChunkReadError
 from swift.common.storage_policy import (
     POLICIES, get_policy_string, StoragePolicy, ECStoragePolicy,
-    BaseStoragePolicy, REPL_POLICY, EC_POLICY)
+    BaseStoragePolicy, REPL_POLICY, EC_POLICY, PolicyError)
 
 
 test_policies = [
@@ -190,6 +195,109 @@ class TestDiskFileModuleMethods(unittest.TestCase):
         bad_path = '/srv/node/sda1/obj1/1/abc/def/1234.data'
         self.assertEqual(diskfile.extract_policy(bad_path), None)
 
+    def test_encode_decode_metadata(self):
+        metadata_samples = [
+            {},
+            {'X-Timestamp': '1381679759.90941',
+             'Content-Length': '1024',
+             'ETag': 'd41d8cd98f00b204e9800998ecf8427e',
+             'Content-Type': 'text/plain',
+             'name': '/a/c/o',
+             'X-Object-Meta-Color': 'blue'},
+            # values the fixed fields can't hold go to the tail
+            {'X-Timestamp': '1381679759.90941_0000000000000001',
+             'Content-Length': '0012',
+             'ETag': 'D41D8CD98F00B204E9800998ECF8427E'},
+            {'X-Timestamp': '1381679759.90941',
+             'Content-Length': str(2 ** 64),
+             'ETag': '"multipart"'},
+            {'Content-Length': '0', 'name': '/a/c/\xc3\xa9', '': ''},
+            # a trailing newline must not be lost
+            {'X-Timestamp': '1381679759.90941\n',
+             'ETag': 'd41d8cd98f00b204e9800998ecf8427e\n'},
+        ]
+        for metadata in metadata_samples:
+            for metadata_format in diskfile.METADATA_FORMATS:
+                metastr = diskfile.encode_metadata(metadata, metadata_format)
+                self.assertEqual(metadata, diskfile.decode_metadata(metastr))
+        self.assertRaises(ValueError, diskfile.encode_metadata, {}, 'json')
+
+    def test_binary_metadata_layout(self):
+        metadata = {'X-Timestamp': '1381679759.90941',
+                    'Content-Length': '1024',
+                    'ETag': 'd41d8cd98f00b204e9800998ecf8427e',
+                    'name': '/a/c/o'}
+        metastr = diskfile.encode_metadata(metadata, 'binary')
+        self.assertEqual('SWMD\x01\x07', metastr[:6])
+        self.assertEqual(struct.pack('!QQ', 138167975990941, 1024),
+                         metastr[6:22])
+        self.assertEqual('d41d8cd98f00b204e9800998ecf8427e',
+                         metastr[22:38].encode('hex'))
+        self.assertEqual(struct.pack('!IHI', 1, 4, 6) + 'name/a/c/o',
+                         metastr[38:])
+        self.assertTrue(len(metastr) <
+                        len(diskfile.encode_metadata(metadata, 'pickle')))
+
+    def test_binary_metadata_falls_back_to_pickle(self):
+        for metadata in ({'Content-Length': 1024},
+                         {u'X-Object-Meta-Color': 'blue'},
+                         {'X-Object-Meta-Color': u'blue'},
+                         {'x' * 2 ** 16: 'y'}):
+            metastr = diskfile.encode_metadata(metadata, 'binary')
+            self.assertEqual(metadata, pickle.loads(metastr))
+
+    def test_decode_metadata_keys(self):
+        metadata = {'X-Timestamp': '1381679759.90941',
+                    'Content-Length': '1024',
+                    'ETag': 'd41d8cd98f00b204e9800998ecf8427e',
+                    'Content-Type': 'text/plain',
+                    'name': '/a/c/o'}
+        metastr = diskfile.encode_metadata(metadata, 'binary')
+        self.assertEqual(
+            {'X-Timestamp': '1381679759.90941', 'Content-Length': '1024'},
+            diskfile.decode_metadata(metastr,
+                                     keys=('X-Timestamp', 'Content-Length')))
+        self.assertEqual({'name': '/a/c/o', 'ETag': metadata['ETag']},
+                         diskfile.decode_metadata(metastr,
+                                                  keys=('name', 'ETag')))
+        self.assertEqual({}, diskfile.decode_metadata(
+            metastr, keys=('X-Object-Meta-Missing',)))
+        # the tail is not even looked at for fixed fields
+        self.assertEqual({'ETag': metadata['ETag']},
+                         diskfile.decode_metadata(metastr[:38] + 'junk',
+                                                  keys=('ETag',)))
+        # pickled metadata is decoded in full regardless
+        metastr = diskfile.encode_metadata(metadata, 'pickle')
+        self.assertEqual(metadata, diskfile.decode_metadata(
+            metastr, keys=('ETag',)))
+
+    def test_decode_bad_binary_metadata(self):
+        metastr = diskfile.encode_metadata({'name': '/a/c/o'}, 'binary')
+        self.assertRaises(ValueError, diskfile.decode_metadata, metastr[:-1])
+        self.assertRaises(ValueError, diskfile.decode_metadata,
+                          metastr + 'x')
+        self.assertRaises(struct.error, diskfile.decode_metadata,
+                          metastr[:20])
+        self.assertRaises(ValueError, diskfile.decode_metadata,
+                          'SWMD\x02' + metastr[5:])
+
+    def test_read_write_metadata_formats(self):
+        metadata = {'X-Timestamp': '1381679759.90941',
+                    'Content-Length': '10',
+                    'ETag': 'd41d8cd98f00b204e9800998ecf8427e',
+                    'name': '/a/c/o',
+                    'X-Object-Meta-Big': 'x' * 100}
+        for metadata_format in diskfile.METADATA_FORMATS:
+            path = os.path.join(self.testdir, metadata_format + '.data')
+            with open(path, 'wb') as fp:
+                diskfile.write_metadata(fp.fileno(), metadata,
+                                        metadata_format=metadata_format)
+            self.assertEqual(metadata, diskfile.read_metadata(path))
+            self.assertEqual('/a/c/o', diskfile.read_metadata(
+                path, keys=('name',))['name'])
+        self.assertEqual('SWMD', xattr.getxattr(
+            path, diskfile.METADATA_KEY)[:4])
+
     def test_quarantine_renamer(self):
         for policy in POLICIES:
             # we use this for convenience, not really about a diskfile layout
@@ -451,6 +559,32 @@ class TestDiskFileRouter(unittest.TestCase):
                 manager = router[POLICIES.default]
                 self.assertTrue(isinstance(manager, TestDiskFileManager))
 
+    def test_register_backend(self):
+        with mock.patch.dict(
+                diskfile.DiskFileRouter.backend_to_manager_cls, {}):
+            @diskfile.DiskFileRouter.register(REPL_POLICY, backend='test')
+            class TestDiskFileManager(diskfile.DiskFileManager):
+                pass
+
+            with self.assertRaises(PolicyError):
+                diskfile.DiskFileRouter.register(REPL_POLICY, backend='test')(
+                    TestDiskFileManager)
+
+            with patch_policies(test_policies):
+                router = diskfile.DiskFileRouter({'diskfile_backend': 'test'},
+                                                 debug_logger('test'))
+                self.assertTrue(isinstance(router[POLICIES[0]],
+                                           TestDiskFileManager))
+                # policy types without an implementation use the default
+                self.assertTrue(isinstance(router[POLICIES[1]],
+                                           diskfile.ECDiskFileManager))
+                router = diskfile.DiskFileRouter({}, debug_logger('test'))
+                self.assertFalse(isinstance(router[POLICIES[0]],
+                                            TestDiskFileManager))
+                self.assertRaises(ValueError, diskfile.DiskFileRouter,
+                                  {'diskfile_backend': 'bogus'},
+                                  debug_logger('test'))
+
 
 class BaseDiskFileTestMixin(object):
     """
@@ -687,6 +821,18 @@ class DiskFileManagerMixin(BaseDiskFileTestMixin):
         self.assertTrue('splice()' in warnings[-1])
         self.assertFalse(mgr.use_splice)
 
+    def test_missing_splice_put_warning(self):
+        logger = FakeLogger()
+        with mock.patch('swift.common.splice.splice._c_splice', None):
+            self.conf['splice_put'] = 'yes'
+            mgr = diskfile.DiskFileManager(self.conf, logger)
+
+        warnings = logger.get_lines_for_level('warning')
+        self.assertTrue(len(warnings) > 0)
+        self.assertTrue('splice_put = yes' in warnings[-1])
+        self.assertFalse(mgr.use_splice)
+        self.assertFalse(mgr.use_splice_put)
+
     def test_get_diskfile_from_hash_dev_path_fail(self):
         self.df_mgr.get_dev_path = mock.MagicMock(return_value=None)
         with mock.patch(self._manager_mock('diskfile_cls')), \
@@ -825,7 +971,7 @@ class DiskFileManagerMixin(BaseDiskFileTestMixin):
                 604800)
             readmeta.assert_called_once_with(
                 '/srv/dev/objects/9/900/9a7175077c01a23ade5956b8a2bba900/'
-                '1381679759.90941.data')
+                '1381679759.90941.data', keys=('name',))
 
     def test_listdir_enoent(self):
         oserror = OSError()
@@ -2665,6 +2811,36 @@ class DiskFileMixin(BaseDiskFileTestMixin):
         exp_name = '%s.meta' % timestamp
         self.assertTrue(exp_name in set(dl))
 
+    def test_metadata_format_conf(self):
+        self.assertEqual('pickle', self.df_mgr.metadata_format)
+        self.conf['metadata_format'] = 'bogus'
+        self.assertRaises(ValueError, self.mgr_cls, self.conf, self.logger)
+
+        self.conf['metadata_format'] = 'binary'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        timestamp = self.ts().internal
+        df = self._simple_get_diskfile()
+        with df.create() as writer:
+            writer.write('1234567890')
+            writer.put({'ETag': md5('1234567890').hexdigest(),
+                        'X-Timestamp': timestamp,
+                        'Content-Length': '10',
+                        'X-Object-Meta-Color': 'blue',
+                        # as set by the object server
+                        'X-Object-Sysmeta-Ec-Frag-Index': '2'})
+            writer.commit(Timestamp(timestamp))
+        data_files = [f for f in os.listdir(df._datadir)
+                      if f.endswith('.data')]
+        self.assertEqual(1, len(data_files))
+        self.assertEqual('SWMD', xattr.getxattr(
+            os.path.join(df._datadir, data_files[0]),
+            diskfile.METADATA_KEY)[:4])
+        df = self._simple_get_diskfile()
+        with df.open():
+            self.assertEqual('blue', df.get_metadata()['X-Object-Meta-Color'])
+            self.assertEqual(timestamp, df.get_metadata()['X-Timestamp'])
+            self.assertEqual('1234567890', ''.join(df.reader()))
+
     def test_write_metadata_no_xattr(self):
         timestamp = Timestamp(time()).internal
         metadata = {'X-Timestamp': timestamp, 'X-Object-Meta-test': 'data'}
@@ -2896,6 +3072,25 @@ class DiskFileMixin(BaseDiskFileTestMixin):
         df = self._simple_get_diskfile()
         self.assertRaises(DiskFileDeleted, df.open)
 
+    def test_open_deleted_reads_only_tombstone_timestamp(self):
+        self.conf['metadata_format'] = 'binary'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df = self._simple_get_diskfile()
+        ts = Timestamp(time())
+        df.delete(ts)
+        df = self._simple_get_diskfile()
+        with mock.patch('swift.obj.diskfile.read_metadata',
+                        side_effect=diskfile.read_metadata) as mock_read:
+            try:
+                df.open()
+            except DiskFileDeleted as err:
+                self.assertEqual(err.timestamp, ts)
+                self.assertEqual(err.metadata, {'X-Timestamp': ts.internal})
+            else:
+                self.fail("Expected DiskFileDeleted exception")
+        self.assertEqual([call[1] for call in mock_read.call_args_list],
+                         [{'keys': ('X-Timestamp',)}])
+
     def test_open_deleted_with_corrupt_tombstone(self):
         df = self._get_open_disk_file()
         ts = time()
@@ -3333,6 +3528,191 @@ class DiskFileMixin(BaseDiskFileTestMixin):
                             mock_trampoline:
                         _run_test()
 
+    def _zero_copy_send(self, data, set_ranges=None):
+        self.conf['splice'] = 'on'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df = self._create_test_file(data)
+        reader = df.reader()
+        self.assertTrue(reader.can_zero_copy_send())
+        body_iter = set_ranges(reader) if set_ranges else None
+        rsock, wsock = socket.socketpair()
+        with closing(rsock):
+            with closing(wsock):
+                reader.zero_copy_send(wsock.fileno())
+            sent = ''.join(iter(lambda: rsock.recv(65536), ''))
+        self.assertTrue(reader._fp is None)
+        return sent, body_iter
+
+    def test_zero_copy_send_range(self):
+        if not self._system_can_zero_copy():
+            raise SkipTest("zero-copy support is missing")
+
+        data = ''.join(chr(i % 256) for i in range(10000))
+        sent, body_iter = self._zero_copy_send(
+            data, lambda reader: reader.app_iter_range(1000, 7000))
+        self.assertEqual(sent, data[1000:7000])
+        # the iterator app_iter_range() returned is not needed
+        self.assertEqual(list(body_iter), [])
+        sent, _junk = self._zero_copy_send(
+            data, lambda reader: reader.app_iter_range(9000, None))
+        self.assertEqual(sent, data[9000:])
+
+    def test_zero_copy_send_ranges(self):
+        if not self._system_can_zero_copy():
+            raise SkipTest("zero-copy support is missing")
+
+        data = ''.join(chr(i % 256) for i in range(10000))
+        ranges = [(0, 10), (5000, 7000), (9990, 10000)]
+        sent, _junk = self._zero_copy_send(
+            data, lambda reader: reader.app_iter_ranges(
+                ranges, 'text/plain', '5e816ff8b8b8e9a5d355497e5d9e0301',
+                len(data)))
+        df = self._simple_get_diskfile()
+        with df.open():
+            expected = ''.join(df.reader().app_iter_ranges(
+                ranges, 'text/plain', '5e816ff8b8b8e9a5d355497e5d9e0301',
+                len(data)))
+        self.assertEqual(sent, expected)
+        self.assertTrue('\r\n\r\n' + data[5000:7000] + '\r\n' in sent)
+
+    def test_zero_copy_send_range_quarantine(self):
+        if not self._system_can_zero_copy():
+            raise SkipTest("zero-copy support is missing")
+
+        data = '0123456789' * 1000
+
+        def corrupt_and_set_range(start, stop):
+            def set_range(reader):
+                with open(reader._data_file, 'r+b') as fp:
+                    fp.write('X')
+                return reader.app_iter_range(start, stop)
+            return set_range
+
+        # only part of the object is sent, so it can not be checked
+        sent, _junk = self._zero_copy_send(
+            data, corrupt_and_set_range(0, 5000))
+        self.assertEqual(sent, 'X' + data[1:5000])
+        self.assertEqual(self.logger.get_increments(), [])
+        self._simple_get_diskfile().open()
+
+        # the whole object is sent, so it is checked against its ETag
+        sent, _junk = self._zero_copy_send(
+            data, corrupt_and_set_range(0, len(data)))
+        self.assertEqual(sent, 'X' + data[1:])
+        self.assertEqual(self.logger.get_increments(), ['quarantines'])
+        self.assertRaises(DiskFileNotExist, self._simple_get_diskfile().open)
+
+    def test_zero_copy_receive(self):
+        if not self._system_can_zero_copy():
+            raise SkipTest("zero-copy support is missing")
+
+        self.conf['splice_put'] = 'yes'
+        self.conf['disk_chunk_size'] = 4096
+        df_mgr = diskfile.DiskFileRouter(
+            self.conf, self.logger)[POLICIES.default]
+        self.assertFalse(df_mgr.use_splice)
+        self.assertTrue(df_mgr.use_splice_put)
+        body = ''.join(chr(i % 256) for i in range(20000))
+        df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c', 'o',
+                                 policy=POLICIES.default, frag_index=2)
+        rsock, wsock = socket.socketpair()
+        with closing(rsock), closing(wsock):
+            rsock.setblocking(0)
+            wsock.sendall(body[100:])
+            with df.create() as writer:
+                self.assertTrue(writer.can_zero_copy_receive())
+                with mock.patch('swift.obj.diskfile.trampoline') as \
+                        mock_trampoline:
+                    upload_size, etag = writer.zero_copy_receive(
+                        rsock.fileno(), len(body) - 100, body[:100],
+                        timeout=1)
+                self.assertFalse(mock_trampoline.called)
+                self.assertEqual(upload_size, len(body))
+                self.assertEqual(etag, md5(body).hexdigest())
+                timestamp = Timestamp(time())
+                writer.put({'X-Timestamp': timestamp.internal,
+                            'ETag': etag,
+                            'Content-Length': str(upload_size),
+                            'Content-Type': 'text/plain'})
+                writer.commit(timestamp)
+        df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c', 'o',
+                                 policy=POLICIES.default, frag_index=2)
+        with df.open():
+            self.assertEqual(''.join(df.reader()), body)
+
+    def test_zero_copy_receive_waits_and_fails(self):
+        if not self._system_can_zero_copy():
+            raise SkipTest("zero-copy support is missing")
+
+        self.conf['splice_put'] = 'yes'
+        df_mgr = diskfile.DiskFileRouter(
+            self.conf, self.logger)[POLICIES.default]
+        df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c', 'o',
+                                 policy=POLICIES.default, frag_index=2)
+        rsock, wsock = socket.socketpair()
+        with closing(rsock), closing(wsock):
+            rsock.setblocking(0)
+            calls = []
+
+            def fake_trampoline(fd, read=None, timeout=None,
+                                timeout_exc=None):
+                calls.append((fd, read, timeout, timeout_exc))
+                # the client sends a little then goes away
+                wsock.sendall('abc')
+                wsock.shutdown(socket.SHUT_WR)
+
+            with df.create() as writer:
+                with mock.patch('swift.obj.diskfile.trampoline',
+                                fake_trampoline):
+                    self.assertRaises(ChunkReadError,
+                                      writer.zero_copy_receive,
+                                      rsock.fileno(), 10, timeout=5)
+            self.assertEqual(
+                calls, [(rsock.fileno(), True, 5, diskfile.ChunkReadTimeout)])
+
+    def test_zero_copy_receive_deadline(self):
+        if not self._system_can_zero_copy():
+            raise SkipTest("zero-copy support is missing")
+
+        self.conf['splice_put'] = 'yes'
+        df_mgr = diskfile.DiskFileRouter(
+            self.conf, self.logger)[POLICIES.default]
+        df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c', 'o',
+                                 policy=POLICIES.default, frag_index=2)
+        rsock, wsock = socket.socketpair()
+        with closing(rsock), closing(wsock):
+            rsock.setblocking(0)
+            calls = []
+
+            def fake_trampoline(fd, read=None, timeout=None,
+                                timeout_exc=None):
+                calls.append(timeout)
+                raise timeout_exc()
+
+            with df.create() as writer:
+                # waiting for the client is cut short by the deadline
+                with mock.patch('swift.obj.diskfile.trampoline',
+                                fake_trampoline), \
+                        mock.patch('swift.obj.diskfile.time.time',
+                                   return_value=1000.0):
+                    self.assertRaises(diskfile.ChunkReadTimeout,
+                                      writer.zero_copy_receive,
+                                      rsock.fileno(), 10, timeout=5,
+                                      deadline=1002.0)
+                self.assertEqual(calls, [2.0])
+
+                # the deadline passes while the body is still coming in
+                wsock.sendall('def')
+                self.assertRaises(diskfile.ChunkReadTimeout,
+                                  writer.zero_copy_receive,
+                                  rsock.fileno(), 10, timeout=5,
+                                  deadline=time() - 1)
+
+    def test_zero_copy_receive_off_by_default(self):
+        df = self._simple_get_diskfile()
+        with df.create() as writer:
+            self.assertFalse(writer.can_zero_copy_receive())
+
     def test_create_unlink_cleanup_DiskFileNoSpace(self):
         # Test cleanup when DiskFileNoSpace() is raised.
         df = self.df_mgr.get_diskfile(self.existing_device, '0', 'abc', '123',
@@ -4310,8 +4690,102 @@ class TestSuffixHashes(unittest.TestCase):
             with mock.patch('swift.obj.diskfile.lock_path') as mock_lock:
                 df_mgr.invalidate_hash(suffix_dir)
             self.assertTrue(mock_lock.called)
+            # the invalidation is only journaled...
+            with open(hashes_file, 'rb') as f:
+                self.assertEqual(hashes, pickle.load(f))
+            invalidations_file = os.path.join(
+                part_path, diskfile.HASH_INVALIDATIONS_FILE)
+            with open(invalidations_file, 'rb') as f:
+                self.assertEqual(suffix + '\n', f.read())
+            # ...until it is consolidated into the hashes file
+            consolidated, mtime = df_mgr.consolidate_hashes(part_path)
+            self.assertEqual({suffix: None}, consolidated)
+            self.assertEqual(os.path.getmtime(hashes_file), mtime)
             with open(hashes_file, 'rb') as f:
                 self.assertEqual({suffix: None}, pickle.load(f))
+            with open(invalidations_file, 'rb') as f:
+                self.assertEqual('', f.read())
+
+    def test_invalidate_hash_journal_multiple_suffixes(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            paths, suffix = find_paths_with_matching_suffixes(2, 2)
+            df1 = df_mgr.get_diskfile('sda1', '0', *paths[suffix][0],
+                                      policy=policy)
+            df1.delete(self.ts())
+            hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertEqual([suffix], list(hashes))
+            part_path = os.path.join(self.devices, 'sda1',
+                                     diskfile.get_data_dir(policy), '0')
+            # a second write to the same suffix and a write to a new one
+            df2 = df_mgr.get_diskfile('sda1', '0', *paths[suffix][1],
+                                      policy=policy)
+            df2.delete(self.ts())
+            other_path = [p for s, p in paths.items() if s != suffix][0][0]
+            df3 = df_mgr.get_diskfile('sda1', '0', *other_path,
+                                      policy=policy)
+            df3.delete(self.ts())
+            other_suffix = os.path.basename(os.path.dirname(df3._datadir))
+            invalidations_file = os.path.join(
+                part_path, diskfile.HASH_INVALIDATIONS_FILE)
+            with open(invalidations_file, 'rb') as f:
+                self.assertEqual([suffix, other_suffix], f.read().split())
+            new_hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertEqual(sorted([suffix, other_suffix]),
+                             sorted(new_hashes))
+            self.assertNotEqual(hashes[suffix], new_hashes[suffix])
+            self.assertTrue(new_hashes[other_suffix])
+            with open(invalidations_file, 'rb') as f:
+                self.assertEqual('', f.read())
+            # nothing left to fold in or rehash
+            with mock.patch.object(df_mgr, '_hash_suffix') as mock_hash:
+                self.assertEqual(new_hashes, df_mgr.get_hashes(
+                    'sda1', '0', [], policy))
+            self.assertFalse(mock_hash.called)
+
+    def test_invalidate_hash_while_hashing(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                     policy=policy)
+            df.delete(self.ts())
+            suffix_dir = os.path.dirname(df._datadir)
+            suffix = os.path.basename(suffix_dir)
+            df_mgr.get_hashes('sda1', '0', [], policy)
+            df.delete(self.ts())
+            orig_hash_suffix = df_mgr._hash_suffix
+
+            def racing_hash_suffix(*args, **kwargs):
+                result = orig_hash_suffix(*args, **kwargs)
+                # a PUT lands after the suffix was hashed
+                df_mgr.invalidate_hash(suffix_dir)
+                return result
+
+            with mock.patch.object(df_mgr, '_hash_suffix',
+                                   racing_hash_suffix):
+                df_mgr.get_hashes('sda1', '0', [], policy)
+            # the late invalidation survives to the next pass
+            part_path = os.path.dirname(suffix_dir)
+            hashes, mtime = df_mgr.consolidate_hashes(part_path)
+            self.assertEqual({suffix: None}, hashes)
+
+    def test_consolidate_hashes_no_hashes_file(self):
+        for policy in self.iter_policies():
+            df_mgr = self.df_router[policy]
+            part_path = os.path.join(self.devices, 'sda1',
+                                     diskfile.get_data_dir(policy), '0')
+            mkdirs(part_path)
+            self.assertEqual((None, -1), df_mgr.consolidate_hashes(part_path))
+            invalidations_file = os.path.join(
+                part_path, diskfile.HASH_INVALIDATIONS_FILE)
+            self.assertFalse(os.path.exists(invalidations_file))
+            with open(invalidations_file, 'wb') as f:
+                f.write('abc\n')
+            self.assertEqual((None, -1), df_mgr.consolidate_hashes(part_path))
+            with open(invalidations_file, 'rb') as f:
+                self.assertEqual('', f.read())
+            hashes_file = os.path.join(part_path, diskfile.HASH_FILE)
+            self.assertFalse(os.path.exists(hashes_file))
 
     # invalidate_hash tests - error handling
 
@@ -5083,5 +5557,316 @@ class TestSuffixHashes(unittest.TestCase):
             ])
 
 
+@patch_policies(test_policies)
+class TestPackedDiskFile(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = tempfile.mkdtemp()
+        self.devices = os.path.join(self.testdir, 'node')
+        for device in ('sda1', 'sda2'):
+            mkdirs(os.path.join(self.devices, device,
+                                diskfile.get_tmp_dir(POLICIES[0])))
+        self._orig_tpool_exc = tpool.execute
+        tpool.execute = lambda f, *args, **kwargs: f(*args, **kwargs)
+        self.conf = dict(devices=self.devices, mount_check='false',
+                         diskfile_backend='packed', packed_object_size='100')
+        self.logger = debug_logger('test-packed')
+        self.df_mgr = diskfile.DiskFileRouter(
+            self.conf, self.logger)[POLICIES[0]]
+        self.part_path = os.path.join(self.devices, 'sda1', 'objects', '0')
+        self.ts_iter = make_timestamp_iter()
+
+    def tearDown(self):
+        tpool.execute = self._orig_tpool_exc
+        rmtree(self.testdir, ignore_errors=1)
+
+    def _get_diskfile(self, obj, df_mgr=None, device='sda1'):
+        df_mgr = df_mgr or self.df_mgr
+        return df_mgr.get_diskfile(device, '0', 'a', 'c', obj, POLICIES[0])
+
+    def _put(self, obj, body, df_mgr=None, device='sda1', timestamp=None):
+        df = self._get_diskfile(obj, df_mgr, device)
+        timestamp = timestamp or next(self.ts_iter)
+        with df.create() as writer:
+            writer.write(body)
+            writer.put({'X-Timestamp': timestamp.internal,
+                        'Content-Length': str(len(body)),
+                        'ETag': md5(body).hexdigest(),
+                        'Content-Type': 'text/plain'})
+        return df
+
+    def _read(self, obj, df_mgr=None):
+        df = self._get_diskfile(obj, df_mgr)
+        with df.open():
+            return ''.join(df.reader())
+
+    def _hsh_path(self, obj):
+        object_hash = hash_path('a', 'c', obj)
+        return os.path.join(self.part_path, object_hash[-3:], object_hash)
+
+    def test_manager(self):
+        self.assertTrue(isinstance(self.df_mgr,
+                                   diskfile.PackedDiskFileManager))
+        self.assertEqual(self.df_mgr.packed_object_size, 100)
+        router = diskfile.DiskFileRouter(self.conf, self.logger)
+        self.assertTrue(isinstance(router[POLICIES[1]],
+                                   diskfile.ECDiskFileManager))
+
+    def test_small_object_is_packed(self):
+        self._put('o', 'small body')
+        self.assertFalse(os.path.exists(self._hsh_path('o')))
+        self.assertEqual(
+            sorted(os.listdir(self.part_path)),
+            ['packed-00000000.volume', 'packed.index', 'packed.lock'])
+        self.assertEqual(os.listdir(os.path.join(
+            self.devices, 'sda1', diskfile.get_tmp_dir(POLICIES[0]))), [])
+        df = self._get_diskfile('o')
+        with df.open():
+            self.assertEqual(df.get_metadata()['name'], '/a/c/o')
+            self.assertEqual(df.content_length, 10)
+            reader = df.reader()
+            self.assertFalse(reader.can_zero_copy_send())
+            self.assertEqual(''.join(reader), 'small body')
+        df = self._get_diskfile('o')
+        with df.open():
+            self.assertEqual(
+                ''.join(df.reader().app_iter_range(2, 6)), 'all ')
+
+    def test_large_object_is_not_packed(self):
+        body = 'x' * 101
+        self._put('o', body)
+        files = os.listdir(self._hsh_path('o'))
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('.data'))
+        self.assertEqual(self._read('o'), body)
+
+    def test_overwrite_post_and_delete(self):
+        self._put('o', 'first')
+        self._put('o', 'second')
+        self.assertEqual(self._read('o'), 'second')
+        partition = self.df_mgr.get_packed_partition(self.part_path)
+        object_hash = hash_path('a', 'c', 'o')
+        self.assertEqual(len(partition.files(object_hash)), 1)
+
+        df = self._get_diskfile('o')
+        meta_ts = next(self.ts_iter)
+        df.write_metadata({'X-Timestamp': meta_ts.internal,
+                           'X-Object-Meta-Color': 'blue'})
+        df = self._get_diskfile('o')
+        with df.open():
+            self.assertEqual(df.get_metadata()['X-Object-Meta-Color'],
+                             'blue')
+            self.assertEqual(df.get_metadata()['Content-Length'], '6')
+            self.assertEqual(''.join(df.reader()), 'second')
+
+        delete_ts = next(self.ts_iter)
+        self._get_diskfile('o').delete(delete_ts)
+        with self.assertRaises(DiskFileDeleted) as cm:
+            self._get_diskfile('o').open()
+        self.assertEqual(cm.exception.timestamp, delete_ts)
+        self.assertEqual(partition.refresh().files(object_hash).keys(),
+                         [delete_ts.internal + '.ts'])
+        self.assertFalse(os.path.exists(self._hsh_path('o')))
+
+    def test_tombstone_reclaimed(self):
+        old_ts = Timestamp(time() - 2 * diskfile.ONE_WEEK)
+        self._put('o', 'body', timestamp=old_ts)
+        self._get_diskfile('o').delete(Timestamp(old_ts, offset=1))
+        self.df_mgr.get_hashes('sda1', '0', [], POLICIES[0])
+        partition = self.df_mgr.get_packed_partition(self.part_path)
+        self.assertEqual(partition.suffixes(), set())
+        self.assertRaises(DiskFileNotExist, self._get_diskfile('o').open)
+
+    def test_suffix_hashes_match_unpacked(self):
+        unpacked_mgr = diskfile.DiskFileRouter(
+            {'devices': self.devices, 'mount_check': 'false'},
+            self.logger)[POLICIES[0]]
+        self.assertFalse(isinstance(unpacked_mgr,
+                                    diskfile.PackedDiskFileManager))
+        for obj, body in (('o1', 'a'), ('o2', 'b' * 200), ('o3', 'c')):
+            timestamp = next(self.ts_iter)
+            self._put(obj, body, timestamp=timestamp)
+            self._put(obj, body, unpacked_mgr, 'sda2', timestamp=timestamp)
+        timestamp = next(self.ts_iter)
+        self._get_diskfile('o3').delete(timestamp)
+        self._get_diskfile('o3', unpacked_mgr, 'sda2').delete(timestamp)
+        packed = self.df_mgr.get_hashes('sda1', '0', [], POLICIES[0])
+        unpacked = unpacked_mgr.get_hashes('sda2', '0', [], POLICIES[0])
+        self.assertEqual(len(packed), 3)
+        self.assertEqual(packed, unpacked)
+        # suffixes only holding packed objects are found without hashes.pkl
+        os.unlink(os.path.join(self.part_path, diskfile.HASH_FILE))
+        self.assertEqual(
+            self.df_mgr.get_hashes('sda1', '0', [], POLICIES[0]), unpacked)
+
+    def test_yield_hashes_and_get_diskfile_from_hash(self):
+        ts_data = next(self.ts_iter)
+        self._put('o', 'body', timestamp=ts_data)
+        ts_meta = next(self.ts_iter)
+        self._get_diskfile('o').write_metadata(
+            {'X-Timestamp': ts_meta.internal})
+        object_hash = hash_path('a', 'c', 'o')
+        self.assertEqual(
+            list(self.df_mgr.yield_hashes('sda1', '0', POLICIES[0])),
+            [(self._hsh_path('o'), object_hash,
+              {'ts_data': ts_data, 'ts_meta': ts_meta})])
+        self.assertEqual(
+            list(self.df_mgr.yield_suffixes('sda1', '0', POLICIES[0])),
+            [(os.path.dirname(self._hsh_path('o')), object_hash[-3:])])
+        df = self.df_mgr.get_diskfile_from_hash('sda1', '0', object_hash,
+                                                POLICIES[0])
+        with df.open():
+            self.assertEqual(''.join(df.reader()), 'body')
+        self.assertRaises(DiskFileNotExist,
+                          self.df_mgr.get_diskfile_from_hash, 'sda1', '0',
+                          'f' * 32, POLICIES[0])
+
+    def test_audit_location_generator(self):
+        self._put('packed', 'body')
+        self._put('unpacked', 'b' * 200)
+        locations = list(self.df_mgr.object_audit_location_generator())
+        self.assertEqual(sorted(str(loc) for loc in locations),
+                         sorted([self._hsh_path('packed'),
+                                 self._hsh_path('unpacked')]))
+        for location in locations:
+            df = self.df_mgr.get_diskfile_from_audit_location(location)
+            with df.open():
+                self.assertTrue(''.join(df.reader()))
+        self.assertEqual(list(self.df_mgr.object_audit_location_generator(
+            device_dirs=['sda2'])), [])
+
+    def test_quarantine_on_bad_etag(self):
+        self._put('o', 'body')
+        volume = os.path.join(self.part_path, 'packed-00000000.volume')
+        with open(volume, 'r+b') as fp:
+            fp.seek(-4, os.SEEK_END)
+            fp.write('BODY')
+        df = self._get_diskfile('o')
+        with df.open():
+            body = ''.join(df.reader())
+        self.assertEqual(body, 'BODY')
+        self.assertEqual(self.logger.get_increments(), ['quarantines'])
+        self.assertRaises(DiskFileNotExist, self._get_diskfile('o').open)
+        object_hash = hash_path('a', 'c', 'o')
+        quarantined = os.path.join(self.devices, 'sda1', 'quarantined',
+                                   'objects', object_hash)
+        self.assertEqual(len(os.listdir(quarantined)), 1)
+
+    def test_quarantine_on_bad_record(self):
+        self._put('o', 'body')
+        volume = os.path.join(self.part_path, 'packed-00000000.volume')
+        with open(volume, 'r+b') as fp:
+            fp.write('JUNK')
+        self.assertRaises(DiskFileQuarantined, self._get_diskfile('o').open)
+        self.assertRaises(DiskFileNotExist, self._get_diskfile('o').open)
+
+    def test_compaction(self):
+        for i in range(10):
+            self._put('o%d' % i, 'x' * 50)
+        for i in range(6):
+            self._put('o%d' % i, 'y' * 50)
+        volume = os.path.join(self.part_path, 'packed-00000000.volume')
+        record_size = os.path.getsize(volume) / 16
+        # another process's view of the partition
+        other_mgr = diskfile.DiskFileRouter(
+            self.conf, debug_logger())[POLICIES[0]]
+        self.assertEqual(self._read('o9', other_mgr), 'x' * 50)
+
+        self.assertEqual(self.df_mgr.compact_partition(self.part_path), 0)
+        self.assertEqual(self.logger.get_increments(), [])
+        for i in range(6, 10):
+            self._put('o%d' % i, 'z' * 50)
+        # serving REPLICATE requests never compacts
+        self.df_mgr.get_hashes('sda1', '0', [], POLICIES[0])
+        self.assertTrue(os.path.exists(volume))
+        self.assertEqual(self.logger.get_increments(), [])
+        self.assertEqual(self.df_mgr.compact_partition(self.part_path),
+                         10 * record_size)
+        self.assertEqual(self.logger.get_increments(), ['packed_compactions'])
+        self.assertFalse(os.path.exists(volume))
+        self.assertEqual(os.path.getsize(
+            os.path.join(self.part_path, 'packed-00000001.volume')),
+            10 * record_size)
+        self.assertEqual(
+            self.logger.log_dict['update_stats'],
+            [(('packed_bytes_reclaimed', 10 * record_size), {})])
+        for i in range(10):
+            self.assertEqual(self._read('o%d' % i, other_mgr),
+                             ('y' if i < 6 else 'z') * 50)
+        self._put('o0', 'w')
+        self.assertEqual(self._read('o0', other_mgr), 'w')
+        self.assertEqual(sorted(
+            name for name in os.listdir(self.part_path)
+            if name.startswith('.packed-')), [])
+
+    def test_get_packed_partition_from_threads(self):
+        self._put('o1', 'one')
+        self.df_mgr._packed_partitions.clear()
+        orig_partition_cls = diskfile.PackedPartition
+
+        def slow_partition(partition_path):
+            # let the other threads look the partition up meanwhile
+            stdlib_time.sleep(0.05)
+            return orig_partition_cls(partition_path)
+
+        partitions = []
+
+        def get_partition():
+            partitions.append(
+                self.df_mgr.get_packed_partition(self.part_path))
+
+        with mock.patch('swift.obj.diskfile.PackedPartition',
+                        slow_partition):
+            threads = [stdlib_threading.Thread(target=get_partition)
+                       for _junk in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(partitions), 3)
+        self.assertTrue(partitions[0] is not None)
+        self.assertTrue(all(partition is partitions[0]
+                            for partition in partitions))
+        self.assertEqual(list(self.df_mgr._packed_partitions),
+                         [self.part_path])
+
+    def test_live_records_waits_for_refresh(self):
+        self._put('o1', 'one')
+        partition = self.df_mgr.get_packed_partition(self.part_path)
+        results = []
+        # another thread is refreshing the index
+        partition._lock.acquire()
+        try:
+            thread = stdlib_threading.Thread(
+                target=lambda: results.append(partition._live_records([0])))
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())
+            self.assertEqual(results, [])
+        finally:
+            partition._lock.release()
+        thread.join()
+        object_hash = hash_path('a', 'c', 'o1')
+        self.assertEqual([record[3:] for record in results[0]],
+                         [(object_hash, filename)
+                          for filename in partition.files(object_hash)])
+        self.assertEqual(partition._live_records([0], others=True), [])
+
+    def test_torn_index_tail(self):
+        self._put('o1', 'one')
+        with open(os.path.join(self.part_path, 'packed.index'), 'ab') as fp:
+            fp.write('\x01\x02')
+        self._put('o2', 'two')
+        other_mgr = diskfile.DiskFileRouter(
+            self.conf, debug_logger())[POLICIES[0]]
+        self.assertEqual(self._read('o1', other_mgr), 'one')
+        self.assertEqual(self._read('o2', other_mgr), 'two')
+
+    def test_remove_hash_dir(self):
+        self._put('o', 'body')
+        self.df_mgr.remove_hash_dir(self._hsh_path('o'))
+        self.assertRaises(DiskFileNotExist, self._get_diskfile('o').open)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -234,6 +234,26 @@ class TestObjectReplicator(unittest.TestCase):
                                  config,
                              ))
 
+    def test_packed_backend_forces_ssync(self):
+        log_message = 'The packed diskfile_backend requires ' \
+            'sync_method = ssync, using ssync'
+        for sync_method in (None, 'rsync', 'ssync'):
+            self.logger.clear()
+            config = {'diskfile_backend': 'packed'}
+            if sync_method:
+                config['sync_method'] = sync_method
+            replicator = object_replicator.ObjectReplicator(
+                config, logger=self.logger)
+            self.assertEqual(replicator.sync_method, replicator.ssync)
+            self.assertEqual(
+                self.logger.get_lines_for_level('warning'),
+                [] if sync_method == 'ssync' else [log_message])
+        self.logger.clear()
+        replicator = object_replicator.ObjectReplicator(
+            {'sync_method': 'rsync'}, logger=self.logger)
+        self.assertEqual(replicator.sync_method, replicator.rsync)
+        self.assertEqual(self.logger.get_lines_for_level('warning'), [])
+
     def _write_disk_data(self, disk_name):
         os.mkdir(os.path.join(self.devices, disk_name))
         objects = os.path.join(self.devices, disk_name,
@@ -1438,7 +1458,7 @@ class TestObjectReplicator(unittest.TestCase):
                     mount_check='false', timeout='300', stats_interval='1')
         replicator = object_replicator.ObjectReplicator(conf)
         was_connector = object_replicator.http_connect
-        was_get_hashes = object_replicator.DiskFileManager._get_hashes
+        was_get_hashes = diskfile.DiskFileManager._get_hashes
         was_execute = tpool.execute
         self.get_hash_count = 0
         try:
@@ -1456,7 +1476,7 @@ class TestObjectReplicator(unittest.TestCase):
 
             self.i_failed = False
             object_replicator.http_connect = mock_http_connect(200)
-            object_replicator.DiskFileManager._get_hashes = fake_get_hashes
+            diskfile.DiskFileManager._get_hashes = fake_get_hashes
             replicator.logger.exception = \
                 lambda *args, **kwargs: fake_exc(self, *args, **kwargs)
             # Write some files into '1' and run replicate- they should be moved
@@ -1493,7 +1513,7 @@ class TestObjectReplicator(unittest.TestCase):
             self.assertFalse(self.i_failed)
         finally:
             object_replicator.http_connect = was_connector
-            object_replicator.DiskFileManager._get_hashes = was_get_hashes
+            diskfile.DiskFileManager._get_hashes = was_get_hashes
             tpool.execute = was_execute
 
     def test_run(self):
@@ -1514,6 +1534,21 @@ class TestObjectReplicator(unittest.TestCase):
         self.replicator.sync_method.assert_called_once_with(
             'node', 'job', 'suffixes')
 
+    def test_update_compacts_partition(self):
+        jobs = [job for job in self.replicator.collect_jobs()
+                if not job['delete']]
+        self.replicator.sync = mock.MagicMock(return_value=(True, []))
+        self.replicator.replication_count = 0
+        self.replicator.suffix_hash = self.replicator.suffix_sync = 0
+        self.replicator.suffix_count = 0
+        self.replicator.partition_times = []
+        with mock.patch('swift.obj.replicator.http_connect',
+                        mock_http_connect(200)), \
+                mock.patch.object(self.replicator._diskfile_mgr,
+                                  'compact_partition') as mock_compact:
+            self.replicator.update(jobs[0])
+        mock_compact.assert_called_once_with(jobs[0]['path'])
+
     @mock.patch('swift.obj.replicator.tpool_reraise', autospec=True)
     @mock.patch('swift.obj.replicator.http_connect', autospec=True)
     def test_update(self, mock_http, mock_tpool_reraise):
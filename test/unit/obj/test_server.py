@@ -6068,6 +6068,7 @@ class TestZeroCopy(unittest.TestCase):
         conf = {'devices': self.testdir,
                 'mount_check': 'false',
                 'splice': 'yes',
+                'splice_put': 'yes',
                 'disk_chunk_size': '4096'}
         self.object_controller = object_server.ObjectController(
             conf, logger=debug_logger())
@@ -6120,6 +6121,144 @@ class TestZeroCopy(unittest.TestCase):
         contents = response.read()
         self.assertEqual(contents, obj_contents)
 
+    def test_GET_range(self):
+        obj_contents = ''.join(chr(i % 251) for i in range(100000))
+        url_path = '/sda1/2100/a/c/o'
+
+        self.http_conn.request('PUT', url_path, obj_contents,
+                               {'X-Timestamp': '1402600322.52126'})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 201)
+        response.read()
+
+        with mock.patch('swift.obj.diskfile.BaseDiskFileReader.'
+                        '_app_iter_range') as mock_app_iter_range:
+            self.http_conn.request('GET', url_path,
+                                   headers={'Range': 'bytes=1000-49999'})
+            response = self.http_conn.getresponse()
+            self.assertEqual(response.status, 206)
+            self.assertEqual(response.getheader('Content-Range'),
+                             'bytes 1000-49999/100000')
+            self.assertEqual(response.read(), obj_contents[1000:50000])
+        self.assertFalse(mock_app_iter_range.called)
+
+    def test_GET_multiple_ranges(self):
+        obj_contents = ''.join(chr(i % 251) for i in range(100000))
+        url_path = '/sda1/2100/a/c/o'
+
+        self.http_conn.request('PUT', url_path, obj_contents,
+                               {'X-Timestamp': '1402600322.52126',
+                                'Content-Type': 'application/octet-stream'})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 201)
+        response.read()
+
+        self.http_conn.request('GET', url_path,
+                               headers={'Range': 'bytes=10-19,-100'})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 206)
+        content_type = response.getheader('Content-Type')
+        self.assertTrue(content_type.startswith(
+            'multipart/byteranges;boundary='))
+        boundary = content_type.split('=', 1)[1]
+        body = response.read()
+        self.assertEqual(len(body), int(response.getheader('Content-Length')))
+        self.assertEqual(body.split('\r\n'), [
+            '--' + boundary,
+            'Content-Type: application/octet-stream',
+            'Content-Range: bytes 10-19/100000',
+            '',
+            obj_contents[10:20],
+            '--' + boundary,
+            'Content-Type: application/octet-stream',
+            'Content-Range: bytes 99900-99999/100000',
+            '',
+            obj_contents[-100:],
+            '--' + boundary + '--'])
+
+    def test_GET_not_modified(self):
+        url_path = '/sda1/2100/a/c/o'
+
+        self.http_conn.request('PUT', url_path, 'obj contents',
+                               {'X-Timestamp': '1402600322.52126'})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 201)
+        response.read()
+
+        self.http_conn.request('GET', url_path, headers={
+            'If-None-Match': md5('obj contents').hexdigest()})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.read(), '')
+
+    def test_PUT_big(self):
+        obj_contents = ''.join(chr(i % 251) for i in range(1024 * 1024))
+        url_path = '/sda1/2100/a/c/o'
+
+        with mock.patch('swift.obj.diskfile.BaseDiskFileWriter.write') as \
+                mock_write:
+            self.http_conn.request('PUT', url_path, obj_contents,
+                                   {'X-Timestamp': '1402600322.52126',
+                                    'ETag': md5(obj_contents).hexdigest()})
+            response = self.http_conn.getresponse()
+            self.assertEqual(response.status, 201)
+            response.read()
+        self.assertFalse(mock_write.called)
+
+        # the connection is still good for the next request
+        self.http_conn.request('GET', url_path)
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Etag'),
+                         md5(obj_contents).hexdigest())
+        self.assertEqual(response.read(), obj_contents)
+
+    def test_PUT_etag_mismatch(self):
+        url_path = '/sda1/2100/a/c/o'
+
+        self.http_conn.request('PUT', url_path, 'obj contents',
+                               {'X-Timestamp': '1402600322.52126',
+                                'ETag': md5('other contents').hexdigest()})
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 422)
+        response.read()
+
+    def test_PUT_max_upload_time(self):
+        self.object_controller.max_upload_time = 0
+        self.http_conn.putrequest('PUT', '/sda1/2100/a/c/o')
+        self.http_conn.putheader('X-Timestamp', '1402600322.52126')
+        self.http_conn.putheader('Content-Type', 'text/plain')
+        self.http_conn.putheader('Content-Length', '1000')
+        self.http_conn.endheaders()
+        # the client is too slow to send the rest of the body
+        self.http_conn.send('A' * 100)
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 408)
+        response.read()
+        self.assertEqual(
+            self.object_controller.logger.get_increment_counts(),
+            {'PUT.timeouts': 1})
+
+    def test_PUT_chunked_is_not_zero_copy(self):
+        url_path = '/sda1/2100/a/c/o'
+
+        self.http_conn.putrequest('PUT', url_path)
+        self.http_conn.putheader('X-Timestamp', '1402600322.52126')
+        self.http_conn.putheader('Transfer-Encoding', 'chunked')
+        self.http_conn.endheaders()
+        with mock.patch('swift.obj.diskfile.BaseDiskFileWriter.'
+                        'zero_copy_receive') as mock_receive:
+            self.http_conn.send('c\r\nobj contents\r\n0\r\n\r\n')
+            response = self.http_conn.getresponse()
+            self.assertEqual(response.status, 201)
+            response.read()
+        self.assertFalse(mock_receive.called)
+
+        self.http_conn.request('GET', url_path)
+        response = self.http_conn.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), 'obj contents')
+
     def test_quarantine(self):
         obj_hash = hash_path('a', 'c', 'o')
         url_path = '/sda1/2100/a/c/o'
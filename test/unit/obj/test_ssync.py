@@ -28,7 +28,7 @@ from swift.common.exceptions import DiskFileNotExist, DiskFileError, \
 from swift.common import utils
 from swift.common.storage_policy import POLICIES
 from swift.common.utils import Timestamp
-from swift.obj import ssync_sender, server
+from swift.obj import diskfile, ssync_sender, server
 from swift.obj.reconstructor import RebuildingECDiskFileStream
 
 from test.unit import patch_policies
@@ -672,6 +672,62 @@ class TestSsyncReplication(TestBaseSsync):
         #    TOTAL =   80
         self.assertEqual(80, trace.get('readline_bytes'))
 
+    def test_sync_packed(self):
+        policy = POLICIES.default
+        conf = {'mount_check': 'false', 'diskfile_backend': 'packed'}
+        self.daemon._diskfile_router = diskfile.DiskFileRouter(
+            dict(conf, devices=self.tx_testdir), self.daemon.logger)
+        self.daemon._diskfile_mgr = self.daemon._diskfile_router[policy]
+        self.rx_controller._diskfile_router = diskfile.DiskFileRouter(
+            dict(conf, devices=self.rx_testdir), self.rx_controller.logger)
+        tx_df_mgr = self.daemon._diskfile_mgr
+        rx_df_mgr = self.rx_controller._diskfile_router[policy]
+        metadata = {'Content-Type': 'text/plain'}
+        # o1 is on tx only, o2 is newer on tx, o3 is deleted on tx
+        self._make_open_diskfile(obj='o1', extra_metadata=metadata,
+                                 df_mgr=tx_df_mgr)
+        self._make_open_diskfile(obj='o2', body='old', extra_metadata=metadata,
+                                 timestamp=next(self.ts_iter),
+                                 df_mgr=rx_df_mgr)
+        self._make_open_diskfile(obj='o2', body='new', extra_metadata=metadata,
+                                 timestamp=next(self.ts_iter),
+                                 df_mgr=tx_df_mgr)
+        t3 = next(self.ts_iter)
+        self._make_open_diskfile(obj='o3', extra_metadata=metadata,
+                                 timestamp=t3, df_mgr=rx_df_mgr)
+        self._make_open_diskfile(obj='o3', extra_metadata=metadata,
+                                 timestamp=t3,
+                                 df_mgr=tx_df_mgr).delete(next(self.ts_iter))
+        part_path = os.path.join(self.tx_testdir, self.device,
+                                 diskfile.get_data_dir(policy), self.partition)
+        suffixes = tx_df_mgr.get_packed_partition(part_path).suffixes()
+        # nothing has a hash dir
+        self.assertEqual([name for name in os.listdir(part_path)
+                          if len(name) == 3], [])
+
+        job = {'device': self.device,
+               'partition': self.partition,
+               'policy': policy}
+        node = dict(self.rx_node)
+        node.update({'index': 0})
+        sender = ssync_sender.Sender(self.daemon, node, job, suffixes)
+        sender.connect, trace = self.make_connect_wrapper(sender)
+        success, in_sync_objs = sender()
+        self.assertTrue(success)
+        self.assertEqual(3, len(in_sync_objs))
+        results = self._analyze_trace(trace)
+        self.assertEqual(
+            ['/a/c/o1', '/a/c/o2', '/a/c/o3'],
+            sorted(subreq['path'] for subreq in results['tx_updates']))
+
+        rx_df = self._open_rx_diskfile('o2', policy)
+        self.assertEqual(''.join(rx_df.reader()), 'new')
+        self._verify_tombstones({'o3': None}, policy)
+        tx_hashes = tx_df_mgr.get_hashes(self.device, self.partition, [],
+                                         policy)
+        self.assertEqual(tx_hashes, rx_df_mgr.get_hashes(
+            self.device, self.partition, [], policy))
+
     def test_meta_file_sync(self):
         policy = POLICIES.default
         rx_node_index = 0
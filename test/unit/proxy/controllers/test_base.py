@@ -17,19 +17,22 @@ import itertools
 from collections import defaultdict
 import unittest
 from mock import patch
+
+import eventlet
 from swift.proxy.controllers.base import headers_to_container_info, \
     headers_to_account_info, headers_to_object_info, get_container_info, \
     get_container_memcache_key, get_account_info, get_account_memcache_key, \
     get_object_env_key, get_info, get_object_info, \
     Controller, GetOrHeadHandler, _set_info_cache, _set_object_info_cache, \
-    bytes_to_skip
+    bytes_to_skip, HedgeTracker, InfoCache, clear_info_cache, prefetch_info
 from swift.common.swob import Request, HTTPException, HeaderKeyDict, \
     RESPONSE_REASONS
 from swift.common import exceptions
 from swift.common.utils import split_path
 from swift.common.http import is_success
 from swift.common.storage_policy import StoragePolicy
-from test.unit import fake_http_connect, FakeRing, FakeMemcache
+from test.unit import fake_http_connect, FakeRing, FakeMemcache, \
+    debug_logger
 from swift.proxy import server as proxy_server
 from swift.common.request_helpers import get_sys_meta_prefix
 
@@ -140,6 +143,14 @@ class FakeApp(object):
         return iter(response.body)
 
 
+class SlowFakeApp(FakeApp):
+
+    def __call__(self, environ, start_response):
+        # let other requests come along while this one's in flight
+        eventlet.sleep(0.01)
+        return super(SlowFakeApp, self).__call__(environ, start_response)
+
+
 class FakeCache(FakeMemcache):
     def __init__(self, stub=None, **pre_cached):
         super(FakeCache, self).__init__()
@@ -151,6 +162,26 @@ class FakeCache(FakeMemcache):
         return self.stub or self.store.get(key)
 
 
+class CountingCache(FakeMemcache):
+    def __init__(self):
+        super(CountingCache, self).__init__()
+        self.gets = 0
+
+    def get(self, key):
+        self.gets += 1
+        return super(CountingCache, self).get(key)
+
+
+class GetManyCache(CountingCache):
+    def __init__(self):
+        super(GetManyCache, self).__init__()
+        self.get_manys = []
+
+    def get_many(self, keys):
+        self.get_manys.append(list(keys))
+        return [self.store.get(key) for key in keys]
+
+
 @patch_policies([StoragePolicy(0, 'zero', True, object_ring=FakeRing())])
 class TestFuncs(unittest.TestCase):
     def setUp(self):
@@ -302,6 +333,169 @@ class TestFuncs(unittest.TestCase):
         # add account was NOT called AGAIN
         self.assertEqual(app.responses.stats['account'], 1)
 
+    def test_get_info_info_cache(self):
+        app = FakeApp()
+        app.info_cache = InfoCache(10, 1, 0.5)
+        app.logger = debug_logger('test')
+        memcache = CountingCache()
+        # the first request fetches the info from the backend, and
+        # caches it both in memcache and the info cache
+        for i in range(100):
+            env = {'swift.cache': memcache}
+            info = get_info(app, env, 'a', 'c')
+            self.assertEqual(info['status'], 200)
+            self.assertEqual(info['object_count'], 1000)
+            # which requests may change
+            info['meta']['changed'] = 'yes'
+        self.assertEqual(app.responses.stats['account'], 1)
+        self.assertEqual(app.responses.stats['container'], 1)
+        self.assertEqual(memcache.gets, 2)
+        self.assertEqual({'info_cache.hit': 99, 'info_cache.miss': 2},
+                         app.logger.get_increment_counts())
+
+        # a worker that finds the info in memcache caches it too
+        app.info_cache.reset()
+        for i in range(100):
+            get_info(app, {'swift.cache': memcache}, 'a', 'c')
+        self.assertEqual(memcache.gets, 3)
+        self.assertEqual(app.responses.stats['container'], 1)
+
+        # writes clear the info cache; the account info is then found in
+        # memcache, the container info on the backend
+        clear_info_cache(app, {'swift.cache': memcache}, 'a', 'c')
+        get_info(app, {'swift.cache': memcache}, 'a', 'c')
+        self.assertEqual(memcache.gets, 5)
+        self.assertEqual(app.responses.stats['container'], 2)
+
+    def test_get_info_coalesced(self):
+        app = SlowFakeApp()
+        pool = eventlet.GreenPool()
+        envs = [{} for i in range(10)]
+        threads = [pool.spawn(get_info, app, env, 'a', 'c') for env in envs]
+        infos = [thread.wait() for thread in threads]
+        # only one request of each went to the backend
+        self.assertEqual(app.responses.stats['account'], 1)
+        self.assertEqual(app.responses.stats['container'], 1)
+        for env, info in zip(envs, infos):
+            self.assertEqual(info['status'], 200)
+            self.assertEqual(info, infos[0])
+            self.assertIs(env['swift.container/a/c'], info)
+        # each request got its own copy
+        self.assertEqual(len(set(id(info) for info in infos)), 10)
+
+        # the requests that waited get the same answer as the one that
+        # went to the backend
+        app = SlowFakeApp(statuses=[404, 404])
+        threads = [pool.spawn(get_info, app, {}, 'a', ret_not_found=True)
+                   for i in range(3)]
+        threads += [pool.spawn(get_info, app, {}, 'a') for i in range(3)]
+        infos = [thread.wait() for thread in threads]
+        self.assertEqual(app.responses.stats['account'], 1)
+        self.assertEqual([info and info['status'] for info in infos],
+                         [404] * 3 + [None] * 3)
+
+        # once done, the next miss goes to the backend again
+        get_info(app, {}, 'a')
+        self.assertEqual(app.responses.stats['account'], 2)
+
+    def test_get_info_coalesced_error(self):
+        def fail(*args):
+            eventlet.sleep(0.01)
+            raise Exception('kaboom')
+
+        app = FakeApp()
+        pool = eventlet.GreenPool()
+        with patch('swift.proxy.controllers.base._get_info_from_backend',
+                   fail):
+            leader = pool.spawn(get_info, app, {}, 'a')
+            eventlet.sleep(0)
+            waiter = pool.spawn(get_info, app, {}, 'a')
+            self.assertRaises(Exception, leader.wait)
+            self.assertIsNone(waiter.wait())
+
+    def test_get_info_skip_cache(self):
+        app = FakeApp()
+        app.logger = debug_logger('test')
+        app.container_existence_skip_cache = 0.01
+        memcache = FakeCache(**{
+            'container/a/c': {'status': 200, 'object_count': 42},
+            'account/a': {'status': 200}})
+        with patch('swift.proxy.controllers.base.random.random',
+                   return_value=0.5):
+            info = get_info(app, {'swift.cache': memcache}, 'a', 'c')
+        self.assertEqual(info['object_count'], 42)
+        self.assertEqual(app.responses.stats['container'], 0)
+        with patch('swift.proxy.controllers.base.random.random',
+                   return_value=0.005):
+            info = get_info(app, {'swift.cache': memcache}, 'a', 'c')
+        # the info was refreshed from the backend
+        self.assertEqual(info['object_count'], 1000)
+        self.assertEqual(app.responses.stats['account'], 0)
+        self.assertEqual(app.responses.stats['container'], 1)
+        self.assertEqual(
+            memcache.store['container/a/c']['object_count'], 1000)
+        self.assertEqual({'info_cache.refresh': 1},
+                         app.logger.get_increment_counts())
+
+    def test_get_info_get_many(self):
+        app = FakeApp()
+        memcache = GetManyCache()
+        get_info(app, {'swift.cache': memcache}, 'a', 'c')
+        self.assertEqual(app.responses.stats['account'], 1)
+        self.assertEqual(app.responses.stats['container'], 1)
+        # the account's info is looked up with the container's, and isn't
+        # looked up again once it's known to be missing
+        self.assertEqual(memcache.get_manys, [['container/a/c', 'account/a']])
+        self.assertEqual(memcache.gets, 0)
+
+        # both are found at once
+        env = {'swift.cache': memcache}
+        info = get_info(app, env, 'a', 'c')
+        self.assertEqual(info['status'], 200)
+        self.assertEqual(env['swift.account/a']['status'], 200)
+        self.assertEqual(len(memcache.get_manys), 2)
+        self.assertEqual(app.responses.stats['container'], 1)
+        # and the account's info isn't looked up again
+        get_info(app, env, 'a')
+        self.assertEqual(len(memcache.get_manys), 2)
+        self.assertEqual(memcache.gets, 0)
+
+    def test_prefetch_info(self):
+        app = FakeApp()
+        memcache = GetManyCache()
+        memcache.set('account/a', {'status': 200, 'total_object_count': 5})
+        memcache.set('container/a/c', {'status': 200, 'object_count': 2})
+        memcache.set('token', 'value')
+        env = {'swift.cache': memcache}
+        self.assertEqual(
+            prefetch_info(env, app, 'a', 'c', ['token', 'missing']),
+            ['value', None])
+        self.assertEqual(memcache.get_manys, [
+            ['account/a', 'container/a/c', 'token', 'missing']])
+        self.assertEqual(get_info(app, env, 'a')['total_object_count'], 5)
+        self.assertEqual(get_info(app, env, 'a', 'c')['object_count'], 2)
+        self.assertEqual(len(memcache.get_manys), 1)
+        self.assertEqual(memcache.gets, 0)
+        self.assertEqual(app.responses.stats['account'], 0)
+        self.assertEqual(app.responses.stats['container'], 0)
+
+        # info already in env isn't looked up again
+        self.assertEqual(prefetch_info(env, app, 'a', 'c', ['token']),
+                         ['value'])
+        self.assertEqual(memcache.gets, 1)
+        self.assertEqual(len(memcache.get_manys), 1)
+
+        # without get_many only the other keys are looked up
+        memcache = CountingCache()
+        memcache.set('token', 'value')
+        env = {'swift.cache': memcache}
+        self.assertEqual(prefetch_info(env, app, 'a', 'c', ['token']),
+                         ['value'])
+        self.assertEqual(memcache.gets, 1)
+        self.assertNotIn('swift.account/a', env)
+        self.assertEqual(prefetch_info({}, app, 'a', 'c', ['token']),
+                         [None])
+
     def test_get_container_info_swift_source(self):
         app = FakeApp()
         req = Request.blank("/v1/a/c", environ={'swift.cache': FakeCache()})
@@ -828,3 +1022,110 @@ class TestFuncs(unittest.TestCase):
         # prime numbers
         self.assertEqual(bytes_to_skip(11, 7), 4)
         self.assertEqual(bytes_to_skip(97, 7873823), 55)
+
+
+class TestInfoCache(unittest.TestCase):
+    def test_get_and_set(self):
+        cache = InfoCache(10, 2, 1)
+        self.assertIsNone(cache.get('container/a/c'))
+        info = {'status': 200, 'object_count': 3, 'meta': {'a': 'b'}}
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=1000):
+            cache.set('container/a/c', info)
+            cache.set('container/a/missing', {'status': 404})
+            cache.set('container/a/error', {'status': 503})
+            cached = cache.get('container/a/c')
+            self.assertEqual(cached, info)
+            # callers get copies
+            cached['meta']['a'] = 'c'
+            self.assertEqual(cache.get('container/a/c'), info)
+            self.assertEqual(cache.get('container/a/missing'),
+                             {'status': 404})
+            self.assertIsNone(cache.get('container/a/error'))
+        # missing containers are cached for less time
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=1001.5):
+            self.assertEqual(cache.get('container/a/c'), info)
+            self.assertIsNone(cache.get('container/a/missing'))
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=1002.5):
+            self.assertIsNone(cache.get('container/a/c'))
+        self.assertEqual(len(cache.mapping), 0)
+
+    def test_set_again(self):
+        cache = InfoCache(2, 1, 1)
+        cache.set('account/a', {'status': 200, 'bytes': 1})
+        cache.set('account/a', {'status': 200, 'bytes': 2})
+        cache.set('account/b', {'status': 200, 'bytes': 3})
+        self.assertEqual(cache.get('account/a')['bytes'], 2)
+        cache.set('account/a', {'status': 503})
+        self.assertIsNone(cache.get('account/a'))
+        self.assertEqual(cache.get('account/b')['bytes'], 3)
+
+    def test_lru(self):
+        cache = InfoCache(2, 1, 1)
+        cache.set('account/a', {'status': 200})
+        cache.set('account/b', {'status': 200})
+        cache.get('account/a')
+        cache.set('account/c', {'status': 200})
+        self.assertIsNone(cache.get('account/b'))
+        self.assertIsNotNone(cache.get('account/a'))
+        self.assertIsNotNone(cache.get('account/c'))
+
+    def test_negative_ttl_zero(self):
+        cache = InfoCache(2, 1, 0)
+        cache.set('account/a', {'status': 404})
+        self.assertIsNone(cache.get('account/a'))
+        cache.delete('account/a')
+
+
+class TestHedgeTracker(unittest.TestCase):
+    def test_delay(self):
+        tracker = HedgeTracker(90, 0.02, 0.5, 0.1)
+        # not enough response times yet
+        for i in range(tracker.min_samples - 1):
+            tracker.record(0.03)
+        self.assertEqual(tracker.delay, 0.5)
+
+        tracker = HedgeTracker(90, 0.02, 0.5, 0.1)
+        for i in range(100):
+            tracker.record(0.001 * (i + 1))
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=1000):
+            self.assertAlmostEqual(tracker.delay, 0.091)
+            # it takes a while to notice new response times
+            for i in range(100):
+                tracker.record(0.1)
+            self.assertAlmostEqual(tracker.delay, 0.091)
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=1000 + tracker.update_interval):
+            self.assertAlmostEqual(tracker.delay, 0.1)
+
+    def test_delay_bounds(self):
+        tracker = HedgeTracker(50, 0.02, 0.5, 0.1)
+        for i in range(tracker.min_samples):
+            tracker.record(0.001)
+        self.assertEqual(tracker.delay, 0.02)
+
+        tracker = HedgeTracker(50, 0.02, 0.5, 0.1)
+        for i in range(tracker.min_samples):
+            tracker.record(3)
+        self.assertEqual(tracker.delay, 0.5)
+
+    def test_max_ratio(self):
+        tracker = HedgeTracker(95, 0.01, 1, 0.25)
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=1000):
+            allowed = []
+            for i in range(8):
+                allowed.append(tracker.start_request())
+                if allowed[-1]:
+                    tracker.hedged()
+            self.assertEqual(allowed, [True, False, False, False,
+                                       True, False, False, False])
+        # old requests and hedges count for less as time goes by
+        with patch('swift.proxy.controllers.base.time.time',
+                   return_value=1000 + tracker.decay_interval):
+            self.assertTrue(tracker.start_request())
+            self.assertEqual(tracker.requests, 5)
+            self.assertEqual(tracker.hedges, 1)
@@ -17,6 +17,7 @@
 import email.parser
 import itertools
 import random
+import threading
 import time
 import unittest
 from collections import defaultdict
@@ -25,6 +26,7 @@ import json
 from hashlib import md5
 
 import mock
+import eventlet
 from eventlet import Timeout
 from six import BytesIO
 from six.moves import range
@@ -398,6 +400,14 @@ class BaseObjectControllerMixin(object):
             resp = req.get_response(self.app)
         self.assertEqual(resp.status_int, 200)
 
+    def test_HEAD_x_newest_last_node_fails(self):
+        req = swift.common.swob.Request.blank('/v1/a/c/o', method='HEAD',
+                                              headers={'X-Newest': 'true'})
+        # the first node answers, every later one fails
+        with set_http_connect(200, Exception('kaboom')):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+
     def test_HEAD_x_newest_different_timestamps(self):
         req = swob.Request.blank('/v1/a/c/o', method='HEAD',
                                  headers={'X-Newest': 'true'})
@@ -535,6 +545,25 @@ class TestReplicatedObjController(BaseObjectControllerMixin,
             resp = req.get_response(self.app)
         self.assertEqual(resp.status_int, 201)
 
+    def test_PUT_phase_times(self):
+        req = swift.common.swob.Request.blank(
+            '/v1/a/c/o', method='PUT', body='test body',
+            environ={'swift.phase_times': {}})
+        with set_http_connect(201, 201, 201):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 201)
+        self.assertEqual(
+            sorted(req.environ['swift.phase_times']),
+            ['connect', 'expect', 'quorum', 'transfer'])
+
+        # nothing is timed unless asked for
+        req = swift.common.swob.Request.blank(
+            '/v1/a/c/o', method='PUT', body='test body')
+        with set_http_connect(201, 201, 201):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 201)
+        self.assertNotIn('swift.phase_times', req.environ)
+
     def test_PUT_empty_bad_etag(self):
         req = swift.common.swob.Request.blank('/v1/a/c/o', method='PUT')
         req.headers['Content-Length'] = '0'
@@ -700,6 +729,67 @@ class TestReplicatedObjController(BaseObjectControllerMixin,
             resp = req.get_response(self.app)
         self.assertEqual(resp.status_int, 200)
 
+    def test_GET_hedged(self):
+        self.app.hedged_gets = True
+        # no response times seen yet, so this is the hedging delay
+        self.app.hedge_max_delay = 0.01
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        codes = [FakeStatus(200, response_sleep=0.5), 200]
+        with set_http_connect(*codes, body_iter=['slow', 'fast']):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.body, 'fast')
+        self.assertEqual({'hedged_gets.issued': 1, 'hedged_gets.won': 1},
+                         self.logger.get_increment_counts())
+
+    def test_GET_hedged_first_node_wins(self):
+        self.app.hedged_gets = True
+        self.app.hedge_max_delay = 0.01
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        codes = [FakeStatus(200, response_sleep=0.05),
+                 FakeStatus(200, response_sleep=0.5)]
+        with set_http_connect(*codes, body_iter=['first', 'second']):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.body, 'first')
+        self.assertEqual({'hedged_gets.issued': 1},
+                         self.logger.get_increment_counts())
+
+    def test_GET_hedged_error(self):
+        self.app.hedged_gets = True
+        self.app.hedge_max_delay = 0.01
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        # the hedge's error doesn't stop the first node's response being used
+        codes = [FakeStatus(200, response_sleep=0.05), 503]
+        with set_http_connect(*codes):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual({'hedged_gets.issued': 1},
+                         self.logger.get_increment_counts())
+
+    def test_GET_not_hedged(self):
+        self.app.hedged_gets = True
+        self.app.hedge_max_delay = 0.5
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        with set_http_connect(FakeStatus(200, response_sleep=0.01)):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual({}, self.logger.get_increment_counts())
+
+        # over the policy's hedge ratio
+        self.app.hedge_max_delay = 0.01
+        self.app.hedge_policy_max_ratios = {self.policy.idx: 0.5}
+        self.app.hedge_trackers.clear()
+        codes = [FakeStatus(200, response_sleep=0.05), 200] + \
+            [FakeStatus(200, response_sleep=0.05)]
+        with set_http_connect(*codes, body_iter=['slow', 'fast', 'slow']):
+            resp = req.get_response(self.app)
+            self.assertEqual(resp.body, 'fast')
+            resp = req.get_response(self.app)
+            self.assertEqual(resp.body, 'slow')
+        self.assertEqual({'hedged_gets.issued': 1, 'hedged_gets.won': 1},
+                         self.logger.get_increment_counts())
+
     def test_GET_handoff(self):
         req = swift.common.swob.Request.blank('/v1/a/c/o')
         codes = [503] * self.obj_ring.replicas + [200]
@@ -1182,6 +1272,52 @@ class TestECObjController(BaseObjectControllerMixin, unittest.TestCase):
             resp = req.get_response(self.app)
         self.assertEqual(resp.status_int, 200)
 
+    def test_GET_prefers_data_fragments(self):
+        ip_to_index = dict((node['ip'], node['index'])
+                           for node in self.obj_ring.get_part_nodes(1))
+
+        def do_get():
+            connected = []
+
+            def capture_connect(ip, port, device, part, method, path,
+                                headers, **kwargs):
+                connected.append(ip_to_index[ip])
+
+            req = swift.common.swob.Request.blank('/v1/a/c/o')
+            get_resp = [200] * self.policy.ec_ndata
+            with set_http_connect(*get_resp, give_connect=capture_connect):
+                resp = req.get_response(self.app)
+            self.assertEqual(resp.status_int, 200)
+            return sorted(connected)
+
+        data_indexes = list(range(self.policy.ec_ndata))
+        # put the parity nodes first when shuffling
+        with mock.patch('swift.proxy.server.shuffle',
+                        lambda nodes: nodes.reverse()):
+            self.assertEqual(do_get(), data_indexes)
+            self.app.ec_prefer_data_fragments = False
+            self.assertNotEqual(do_get(), data_indexes)
+
+    def test_GET_data_only_gets_metric(self):
+        ndata = self.policy.ec_ndata
+        headers = [{'X-Object-Sysmeta-Ec-Frag-Index': str(i)}
+                   for i in range(ndata)]
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        with set_http_connect(*([200] * ndata), headers=headers):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(
+            self.logger.get_increment_counts().get('ec_data_only_gets'), 1)
+
+        # one parity fragment has to be decoded with the data
+        headers[0] = {'X-Object-Sysmeta-Ec-Frag-Index': str(ndata)}
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        with set_http_connect(*([200] * ndata), headers=headers):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(
+            self.logger.get_increment_counts().get('ec_data_only_gets'), 1)
+
     def test_GET_error(self):
         req = swift.common.swob.Request.blank('/v1/a/c/o')
         get_resp = [503] + [200] * self.policy.ec_ndata
@@ -1225,6 +1361,60 @@ class TestECObjController(BaseObjectControllerMixin, unittest.TestCase):
         self.assertEqual(len(real_body), len(resp.body))
         self.assertEqual(real_body, resp.body)
 
+    def _record_ec_threads(self, method):
+        # run the policy's pyeclib method for real, noting the thread
+        threads = []
+        real_method = getattr(self.policy.pyeclib_driver, method)
+
+        def record(*args):
+            threads.append(threading.current_thread())
+            return real_method(*args)
+
+        patcher = mock.patch.object(self.policy.pyeclib_driver, method,
+                                    record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return threads
+
+    def test_GET_with_body_ec_threads(self):
+        self.app.ec_threads = 2
+        self.addCleanup(self.app.get_ec_threadpool().terminate)
+        segment_size = self.policy.ec_segment_size
+        real_body = ('asdf' * segment_size)[:-10]
+        ec_archive_bodies = self._make_ec_archive_bodies(real_body)
+        threads = self._record_ec_threads('decode')
+        headers = {'X-Object-Sysmeta-Ec-Content-Length': str(len(real_body))}
+        status_codes = [200] * self.policy.ec_ndata
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        with set_http_connect(*status_codes, body_iter=ec_archive_bodies,
+                              headers=headers):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(real_body, resp.body)
+        # every segment was decoded outside the hub's thread
+        self.assertEqual(len(threads), 4)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_decode_segments_pipelined(self):
+        decoded = []
+
+        def decode(fragments):
+            decoded.append(fragments[0])
+            return fragments[0].upper()
+
+        policy = mock.MagicMock()
+        policy.pyeclib_driver.decode.side_effect = decode
+        app_iter = obj.ECAppIter('/a/c/o', policy, [], [], 0, 0,
+                                 self.logger, pipeline_depth=2)
+        frag_iters = [(frag for frag in ['a', 'b', 'c']) for i in range(2)]
+        seg_iter = app_iter._decode_segments_from_fragments(frag_iters)
+        self.assertEqual(next(seg_iter), 'A')
+        eventlet.sleep(0)
+        # the next segment was decoded while the first one was used
+        self.assertEqual(decoded, ['a', 'b'])
+        self.assertEqual(list(seg_iter), ['B', 'C'])
+        self.assertEqual(decoded, ['a', 'b', 'c'])
+
     def test_PUT_simple(self):
         req = swift.common.swob.Request.blank('/v1/a/c/o', method='PUT',
                                               body='')
@@ -1237,6 +1427,41 @@ class TestECObjController(BaseObjectControllerMixin, unittest.TestCase):
             resp = req.get_response(self.app)
         self.assertEqual(resp.status_int, 201)
 
+    def test_PUT_phase_times(self):
+        req = swift.common.swob.Request.blank(
+            '/v1/a/c/o', method='PUT', body='test body',
+            environ={'swift.phase_times': {}})
+        codes = [201] * self.replicas()
+        expect_headers = {
+            'X-Obj-Metadata-Footer': 'yes',
+            'X-Obj-Multiphase-Commit': 'yes'
+        }
+        with set_http_connect(*codes, expect_headers=expect_headers):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 201)
+        self.assertEqual(
+            sorted(req.environ['swift.phase_times']),
+            ['connect', 'expect', 'quorum', 'transfer'])
+
+    def test_PUT_with_body_ec_threads(self):
+        self.app.ec_threads = 2
+        self.addCleanup(self.app.get_ec_threadpool().terminate)
+        threads = self._record_ec_threads('encode')
+        segment_size = self.policy.ec_segment_size
+        req = swift.common.swob.Request.blank(
+            '/v1/a/c/o', method='PUT',
+            body=('asdf' * segment_size)[:-10])
+        codes = [201] * self.replicas()
+        expect_headers = {
+            'X-Obj-Metadata-Footer': 'yes',
+            'X-Obj-Multiphase-Commit': 'yes'
+        }
+        with set_http_connect(*codes, expect_headers=expect_headers):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 201)
+        self.assertEqual(len(threads), 4)
+        self.assertNotIn(threading.current_thread(), threads)
+
     def test_PUT_with_explicit_commit_status(self):
         req = swift.common.swob.Request.blank('/v1/a/c/o', method='PUT',
                                               body='')
@@ -67,6 +67,7 @@ from swift.common.exceptions import ChunkReadTimeout, DiskFileNotExist, \
     APIVersionError
 from swift.common import utils, constraints
 from swift.common.ring import RingData
+from swift.common.bufferedhttp import BufferedHTTPConnection
 from swift.common.utils import mkdirs, normalize_timestamp, NullLogger
 from swift.common.wsgi import monkey_patch_mimetools, loadapp
 from swift.proxy.controllers import base as proxy_base
@@ -854,31 +855,106 @@ class TestProxyServer(unittest.TestCase):
             rmtree(swift_dir, ignore_errors=True)
 
     def test_node_timing(self):
-        baseapp = proxy_server.Application({'sorting_method': 'timing'},
+        recon_cache_path = mkdtemp()
+        self.addCleanup(rmtree, recon_cache_path)
+        baseapp = proxy_server.Application({'sorting_method': 'timing',
+                                            'recon_cache_path':
+                                            recon_cache_path},
                                            FakeMemcache(),
                                            container_ring=FakeRing(),
                                            account_ring=FakeRing())
-        self.assertEqual(baseapp.node_timings, {})
+        self.assertEqual(baseapp.node_timings.items(), [])
 
         req = Request.blank('/v1/account', environ={'REQUEST_METHOD': 'HEAD'})
         baseapp.update_request(req)
         resp = baseapp.handle_request(req)
         self.assertEqual(resp.status_int, 503)  # couldn't connect to anything
-        exp_timings = {}
-        self.assertEqual(baseapp.node_timings, exp_timings)
-
-        times = [time.time()]
-        exp_timings = {'127.0.0.1': (0.1, times[0] + baseapp.timing_expiry)}
-        with mock.patch('swift.proxy.server.time', lambda: times.pop(0)):
-            baseapp.set_node_timing({'ip': '127.0.0.1'}, 0.1)
-        self.assertEqual(baseapp.node_timings, exp_timings)
-
-        nodes = [{'ip': '127.0.0.1'}, {'ip': '127.0.0.2'}, {'ip': '127.0.0.3'}]
+        self.assertEqual(baseapp.node_timings.items(), [])
+
+        nodes = [{'ip': '127.0.0.%d' % i, 'port': 6000, 'device': 'sda'}
+                 for i in range(1, 5)]
+        now = time.time()
+        with mock.patch('swift.proxy.server.time', lambda: now):
+            baseapp.set_node_timing(nodes[0], 0.1)
+            baseapp.set_node_first_byte_timing(nodes[0], 0.2)
+            baseapp.set_node_timing(nodes[1], 0.1)
+            baseapp.set_node_timing(nodes[2], 0.2)
+        self.assertEqual(sorted(baseapp.node_timings.items()), [
+            ('127.0.0.1:6000/sda', now, {'connect': 0.1, 'first_byte': 0.2}),
+            ('127.0.0.2:6000/sda', now, {'connect': 0.1, 'first_byte': 0}),
+            ('127.0.0.3:6000/sda', now, {'connect': 0.2, 'first_byte': 0})])
+
+        # timings are shared with other workers through recon_cache_path
+        otherapp = proxy_server.Application({'sorting_method': 'timing',
+                                             'recon_cache_path':
+                                             recon_cache_path},
+                                            FakeMemcache(),
+                                            container_ring=FakeRing(),
+                                            account_ring=FakeRing())
+        with mock.patch('swift.proxy.server.shuffle', lambda l: l):
+            res = otherapp.sort_nodes(list(nodes))
+        # nodes without timings are tried first
+        self.assertEqual(res, [nodes[3], nodes[1], nodes[2], nodes[0]])
+
+        # later timings are averaged in
+        with mock.patch('swift.proxy.server.time', lambda: now + 1):
+            baseapp.set_node_timing(nodes[2], 0.1)
+        self.assertAlmostEqual(
+            baseapp.node_timings.get('127.0.0.3:6000/sda')[1]['connect'],
+            0.18)
+        # ...until they expire
+        with mock.patch('swift.proxy.server.time',
+                        lambda: now + 1 + baseapp.timing_expiry):
+            baseapp.set_node_timing(nodes[2], 0.1)
+            self.assertEqual(
+                baseapp.node_timings.get('127.0.0.3:6000/sda')[1]['connect'],
+                0.1)
+            with mock.patch('swift.proxy.server.shuffle', lambda l: l):
+                res = otherapp.sort_nodes(list(nodes))
+            self.assertEqual(res, [nodes[0], nodes[1], nodes[3], nodes[2]])
+
+    def test_node_timing_not_shared(self):
+        recon_cache_path = mkdtemp()
+        rmtree(recon_cache_path)
+        logger = debug_logger('test')
+        baseapp = proxy_server.Application({'sorting_method': 'timing',
+                                            'recon_cache_path':
+                                            recon_cache_path},
+                                           FakeMemcache(), logger=logger,
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertIn('not sharing it with other workers',
+                      logger.get_lines_for_level('warning')[0])
+        baseapp.set_node_timing(
+            {'ip': '127.0.0.1', 'port': 6000, 'device': 'sda'}, 0.1)
+        self.assertEqual(len(baseapp.node_timings.items()), 1)
+
+    def test_node_iter_timing(self):
+        recon_cache_path = mkdtemp()
+        self.addCleanup(rmtree, recon_cache_path)
+        baseapp = proxy_server.Application({'sorting_method': 'timing',
+                                            'recon_cache_path':
+                                            recon_cache_path},
+                                           FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        ring = baseapp.container_ring
+        ring.max_more_nodes = 6
+        primaries = ring.get_part_nodes(0)
+        handoffs = list(ring.get_more_nodes(0))
+        for i, node in enumerate(primaries + handoffs):
+            # the later in the ring order, the faster
+            baseapp.set_node_timing(node, 1 - 0.1 * i)
         with mock.patch('swift.proxy.server.shuffle', lambda l: l):
-            res = baseapp.sort_nodes(nodes)
-        exp_sorting = [{'ip': '127.0.0.2'}, {'ip': '127.0.0.3'},
-                       {'ip': '127.0.0.1'}]
-        self.assertEqual(res, exp_sorting)
+            nodes = list(baseapp.iter_nodes(ring, 0))
+        # the primaries and as many handoffs as are expected to be used are
+        # sorted, the rest stay in ring order
+        self.assertEqual(nodes, primaries[::-1] + handoffs[:3][::-1])
+        with mock.patch('swift.proxy.server.shuffle', lambda l: l), \
+                mock.patch.object(baseapp, 'request_node_count',
+                                  lambda r: 8):
+            nodes = list(baseapp.iter_nodes(ring, 0))
+        self.assertEqual(nodes, primaries[::-1] + handoffs[:5][::-1])
 
     def test_node_affinity(self):
         baseapp = proxy_server.Application({'sorting_method': 'affinity',
@@ -982,6 +1058,199 @@ class TestProxyServer(unittest.TestCase):
         self.assertEqual(log_kwargs['exc_info'][1], e3)
         self.assertEqual(4, node_error_count(app, node))
 
+    def test_error_limiting_scope(self):
+        app = proxy_server.Application({}, FakeMemcache(),
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing())
+        self.assertEqual(app.error_limiting_scope, 'worker')
+        self.assertIsNone(app.shared_error_limiting)
+        self.assertRaises(ValueError, proxy_server.Application,
+                          {'error_limiting_scope': 'galaxy'}, FakeMemcache(),
+                          account_ring=FakeRing(), container_ring=FakeRing())
+
+    def _check_shared_error_limiting(self, app, other_app):
+        node = app.container_ring.get_part_nodes(0)[0]
+        other_node = app.container_ring.get_part_nodes(0)[1]
+        for i in range(app.error_suppression_limit):
+            app.error_occurred(node, 'test msg')
+            other_app.error_occurred(node, 'test msg')
+        # neither worker has seen enough errors on its own, but together
+        # they have
+        self.assertEqual(app.error_suppression_limit,
+                         node_error_count(other_app, node))
+        self.assertTrue(other_app.error_limited(node))
+        self.assertFalse(other_app.error_limited(other_node))
+        self.assertEqual({'error_limit.saved': 1},
+                         other_app.logger.get_increment_counts())
+
+        other_app.error_limit(other_node, 'test msg')
+        self.assertTrue(app.error_limited(other_node))
+
+    def test_error_limiting_scope_host(self):
+        recon_cache_path = mkdtemp()
+        self.addCleanup(rmtree, recon_cache_path)
+        conf = {'error_limiting_scope': 'host',
+                'recon_cache_path': recon_cache_path}
+        app, other_app = [
+            proxy_server.Application(conf, FakeMemcache(),
+                                     account_ring=FakeRing(),
+                                     container_ring=FakeRing(),
+                                     logger=debug_logger('test'))
+            for _junk in range(2)]
+        self._check_shared_error_limiting(app, other_app)
+
+        # errors are forgotten after error_suppression_interval
+        node = app.container_ring.get_part_nodes(0)[0]
+        now = time.time() + app.error_suppression_interval + 1
+        with mock.patch('swift.proxy.server.time', return_value=now):
+            self.assertFalse(other_app.error_limited(node))
+            other_app.error_occurred(node, 'test msg')
+        self.assertEqual(
+            1, other_app.shared_error_limiting.get(
+                other_app._error_limit_node_key(node))[1]['errors'])
+
+    def test_error_limiting_scope_cluster(self):
+        memcache = FakeMemcache()
+        conf = {'error_limiting_scope': 'cluster'}
+        app, other_app = [
+            proxy_server.Application(conf, memcache,
+                                     account_ring=FakeRing(),
+                                     container_ring=FakeRing(),
+                                     logger=debug_logger('test'))
+            for _junk in range(2)]
+        self.assertIsNone(app.shared_error_limiting)
+        self._check_shared_error_limiting(app, other_app)
+        node = app.container_ring.get_part_nodes(0)[0]
+        self.assertEqual(
+            app.error_suppression_limit * 2,
+            memcache.get('error_limiting/%s' %
+                         app._error_limit_node_key(node)))
+
+        # no memcache, no sharing
+        app = proxy_server.Application(conf, None,
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing())
+        app.error_occurred(node, 'test msg')
+        self.assertFalse(app.error_limited(node))
+
+    def test_info_cache(self):
+        app = proxy_server.Application({}, FakeMemcache(),
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing())
+        self.assertIsNone(app.info_cache)
+        self.assertEqual(app.account_existence_skip_cache, 0)
+        self.assertEqual(app.container_existence_skip_cache, 0)
+
+        conf = {'info_cache_size': '50',
+                'info_cache_positive_ttl': '2',
+                'info_cache_negative_ttl': '0.5',
+                'account_existence_skip_cache_pct': '0.1',
+                'container_existence_skip_cache_pct': '1'}
+        app = proxy_server.Application(conf, FakeMemcache(),
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing())
+        self.assertEqual(app.account_existence_skip_cache, 0.001)
+        self.assertEqual(app.container_existence_skip_cache, 0.01)
+        self.assertEqual(app.info_cache.maxsize, 50)
+        self.assertEqual(app.info_cache.positive_ttl, 2)
+        self.assertEqual(app.info_cache.negative_ttl, 0.5)
+
+        for size in ('0', '-1'):
+            conf['info_cache_size'] = size
+            app = proxy_server.Application(conf, FakeMemcache(),
+                                           account_ring=FakeRing(),
+                                           container_ring=FakeRing())
+            self.assertIsNone(app.info_cache)
+            # requests work without the cache
+            req = Request.blank('/v1/a/c', environ={'REQUEST_METHOD': 'HEAD'})
+            with save_globals():
+                set_http_connect(200, 200)
+                resp = app.handle_request(req)
+            self.assertEqual(resp.status_int, 200)
+
+    def test_ec_threadpool(self):
+        app = proxy_server.Application({}, FakeMemcache(),
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing())
+        self.assertIsNone(app.get_ec_threadpool())
+        self.assertEqual(app.ec_pipeline_depth, 2)
+
+        conf = {'ec_threads': '3', 'ec_pipeline_depth': '4'}
+        app = proxy_server.Application(conf, FakeMemcache(),
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing())
+        self.assertEqual(app.ec_pipeline_depth, 4)
+        # the threads aren't started until they're needed
+        self.assertIsNone(app._ec_threadpool)
+        threadpool = app.get_ec_threadpool()
+        self.addCleanup(threadpool.terminate)
+        self.assertEqual(threadpool.nthreads, 3)
+        self.assertIs(app.get_ec_threadpool(), threadpool)
+
+    def test_backend_keepalive(self):
+        app = proxy_server.Application({}, FakeMemcache(),
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing())
+        self.assertIsNone(app.backend_pool)
+        self.assertIsNone(BufferedHTTPConnection.pool)
+
+        conf = {'backend_keepalive': 'yes',
+                'backend_keepalive_pool_size': '3',
+                'backend_keepalive_timeout': '2.5'}
+        app = proxy_server.Application(conf, FakeMemcache(),
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing(),
+                                       logger=debug_logger('test'))
+        try:
+            self.assertIs(BufferedHTTPConnection.pool, app.backend_pool)
+            self.assertEqual(app.backend_pool.max_idle, 3)
+            self.assertEqual(app.backend_pool.idle_timeout, 2.5)
+
+            # erroring nodes lose their idle connections
+            node = app.container_ring.get_part_nodes(0)[0]
+            with mock.patch.object(app.backend_pool, 'evict') as mock_evict:
+                app.error_occurred(node, 'test msg')
+                app.exception_occurred(node, 'test', 'test msg')
+                app.error_limit(node, 'test msg')
+            self.assertEqual(
+                [mock.call(node['ip'], node['port'])] * 3,
+                mock_evict.call_args_list)
+        finally:
+            BufferedHTTPConnection.pool = None
+
+    @patch_policies([StoragePolicy(0, 'zero', True, object_ring=FakeRing()),
+                     StoragePolicy(1, 'one', object_ring=FakeRing()),
+                     StoragePolicy(2, 'two', object_ring=FakeRing())])
+    def test_hedge_trackers(self):
+        app = proxy_server.Application({}, FakeMemcache(),
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing())
+        self.assertIsNone(app.get_hedge_tracker('0'))
+
+        conf = {'hedged_gets': 'yes',
+                'hedge_percentile': '99',
+                'hedge_min_delay': '0.005',
+                'hedge_max_delay': '0.2',
+                'hedge_max_ratio': '0.1',
+                'hedge_policy_max_ratios': '1:0.5, 2:0'}
+        app = proxy_server.Application(conf, FakeMemcache(),
+                                       account_ring=FakeRing(),
+                                       container_ring=FakeRing())
+        tracker = app.get_hedge_tracker('0')
+        self.assertIs(tracker, app.get_hedge_tracker(0))
+        self.assertEqual(tracker.percentile, 99)
+        self.assertEqual(tracker.min_delay, 0.005)
+        self.assertEqual(tracker.max_delay, 0.2)
+        self.assertEqual(tracker.max_ratio, 0.1)
+        self.assertEqual(app.get_hedge_tracker('1').max_ratio, 0.5)
+        self.assertIsNone(app.get_hedge_tracker('2'))
+        self.assertIsNone(app.get_hedge_tracker('3'))
+
+        conf['hedge_policy_max_ratios'] = '1=0.5'
+        self.assertRaises(ValueError, proxy_server.Application, conf,
+                          FakeMemcache(), account_ring=FakeRing(),
+                          container_ring=FakeRing())
+
     def test_valid_api_version(self):
         app = proxy_server.Application({}, FakeMemcache(),
                                        account_ring=FakeRing(),
@@ -1095,6 +1364,36 @@ class TestProxyServerLoading(unittest.TestCase):
         for policy in POLICIES:
             self.assertEqual(policy.object_ring,
                              app.get_object_ring(int(policy)))
+            self.assertFalse(policy.object_ring.background_reload)
+        self.assertFalse(app.account_ring.background_reload)
+        self.assertFalse(app.container_ring.background_reload)
+
+    def test_load_rings_background_reload(self):
+        conf_path = os.path.join(self.tempdir, 'proxy-server.conf')
+        conf_body = """
+        [DEFAULT]
+        swift_dir = %s
+
+        [pipeline:main]
+        pipeline = proxy-server
+
+        [app:proxy-server]
+        use = egg:swift#proxy
+        background_ring_reload = true
+        """ % self.tempdir
+        with open(conf_path, 'w') as f:
+            f.write(dedent(conf_body))
+        for ring_name in ['account', 'container'] + [
+                policy.ring_name for policy in POLICIES]:
+            write_fake_ring(os.path.join(self.tempdir,
+                                         ring_name + '.ring.gz'))
+        app = loadapp(conf_path)
+        while hasattr(app, 'app'):
+            app = app.app
+        for ring in [app.account_ring, app.container_ring] + [
+                app.get_object_ring(int(policy)) for policy in POLICIES]:
+            self.assertTrue(ring.background_reload)
+            self.assertTrue(ring.logger)
 
     def test_missing_rings(self):
         conf_path = os.path.join(self.tempdir, 'proxy-server.conf')